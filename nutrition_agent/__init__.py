@@ -1 +1,18 @@
-from . import agent
+"""
+AI nutritionist: patient analysis, nutrition targets and meal planning on Google ADK.
+
+Submodules are imported on first use, so `import nutrition_agent.validator`
+(or food_db, calculator, ...) does not load the agent graph, the ADK runner
+or the model clients. `nutrition_agent.agent` and `nutrition_agent.root_agent`
+still resolve as before for the ADK CLI.
+"""
+import importlib
+from typing import Any
+
+
+def __getattr__(name: str) -> Any:
+    if name == "agent":
+        return importlib.import_module(".agent", __name__)
+    if name == "root_agent":
+        return importlib.import_module(".agent", __name__).get_nutritionist_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
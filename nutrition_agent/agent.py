@@ -1,60 +1,112 @@
-from asyncio import events
-from google.adk.agents import Agent, SequentialAgent, LoopAgent
-from google.adk.models.google_llm import Gemini
-from google.adk.runners import Runner
-from google.adk.tools import FunctionTool, google_search
-from google.adk.tools.agent_tool import AgentTool
-from google.adk.plugins.logging_plugin import LoggingPlugin
-from google.adk.sessions import InMemorySessionService
+from google.adk.agents import Agent, SequentialAgent, LoopAgent, ParallelAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.tools import FunctionTool
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
 from google.genai import types
 from dotenv import load_dotenv
 import os
+import sys
 import json
+import time
+import argparse
 import asyncio
+import threading
 import traceback
-from typing import Dict, Any
-from google.adk.tools.mcp_tool.mcp_toolset import McpToolset
-from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
-from mcp import StdioServerParameters
-
-load_dotenv()
+from typing import Dict, Any, List, Optional
+
+from .calculator import calculate_requirements
+from .bulk_lookup import make_bulk_lookup_tool
+from .loop_control import ApprovalGateAgent, ConvergenceGateAgent
+from .validator import validate_meal_plan, numeric_critique, merge_critique, add_issues, EXTRA_ISSUES_KEY
+from .meal_plan import MEALS, recompute_totals
+from .patching import apply_patch, is_patch, patch_error_issues, PATCH_ERRORS_KEY
+from .portions import optimize_portions
+from .projection import apply_state_projections
+from .schemas import apply_output_validation
+from .meal_planning import MealPlanAggregatorAgent, prepare_meal_targets, skip_excluded_meal, target_key, plan_key
+from .search_cache import CachedAgentTool
+from .json_utils import load_state_json, dumps_compact
+from .deadline import DEGRADED_KEY, DEADLINE_GRACE_SECONDS, deadline_state
+from .patient_store import get_patient_store, json_file_cache, DEFAULT_STORE_PATH as DEFAULT_PATIENT_STORE_PATH
 
 APP_NAME="nutrition_agent"
 USER_ID="user1234"
 SESSION_ID="1234"
 MODEL_ID="gemini-2.5-flash-lite"
 
+# Calls are paced by the shared per-model rate limiter (rate_limit.py), so
+# retries only cover the occasional 429/5xx and back off moderately
 retry_config=types.HttpRetryOptions(
     attempts=5,  # Maximum retry attempts
-    exp_base=7,  # Delay multiplier
+    exp_base=2,  # Delay multiplier
     initial_delay=1,
+    max_delay=30,
     http_status_codes=[429, 500, 503, 504], # Retry on these HTTP errors
 )
 
+
+def build_model(model_id: str):
+    """
+    Build the model for an agent: Gemini with retry_config behind the shared
+    rate limiter, or the offline FakeGeminiModel when NUTRITION_AGENT_FAKE_MODEL is set.
+    """
+    if os.environ.get("NUTRITION_AGENT_FAKE_MODEL", "").lower() in ("1", "true", "yes"):
+        from .fake_model import FakeGeminiModel
+
+        return FakeGeminiModel.from_env(model_id, retry_options=retry_config)
+    from .rate_limit import RateLimitedGemini
+
+    return RateLimitedGemini(model=model_id, retry_options=retry_config)
+
+
 #sample data
-def analyze_health_metrics() -> str:
+QUESTIONNAIRE_PATH = "/home/prxbhu/Documents/nutritionist-agent/quest.json"
+MEASUREMENTS_PATH = "/home/prxbhu/Documents/nutritionist-agent/measurements.json"
+
+
+def load_patient_data(state: Dict[str, Any]) -> Optional[str]:
+    """
+    Load a patient's questionnaire and measurements as minified JSON.
+
+    Args:
+        state: Session state with the file paths or patient_id/patient_store_path
+
+    Returns:
+        The minified JSON, or None if the patient is not in the patient store
+    """
+    # Patients with a patient_id are served from the patient store when one is
+    # configured, unless their entry names its own files
+    patient_id = state.get("patient_id")
+    has_files = state.get("questionnaire_path") or state.get("measurements_path")
+    store_path = state.get("patient_store_path", DEFAULT_PATIENT_STORE_PATH)
+    if patient_id and store_path and not has_files:
+        return get_patient_store(store_path).get(str(patient_id))
+
+    # Batch runs put each patient's file paths in session state
+    questionnaire_path = state.get("questionnaire_path", QUESTIONNAIRE_PATH)
+    measurements_path = state.get("measurements_path", MEASUREMENTS_PATH)
+    
+    analysis = {
+        "questionnaire": json_file_cache.load(questionnaire_path),
+        "measurements": json_file_cache.load(measurements_path)
+    }
+    
+    return dumps_compact(analysis)
+
+
+def analyze_health_metrics(tool_context: ToolContext) -> str:
     """
     Fetch the questionnaire and measurements data of the patient.
     
     Returns:
-        A JSON string containing questionnaire responses and measurements data
+        A minified JSON string containing questionnaire responses and measurements data
     """
     try:
-        questionnaire_path = "/home/prxbhu/Documents/nutritionist-agent/quest.json"
-        measurements_path = "/home/prxbhu/Documents/nutritionist-agent/measurements.json"
-        
-        with open(questionnaire_path, 'r') as q_file:
-            questionnaire = json.load(q_file)
-        
-        with open(measurements_path, 'r') as m_file:
-            measurements = json.load(m_file)
-        
-        analysis = {
-            "questionnaire": questionnaire,
-            "measurements": measurements
-        }
-        
-        return json.dumps(analysis, indent=2)
+        analysis = load_patient_data(tool_context.state)
+        if analysis is None:
+            return json.dumps({"error": f"Patient not found: {tool_context.state.get('patient_id')}"})
+        return analysis
     except FileNotFoundError as e:
         return json.dumps({"error": f"File not found: {str(e)}"})
     except json.JSONDecodeError as e:
@@ -62,10 +114,14 @@ def analyze_health_metrics() -> str:
 
 
 # Web Search Agent instead of direct google_search tool use
-web_search_agent = Agent(
-    name="web_search_agent",
-    model=Gemini(model="gemini-2.5-flash-lite", retry_options=retry_config),
-    instruction="""You are a web search specialist. Your job is to perform web searches and return relevant results.
+def make_web_search_tool() -> CachedAgentTool:
+    """Build web_search_agent behind the persistent search cache, so repeated queries are served from it."""
+    from google.adk.tools import google_search
+
+    web_search_agent = Agent(
+        name="web_search_agent",
+        model=build_model("gemini-2.5-flash-lite"),
+        instruction="""You are a web search specialist. Your job is to perform web searches and return relevant results.
 
                 When given a search query, use the google_search tool to find information and return the most relevant results in a clear, structured format.
 
@@ -76,19 +132,19 @@ web_search_agent = Agent(
                 - Relevant details to the query
 
                 Be factual and cite sources when possible.""",
-    tools=[google_search],
-    output_key="search_results"
-)
-
-web_search_tool = AgentTool(web_search_agent)
-
+        tools=[google_search],
+        output_key="search_results"
+    )
+    return CachedAgentTool(web_search_agent)
 
 
 # Agent 1: Patient Data Retrieval and Analysis
-patient_data_agent = Agent(
-    model=Gemini(model="gemini-2.5-flash-lite", retry_options=retry_config),
-    name="patient_data_agent",
-    instruction="""You are a patient data retrieval and analysis specialist.
+def make_patient_data_agent() -> Agent:
+    """Build the agent that fetches and analyzes the patient's data."""
+    return Agent(
+        model=build_model("gemini-2.5-flash-lite"),
+        name="patient_data_agent",
+        instruction="""You are a patient data retrieval and analysis specialist.
 
                 **TASK:**
                 1. Call the analyze_health_metrics tool to fetch patient data
@@ -154,87 +210,66 @@ patient_data_agent = Agent(
                 - Output ONLY the JSON, no additional text before or after
                 - Ensure all JSON is valid and properly formatted
                 - Use the analyze_health_metrics tool first to get the data""",
-    tools=[FunctionTool(func=analyze_health_metrics)],
-    output_key="patient_health_data"
-)
+        tools=[FunctionTool(func=analyze_health_metrics)],
+        output_key="patient_health_data"
+    )
+
 
 # Agent 2: Nutrition Requirements Calculator
-nutrition_calculator_agent = Agent(
-    model=Gemini(model="gemini-2.5-flash-lite", retry_options=retry_config),
-    name="nutrition_calculator_agent",
-    instruction="""You are a nutritional requirements calculator.
+def compute_nutrition_targets(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    Run the deterministic calculator before the guidelines model call so the
+    numeric targets never depend on the LLM. A profile without a weight or
+    height stops the run rather than planning around a meaningless BMR.
+    """
+    targets = calculate_requirements(callback_context.state.get("patient_health_data"))
+    if "error" in targets:
+        raise ValueError(targets["error"])
+    callback_context.state["calculated_nutrition_targets"] = dumps_compact(targets)
+    return None
+
+
+def merge_nutrition_guidelines(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    Merge the model's free-text guidelines into the calculated targets and
+    publish the result as nutrition_requirements.
+    """
+    requirements = load_state_json(callback_context.state.get("calculated_nutrition_targets")) or {}
+    guidelines = load_state_json(callback_context.state.get("nutrition_guidelines")) or {}
+    for key in ("special_dietary_guidelines", "additional_recommendations"):
+        if isinstance(guidelines.get(key), list):
+            requirements[key] = guidelines[key]
+    callback_context.state["nutrition_requirements"] = json.dumps(requirements, indent=2)
+    return None
+
+
+def make_nutrition_calculator_agent() -> Agent:
+    """Build the agent that writes guidelines around the calculated targets."""
+    return Agent(
+        model=build_model("gemini-2.5-flash-lite"),
+        name="nutrition_calculator_agent",
+        instruction="""You are a clinical nutrition guidelines writer.
 
                 **INPUT DATA:**
-                You will receive patient health data in JSON format:
+                Patient health data:
                 {patient_health_data}
 
-                **TASK:**
-                1. Calculate daily caloric needs using Mifflin-St Jeor equation
-                2. Determine macronutrient distribution
-                3. Apply medical condition adjustments
-                4. Calculate meal distribution
+                Calculated nutrition targets (already computed, do NOT recalculate or change them):
+                {calculated_nutrition_targets}
 
-                **CALCULATION FORMULAS:**
-                - BMR (Male): 10 × weight(kg) + 6.25 × height(cm) - 5 × age(years) + 5
-                - BMR (Female): 10 × weight(kg) + 6.25 × height(cm) - 5 × age(years) - 161
-                - Activity Multipliers: Sedentary=1.2, Lightly Active=1.375, Moderately Active=1.55, Very Active=1.725
+                **TASK:**
+                Write the dietary guidelines and recommendations that go with these targets,
+                taking the patient's medical conditions, deficiencies and lifestyle into account.
 
                 **OUTPUT FORMAT - You MUST respond with ONLY valid JSON in this exact structure:**
 
-                ```json 
+                ```json
                 {
-                "daily_targets": {
-                    "total_calories": <number>,
-                    "protein_grams": <number>,
-                    "protein_percentage": <number>,
-                    "carbohydrates_grams": <number>,
-                    "carbohydrates_percentage": <number>,
-                    "fats_grams": <number>,
-                    "fats_percentage": <number>,
-                    "fiber_grams": <number>,    
-                    "sodium_mg": <number>
-                },
-                "calculations": {
-                    "bmr": <number>,
-                    "activity_level": "<sedentary/lightly_active/moderately_active/very_active>",
-                    "activity_multiplier": <number>,
-                    "tdee": <number>
-                },
                 "special_dietary_guidelines": [
                     "<guideline 1>",
                     "<guideline 2>",
                     "<guideline 3>"
                 ],
-                "meal_distribution": {
-                    "breakfast": {
-                    "percentage": <number>,
-                    "calories": <number>
-                    },
-                    "mid_morning_snack": {
-                    "percentage": <number>,
-                    "calories": <number>,
-                    "include": <boolean>
-                    },
-                    "lunch": {
-                    "percentage": <number>,
-                    "calories": <number>
-                    },
-                    "evening_snack": {
-                    "percentage": <number>,
-                    "calories": <number>,
-                    "include": <boolean>
-                    },
-                    "dinner": {
-                    "percentage": <number>,
-                    "calories": <number>
-                    }
-                },
-                "medical_adjustments": {
-                    "diabetes": "<adjustments if applicable>",
-                    "hypertension": "<adjustments if applicable>",
-                    "high_cholesterol": "<adjustments if applicable>",
-                    "vitamin_deficiencies": "<adjustments if applicable>"
-                },
                 "additional_recommendations": [
                     "<recommendation 1>",
                     "<recommendation 2>"
@@ -244,175 +279,158 @@ nutrition_calculator_agent = Agent(
 
                 **IMPORTANT:** 
                 - Output ONLY the JSON, no additional text
-                - Use web search using the web_search_tool if you need current nutritional guidelines
-                - Ensure calculations are accurate""",
-    tools=[web_search_tool],
-    output_key="nutrition_requirements"
-)
-
-# Agent 3: Initial Meal Planning Agent
-initial_meal_planner_agent = Agent(
-    model=Gemini(model="gemini-2.0-flash-exp", retry_options=retry_config),
-    name="initial_meal_planner_agent",
-    instruction="""You are an expert meal planner specializing in Indian cuisine.
+                - Keep guidelines specific to Indian cuisine and consistent with the calculated targets""",
+        before_agent_callback=compute_nutrition_targets,
+        after_agent_callback=merge_nutrition_guidelines,
+        output_key="nutrition_guidelines"
+    )
+
+# Agent 3: Initial Meal Planning - one planner per meal, run in parallel
+def make_meal_planner(meal: str, lookup_tool: BaseTool) -> Agent:
+    """Build the planner agent for a single meal."""
+    label = meal.replace("_", " ")
+    return Agent(
+        model=build_model("gemini-2.0-flash-exp"),
+        name=f"{meal}_planner_agent",
+        instruction=f"""You are an expert meal planner specializing in Indian cuisine.
+                You are planning ONLY the {label} of a daily meal plan; the other meals are planned separately.
 
                 **INPUT DATA:**
-                Patient Health Data: {patient_health_data}
-                Nutrition Requirements: {nutrition_requirements}
-
-                **TASK:**
-                Create an initial personalized Indian meal plan that meets the nutritional targets.
+                Patient Health Data: {{patient_health_data}}
+                Medical adjustments and guidelines: {{nutrition_requirements}}
+                Targets for this meal: {{{target_key(meal)}}}
 
                 **PROCESS:**
                 1. Review patient preferences and restrictions from patient_health_data
-                2. Use nutrition_requirements for calorie and macro targets
-                3. Use web search to find accurate nutritional values for Indian foods
-                4. Calculate portions to meet targets
+                2. Choose foods suitable for {label} that fit the targets for this meal
+                3. Look up ALL chosen foods with ONE lookup_foods_nutrition call to get accurate nutritional values
+                4. Calculate portions so the meal's calories and macros match its targets
                 5. Ensure medical compliance
 
-                **SEARCH EXAMPLES:**
-                - "nutritional value of chapati per 100g"
-                - "calories in dal 1 cup"
-                - "paneer nutrition facts"
+                **LOOKUP EXAMPLE:**
+                - lookup_foods_nutrition(food_names=["chapati", "toor dal"], quantities=["2 pieces", "1 katori"])
+
+                Each row of the returned table gives a food's nutrients for its quantity.
+                Foods not in the local database are searched on the web and scaled the same way; if their values
+                cannot be read, a per-100 g summary comes back under "web_search" instead.
 
                 **OUTPUT FORMAT - You MUST respond with ONLY valid JSON in this exact structure:**
 
                 ```json
-                {
-                "meal_plan": {
-                    "breakfast": {
-                    "time": "7:00-8:00 AM",
-                    "target_calories": <number>,
-                    "foods": [
-                        {
-                        "name": "<food name>",
-                        "quantity": "<amount with unit>",
-                        "calories": <number>,
-                        "protein_g": <number>,
-                        "carbs_g": <number>,
-                        "fats_g": <number>
-                        }
-                    ],
-                    "preparation_notes": "<any special instructions>",
-                    "totals": {
-                        "calories": <number>,
-                        "protein_g": <number>,
-                        "carbs_g": <number>,
-                        "fats_g": <number>
-                    }
-                    },
-                    "mid_morning_snack": {
-                    "time": "10:30-11:00 AM",
-                    "target_calories": <number>,
-                    "include": <boolean>,
-                    "foods": [],
-                    "preparation_notes": "",
-                    "totals": {
-                        "calories": <number>,
-                        "protein_g": <number>,
-                        "carbs_g": <number>,
-                        "fats_g": <number>
-                    }
-                    },
-                    "lunch": {
-                    "time": "1:00-2:00 PM",
-                    "target_calories": <number>,
-                    "foods": [],
-                    "preparation_notes": "",
-                    "totals": {
-                        "calories": <number>,
-                        "protein_g": <number>,
-                        "carbs_g": <number>,
-                        "fats_g": <number>
-                    }
-                    },
-                    "evening_snack": {
-                    "time": "4:30-5:00 PM",
-                    "target_calories": <number>,
-                    "include": <boolean>,
-                    "foods": [],
-                    "preparation_notes": "",
-                    "totals": {
-                        "calories": <number>,
-                        "protein_g": <number>,
-                        "carbs_g": <number>,
-                        "fats_g": <number>
-                    }
-                    },
-                    "dinner": {
-                    "time": "7:30-8:30 PM",
-                    "target_calories": <number>,
-                    "foods": [],
-                    "preparation_notes": "",
-                    "totals": {
-                        "calories": <number>,
-                        "protein_g": <number>,
-                        "carbs_g": <number>,
-                        "fats_g": <number>
-                    }
-                    }
-                },
-                "daily_totals": {
+                {{
+                "time": "<time window>",
+                "foods": [
+                    {{
+                    "name": "<food name>",
+                    "quantity": "<amount with unit>",
                     "calories": <number>,
                     "protein_g": <number>,
                     "carbs_g": <number>,
                     "fats_g": <number>,
                     "fiber_g": <number>
-                },
-                "target_comparison": {
-                    "calories_percentage": <number>,
-                    "protein_percentage": <number>,
-                    "carbs_percentage": <number>,
-                    "fats_percentage": <number>
-                },
-                "important_notes": [
-                    "<note 1>",
-                    "<note 2>"
-                ]
-                }
+                    }}
+                ],
+                "preparation_notes": "<any special instructions>",
+                "notes": ["<important note for the patient, if any>"]
+                }}
                 ```
 
                 **IMPORTANT:** 
                 - Output ONLY valid JSON, no additional text
-                - Use web search using the web_search_tool if you need to verify nutritional values
-                - Ensure all meals follow medical guidelines from patient data""",
-    tools=[web_search_tool],
-    output_key="current_meal_plan"
-)
+                - Do NOT compute meal or daily totals; they are calculated in code""",
+        tools=[lookup_tool],
+        before_agent_callback=skip_excluded_meal,
+        output_key=plan_key(meal)
+    )
+
+
+def make_initial_meal_planner(lookup_tool: BaseTool) -> SequentialAgent:
+    """Build the parallel per-meal planners followed by the code aggregator."""
+    meal_planner_agents = [make_meal_planner(meal, lookup_tool) for meal in MEALS]
+
+    parallel_meal_planner_agent = ParallelAgent(
+        name="parallel_meal_planner_agent",
+        sub_agents=meal_planner_agents,
+        description="Plans all meals concurrently, each against its share of the daily targets",
+        before_agent_callback=prepare_meal_targets,
+    )
+
+    meal_plan_aggregator_agent = MealPlanAggregatorAgent(
+        name="meal_plan_aggregator_agent",
+        description="Assembles the per-meal plans into current_meal_plan and computes totals",
+    )
+
+    return SequentialAgent(
+        name="initial_meal_planner_agent",
+        sub_agents=[parallel_meal_planner_agent, meal_plan_aggregator_agent],
+        description="Creates the initial meal plan and writes current_meal_plan",
+    )
+
 
 # Agent 4: Meal Plan Critic
-meal_plan_critic_agent = Agent(
-    model=Gemini(model="gemini-2.0-flash-exp", retry_options=retry_config),
-    name="meal_plan_critic_agent",
-    instruction="""You are a meal plan critic and validator.
+def run_numeric_validation(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    Check calories, macros and completeness in code before the critic runs.
+
+    Calorie and macro misses are first fixed by rescaling portions in code
+    (portions.py); the rescaled plan replaces current_meal_plan when it has
+    fewer nutritional issues. A plan that still fails these checks gets a
+    NEEDS_REVISION critique directly and the critic model call is skipped.
+    Issues other checks put in state (such as repeated dishes in a weekly
+    plan) count as part of these checks, and refiner operations that could not
+    be applied are reported as minor issues so the next refinement sees them.
+    """
+    state = callback_context.state
+    validation = validate_meal_plan(state.get("current_meal_plan"), state.get("nutrition_requirements"))
+    optimized = optimize_portions(state.get("current_meal_plan"), state.get("nutrition_requirements"), validation)
+    if optimized is not None:
+        state["current_meal_plan"] = json.dumps(optimized["plan"], indent=2)
+        state["portion_adjustments"] = optimized["adjustments"]
+        validation = optimized["validation"]
+    extra_issues = (state.get(EXTRA_ISSUES_KEY) or []) + patch_error_issues(state.get(PATCH_ERRORS_KEY) or [])
+    validation = add_issues(validation, extra_issues)
+    state["numeric_validation"] = dumps_compact(validation)
+    if validation["passed"]:
+        return None
+    critique = json.dumps(numeric_critique(validation), indent=2)
+    state["critique"] = critique
+    return types.Content(role="model", parts=[types.Part(text=critique)])
+
+
+def merge_numeric_validation(callback_context: CallbackContext) -> Optional[types.Content]:
+    """Merge the numeric checks into the critic's medical/practical review and set the final status."""
+    state = callback_context.state
+    validation = load_state_json(state.get("numeric_validation"))
+    if validation is None:
+        return None
+    critique = merge_critique(validation, load_state_json(state.get("critic_review")))
+    state["critique"] = json.dumps(critique, indent=2)
+    return None
+
+
+def make_meal_plan_critic() -> Agent:
+    """Build the critic that reviews medical compliance and practicality."""
+    return Agent(
+        model=build_model("gemini-2.0-flash-exp"),
+        name="meal_plan_critic_agent",
+        instruction="""You are a meal plan critic reviewing medical compliance and practicality.
+
+                Calorie/macro accuracy and meal completeness have already been verified in code;
+                do NOT evaluate them.
 
                 **INPUT DATA:**
                 Patient Health Data: {patient_health_data}
                 Nutrition Requirements: {nutrition_requirements}
                 Current Meal Plan: {current_meal_plan}
 
-                **TASK:**
-                Evaluate the meal plan and determine if it's approved or needs refinement.
-
                 **EVALUATION CRITERIA:**
-                1. Nutritional Accuracy: Calories within ±100 kcal, macros within ±10%
-                2. Medical Compliance: Follows all dietary guidelines for medical conditions
-                3. Practical Assessment: Realistic portions, cultural appropriateness
-                4. Completeness: All required meals included with proper calculations
+                1. Medical Compliance: Follows all dietary guidelines for medical conditions, restrictions and allergies
+                2. Practical Assessment: Realistic portions, variety, cultural appropriateness, ease of preparation
 
                 **OUTPUT FORMAT - You MUST respond with ONLY valid JSON in this exact structure:**
 
                 ```json
                 {
-                "status": "<APPROVED or NEEDS_REVISION>",
-                "nutritional_accuracy": {
-                    "calories_status": "<within_range/too_high/too_low>",
-                    "calories_difference": <number>,
-                    "protein_status": "<within_range/too_high/too_low>",
-                    "carbs_status": "<within_range/too_high/too_low>",
-                    "fats_status": "<within_range/too_high/too_low>",
-                    "overall_score": "<excellent/good/needs_improvement/poor>"
-                },
                 "medical_compliance": {
                     "diabetes_compliance": "<compliant/non_compliant/not_applicable>",
                     "hypertension_compliance": "<compliant/non_compliant/not_applicable>",
@@ -429,7 +447,7 @@ meal_plan_critic_agent = Agent(
                 },
                 "issues": [
                     {
-                    "category": "<nutritional/medical/practical/completeness>",
+                    "category": "<medical/practical>",
                     "severity": "<critical/major/minor>",
                     "problem": "<description of the problem>",
                     "suggestion": "<specific actionable fix>"
@@ -440,41 +458,52 @@ meal_plan_critic_agent = Agent(
                 }
                 ```
 
-                **CRITICAL RULES:**
-                - Set "status" to "APPROVED" ONLY if:
-                - Nutritional accuracy overall_score is "excellent" or "good"
-                - Medical compliance overall_score is "excellent" or "good"
-                - Practical assessment overall_score is "excellent" or "good"
-                - No critical or major issues found
-                - Set "status" to "NEEDS_REVISION" if any criteria are not met
+                **RULES:**
+                - Use "critical" or "major" severity only for problems that must be fixed before approval
                 - Always provide specific, actionable suggestions in issues array
 
                 **IMPORTANT:** 
-                - Output ONLY valid JSON, no additional text
-                - Use web search using the web_search_tool to verify nutritional values if needed""",
-    tools=[web_search_tool],
-    output_key="critique"
-)
+                - Output ONLY valid JSON, no additional text""",
+        before_agent_callback=run_numeric_validation,
+        after_agent_callback=merge_numeric_validation,
+        output_key="critic_review"
+    )
 
-def exit_loop() -> Dict[str, str]:
-    """
-    Call this function ONLY when the meal plan critique status is 'APPROVED', 
-    indicating the meal plan is complete and no more changes are needed.
-    
-    Returns:
-        A dictionary with approval status
-    """
-    return {
-        "status": "approved",
-        "message": "Meal plan approved. Exiting refinement loop."
-    }
-exit_tool = FunctionTool(func=exit_loop)
 
 # Agent 5: Meal Plan Refiner
-meal_plan_refiner_agent = Agent(
-    model=Gemini(model="gemini-2.0-flash-exp", retry_options=retry_config),
-    name="meal_plan_refiner_agent",
-    instruction="""You are a meal plan refiner.
+def apply_meal_plan_patch(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    Apply the refiner's patch to current_meal_plan and recompute totals.
+
+    A full meal plan (no "operations") is accepted as a replacement so an
+    off-format response still makes progress. Operations that could not be
+    applied are kept in state for run_numeric_validation to report.
+    """
+    state = callback_context.state
+    output = load_state_json(state.get("meal_plan_patch"))
+    plan = load_state_json(state.get("current_meal_plan")) or {}
+    requirements = load_state_json(state.get("nutrition_requirements")) or {}
+    daily_targets = requirements.get("daily_targets") or {}
+
+    errors: List[str] = []
+    if is_patch(output):
+        patched, errors = apply_patch(plan, output, daily_targets)
+    elif isinstance(output, dict) and "meal_plan" in output:
+        patched = recompute_totals(output, daily_targets)
+    else:
+        state[PATCH_ERRORS_KEY] = errors
+        return None
+    state[PATCH_ERRORS_KEY] = errors
+    state["current_meal_plan"] = json.dumps(patched, indent=2)
+    return None
+
+
+def make_meal_plan_refiner(lookup_tool: BaseTool) -> Agent:
+    """Build the refiner that fixes the critique's issues with a patch."""
+    return Agent(
+        model=build_model("gemini-2.0-flash-exp"),
+        name="meal_plan_refiner_agent",
+        instruction="""You are a meal plan refiner.
 
                 **INPUT DATA:**
                 Patient Health Data: {patient_health_data}
@@ -483,41 +512,28 @@ meal_plan_refiner_agent = Agent(
                 Critique: {critique}
 
                 **TASK:**
-                1. Parse the critique JSON to check the status
-                2. If status is "APPROVED", call the exit_tool immediately
-                3. If status is "NEEDS_REVISION", refine the meal plan to address ALL issues
-
-                **DECISION LOGIC:**
-                ```
-                IF critique.status == "APPROVED":
-                    CALL exit_tool
-                    STOP - do not output anything else
-                ELSE:
-                    Refine the meal plan
-                    Output refined meal plan in JSON format
-                ```
+                The critique status is "NEEDS_REVISION" (approved plans never reach you).
+                Fix ALL issues in the critique by changing only the meals and foods involved.
 
                 **REFINEMENT PROCESS:**
                 1. Read each issue from critique.issues array
-                2. For each issue, make specific changes to address it
-                3. Use web search to get accurate nutritional data for any new/modified foods
-                4. Recalculate all nutritional values
-                5. Ensure the refined plan maintains the same JSON structure
+                2. For each issue, decide the smallest change that fixes it
+                3. Look up all new/modified foods with ONE lookup_foods_nutrition call to get accurate nutritional data
+                4. Express the changes as patch operations; meal and daily totals are recalculated in code
 
-                **OUTPUT FORMAT - If refining, output ONLY valid JSON in the SAME structure as initial meal plan:**
+                **OUTPUT FORMAT - Output ONLY a JSON patch with these operations:**
 
                 ```json
                 {
-                "meal_plan": {
-                    "breakfast": { ... },
-                    "mid_morning_snack": { ... },
-                    "lunch": { ... },
-                    "evening_snack": { ... },
-                    "dinner": { ... }
-                },
-                "daily_totals": { ... },
-                "target_comparison": { ... },
-                "important_notes": [ ... ],
+                "operations": [
+                    {"op": "rescale", "meal": "<meal>", "food": "<existing food name>", "factor": <number>, "quantity": "<new amount with unit>"},
+                    {"op": "replace", "meal": "<meal>", "food": "<existing food name>",
+                     "new_food": {"name": "<food>", "quantity": "<amount>", "calories": <number>, "protein_g": <number>, "carbs_g": <number>, "fats_g": <number>}},
+                    {"op": "remove", "meal": "<meal>", "food": "<existing food name>"},
+                    {"op": "add", "meal": "<meal>",
+                     "new_food": {"name": "<food>", "quantity": "<amount>", "calories": <number>, "protein_g": <number>, "carbs_g": <number>, "fats_g": <number>}},
+                    {"op": "replace_meal", "meal": "<meal>", "foods": [<new_food objects>], "preparation_notes": "<notes>"}
+                ],
                 "refinement_notes": [
                     "<what was changed and why>",
                     "<issue addressed>"
@@ -525,176 +541,313 @@ meal_plan_refiner_agent = Agent(
                 }
                 ```
 
+                Meals are: breakfast, mid_morning_snack, lunch, evening_snack, dinner.
+                "rescale" multiplies all nutrient values of the food by factor.
+
                 **IMPORTANT:** 
-                - If critique.status is "APPROVED", ONLY call exit_tool, do NOT output JSON
-                - If refining, output ONLY valid JSON, no additional text
+                - Output ONLY valid JSON, no additional text
+                - Do NOT repeat unchanged meals or foods
                 - Address ALL issues from the critique
-                - Use web search to verify nutritional accuracy""",
-    tools=[exit_tool, web_search_tool],
-    output_key="current_meal_plan"
-)
-
-# Loop Agent: Meal Plan Refinement Loop
-meal_plan_refinement_loop = LoopAgent(
-    name="meal_plan_refinement_loop",
-    sub_agents=[meal_plan_critic_agent, meal_plan_refiner_agent],
-    max_iterations=3,
-)
+                - Use lookup_foods_nutrition to verify nutritional accuracy""",
+        tools=[lookup_tool],
+        after_agent_callback=apply_meal_plan_patch,
+        output_key="meal_plan_patch"
+    )
+
+
+def make_refinement_loop(lookup_tool: BaseTool) -> LoopAgent:
+    """Build the critic/refiner loop with its code-level exit gates."""
+    # Loop control: exit on approval or once the refiner stops changing the plan,
+    # without spending a model call on the decision
+    approval_gate_agent = ApprovalGateAgent(
+        name="approval_gate_agent",
+        description="Exits the refinement loop when the critique status is APPROVED",
+    )
+    convergence_gate_agent = ConvergenceGateAgent(
+        name="convergence_gate_agent",
+        description="Exits the refinement loop when the refined plan equals the previous plan",
+    )
+
+    # Loop Agent: Meal Plan Refinement Loop
+    return LoopAgent(
+        name="meal_plan_refinement_loop",
+        sub_agents=[make_meal_plan_critic(), approval_gate_agent, make_meal_plan_refiner(lookup_tool), convergence_gate_agent],
+        max_iterations=3,
+    )
+
+
+def build_nutritionist_agent() -> SequentialAgent:
+    """
+    Build the full agent graph and its model clients.
 
-# Root Sequential Agent - Orchestrates the workflow
-nutritionist_agent = SequentialAgent(
-    name="nutritionist_agent",
-    sub_agents=[
-        patient_data_agent,
-        nutrition_calculator_agent,
-        initial_meal_planner_agent,
-        meal_plan_refinement_loop
-    ],
-    description="""You are the orchestrator of a comprehensive AI nutritionist system  with structured JSON data flow.
+    Prefer get_nutritionist_agent(), which builds the graph once per process.
+    """
+    # .env may set the API key or NUTRITION_AGENT_FAKE_MODEL, which build_model reads
+    load_dotenv()
+    # Resolves all foods of a meal in one call: local database first, concurrent web searches for the rest
+    lookup_tool = make_bulk_lookup_tool(make_web_search_tool())
+
+    # Root Sequential Agent - Orchestrates the workflow
+    nutritionist_agent = SequentialAgent(
+        name="nutritionist_agent",
+        sub_agents=[
+            make_patient_data_agent(),
+            make_nutrition_calculator_agent(),
+            make_initial_meal_planner(lookup_tool),
+            make_refinement_loop(lookup_tool),
+        ],
+        description="""You are the orchestrator of a comprehensive AI nutritionist system  with structured JSON data flow.
 
                 **Workflow:**
                 1. Patient Data Agent → outputs patient_health_data (JSON)
-                2. Nutrition Calculator → uses patient_health_data, outputs nutrition_requirements (JSON)
-                3. Initial Meal Planner → uses both JSONs, outputs current_meal_plan (JSON)
+                2. Nutrition Calculator → computes targets from patient_health_data in code, adds guidelines, outputs nutrition_requirements (JSON)
+                3. Initial Meal Planner → one planner per meal in parallel, then a code aggregator outputs current_meal_plan (JSON)
                 4. Refinement Loop (max 3 iterations):
-                - Critic → evaluates meal plan, outputs critique (JSON with status)
-                - Refiner → if APPROVED calls exit_tool, else refines and outputs updated meal plan (JSON)
+                - Critic → numeric checks in code (failures skip the model), then medical/practical review; outputs critique (JSON with status)
+                - Approval gate (code) → exits the loop if the critique is APPROVED
+                - Refiner → outputs a patch for the flagged meals, merged into current_meal_plan in code
+                - Convergence gate (code) → exits the loop if the plan did not change
 
                 All agents communicate via structured JSON, ensuring reliable data passing."""
-)
+    )
+
+    # Inject only the state fields each agent needs, minified
+    apply_state_projections(nutritionist_agent)
+
+    # Validate every model-written output against its schema, retrying a malformed one once
+    apply_output_validation(nutritionist_agent)
+    return nutritionist_agent
+
+
+_nutritionist_agent: Optional[SequentialAgent] = None
+_nutritionist_agent_lock = threading.Lock()
+
+
+def get_nutritionist_agent() -> SequentialAgent:
+    """
+    Return the process-wide agent graph, building it on first use.
+
+    Importing this module only defines the agents; the model clients and the
+    graph are created here, once, so tools and CLIs that never run the
+    pipeline do not pay for them.
+    """
+    global _nutritionist_agent
+    if _nutritionist_agent is None:
+        with _nutritionist_agent_lock:
+            if _nutritionist_agent is None:
+                _nutritionist_agent = build_nutritionist_agent()
+    return _nutritionist_agent
 
 
-async def main():
-    """Main execution function to run the nutritionist agent"""
+def __getattr__(name: str) -> Any:
+    # nutritionist_agent (and root_agent, for the ADK CLI) are built on first access
+    if name in ("nutritionist_agent", "root_agent"):
+        return get_nutritionist_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+
+# State keys emitted as NDJSON records while the pipeline runs
+STAGE_OUTPUT_KEYS = ["patient_health_data", "nutrition_requirements", "current_meal_plan", "critique"]
+
+
+def stage_records(event, started: float, iteration_count: int) -> List[Dict[str, Any]]:
+    """
+    Build one NDJSON record per stage output written to state by an event.
+
+    Args:
+        event: An ADK event from the runner stream
+        started: perf_counter() value at the start of the run
+        iteration_count: Number of critiques produced so far
+
+    Returns:
+        A list of records (usually empty or one)
+    """
+    state_delta = event.actions.state_delta if event.actions else {}
+    records = []
+    for key in STAGE_OUTPUT_KEYS:
+        if key in state_delta and state_delta[key] is not None:
+            value = state_delta[key]
+            parsed = load_state_json(value)
+            records.append({
+                "type": "stage_output",
+                "key": key,
+                "agent": event.author,
+                "iteration": iteration_count if iteration_count > 0 else None,
+                "elapsed_seconds": round(time.perf_counter() - started, 3),
+                "data": parsed if parsed is not None else value,
+            })
+    return records
+
+
+def print_meal_summary(final_json: Dict[str, Any], out=sys.stderr) -> None:
+    """Print a human-readable summary of a meal plan."""
+    print("\n" + "=" * 80, file=out)
+    print("MEAL SUMMARY", file=out)
+    print("=" * 80, file=out)
+
+    for meal_name, meal_data in final_json['meal_plan'].items():
+        if meal_data.get('include', True):
+            print(f"\n{meal_name.upper().replace('_', ' ')}:", file=out)
+            print(f"  Time: {meal_data.get('time', 'N/A')}", file=out)
+            print(f"  Calories: {meal_data.get('totals', {}).get('calories', 0)} kcal", file=out)
+            print(f"  Foods:", file=out)
+            for food in meal_data.get('foods', []):
+                print(f"    - {food.get('name')} ({food.get('quantity')})", file=out)
+
+    if 'daily_totals' in final_json:
+        print(f"\nDAILY TOTALS:", file=out)
+        totals = final_json['daily_totals']
+        print(f"  Calories: {totals.get('calories', 0)} kcal", file=out)
+        print(f"  Protein: {totals.get('protein_g', 0)}g", file=out)
+        print(f"  Carbs: {totals.get('carbs_g', 0)}g", file=out)
+        print(f"  Fats: {totals.get('fats_g', 0)}g", file=out)
+
+
+async def main(
+    output_path: Optional[str] = None,
+    metrics_dir: Optional[str] = None,
+    cassette_path: Optional[str] = None,
+    cassette_mode: str = "replay",
+    sessions_db: Optional[str] = None,
+    resume: bool = False,
+    stage_memo_path: Optional[str] = None,
+    deadline_seconds: Optional[float] = None,
+):
+    """
+    Main execution function to run the nutritionist agent.
+
+    Stage outputs are streamed as NDJSON (one JSON object per line) to stdout,
+    or to output_path, as soon as each agent produces them. Progress messages
+    and the final summary go to stderr. With metrics_dir, a per-run metrics
+    JSON file and a Prometheus text file are written there. With cassette_path,
+    model and web search traffic is recorded to or replayed from that cassette.
+    With sessions_db, the session is checkpointed to SQLite; resume continues
+    the checkpointed session from its last completed stage. With
+    stage_memo_path, stages whose inputs were seen before are served from that
+    stage memo instead of calling their models. With deadline_seconds, the run
+    is bounded end to end: refinement is cut short as the deadline nears and
+    the best meal plan so far is returned.
+    """
     
+    from google.adk.plugins.logging_plugin import LoggingPlugin
+    from google.adk.runners import Runner
+
+    from .cassette import CassettePlugin
+    from .checkpoint import CheckpointPlugin, create_session_service, open_session
+    from .deadline import DeadlinePlugin
+    from .memo import StageMemo, StageMemoPlugin
+    from .metrics import MetricsPlugin
+
+    nutritionist_agent = get_nutritionist_agent()
+
     # Initialize session service and runner
-    session_service = InMemorySessionService()
-    await session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID)
-    runner = Runner(agent=nutritionist_agent, app_name=APP_NAME, session_service=session_service, plugins=[LoggingPlugin()])
-    # runner = InMemoryRunner(
-    #     agent=nutritionist_agent,
-    #     plugins=[LoggingPlugin()]
-    # )
+    session_service = create_session_service(sessions_db)
+    await open_session(session_service, APP_NAME, USER_ID, SESSION_ID, resume=resume)
+    # LoggingPlugin prints to stdout, so it is only enabled when NDJSON goes to a file
+    plugins = [LoggingPlugin()] if output_path else []
+    plugins.append(CheckpointPlugin())
+    plugins.append(DeadlinePlugin(retry_config))
+    if metrics_dir:
+        plugins.append(MetricsPlugin(metrics_dir))
+    if cassette_path:
+        plugins.append(CassettePlugin(cassette_path, cassette_mode))
+    if stage_memo_path:
+        plugins.append(StageMemoPlugin(StageMemo(stage_memo_path), nutritionist_agent, load_patient_data))
+    runner = Runner(agent=nutritionist_agent, app_name=APP_NAME, session_service=session_service, plugins=plugins)
     
     # User query
     query = "Generate a meal plan for the user"
     content = types.Content(role='user', parts=[types.Part(text=query)])
     
-    print("=" * 80)
-    print("NUTRITIONIST AI AGENT SYSTEM")
-    print("=" * 80)
-    print(f"\nProcessing request: {query}\n")
-    print("-" * 80)
+    print("=" * 80, file=sys.stderr)
+    print("NUTRITIONIST AI AGENT SYSTEM", file=sys.stderr)
+    print("=" * 80, file=sys.stderr)
+    print(f"\nProcessing request: {query}\n", file=sys.stderr)
+    print("-" * 80, file=sys.stderr)
     
+    output = open(output_path, "a") if output_path else sys.stdout
+    started = time.perf_counter()
     try:
-        # Execute the agent workflow
-        events = runner.run(user_id=USER_ID, session_id=SESSION_ID, new_message=content)
-        agent_responses = []
         iteration_count = 0
-        # Display final meal plan 
-        # print("\n" + "=" * 80)
-        # print("FINAL MEAL PLAN")
-        # print("=" * 80)
-        # for event in events:
-        #     if event.is_final_response():
-        #         final_response = event.content.parts[0].text
-        #         print("Agent Response:", final_response)
-        
-        for event in events:
-            if hasattr(event, 'is_final_response') and event.is_final_response():
-                if hasattr(event, 'content') and event.content.parts:
-                    response = event.content.parts[0].text
-                    agent_name = event.author if hasattr(event, 'author') else "Unknown"
-                    
-                    # Track iterations
-                    if 'critic' in agent_name.lower():
-                        iteration_count += 1
-                    
-                    agent_responses.append({
-                        'agent': agent_name,
-                        'response': response,
-                        'iteration': iteration_count if iteration_count > 0 else None
-                    })
-        
-        # Parse and display final meal plan
-        if agent_responses:
-            final_response = agent_responses[-1]['response']
-            
-            # Try to parse as JSON for prettier display
+        final_meal_plan = None
+        deadline = time.time() + deadline_seconds if deadline_seconds else None
+
+        async def stream_events():
+            nonlocal iteration_count, final_meal_plan
+            async for event in runner.run_async(
+                user_id=USER_ID,
+                session_id=SESSION_ID,
+                new_message=content,
+                state_delta=deadline_state(deadline),
+            ):
+                if not event.actions or not event.actions.state_delta:
+                    continue
+                if "critique" in event.actions.state_delta:
+                    iteration_count += 1
+                for record in stage_records(event, started, iteration_count):
+                    output.write(json.dumps(record) + "\n")
+                    output.flush()
+                    print(f"[{record['elapsed_seconds']:>8.1f}s] {record['agent']} -> {record['key']}", file=sys.stderr)
+                    if record["key"] == "current_meal_plan":
+                        final_meal_plan = record["data"]
+
+        timed_out = False
+        if deadline:
             try:
-                final_json = json.loads(final_response)
-                
-                print("\n" + "=" * 80)
-                print("FINAL REFINED & VALIDATED MEAL PLAN (JSON)")
-                print("=" * 80)
-                print(json.dumps(final_json, indent=2))
-                
-                # Extract and display key information
-                if 'meal_plan' in final_json:
-                    print("\n" + "=" * 80)
-                    print("MEAL SUMMARY")
-                    print("=" * 80)
-                    
-                    for meal_name, meal_data in final_json['meal_plan'].items():
-                        if meal_data.get('include', True):
-                            print(f"\n{meal_name.upper().replace('_', ' ')}:")
-                            print(f"  Time: {meal_data.get('time', 'N/A')}")
-                            print(f"  Calories: {meal_data.get('totals', {}).get('calories', 0)} kcal")
-                            print(f"  Foods:")
-                            for food in meal_data.get('foods', []):
-                                print(f"    - {food.get('name')} ({food.get('quantity')})")
-                    
-                    if 'daily_totals' in final_json:
-                        print(f"\nDAILY TOTALS:")
-                        totals = final_json['daily_totals']
-                        print(f"  Calories: {totals.get('calories', 0)} kcal")
-                        print(f"  Protein: {totals.get('protein_g', 0)}g")
-                        print(f"  Carbs: {totals.get('carbs_g', 0)}g")
-                        print(f"  Fats: {totals.get('fats_g', 0)}g")
-                
-            except json.JSONDecodeError:
-                # If not JSON, display as text
-                print("\n" + "=" * 80)
-                print("FINAL OUTPUT")
-                print("=" * 80)
-                print(final_response)
-            
-            # # Show refinement summary
-            # print("\n" + "=" * 80)
-            # print("REFINEMENT SUMMARY")
-            # print("=" * 80)
-            # print(f"Total refinement iterations: {iteration_count}")
-            
-            # # Show critique history
-            # critic_responses = [r for r in agent_responses if 'critic' in r['agent'].lower()]
-            # if critic_responses:
-            #     print(f"\nCritique iterations: {len(critic_responses)}")
-            #     for idx, critic in enumerate(critic_responses, 1):
-            #         print(f"\n--- Iteration {idx} Critique ---")
-            #         try:
-            #             critique_json = json.loads(critic['response'])
-            #             print(f"Status: {critique_json.get('status', 'UNKNOWN')}")
-            #             print(f"Summary: {critique_json.get('summary', 'N/A')}")
-            #             if critique_json.get('issues'):
-            #                 print(f"Issues found: {len(critique_json['issues'])}")
-            #         except:
-            #             print(critic['response'][:300] + "...")
-                        
+                await asyncio.wait_for(stream_events(), deadline_seconds + DEADLINE_GRACE_SECONDS)
+            except asyncio.TimeoutError:
+                timed_out = True
+                print("\n⚠️ Deadline reached; returning the best meal plan so far", file=sys.stderr)
         else:
-            print("\n⚠️ No final response received from agents")
+            await stream_events()
+
+        session = await session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID)
+        output.write(json.dumps({
+            "type": "run_complete",
+            "iterations": iteration_count,
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+            "degraded": bool(timed_out or (session and session.state.get(DEGRADED_KEY))),
+        }) + "\n")
+        output.flush()
+
+        if final_meal_plan is None:
+            # Every stage may have been restored from the checkpoint
+            final_meal_plan = load_state_json(session.state.get("current_meal_plan")) if session else None
+
+        if isinstance(final_meal_plan, dict) and 'meal_plan' in final_meal_plan:
+            print_meal_summary(final_meal_plan)
+        elif final_meal_plan is None:
+            print("\n⚠️ No meal plan received from agents", file=sys.stderr)
 
-        
     except Exception as e:
-        print(f"\n❌ Error occurred: {str(e)}")
+        print(f"\n❌ Error occurred: {str(e)}", file=sys.stderr)
         traceback.print_exc()
     finally:
+        if output_path:
+            output.close()
         try:
             await runner.close()
-            print("\n✅ Runner closed successfully")
+            print("\n✅ Runner closed successfully", file=sys.stderr)
         except Exception as cleanup_error:
-            print(f"⚠️ Cleanup error (can be ignored): {cleanup_error}")
+            print(f"⚠️ Cleanup error (can be ignored): {cleanup_error}", file=sys.stderr)
 
 
 # Entry point
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    from .cassette import MODES as CASSETTE_MODES
+
+    parser = argparse.ArgumentParser(description="Run the nutritionist agent and stream stage outputs as NDJSON")
+    parser.add_argument("--output", "-o", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--metrics-dir", help="Directory for per-run metrics JSON and metrics.prom")
+    parser.add_argument("--cassette", help="Cassette file for recording or replaying model and search traffic")
+    parser.add_argument("--cassette-mode", choices=CASSETTE_MODES, default="replay")
+    parser.add_argument("--sessions-db", help="SQLite file for the checkpointed session")
+    parser.add_argument("--resume", action="store_true", help="Resume the checkpointed session from its last completed stage")
+    parser.add_argument("--stage-memo", help="SQLite stage memo for reusing stage outputs across runs")
+    parser.add_argument("--deadline", type=float, help="End-to-end seconds for the run; returns the best plan so far when reached")
+    args = parser.parse_args()
+    asyncio.run(main(
+        args.output, args.metrics_dir, args.cassette, args.cassette_mode, args.sessions_db, args.resume,
+        args.stage_memo, args.deadline,
+    ))
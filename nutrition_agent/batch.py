@@ -0,0 +1,323 @@
+"""
+Batch meal-plan generation for a roster of patients.
+
+Each manifest entry gets its own session and all runs share one Runner. Up to
+`concurrency` pipelines execute at once; results are yielded as soon as each
+patient finishes, and a failure only affects that patient's record.
+
+Manifest format (JSON array or JSON Lines), one object per patient:
+
+    {"patient_id": "p001", "questionnaire_path": "...", "measurements_path": "..."}
+
+With --patient-store, entries only need a patient_id; the patient's data is
+read from the store (see patient_store.py).
+
+Usage:
+    python -m nutrition_agent.batch roster.jsonl --output plans.jsonl --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import traceback
+from typing import Dict, Any, List, AsyncIterator, Optional, Sequence
+
+from google.adk.runners import Runner
+from google.genai import types
+
+from .agent import get_nutritionist_agent, APP_NAME, load_patient_data, retry_config
+from .json_utils import load_state_json
+from .metrics import MetricsPlugin
+from .checkpoint import CheckpointPlugin, create_session_service, open_session, session_id_for
+from .compaction import evict_session
+from .cassette import CassettePlugin, MODES as CASSETTE_MODES
+from .memo import StageMemo, StageMemoPlugin
+from .deadline import DeadlinePlugin, DEGRADED_KEY, DEADLINE_GRACE_SECONDS, deadline_state
+
+DEFAULT_CONCURRENCY = 4
+QUERY = "Generate a meal plan for the user"
+
+# Manifest fields copied into the patient's session state
+PATIENT_STATE_KEYS = ["patient_id", "questionnaire_path", "measurements_path", "patient_store_path"]
+RESULT_STATE_KEYS = ["patient_health_data", "nutrition_requirements", "current_meal_plan", "critique"]
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """
+    Load a patient manifest from a JSON array or JSON Lines file.
+
+    Args:
+        path: Manifest file path
+
+    Returns:
+        A list of patient entries, each with a patient_id
+    """
+    with open(path, "r") as manifest_file:
+        text = manifest_file.read().strip()
+    if text.startswith("["):
+        patients = json.loads(text)
+    else:
+        patients = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for index, patient in enumerate(patients):
+        patient.setdefault("patient_id", f"patient-{index + 1}")
+    return patients
+
+
+async def _drain(events: AsyncIterator[Any]) -> None:
+    async for _ in events:
+        pass
+
+
+async def run_patient(
+    runner: Runner,
+    patient: Dict[str, Any],
+    semaphore: asyncio.Semaphore,
+    resume: bool = False,
+    retries: int = 0,
+    deadline_seconds: Optional[float] = None,
+    evict: bool = True,
+    run_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Run the full nutritionist pipeline for one patient in its own session.
+
+    A failed attempt is retried in the same session, so with a CheckpointPlugin
+    on the runner the retry resumes from the last completed stage.
+
+    With deadline_seconds, the deadline (counted from when the patient starts
+    running, across retries) is put in session state for a DeadlinePlugin on
+    the runner, and the run is cut off shortly after it. A run that ends at
+    the deadline with a meal plan is still "ok", with "degraded" set.
+
+    Args:
+        runner: Shared runner for nutritionist_agent
+        patient: Manifest entry
+        semaphore: Bounds how many pipelines run at once
+        resume: Continue the patient's existing session (see checkpoint.session_id_for)
+        retries: Extra attempts after a failure
+        deadline_seconds: End-to-end time budget for the patient
+        evict: Delete an in-memory session once its outputs are in the result record
+        run_id: Run name added to checkpointed session IDs; pass the same one to resume
+
+    Returns:
+        A result record with status "ok" and the final state outputs, or
+        status "error" with the error message
+    """
+    patient_id = str(patient["patient_id"])
+    result: Dict[str, Any] = {"patient_id": patient_id}
+    async with semaphore:
+        started = time.perf_counter()
+        session_service = runner.session_service
+        session_id = session_id_for(patient_id, session_service, run_id, resume)
+        deadline = time.time() + deadline_seconds if deadline_seconds else None
+        for attempt in range(1, retries + 2):
+            result = {"patient_id": patient_id, "attempts": attempt}
+            try:
+                session = await open_session(
+                    session_service,
+                    runner.app_name,
+                    patient_id,
+                    session_id,
+                    state={key: patient[key] for key in PATIENT_STATE_KEYS if key in patient},
+                    resume=resume or attempt > 1,
+                )
+                content = types.Content(role="user", parts=[types.Part(text=QUERY)])
+                events = runner.run_async(
+                    user_id=patient_id,
+                    session_id=session.id,
+                    new_message=content,
+                    state_delta=deadline_state(deadline),
+                )
+                timed_out = False
+                if deadline:
+                    try:
+                        await asyncio.wait_for(_drain(events), deadline - time.time() + DEADLINE_GRACE_SECONDS)
+                    except asyncio.TimeoutError:
+                        # Fall through to whatever plan the session holds
+                        timed_out = True
+                else:
+                    await _drain(events)
+
+                session = await session_service.get_session(
+                    app_name=runner.app_name, user_id=patient_id, session_id=session.id
+                )
+                state = session.state if session else {}
+                result["status"] = "ok"
+                result["session_id"] = session.id if session else None
+                for key in RESULT_STATE_KEYS:
+                    value = state.get(key)
+                    result[key] = load_state_json(value) if value is not None else None
+                if deadline:
+                    result["degraded"] = bool(timed_out or state.get(DEGRADED_KEY))
+                if result["current_meal_plan"] is None:
+                    result["status"] = "error"
+                    result["error"] = "Pipeline finished without a meal plan"
+            except Exception as e:
+                result["status"] = "error"
+                result["error"] = f"{type(e).__name__}: {e}"
+                result["traceback"] = traceback.format_exc()
+            if result["status"] == "ok" or (deadline and time.time() >= deadline):
+                break
+        if evict:
+            await evict_session(session_service, runner.app_name, patient_id, session_id)
+        result["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def run_batch(
+    patients: Sequence[Dict[str, Any]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    runner: Optional[Runner] = None,
+    resume: bool = False,
+    retries: int = 0,
+    deadline_seconds: Optional[float] = None,
+    run_id: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Generate meal plans for many patients concurrently.
+
+    Args:
+        patients: Manifest entries
+        concurrency: Maximum number of pipelines running at once
+        runner: Runner to use; one with a compacting in-memory session service,
+            a CheckpointPlugin and a DeadlinePlugin is created if omitted
+        resume: Continue each patient's existing session
+        retries: Extra attempts per failed patient, resumed from its checkpoint
+        deadline_seconds: End-to-end time budget per patient
+        run_id: Run name added to checkpointed session IDs
+
+    Yields:
+        One result record per patient, in completion order
+    """
+    owns_runner = runner is None
+    if runner is None:
+        runner = Runner(
+            agent=get_nutritionist_agent(),
+            app_name=APP_NAME,
+            session_service=create_session_service(None),
+            plugins=[CheckpointPlugin(), DeadlinePlugin(retry_config)],
+        )
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    tasks = [
+        asyncio.create_task(run_patient(
+            runner, patient, semaphore, resume=resume, retries=retries, deadline_seconds=deadline_seconds,
+            run_id=run_id,
+        ))
+        for patient in patients
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        if owns_runner:
+            await runner.close()
+
+
+async def main_batch(
+    manifest_path: str,
+    output_path: Optional[str],
+    concurrency: int,
+    metrics_dir: Optional[str] = None,
+    cassette_path: Optional[str] = None,
+    cassette_mode: str = "replay",
+    patient_store_path: Optional[str] = None,
+    sessions_db: Optional[str] = None,
+    resume: bool = False,
+    retries: int = 0,
+    stage_memo_path: Optional[str] = None,
+    deadline_seconds: Optional[float] = None,
+    run_id: Optional[str] = None,
+) -> int:
+    """
+    Run a manifest and stream results as JSON Lines.
+
+    Args:
+        manifest_path: Patient manifest file
+        output_path: JSON Lines output file, or None for stdout
+        concurrency: Maximum number of pipelines running at once
+        metrics_dir: Directory for per-run metrics, metrics.prom and the batch summary.json
+        cassette_path: Cassette to record model and web search traffic to, or replay it from
+        cassette_mode: "record", "replay" or "auto"
+        patient_store_path: Patient store used for entries without their own patient_store_path
+        sessions_db: SQLite file for checkpointed sessions (in-memory if omitted)
+        resume: Continue each patient's checkpointed session instead of starting over
+        retries: Extra attempts per failed patient, resumed from its checkpoint
+        stage_memo_path: Stage memo for reusing stage outputs of previously seen inputs
+        deadline_seconds: End-to-end time budget per patient; refinement is cut short as it nears
+        run_id: Run name added to checkpointed session IDs; --resume needs the same one
+
+    Returns:
+        Number of patients that failed
+    """
+    patients = load_manifest(manifest_path)
+    if patient_store_path:
+        for patient in patients:
+            patient.setdefault("patient_store_path", patient_store_path)
+    output = open(output_path, "a") if output_path else sys.stdout
+    failures = 0
+    started = time.perf_counter()
+    metrics = MetricsPlugin(metrics_dir, prometheus_interval=None) if metrics_dir else None
+    plugins = [CheckpointPlugin(), DeadlinePlugin(retry_config)] + ([metrics] if metrics else [])
+    if cassette_path:
+        plugins.append(CassettePlugin(cassette_path, cassette_mode))
+    if stage_memo_path:
+        plugins.append(StageMemoPlugin(StageMemo(stage_memo_path), get_nutritionist_agent(), load_patient_data))
+    runner = Runner(
+        agent=get_nutritionist_agent(),
+        app_name=APP_NAME,
+        session_service=create_session_service(sessions_db),
+        plugins=plugins,
+    )
+    try:
+        async for result in run_batch(
+            patients, concurrency=concurrency, runner=runner, resume=resume, retries=retries,
+            deadline_seconds=deadline_seconds, run_id=run_id,
+        ):
+            if result["status"] != "ok":
+                failures += 1
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            degraded = " (degraded at deadline)" if result.get("degraded") else ""
+            print(f"[{result['status']}] {result['patient_id']} in {result['elapsed_seconds']}s{degraded}", file=sys.stderr)
+    finally:
+        if output_path:
+            output.close()
+        # Closing the runner closes the metrics plugin, which writes metrics.prom once
+        await runner.close()
+    if metrics:
+        metrics.write_summary(os.path.join(metrics_dir, "summary.json"))
+    print(
+        f"Processed {len(patients)} patients ({failures} failed) in {time.perf_counter() - started:.1f}s",
+        file=sys.stderr,
+    )
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate meal plans for a patient manifest")
+    parser.add_argument("manifest", help="JSON or JSON Lines file with one entry per patient")
+    parser.add_argument("--output", "-o", help="JSON Lines output file (default: stdout)")
+    parser.add_argument("--concurrency", "-c", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--metrics-dir", help="Directory for per-run metrics JSON, metrics.prom and summary.json")
+    parser.add_argument("--cassette", help="Cassette file for recording or replaying model and search traffic")
+    parser.add_argument("--cassette-mode", choices=CASSETTE_MODES, default="replay")
+    parser.add_argument("--patient-store", help="JSON Lines or SQLite patient store keyed by patient_id")
+    parser.add_argument("--sessions-db", help="SQLite file for checkpointed sessions")
+    parser.add_argument("--resume", action="store_true", help="Resume each patient's checkpointed session")
+    parser.add_argument("--retries", type=int, default=0, help="Extra attempts per failed patient, resumed from its checkpoint")
+    parser.add_argument("--stage-memo", help="SQLite stage memo for reusing stage outputs across runs")
+    parser.add_argument("--run-id", help="Name for this run's checkpointed sessions; resume with the same --run-id")
+    parser.add_argument("--deadline", type=float, help="End-to-end seconds per patient; returns the best plan so far when reached")
+    args = parser.parse_args()
+    if args.resume and not args.sessions_db:
+        parser.error("--resume needs the --sessions-db the sessions were checkpointed to")
+    failures = asyncio.run(main_batch(
+        args.manifest, args.output, args.concurrency, args.metrics_dir, args.cassette, args.cassette_mode,
+        args.patient_store, args.sessions_db, args.resume, args.retries, args.stage_memo, args.deadline,
+        args.run_id,
+    ))
+    sys.exit(1 if failures else 0)
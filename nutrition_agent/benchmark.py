@@ -0,0 +1,266 @@
+"""
+Offline load benchmark for the nutritionist_agent orchestration.
+
+Every model in the graph is replaced by FakeGeminiModel, then batches of
+synthetic patients are run at each concurrency level. For each level the
+report records plans per second, per-patient latency percentiles, per-stage
+overhead (agent wall time minus the time spent in its model calls), model
+calls, retries and memory.
+
+Reports are JSON. Pass --baseline with an earlier report to list regressions
+beyond --threshold; the exit status is 1 when any regression is found.
+
+Usage:
+    python -m nutrition_agent.benchmark --concurrency 1 10 100 1000 \\
+        --latency lognormal:0.2,0.5 --approve-after 2 --report bench.json --baseline previous.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+
+from google.adk import version as adk_version
+from google.adk.runners import Runner
+
+from .agent import get_nutritionist_agent, APP_NAME
+from .batch import run_batch
+from .compaction import CompactingSessionService
+from .fake_model import install_fake_models
+from .metrics import MetricsPlugin, summarize
+
+DEFAULT_LEVELS = [1, 10, 100, 1000]
+DEFAULT_THRESHOLD = 0.10
+# Per-stage overhead changes smaller than this are treated as noise
+MIN_OVERHEAD_DELTA_SECONDS = 0.001
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def stage_overheads(runs: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """
+    Average wall time, model time and orchestration overhead per agent.
+
+    Args:
+        runs: MetricsPlugin.completed_runs
+
+    Returns:
+        Agent name -> wall_mean, model_mean and overhead_mean in seconds, per run
+    """
+    totals: Dict[str, Dict[str, float]] = defaultdict(lambda: {"wall": 0.0, "model": 0.0})
+    for run in runs:
+        by_agent = run["model_calls"]["by_agent"]
+        for name, wall in run["agents"].items():
+            totals[name]["wall"] += wall["sum"]
+            totals[name]["model"] += (by_agent.get(name) or {}).get("latency_seconds", {}).get("sum", 0.0)
+    count = max(1, len(runs))
+    return {
+        name: {
+            "wall_mean": round(values["wall"] / count, 6),
+            "model_mean": round(values["model"] / count, 6),
+            "overhead_mean": round((values["wall"] - values["model"]) / count, 6),
+        }
+        for name, values in sorted(totals.items())
+    }
+
+
+async def run_level(concurrency: int, patients: int, trace_memory: bool = False) -> Dict[str, Any]:
+    """
+    Run one batch of synthetic patients at a concurrency level.
+
+    Args:
+        concurrency: Maximum number of pipelines running at once
+        patients: Number of patients in the batch
+        trace_memory: Measure peak Python heap with tracemalloc (slower)
+
+    Returns:
+        The level's report entry
+    """
+    metrics = MetricsPlugin(max_kept_runs=None)
+    runner = Runner(
+        agent=get_nutritionist_agent(),
+        app_name=APP_NAME,
+        session_service=CompactingSessionService(),
+        plugins=[metrics],
+    )
+    manifest = [{"patient_id": f"bench-{concurrency}-{index + 1}"} for index in range(patients)]
+
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    results = []
+    try:
+        async for result in run_batch(manifest, concurrency=concurrency, runner=runner):
+            results.append(result)
+    finally:
+        wall = time.perf_counter() - started
+        traced_peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+        await runner.close()
+
+    ok = [r for r in results if r["status"] == "ok"]
+    aggregate = metrics.aggregate()
+    counters = aggregate["counters"]
+    approved = sum(1 for r in ok if (r.get("critique") or {}).get("status") == "APPROVED")
+    entry = {
+        "concurrency": concurrency,
+        "patients": patients,
+        "ok": len(ok),
+        "failed": len(results) - len(ok),
+        "approved": approved,
+        "wall_seconds": round(wall, 3),
+        "plans_per_second": round(len(ok) / wall, 3) if wall else 0.0,
+        "patient_latency_seconds": summarize([r["elapsed_seconds"] for r in results]),
+        "loop_iterations": (aggregate["summaries"].get("loop_iterations") or {}).get("", summarize([])),
+        "model_calls": int(sum(counters.get("model_calls", {}).values())),
+        "model_errors": int(sum(counters.get("model_errors", {}).values())),
+        "retryable_responses": int(sum(counters.get("retryable_responses", {}).values())),
+        "prompt_tokens": int(sum(counters.get("prompt_tokens", {}).values())),
+        "max_rss_mb": _max_rss_mb(),
+        "traced_peak_mb": round(traced_peak / (1024 * 1024), 1) if traced_peak is not None else None,
+        "stages": stage_overheads(metrics.completed_runs),
+    }
+    return entry
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    List regressions of a report against a baseline, per matching concurrency level.
+
+    Args:
+        current: New report
+        baseline: Earlier report
+        threshold: Relative change counted as a regression (0.1 = 10%)
+
+    Returns:
+        Human-readable regression descriptions
+    """
+    regressions = []
+    baseline_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+
+    def worse(label: str, new: Optional[float], old: Optional[float], higher_is_better: bool = False) -> None:
+        if not new or not old:
+            return
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > threshold:
+            regressions.append(f"{label}: {old:g} -> {new:g} ({change:+.0%})")
+
+    for level in current.get("levels", []):
+        old = baseline_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        prefix = f"concurrency {level['concurrency']}"
+        worse(f"{prefix} plans_per_second", level["plans_per_second"], old["plans_per_second"], higher_is_better=True)
+        worse(f"{prefix} p95 patient latency", level["patient_latency_seconds"]["p95"], old["patient_latency_seconds"]["p95"])
+        worse(f"{prefix} max_rss_mb", level["max_rss_mb"], old["max_rss_mb"])
+        worse(f"{prefix} traced_peak_mb", level.get("traced_peak_mb"), old.get("traced_peak_mb"))
+        if level["failed"] > old["failed"]:
+            regressions.append(f"{prefix} failed: {old['failed']} -> {level['failed']}")
+        for name, stage in level["stages"].items():
+            old_stage = old["stages"].get(name)
+            if old_stage and stage["overhead_mean"] - old_stage["overhead_mean"] > MIN_OVERHEAD_DELTA_SECONDS:
+                worse(f"{prefix} {name} overhead_mean", stage["overhead_mean"], old_stage["overhead_mean"])
+    return regressions
+
+
+async def run_benchmark(
+    levels: List[int],
+    patients: Optional[int] = None,
+    trace_memory: bool = False,
+    **fake_config: Any,
+) -> Dict[str, Any]:
+    """
+    Install fake models and run every concurrency level.
+
+    Args:
+        levels: Concurrency levels to run
+        patients: Patients per level (default: the level's concurrency)
+        trace_memory: Measure peak Python heap with tracemalloc
+        **fake_config: FakeGeminiModel fields
+
+    Returns:
+        The benchmark report
+    """
+    install_fake_models(get_nutritionist_agent(), **fake_config)
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "adk": adk_version.__version__,
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "patients": patients,
+            "trace_memory": trace_memory,
+            **{key: value for key, value in fake_config.items() if key != "retry_options"},
+        },
+        "levels": [],
+    }
+    for concurrency in levels:
+        entry = await run_level(concurrency, patients or concurrency, trace_memory)
+        report["levels"].append(entry)
+        print(
+            f"concurrency {concurrency:>5}: {entry['ok']}/{entry['patients']} ok, "
+            f"{entry['plans_per_second']:.2f} plans/s, p95 {entry['patient_latency_seconds']['p95']:.3f}s, "
+            f"max RSS {entry['max_rss_mb']} MB",
+            file=sys.stderr,
+        )
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the agent orchestration with fake models")
+    parser.add_argument("--concurrency", "-c", type=int, nargs="+", default=DEFAULT_LEVELS)
+    parser.add_argument("--patients", "-n", type=int, help="Patients per level (default: the concurrency)")
+    parser.add_argument("--latency", default="lognormal:0.2,0.5", help="fixed:S | uniform:LO,HI | normal:MEAN,SD | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 503 per attempt")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of an injected 429 per attempt")
+    parser.add_argument("--approve-after", type=int, default=1, help="Critic approves on its Nth review")
+    parser.add_argument("--retry-delay-scale", type=float, default=0.01, help="Scale for the emulated retry backoff")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="Record peak Python heap with tracemalloc")
+    parser.add_argument("--report", "-o", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(
+        args.concurrency,
+        patients=args.patients,
+        trace_memory=args.trace_memory,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        approve_after=args.approve_after,
+        retry_delay_scale=args.retry_delay_scale,
+        seed=args.seed,
+    ))
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as baseline_file:
+            regressions = compare_reports(report, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if not regressions:
+            print("No regressions against baseline", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,315 @@
+"""
+Bulk nutrient lookup: every food of a meal in one tool call.
+
+Verifying a meal with lookup_food_nutrition costs one model turn per food, and
+each food missing from the local database costs another web_search_tool turn
+(a nested web_search_agent run), all serialized. lookup_foods_nutrition takes
+the whole list of foods and quantities instead:
+
+- foods in the local food-composition database are resolved directly
+- the rest are searched concurrently through the wrapped search tool, once
+  per food name and for 100 g, so its cache and in-flight coalescing
+  (search_cache.py) share the query across quantities, items, agents and
+  sessions; the per-100g values read from the summary are scaled to each
+  quantity locally, like a database record
+- the result is one table with a row of nutrients per item
+
+Each web search goes through the plugins' tool callbacks with its own
+function call ID, so cassettes and metrics see it as they would a direct
+web_search_tool call.
+"""
+import asyncio
+import json
+import logging
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+from google.adk.tools import FunctionTool
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+
+from .food_db import NUTRIENT_FIELDS, get_food_database, normalize_name, nutrients_for, parse_quantity
+from .json_utils import dumps_compact
+
+logger = logging.getLogger(__name__)
+
+# Web searches a single bulk lookup runs at once
+MAX_CONCURRENT_SEARCHES = 8
+# Foods accepted in a single call
+MAX_ITEMS = 40
+
+COLUMNS = ["food_name", "quantity", "matched_name", "match_type", "grams"] + NUTRIENT_FIELDS
+# match_type of rows scaled from the per-100g values of a web search summary
+# (the database's are "exact", "prefix" and "fuzzy", see FoodDatabase.lookup)
+WEB_SEARCH_MATCH = "web_search"
+# Nutrients a search summary must give for its values to be used
+REQUIRED_NUTRIENTS = ["calories", "protein_g", "carbs_g", "fats_g"]
+
+# Label -> (field, priority); a more specific label (total fat) wins over a generic one (fat).
+# Labels mapped to None (saturated fat, net carbs, ...) are matched so that their values are
+# never taken for another field.
+_NUTRIENT_LABELS: Dict[str, Optional[Tuple[str, int]]] = {
+    "calories": ("calories", 1), "energy": ("calories", 1),
+    "protein": ("protein_g", 1),
+    "total carbohydrates": ("carbs_g", 2), "total carbohydrate": ("carbs_g", 2), "total carbs": ("carbs_g", 2),
+    "carbohydrates": ("carbs_g", 1), "carbohydrate": ("carbs_g", 1), "carbs": ("carbs_g", 1),
+    "total fat": ("fats_g", 2), "total fats": ("fats_g", 2), "fat": ("fats_g", 1), "fats": ("fats_g", 1),
+    "dietary fiber": ("fiber_g", 2), "dietary fibre": ("fiber_g", 2), "fiber": ("fiber_g", 1), "fibre": ("fiber_g", 1),
+    "sodium": ("sodium_mg", 1),
+    "saturated fat": None, "saturated fats": None, "trans fat": None, "trans fats": None,
+    "monounsaturated fat": None, "polyunsaturated fat": None, "net carbs": None,
+}
+_KJ_PER_KCAL = 4.184
+_LABEL_PATTERN = "|".join(
+    re.escape(label).replace(r"\ ", r"\s+") for label in sorted(_NUTRIENT_LABELS, key=len, reverse=True)
+)
+# A label, an optional "per 100 g" or "(kcal)" qualifier, an optional ":" or "=", then the
+# value and its unit; a kJ value may be followed by its kcal equivalent in parentheses.
+# Any other text between label and number means the number is not the label's value.
+_NUTRIENT_RE = re.compile(
+    r"\b(" + _LABEL_PATTERN + r")(?:_g|_mg|_kcal)?\b"
+    r"(?:\s*\(?\s*per\s+100\s*g\s*\)?|\s*\((?:kcal|kj|g|mg)\))?"
+    r"\s*[:=]?\s*(\d+(?:\.\d+)?)\s*(kcal|kj|mg|g)?\b"
+    r"(?:\s*\(\s*(\d+(?:\.\d+)?)\s*kcal\s*\))?",
+    re.IGNORECASE,
+)
+_PORTION_RE = re.compile(
+    r"\b(piece|cup|katori|bowl|glass|slice|tbsp|tsp)\b\s*[:=(]?\s*(\d+(?:\.\d+)?)\s*(?:g|ml)\b",
+    re.IGNORECASE,
+)
+
+
+def _nutrient_value(field: str, value: float, unit: str, kcal: Optional[str]) -> float:
+    """Convert a labelled value to the unit of its field (kcal, g or mg)."""
+    if field == "calories":
+        if unit == "kj":
+            return float(kcal) if kcal else round(value / _KJ_PER_KCAL, 1)
+        return value
+    if field == "sodium_mg":
+        return value * 1000 if unit == "g" else value
+    return value / 1000 if unit == "mg" else value
+
+
+def _local_row(food_name: str, quantity: str) -> Tuple[Optional[List[Any]], Optional[Dict[str, Any]]]:
+    """
+    Resolve one item from the local database.
+
+    Returns:
+        (table row, None) when found with a known unit, (None, unresolved entry)
+        when the unit is unknown, or (None, None) when the food is not in the database
+    """
+    result = get_food_database().lookup(food_name)
+    if result is None:
+        return None, None
+    record, match_type, _ = result
+    row = _scaled_row(food_name, quantity, record, match_type)
+    if row is None:
+        return None, _unresolved(food_name, quantity, record, match_type)
+    return row, None
+
+
+def _not_found(food_name: str, quantities: List[str], **details: Any) -> Dict[str, Any]:
+    """A "web_search" entry for a food without usable values, with similar database foods if any."""
+    entry: Dict[str, Any] = {"food_name": food_name, "quantities": quantities, **details}
+    suggestions = get_food_database().suggest(food_name)
+    if suggestions:
+        entry["suggestions"] = suggestions
+    return entry
+
+
+async def _run_tool(tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext, index: int) -> Any:
+    """Run a tool from inside another tool call, through the plugins' tool callbacks."""
+    invocation_context = tool_context._invocation_context
+    context = ToolContext(
+        invocation_context,
+        event_actions=tool_context.actions,
+        function_call_id=f"{tool_context.function_call_id or 'lookup_foods_nutrition'}:{index}",
+    )
+    plugins = invocation_context.plugin_manager
+    result = await plugins.run_before_tool_callback(tool=tool, tool_args=args, tool_context=context)
+    if result is None:
+        try:
+            result = await tool.run_async(args=args, tool_context=context)
+        except Exception as e:
+            result = await plugins.run_on_tool_error_callback(tool=tool, tool_args=args, tool_context=context, error=e)
+            if result is None:
+                raise
+    altered = await plugins.run_after_tool_callback(tool=tool, tool_args=args, tool_context=context, result=result)
+    return altered if altered is not None else result
+
+
+def search_request(food_name: str) -> str:
+    """
+    Build the web search request for a food missing from the local database.
+
+    The request names only the food, not the quantity, so every quantity of a
+    food shares one cached search.
+    """
+    return (
+        f"{food_name} nutrition facts per 100 g. Give each value on its own line as "
+        "calories: <kcal>, protein_g, carbs_g, fats_g, fiber_g, sodium_mg, and the weight of "
+        "one piece, cup, katori and tbsp where it applies, e.g. 'katori: 150 g'"
+    )
+
+
+def parse_search_summary(food_name: str, summary: Any) -> Optional[Dict[str, Any]]:
+    """
+    Read per-100g nutrients and portion weights from a web search summary.
+
+    A value is only taken when it directly follows its label (after an
+    optional "per 100 g" qualifier and ":" or "="), so "Calories per 100 g: 52"
+    reads 52, not 100. Total fat wins over saturated or trans fat, kcal over
+    kJ, and values in the wrong unit (sodium in g, fat in mg) are converted.
+
+    Args:
+        food_name: Food the summary is about
+        summary: Summary text returned by the search tool
+
+    Returns:
+        A record shaped like a food database record ("name", "per_100g",
+        "portions"), or None if the summary lacks any of REQUIRED_NUTRIENTS
+    """
+    text = str(summary or "")
+    per_100g: Dict[str, float] = {}
+    priorities: Dict[str, int] = {}
+    for label, value, unit, kcal in _NUTRIENT_RE.findall(text):
+        entry = _NUTRIENT_LABELS[" ".join(label.lower().split())]
+        if entry is None:
+            continue
+        field, priority = entry
+        if priority > priorities.get(field, 0):
+            per_100g[field] = _nutrient_value(field, float(value), unit.lower(), kcal or None)
+            priorities[field] = priority
+    if any(field not in per_100g for field in REQUIRED_NUTRIENTS):
+        return None
+    portions: Dict[str, float] = {}
+    for unit, grams in _PORTION_RE.findall(text):
+        if float(grams) > 0:
+            portions.setdefault(unit.lower(), float(grams))
+    return {"name": food_name, "per_100g": per_100g, "portions": portions}
+
+
+def _scaled_row(food_name: str, quantity: str, record: Dict[str, Any], match_type: str) -> Optional[List[Any]]:
+    grams = parse_quantity(quantity, record)
+    if grams is None:
+        return None
+    nutrients = nutrients_for(record, grams)
+    row = [food_name, quantity, record["name"], match_type, round(grams, 1)]
+    return row + [nutrients.get(field) for field in NUTRIENT_FIELDS]
+
+
+def _unresolved(food_name: str, quantity: str, record: Dict[str, Any], match_type: str) -> Dict[str, Any]:
+    return {
+        "food_name": food_name,
+        "quantity": quantity,
+        "matched_name": record["name"],
+        "match_type": match_type,
+        "per_100g": record["per_100g"],
+        "portions_g": record["portions"],
+        "message": f"Unknown unit in quantity '{quantity}'; use portions_g to convert",
+    }
+
+
+class BulkFoodLookupTool(FunctionTool):
+    """lookup_foods_nutrition, keeping the search tool it falls back to so graph walks can reach its agent."""
+
+    def __init__(self, func, search_tool: BaseTool):
+        super().__init__(func=func)
+        self.search_tool = search_tool
+
+
+def make_bulk_lookup_tool(search_tool: BaseTool) -> BulkFoodLookupTool:
+    """
+    Build the lookup_foods_nutrition tool.
+
+    Args:
+        search_tool: Tool used for foods missing from the local database (web_search_tool)
+
+    Returns:
+        A tool resolving many foods per call
+    """
+
+    async def lookup_foods_nutrition(
+        food_names: List[str], quantities: List[str], tool_context: ToolContext
+    ) -> str:
+        """
+        Look up nutritional values for several foods at once. Use this to verify all foods of a meal in one call.
+
+        Args:
+            food_names: Names of the foods, e.g. ["chapati", "toor dal", "cucumber raita"]
+            quantities: Amount of each food, in the same order, e.g. ["2 pieces", "1 katori", "1 cup"]
+
+        Returns:
+            A JSON string with a table of nutrients per item ("columns" and one
+            row per item, nutrients for the given quantity, match_type telling
+            an exact database match from a fuzzy one or a web search), "unresolved"
+            items whose unit could not be converted (with per-100g values and
+            portions_g), and "web_search" per-100g summaries for foods not in
+            the local database whose values could not be read, with similar
+            database foods as "suggestions".
+        """
+        if not food_names:
+            return json.dumps({"error": "food_names is empty"})
+        if len(food_names) > MAX_ITEMS:
+            return json.dumps({"error": f"At most {MAX_ITEMS} foods per call, got {len(food_names)}"})
+        quantities = list(quantities or [])
+        if len(quantities) > len(food_names):
+            return json.dumps({"error": f"Got {len(quantities)} quantities for {len(food_names)} foods"})
+        quantities += ["100 g"] * (len(food_names) - len(quantities))
+
+        items: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        for name, quantity in zip(food_names, quantities):
+            items.setdefault((normalize_name(str(name)), str(quantity).strip().lower()), (str(name), str(quantity)))
+
+        rows: List[List[Any]] = []
+        unresolved: List[Dict[str, Any]] = []
+        missing: Dict[str, Tuple[str, List[str]]] = {}
+        for name, quantity in items.values():
+            row, entry = _local_row(name, quantity)
+            if row is not None:
+                rows.append(row)
+            elif entry is not None:
+                unresolved.append(entry)
+            else:
+                missing.setdefault(normalize_name(name), (name, []))[1].append(quantity)
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_SEARCHES)
+
+        async def search(index: int, name: str, food_quantities: List[str]) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    result = await _run_tool(search_tool, {"request": search_request(name)}, tool_context, index)
+                except Exception as e:
+                    logger.warning("bulk lookup: web search for %r failed: %s", name, e)
+                    return _not_found(name, food_quantities, error=f"Web search failed: {e}")
+            if isinstance(result, dict):
+                result = result.get("result", result)
+            record = parse_search_summary(name, result)
+            if record is None:
+                return _not_found(name, food_quantities, summary_per_100g=result)
+            return {"record": record, "quantities": food_quantities}
+
+        # Results are merged in input order, so the table does not depend on which search finishes first
+        searches: List[Dict[str, Any]] = []
+        for found in await asyncio.gather(
+            *(search(i, name, food_quantities) for i, (name, food_quantities) in enumerate(missing.values()))
+        ):
+            record = found.get("record")
+            if record is None:
+                searches.append(found)
+                continue
+            for quantity in found["quantities"]:
+                row = _scaled_row(record["name"], quantity, record, WEB_SEARCH_MATCH)
+                if row is not None:
+                    rows.append(row)
+                else:
+                    unresolved.append(_unresolved(record["name"], quantity, record, WEB_SEARCH_MATCH))
+
+        response: Dict[str, Any] = {"columns": COLUMNS, "rows": rows}
+        if unresolved:
+            response["unresolved"] = unresolved
+        if searches:
+            response["web_search"] = searches
+        return dumps_compact(response)
+
+    return BulkFoodLookupTool(lookup_foods_nutrition, search_tool)
@@ -0,0 +1,386 @@
+"""
+Deterministic nutrition requirements calculator.
+
+Implements the Mifflin-St Jeor / activity multiplier / meal split rules that
+were previously evaluated by the nutrition_calculator_agent model, producing
+the same `nutrition_requirements` JSON shape. Only the free-text guideline
+fields are left for the LLM to fill in.
+"""
+import re
+from typing import Dict, Any, List, Sequence, Union
+
+import numpy as np
+
+from .json_utils import load_state_json
+from .meal_plan import MEALS, REQUIRED_MEALS
+
+ACTIVITY_LEVELS = ["sedentary", "lightly_active", "moderately_active", "very_active"]
+ACTIVITY_MULTIPLIERS = {
+    "sedentary": 1.2,
+    "lightly_active": 1.375,
+    "moderately_active": 1.55,
+    "very_active": 1.725,
+}
+
+# Mifflin-St Jeor sex constant; "unknown" uses the midpoint of both equations
+SEX_CONSTANTS = {"male": 5.0, "female": -161.0, "unknown": -78.0}
+MIN_CALORIES = {"male": 1500.0, "female": 1200.0, "unknown": 1350.0}
+DEFAULT_AGE = 30.0
+
+WEIGHT_LOSS_DEFICIT = 500.0
+WEIGHT_GAIN_SURPLUS = 300.0
+
+SNACKS = [meal for meal in MEALS if meal not in REQUIRED_MEALS]
+MEAL_PERCENTAGES = {
+    "breakfast": 25,
+    "mid_morning_snack": 10,
+    "lunch": 30,
+    "evening_snack": 10,
+    "dinner": 25,
+}
+NO_SNACK_MEAL_PERCENTAGES = {
+    "breakfast": 30,
+    "mid_morning_snack": 0,
+    "lunch": 40,
+    "evening_snack": 0,
+    "dinner": 30,
+}
+
+KCAL_PER_GRAM = {"protein": 4.0, "carbohydrates": 4.0, "fats": 9.0}
+FIBER_GRAMS_PER_1000_KCAL = 14.0
+
+_CONDITION_KEYWORDS = {
+    "diabetes": ["diabet", "hba1c", "glucose", "insulin resist", "hyperglycemia"],
+    "hypertension": ["hypertens", "blood pressure"],
+    "high_cholesterol": ["cholesterol", "ldl", "triglycer", "dyslipid", "hyperlipid"],
+    "vitamin_deficiencies": ["vitamin", "deficien", "b12", "anemia", "anaemia", "ferritin", "iron"],
+}
+
+# Profile fields the BMR cannot be computed without
+REQUIRED_INPUTS = ["weight_kg", "height_cm"]
+
+# "3 meals and 2 snacks", "no snacks", "5 small meals"
+_COUNT_WORDS = {"no": 0, "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6}
+_COUNT = r"(\d+|" + "|".join(_COUNT_WORDS) + r")\s+(?:[a-z]+\s+)?"
+_SNACK_COUNT_RE = re.compile(r"\b" + _COUNT + r"snacks?\b")
+_MEAL_COUNT_RE = re.compile(r"\b" + _COUNT + r"meals?\b")
+_SKIPS_SNACKS_RE = re.compile(r"\b(?:without|skips?|skipping|avoids?)\s+(?:[a-z]+\s+)?snack")
+
+
+def _number(value: Any, default: float) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _count(text: str) -> int:
+    return int(text) if text.isdigit() else _COUNT_WORDS[text]
+
+
+def _missing_inputs(profile: Dict[str, Any]) -> List[str]:
+    return [field for field in REQUIRED_INPUTS if _number(profile.get(field), 0.0) <= 0]
+
+
+def _missing_inputs_error(missing: List[str]) -> Dict[str, Any]:
+    return {
+        "error": f"Cannot calculate requirements without {', '.join(missing)} in patient_profile",
+        "missing_inputs": missing,
+    }
+
+
+def _sex(profile: Dict[str, Any]) -> str:
+    gender = str(profile.get("gender", "unknown")).strip().lower()
+    return gender if gender in SEX_CONSTANTS else "unknown"
+
+
+def _activity_level(lifestyle: Dict[str, Any]) -> str:
+    level = str(lifestyle.get("exercise_level", "")).strip().lower().replace(" ", "_")
+    if level in ACTIVITY_MULTIPLIERS:
+        return level
+    minutes = _number(lifestyle.get("exercise_minutes_per_week"), 0.0)
+    if minutes < 60:
+        return "sedentary"
+    if minutes < 150:
+        return "lightly_active"
+    if minutes < 300:
+        return "moderately_active"
+    return "very_active"
+
+
+def _medical_texts(health_data: Dict[str, Any]) -> Dict[str, List[str]]:
+    conditions = health_data.get("medical_conditions") or {}
+    blood = health_data.get("blood_test_analysis") or {}
+    texts = [str(c) for c in conditions.get("current") or []]
+    texts += [str(r) for r in blood.get("health_risks") or []]
+    for abnormal in blood.get("abnormal_values") or []:
+        if isinstance(abnormal, dict) and abnormal.get("status") in ("high", "low"):
+            texts.append(f"{abnormal.get('parameter', '')} {abnormal.get('status')}")
+    deficiencies = [str(d) for d in blood.get("deficiencies") or []]
+    return {"conditions": texts, "deficiencies": deficiencies}
+
+
+def detect_conditions(health_data: Dict[str, Any]) -> Dict[str, Union[bool, List[str]]]:
+    """
+    Detect the medical conditions that change the calculated targets.
+
+    Args:
+        health_data: Parsed patient_health_data
+
+    Returns:
+        A dictionary of condition flags plus the list of detected deficiencies
+    """
+    texts = _medical_texts(health_data)
+    joined = " | ".join(texts["conditions"]).lower()
+    flags: Dict[str, Union[bool, List[str]]] = {}
+    for condition in ("diabetes", "hypertension", "high_cholesterol"):
+        flags[condition] = any(k in joined for k in _CONDITION_KEYWORDS[condition])
+    deficiencies = list(texts["deficiencies"])
+    for text in texts["conditions"]:
+        lowered = text.lower()
+        if any(k in lowered for k in _CONDITION_KEYWORDS["vitamin_deficiencies"]) and text not in deficiencies:
+            deficiencies.append(text)
+    flags["vitamin_deficiencies"] = deficiencies
+    return flags
+
+
+def _includes_snacks(health_data: Dict[str, Any], diabetes: bool) -> bool:
+    # Diabetic patients keep snacks to spread carbohydrate load across the day
+    if diabetes:
+        return True
+    frequency = str((health_data.get("dietary_preferences") or {}).get("eating_frequency", "")).lower()
+    snacks = _SNACK_COUNT_RE.search(frequency)
+    if snacks:
+        return _count(snacks.group(1)) > 0
+    if _SKIPS_SNACKS_RE.search(frequency):
+        return False
+    # A meal count without snacks: "3 meals a day" has none, "5 small meals" are main meals plus snacks
+    meals = _MEAL_COUNT_RE.search(frequency)
+    return not meals or _count(meals.group(1)) > len(REQUIRED_MEALS)
+
+
+def _macro_percentages(diabetes: bool, high_cholesterol: bool) -> Dict[str, int]:
+    fats = 25 if high_cholesterol else 30
+    if diabetes:
+        # Carbohydrates are capped and the remainder goes to protein
+        carbohydrates = 45
+        protein = 100 - carbohydrates - fats
+    else:
+        protein = 20
+        carbohydrates = 100 - protein - fats
+    return {"protein": protein, "carbohydrates": carbohydrates, "fats": fats}
+
+
+def _medical_adjustments(flags: Dict[str, Any], macros: Dict[str, int], fiber: int, sodium: int) -> Dict[str, str]:
+    not_applicable = "Not applicable"
+    deficiencies = flags["vitamin_deficiencies"]
+    return {
+        "diabetes": (
+            f"Carbohydrates limited to {macros['carbohydrates']}% of calories, fiber at least {fiber} g, "
+            "low-glycemic whole grains and carbohydrates spread across all meals"
+            if flags["diabetes"] else not_applicable
+        ),
+        "hypertension": (
+            f"Sodium limited to {sodium} mg/day; avoid pickles, papad and added salt; emphasise potassium-rich vegetables"
+            if flags["hypertension"] else not_applicable
+        ),
+        "high_cholesterol": (
+            f"Fats limited to {macros['fats']}% of calories with minimal saturated fat; prefer mustard/groundnut oil, "
+            "avoid ghee, butter and fried snacks"
+            if flags["high_cholesterol"] else not_applicable
+        ),
+        "vitamin_deficiencies": (
+            "Include food sources addressing: " + ", ".join(deficiencies)
+            if deficiencies else not_applicable
+        ),
+    }
+
+
+def _meal_distribution(total_calories: int, include_snacks: bool) -> Dict[str, Dict[str, Any]]:
+    percentages = MEAL_PERCENTAGES if include_snacks else NO_SNACK_MEAL_PERCENTAGES
+    distribution: Dict[str, Dict[str, Any]] = {}
+    for meal in MEALS:
+        entry: Dict[str, Any] = {
+            "percentage": percentages[meal],
+            "calories": int(round(total_calories * percentages[meal] / 100)),
+        }
+        if meal in SNACKS:
+            entry["include"] = include_snacks
+        distribution[meal] = entry
+    return distribution
+
+
+def calculate_requirements(patient_health_data: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Calculate daily nutrition requirements for a single patient.
+
+    Args:
+        patient_health_data: The patient_health_data JSON (string or parsed)
+
+    Returns:
+        A dictionary in the nutrition_requirements shape. The free-text
+        special_dietary_guidelines and additional_recommendations are empty.
+        Without a weight or height the dictionary is instead an "error" plus
+        the "missing_inputs" fields.
+    """
+    health_data = load_state_json(patient_health_data) or {}
+    profile = health_data.get("patient_profile") or {}
+    lifestyle = health_data.get("lifestyle_factors") or {}
+    missing = _missing_inputs(profile)
+    if missing:
+        return _missing_inputs_error(missing)
+
+    sex = _sex(profile)
+    weight = _number(profile.get("weight_kg"), 0.0)
+    height = _number(profile.get("height_cm"), 0.0)
+    age = _number(profile.get("age"), DEFAULT_AGE)
+    bmi = _number(profile.get("bmi"), weight / (height / 100) ** 2)
+
+    activity_level = _activity_level(lifestyle)
+    multiplier = ACTIVITY_MULTIPLIERS[activity_level]
+    bmr = 10 * weight + 6.25 * height - 5 * age + SEX_CONSTANTS[sex]
+    tdee = bmr * multiplier
+
+    if bmi >= 25:
+        target = tdee - WEIGHT_LOSS_DEFICIT
+    elif bmi < 18.5:
+        target = tdee + WEIGHT_GAIN_SURPLUS
+    else:
+        target = tdee
+    total_calories = int(round(max(target, MIN_CALORIES[sex])))
+
+    flags = detect_conditions(health_data)
+    macros = _macro_percentages(flags["diabetes"], flags["high_cholesterol"])
+    min_fiber = 30 if flags["diabetes"] or flags["high_cholesterol"] else 25
+    fiber = int(max(round(total_calories * FIBER_GRAMS_PER_1000_KCAL / 1000), min_fiber))
+    sodium = 1500 if flags["hypertension"] else 2300
+
+    return {
+        "daily_targets": {
+            "total_calories": total_calories,
+            "protein_grams": int(round(total_calories * macros["protein"] / 100 / KCAL_PER_GRAM["protein"])),
+            "protein_percentage": macros["protein"],
+            "carbohydrates_grams": int(round(total_calories * macros["carbohydrates"] / 100 / KCAL_PER_GRAM["carbohydrates"])),
+            "carbohydrates_percentage": macros["carbohydrates"],
+            "fats_grams": int(round(total_calories * macros["fats"] / 100 / KCAL_PER_GRAM["fats"])),
+            "fats_percentage": macros["fats"],
+            "fiber_grams": fiber,
+            "sodium_mg": sodium,
+        },
+        "calculations": {
+            "bmr": int(round(bmr)),
+            "activity_level": activity_level,
+            "activity_multiplier": multiplier,
+            "tdee": int(round(tdee)),
+        },
+        "special_dietary_guidelines": [],
+        "meal_distribution": _meal_distribution(total_calories, _includes_snacks(health_data, flags["diabetes"])),
+        "medical_adjustments": _medical_adjustments(flags, macros, fiber, sodium),
+        "additional_recommendations": [],
+    }
+
+
+def calculate_requirements_batch(profiles: Sequence[Union[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Calculate nutrition requirements for many patients in one vectorized pass.
+
+    Feature extraction is per profile, while the BMR/TDEE/target/macro
+    arithmetic runs as NumPy array operations over the whole batch. Results
+    are identical to calling calculate_requirements() on each profile.
+
+    Args:
+        profiles: A sequence of patient_health_data JSON strings or dicts
+
+    Returns:
+        A list of nutrition_requirements dictionaries (or missing-input
+        errors), in input order
+    """
+    parsed = [load_state_json(p) or {} for p in profiles]
+    n = len(parsed)
+    if n == 0:
+        return []
+
+    weight = np.zeros(n)
+    height = np.zeros(n)
+    age = np.full(n, DEFAULT_AGE)
+    bmi = np.zeros(n)
+    sex_constant = np.zeros(n)
+    min_calories = np.zeros(n)
+    multiplier = np.zeros(n)
+    diabetes = np.zeros(n, dtype=bool)
+    hypertension = np.zeros(n, dtype=bool)
+    cholesterol = np.zeros(n, dtype=bool)
+    activity_levels: List[str] = []
+    flags_list: List[Dict[str, Any]] = []
+    include_snacks: List[bool] = []
+
+    for i, health_data in enumerate(parsed):
+        profile = health_data.get("patient_profile") or {}
+        lifestyle = health_data.get("lifestyle_factors") or {}
+        sex = _sex(profile)
+        weight[i] = _number(profile.get("weight_kg"), 0.0)
+        height[i] = _number(profile.get("height_cm"), 0.0)
+        age[i] = _number(profile.get("age"), DEFAULT_AGE)
+        bmi[i] = _number(
+            profile.get("bmi"),
+            weight[i] / (height[i] / 100) ** 2 if weight[i] and height[i] else 22.0,
+        )
+        sex_constant[i] = SEX_CONSTANTS[sex]
+        min_calories[i] = MIN_CALORIES[sex]
+        level = _activity_level(lifestyle)
+        activity_levels.append(level)
+        multiplier[i] = ACTIVITY_MULTIPLIERS[level]
+        flags = detect_conditions(health_data)
+        flags_list.append(flags)
+        diabetes[i] = flags["diabetes"]
+        hypertension[i] = flags["hypertension"]
+        cholesterol[i] = flags["high_cholesterol"]
+        include_snacks.append(_includes_snacks(health_data, flags["diabetes"]))
+
+    bmr = 10 * weight + 6.25 * height - 5 * age + sex_constant
+    tdee = bmr * multiplier
+    adjustment = np.where(bmi >= 25, -WEIGHT_LOSS_DEFICIT, np.where(bmi < 18.5, WEIGHT_GAIN_SURPLUS, 0.0))
+    total_calories = np.round(np.maximum(tdee + adjustment, min_calories)).astype(int)
+
+    fats_pct = np.where(cholesterol, 25, 30)
+    carbs_pct = np.where(diabetes, 45, 80 - fats_pct)
+    protein_pct = 100 - carbs_pct - fats_pct
+    protein_g = total_calories * protein_pct / 100 / KCAL_PER_GRAM["protein"]
+    carbs_g = total_calories * carbs_pct / 100 / KCAL_PER_GRAM["carbohydrates"]
+    fats_g = total_calories * fats_pct / 100 / KCAL_PER_GRAM["fats"]
+    min_fiber = np.where(diabetes | cholesterol, 30, 25)
+    fiber = np.maximum(np.round(total_calories * FIBER_GRAMS_PER_1000_KCAL / 1000), min_fiber).astype(int)
+    sodium = np.where(hypertension, 1500, 2300)
+
+    results: List[Dict[str, Any]] = []
+    for i in range(n):
+        missing = _missing_inputs(parsed[i].get("patient_profile") or {})
+        if missing:
+            results.append(_missing_inputs_error(missing))
+            continue
+        calories = int(total_calories[i])
+        macros = {"protein": int(protein_pct[i]), "carbohydrates": int(carbs_pct[i]), "fats": int(fats_pct[i])}
+        results.append({
+            "daily_targets": {
+                "total_calories": calories,
+                "protein_grams": int(round(float(protein_g[i]))),
+                "protein_percentage": macros["protein"],
+                "carbohydrates_grams": int(round(float(carbs_g[i]))),
+                "carbohydrates_percentage": macros["carbohydrates"],
+                "fats_grams": int(round(float(fats_g[i]))),
+                "fats_percentage": macros["fats"],
+                "fiber_grams": int(fiber[i]),
+                "sodium_mg": int(sodium[i]),
+            },
+            "calculations": {
+                "bmr": int(round(float(bmr[i]))),
+                "activity_level": activity_levels[i],
+                "activity_multiplier": float(multiplier[i]),
+                "tdee": int(round(float(tdee[i]))),
+            },
+            "special_dietary_guidelines": [],
+            "meal_distribution": _meal_distribution(calories, include_snacks[i]),
+            "medical_adjustments": _medical_adjustments(flags_list[i], macros, int(fiber[i]), int(sodium[i])),
+            "additional_recommendations": [],
+        })
+    return results
@@ -0,0 +1,303 @@
+"""
+Record/replay cassettes for model and web search traffic.
+
+CassettePlugin captures every model request/response made by the
+nutritionist_agent tree, and every web_search_agent result (the google_search
+grounding summaries), into a SQLite cassette file. Entries are keyed by a
+SHA-256 of the agent name plus the normalized request content. Replay serves
+them back without calling the model or the search tool, so recorded
+production traces can be rerun offline and deterministically.
+
+Modes:
+    record  call the live model and store every exchange
+    replay  serve only from the cassette; a miss raises CassetteMissError
+    auto    serve hits from the cassette and record misses
+
+Identical requests (e.g. the same prompt for two patients) are stored in
+sequence and replayed in the recorded order. Responses are stored as
+zlib-compressed JSON along with the recorded latency; replay can sleep for
+that latency (simulate_latency) or return immediately, which isolates the
+framework's own overhead.
+
+A served model response still goes through the agent's own model callbacks,
+as a live response would: output validation (schemas.py) sees the recorded
+response and its retry is served from the cassette too.
+"""
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+from google.genai import types
+
+MODES = ("record", "replay", "auto")
+# Tools whose results are recorded and replayed as well as model traffic
+RECORDED_TOOLS = ("web_search_agent",)
+
+# Per-call identifiers generated by ADK; they differ between runs of the same trace
+_VOLATILE_KEYS = {"id"}
+
+
+class CassetteMissError(KeyError):
+    """Raised in replay mode when a request is not in the cassette."""
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if k not in _VOLATILE_KEYS and v is not None}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def _instruction_text(llm_request: LlmRequest) -> str:
+    instruction = llm_request.config.system_instruction if llm_request.config else None
+    if isinstance(instruction, types.Content):
+        return "\n".join(part.text or "" for part in instruction.parts or [])
+    return str(instruction or "")
+
+
+def request_key(agent_name: str, llm_request: LlmRequest) -> str:
+    """
+    Hash an agent's model request into a cassette key.
+
+    Args:
+        agent_name: Agent making the request
+        llm_request: The request
+
+    Returns:
+        Hex SHA-256 of the agent name, model, instruction, contents and tool names
+    """
+    payload = {
+        "agent": agent_name,
+        "model": llm_request.model,
+        "instruction": _instruction_text(llm_request),
+        "contents": _normalize([c.model_dump(mode="json", exclude_none=True) for c in llm_request.contents]),
+        "tools": sorted(llm_request.tools_dict),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def tool_key(tool_name: str, tool_args: Dict[str, Any]) -> str:
+    """Hash a tool call into a cassette key."""
+    payload = {"tool": tool_name, "args": _normalize(tool_args)}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class Cassette:
+    """Indexed SQLite store of recorded exchanges with compressed payloads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS exchanges ("
+            "key TEXT NOT NULL, seq INTEGER NOT NULL, kind TEXT NOT NULL, name TEXT NOT NULL, "
+            "payload BLOB NOT NULL, latency_seconds REAL NOT NULL, recorded_at REAL NOT NULL, "
+            "PRIMARY KEY (key, seq))"
+        )
+        self._replay_cursors: Dict[str, int] = defaultdict(int)
+
+    def append(self, key: str, kind: str, name: str, payload: Any, latency_seconds: float) -> None:
+        """
+        Store an exchange after any earlier ones with the same key.
+
+        Args:
+            key: Request hash
+            kind: "model" or "tool"
+            name: Agent or tool name
+            payload: JSON-serializable response
+            latency_seconds: Recorded latency
+        """
+        blob = zlib.compress(json.dumps(payload, separators=(",", ":")).encode(), 9)
+        with self._lock:
+            seq = self._db.execute("SELECT COUNT(*) FROM exchanges WHERE key = ?", (key,)).fetchone()[0]
+            self._db.execute(
+                "INSERT INTO exchanges (key, seq, kind, name, payload, latency_seconds, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, seq, kind, name, blob, latency_seconds, time.time()),
+            )
+
+    def next(self, key: str) -> Optional[Tuple[Any, float]]:
+        """
+        Return the next recorded exchange for a key, in recorded order.
+
+        Once every recording of a key has been served, the last one is repeated.
+
+        Args:
+            key: Request hash
+
+        Returns:
+            (payload, latency_seconds), or None when the key was never recorded
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT payload, latency_seconds FROM exchanges WHERE key = ? ORDER BY seq", (key,)
+            ).fetchall()
+            if not rows:
+                return None
+            index = min(self._replay_cursors[key], len(rows) - 1)
+            self._replay_cursors[key] += 1
+        return json.loads(zlib.decompress(rows[index][0])), rows[index][1]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return exchange counts per kind and name."""
+        with self._lock:
+            rows = self._db.execute("SELECT kind, name, COUNT(*) FROM exchanges GROUP BY kind, name").fetchall()
+        return {f"{kind}:{name}": count for kind, name, count in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+async def _run_callbacks(callbacks: List[Any], **kwargs: Any) -> Optional[LlmResponse]:
+    for callback in callbacks:
+        result = callback(**kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        if result is not None:
+            return result
+    return None
+
+
+async def _agent_model_callbacks(
+    callback_context: CallbackContext, llm_request: LlmRequest, llm_response: LlmResponse
+) -> LlmResponse:
+    """
+    Run the agent's before/after model callbacks around a served response.
+
+    ADK skips an agent's own model callbacks when a plugin answers in its
+    before_model callback; they ran around the recorded call, so they run here.
+    """
+    agent = callback_context._invocation_context.agent
+    before = getattr(agent, "canonical_before_model_callbacks", [])
+    response = await _run_callbacks(before, callback_context=callback_context, llm_request=llm_request)
+    if response is not None:
+        return response
+    after = getattr(agent, "canonical_after_model_callbacks", [])
+    altered = await _run_callbacks(after, callback_context=callback_context, llm_response=llm_response)
+    return altered if altered is not None else llm_response
+
+
+class CassettePlugin(BasePlugin):
+    """Records model and web search traffic to a Cassette, or serves it back."""
+
+    def __init__(self, path: str, mode: str = "replay", simulate_latency: bool = False, name: str = "cassette_plugin"):
+        super().__init__(name)
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}; expected one of {', '.join(MODES)}")
+        self.mode = mode
+        self.simulate_latency = simulate_latency
+        self.cassette = Cassette(path)
+        self._pending: Dict[Tuple[str, ...], List[Tuple[str, float]]] = defaultdict(list)
+        self.counters = {"hits": 0, "misses": 0, "recorded": 0}
+
+    async def _serve(self, key: str, name: str) -> Optional[Any]:
+        if self.mode == "record":
+            return None
+        entry = self.cassette.next(key)
+        if entry is None:
+            self.counters["misses"] += 1
+            if self.mode == "replay":
+                raise CassetteMissError(f"No cassette entry for {name} request {key[:12]}")
+            return None
+        payload, latency = entry
+        self.counters["hits"] += 1
+        if self.simulate_latency:
+            await asyncio.sleep(latency)
+        return payload
+
+    async def before_model_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> Optional[LlmResponse]:
+        key = request_key(callback_context.agent_name, llm_request)
+        payload = await self._serve(key, callback_context.agent_name)
+        if payload is not None:
+            return await _agent_model_callbacks(callback_context, llm_request, LlmResponse.model_validate(payload))
+        self._pending[(callback_context.invocation_id, "model", callback_context.agent_name)].append(
+            (key, time.perf_counter())
+        )
+        return None
+
+    async def after_model_callback(
+        self, *, callback_context: CallbackContext, llm_response: LlmResponse
+    ) -> Optional[LlmResponse]:
+        if llm_response.partial:
+            return None
+        pending = self._pending.get((callback_context.invocation_id, "model", callback_context.agent_name))
+        if not pending:
+            return None
+        key, started = pending.pop()
+        self.cassette.append(
+            key, "model", callback_context.agent_name,
+            llm_response.model_dump(mode="json", exclude_none=True), time.perf_counter() - started,
+        )
+        self.counters["recorded"] += 1
+        return None
+
+    async def on_model_error_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest, error: Exception
+    ) -> None:
+        pending = self._pending.get((callback_context.invocation_id, "model", callback_context.agent_name))
+        if pending:
+            pending.pop()
+        return None
+
+    async def before_tool_callback(
+        self, *, tool: BaseTool, tool_args: Dict[str, Any], tool_context: ToolContext
+    ) -> Optional[Dict]:
+        if tool.name not in RECORDED_TOOLS:
+            return None
+        key = tool_key(tool.name, tool_args)
+        payload = await self._serve(key, tool.name)
+        if payload is not None:
+            output_key = getattr(getattr(tool, "agent", None), "output_key", None)
+            if output_key:
+                tool_context.state[output_key] = payload.get("result")
+            return payload
+        self._pending[(tool_context.invocation_id, "tool", tool_context.function_call_id or tool.name)].append(
+            (key, time.perf_counter())
+        )
+        return None
+
+    async def after_tool_callback(
+        self, *, tool: BaseTool, tool_args: Dict[str, Any], tool_context: ToolContext, result: Any
+    ) -> Optional[Dict]:
+        if tool.name not in RECORDED_TOOLS:
+            return None
+        pending = self._pending.get((tool_context.invocation_id, "tool", tool_context.function_call_id or tool.name))
+        if not pending:
+            return None
+        key, started = pending.pop()
+        payload = result if isinstance(result, dict) else {"result": result}
+        self.cassette.append(key, "tool", tool.name, payload, time.perf_counter() - started)
+        self.counters["recorded"] += 1
+        return None
+
+    async def after_run_callback(self, *, invocation_context) -> None:
+        invocation_id = invocation_context.invocation_id
+        for key in [k for k in self._pending if k[0] == invocation_id]:
+            del self._pending[key]
+        return None
+
+    async def close(self) -> None:
+        self.cassette.close()
@@ -0,0 +1,173 @@
+"""
+Checkpointed sessions and stage-level resume for nutritionist_agent.
+
+Sessions are stored with ADK's SqliteSessionService, which persists every
+event's state delta, so patient_health_data, nutrition_requirements and
+current_meal_plan survive a crash as soon as the stage producing them ends.
+
+CheckpointPlugin makes re-running a session resume from the last completed
+stage: a top-level stage whose outputs are already present and valid is
+skipped without calling its model. Once any stage actually runs, every later
+stage runs too, so no stage consumes outputs older than its inputs. The
+refinement loop only counts as complete when it finished (its completion is
+recorded in completed_stages); an interrupted loop restarts from the latest
+checkpointed current_meal_plan.
+"""
+import logging
+import uuid
+from typing import Dict, Any, Callable, Optional, Set
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.sessions import BaseSessionService, InMemorySessionService
+from google.adk.sessions.sqlite_session_service import SqliteSessionService
+from google.genai import types
+
+from .compaction import CompactingSessionService
+from .json_utils import load_state_json
+
+logger = logging.getLogger(__name__)
+
+COMPLETED_STAGES_KEY = "completed_stages"
+
+
+def _has_fields(*fields: str) -> Callable[[Dict[str, Any]], bool]:
+    def check(state: Dict[str, Any]) -> bool:
+        for field in fields:
+            key, name = field.split(".", 1)
+            value = load_state_json(state.get(key))
+            if not isinstance(value, dict) or name not in value:
+                return False
+        return True
+    return check
+
+
+# Top-level stage (in pipeline order) -> check that its outputs in state are present and valid
+STAGE_OUTPUT_CHECKS: Dict[str, Callable[[Dict[str, Any]], bool]] = {
+    "patient_data_agent": _has_fields("patient_health_data.patient_profile"),
+    "nutrition_calculator_agent": _has_fields("nutrition_requirements.daily_targets"),
+    "initial_meal_planner_agent": _has_fields("current_meal_plan.meal_plan"),
+    "meal_plan_refinement_loop": _has_fields("current_meal_plan.meal_plan", "critique.status"),
+}
+# Stages that are only skipped once they ran to completion, not just when their outputs exist
+COMPLETION_REQUIRED = {"meal_plan_refinement_loop"}
+
+
+def create_session_service(db_path: Optional[str]) -> BaseSessionService:
+    """
+    Create the session service: SQLite-backed when db_path is given, otherwise
+    in-memory with a bounded, compacted event history (see compaction.py).
+
+    Args:
+        db_path: SQLite database file, or None
+
+    Returns:
+        The session service
+    """
+    return SqliteSessionService(db_path) if db_path else CompactingSessionService()
+
+
+def session_id_for(
+    patient_id: str,
+    session_service: BaseSessionService,
+    run_id: Optional[str] = None,
+    resume: bool = False,
+) -> str:
+    """
+    Choose the session ID for a patient's run.
+
+    Checkpointed (persistent) sessions, and any resumed session, get a
+    deterministic ID, so a later --resume with the same run_id finds the
+    checkpoint. Other in-memory sessions get a random suffix, as a manifest
+    may list the same patient more than once.
+
+    Args:
+        patient_id: Patient ID
+        session_service: Session service the session is stored in
+        run_id: Optional run name, to keep several runs of a patient apart
+        resume: The run continues an existing session
+
+    Returns:
+        The session ID
+    """
+    if not resume and isinstance(session_service, InMemorySessionService):
+        return f"{patient_id}-{uuid.uuid4().hex[:8]}"
+    return f"{patient_id}-{run_id}" if run_id else patient_id
+
+
+async def open_session(
+    session_service: BaseSessionService,
+    app_name: str,
+    user_id: str,
+    session_id: str,
+    state: Optional[Dict[str, Any]] = None,
+    resume: bool = False,
+):
+    """
+    Return the existing session when resuming, otherwise start a fresh one.
+
+    Args:
+        session_service: Session service
+        app_name: App name
+        user_id: User ID
+        session_id: Session ID
+        state: Initial state for a new session
+        resume: Reuse an existing session with this ID
+
+    Returns:
+        The session
+    """
+    existing = await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+    if existing is not None:
+        if resume:
+            return existing
+        await session_service.delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+    elif resume:
+        logger.warning("no checkpointed session %r for %r; starting from the first stage", session_id, user_id)
+    return await session_service.create_session(
+        app_name=app_name, user_id=user_id, session_id=session_id, state=state or {}
+    )
+
+
+class CheckpointPlugin(BasePlugin):
+    """Skips top-level stages whose checkpointed outputs are already valid."""
+
+    def __init__(self, name: str = "checkpoint_plugin"):
+        super().__init__(name)
+        # Invocations in which a stage has already run, so later stages must run too
+        self._rerunning: Set[str] = set()
+        self.skipped: Dict[str, int] = {}
+
+    async def before_agent_callback(self, *, agent: BaseAgent, callback_context: CallbackContext) -> Optional[types.Content]:
+        check = STAGE_OUTPUT_CHECKS.get(agent.name)
+        invocation_id = callback_context.invocation_id
+        if check is None or invocation_id in self._rerunning:
+            return None
+        state = callback_context.state
+        completed = state.get(COMPLETED_STAGES_KEY) or []
+        if check(state) and (agent.name not in COMPLETION_REQUIRED or agent.name in completed):
+            self.skipped[agent.name] = self.skipped.get(agent.name, 0) + 1
+            logger.info("resuming: skipping %s, outputs already checkpointed", agent.name)
+            # ADK stores skip content under an LLM agent's output_key, so replay the checkpointed output
+            output_key = getattr(agent, "output_key", None)
+            text = state.get(output_key) if output_key and output_key in state else None
+            return types.Content(role="model", parts=[types.Part(text=str(text or f"{agent.name} restored from checkpoint"))])
+        self._rerunning.add(invocation_id)
+        # Later stages will be regenerated from this one's new outputs
+        stages = list(STAGE_OUTPUT_CHECKS)
+        earlier = stages[:stages.index(agent.name)]
+        if any(stage not in earlier for stage in completed):
+            state[COMPLETED_STAGES_KEY] = [stage for stage in completed if stage in earlier]
+        return None
+
+    async def after_agent_callback(self, *, agent: BaseAgent, callback_context: CallbackContext) -> None:
+        if agent.name in STAGE_OUTPUT_CHECKS:
+            completed = list(callback_context.state.get(COMPLETED_STAGES_KEY) or [])
+            if agent.name not in completed:
+                callback_context.state[COMPLETED_STAGES_KEY] = completed + [agent.name]
+        return None
+
+    async def after_run_callback(self, *, invocation_context) -> None:
+        self._rerunning.discard(invocation_context.invocation_id)
+        return None
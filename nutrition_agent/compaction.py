@@ -0,0 +1,122 @@
+"""
+Bounded session memory for long-running workers.
+
+Every stage and every refinement iteration appends an event whose state delta
+carries the full JSON text of current_meal_plan, critique and friends, so an
+in-memory session holds every version of the plan ever produced even though
+session state only needs the latest. CompactingSessionService keeps the
+stored copy of each session small:
+
+- a state delta value is dropped from an event once a later event sets the
+  same key, so only the latest value of each output key is kept
+- only the last max_events events are stored; state is kept separately in
+  session.state, so nothing is lost for later stages
+
+Compaction only touches the service's stored copy. A running invocation keeps
+its own session object with the full event history, so the contents its
+model calls see are unchanged; the history is released when the invocation
+ends. Finished sessions are removed with evict_session() once their outputs
+have been copied into a result record.
+"""
+from typing import Any, Dict, List, Optional, Set
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session
+
+# Stored events kept per session; a full pipeline run appends a few dozen
+DEFAULT_MAX_EVENTS = 32
+
+
+def compact_events(events: List[Event], max_events: int = DEFAULT_MAX_EVENTS) -> List[Event]:
+    """
+    Keep the last max_events events, dropping state delta values that a later event overwrites.
+
+    Events are never modified in place; a compacted event is a copy, since
+    the original may also be in a running invocation's session.
+
+    Args:
+        events: Stored session events, oldest first
+        max_events: Events to keep
+
+    Returns:
+        The compacted events, oldest first
+    """
+    kept = events[-max_events:] if max_events > 0 else []
+    superseded: Set[str] = set()
+    compacted = []
+    for event in reversed(kept):
+        delta = event.actions.state_delta if event.actions else None
+        if delta:
+            stale = superseded.intersection(delta)
+            superseded.update(delta)
+            if stale:
+                actions = event.actions.model_copy(
+                    update={"state_delta": {key: value for key, value in delta.items() if key not in stale}}
+                )
+                event = event.model_copy(update={"actions": actions})
+        compacted.append(event)
+    compacted.reverse()
+    return compacted
+
+
+class CompactingSessionService(InMemorySessionService):
+    """InMemorySessionService whose stored sessions keep a bounded, compacted event history."""
+
+    def __init__(self, max_events: int = DEFAULT_MAX_EVENTS):
+        super().__init__()
+        self.max_events = max_events
+        self.dropped_events = 0
+        self.evicted_sessions = 0
+
+    def _stored(self, app_name: str, user_id: str, session_id: str) -> Optional[Session]:
+        return self.sessions.get(app_name, {}).get(user_id, {}).get(session_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        event = await super().append_event(session=session, event=event)
+        stored = self._stored(session.app_name, session.user_id, session.id)
+        # The caller's session is the live history its model calls are built from; leave it whole
+        if stored is not None and stored is not session:
+            before = len(stored.events)
+            stored.events = compact_events(stored.events, self.max_events)
+            self.dropped_events += before - len(stored.events)
+        return event
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        if self._stored(app_name, user_id, session_id) is not None:
+            self.evicted_sessions += 1
+        await super().delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        # Drop the per-user map too, or every patient ever served leaves an empty entry behind
+        users = self.sessions.get(app_name, {})
+        if user_id in users and not users[user_id]:
+            del users[user_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return stored session and event counts and how much was compacted or evicted."""
+        sessions = [session for users in self.sessions.values() for stored in users.values() for session in stored.values()]
+        return {
+            "sessions": len(sessions),
+            "events": sum(len(session.events) for session in sessions),
+            "dropped_events": self.dropped_events,
+            "evicted_sessions": self.evicted_sessions,
+        }
+
+
+def evicts_finished_sessions(session_service: BaseSessionService) -> bool:
+    """Check whether finished sessions should be deleted: in-memory ones have no use once results are saved."""
+    return isinstance(session_service, InMemorySessionService)
+
+
+async def evict_session(session_service: BaseSessionService, app_name: str, user_id: str, session_id: str) -> None:
+    """
+    Delete a finished session from an in-memory session service.
+
+    Persistent services (SQLite) keep the session as a checkpoint for --resume.
+
+    Args:
+        session_service: Session service holding the session
+        app_name: App name
+        user_id: User ID
+        session_id: Session ID
+    """
+    if evicts_finished_sessions(session_service):
+        await session_service.delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
@@ -0,0 +1,198 @@
+"""
+End-to-end deadline budgets for nutritionist_agent runs.
+
+A run's deadline is stored in session state as an absolute wall-clock time
+(DEADLINE_KEY, seconds since the epoch), so it reaches every agent, including
+the web_search_agent sessions that AgentTool copies the state into.
+
+DeadlinePlugin enforces it:
+
+- every model call gets a per-attempt timeout and a retry budget (attempts and
+  backoff) that fit in the remaining time, passed as per-request http_options
+- once the remaining time drops below a refinement stage's reserve, or its
+  model call fails that close to the deadline, the loop is cut short: the
+  critic and refiner are skipped, the loop exits, and the run ends with the
+  best current_meal_plan so far and its latest critique. DEGRADED_KEY is set
+  in state so callers can tell the plan was not fully refined
+- a run that reaches its deadline before any meal plan exists fails with
+  DeadlineExceededError, since there is nothing to degrade to
+
+Callers also cut the whole run off DEADLINE_GRACE_SECONDS after the deadline
+(see batch.run_patient), so a call that overruns its timeout cannot hold the
+run past it.
+"""
+import logging
+import time
+from typing import Dict, Any, Optional
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+from google.genai import types
+
+from .json_utils import dumps_compact
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_KEY = "deadline_at"
+DEGRADED_KEY = "deadline_degraded"
+PLAN_KEY = "current_meal_plan"
+
+# Per-attempt timeout of a model call when the deadline is far away
+DEFAULT_CALL_TIMEOUT_SECONDS = 60.0
+# Shortest attempt worth starting; fewer retries are allowed below this
+MIN_ATTEMPT_SECONDS = 2.0
+# Extra time a caller allows past the deadline for the degraded result to be assembled
+DEADLINE_GRACE_SECONDS = 1.0
+
+# Refinement stage -> seconds that must remain to start it
+STAGE_RESERVES: Dict[str, float] = {
+    "meal_plan_critic_agent": 15.0,
+    "meal_plan_refiner_agent": 20.0,
+}
+
+# Schema-valid stand-ins for a refinement stage that did not get to run
+_SKIPPED_OUTPUTS: Dict[str, Dict[str, Any]] = {
+    "meal_plan_critic_agent": {
+        "medical_compliance": {"overall_score": "not_evaluated"},
+        "practical_assessment": {"overall_score": "not_evaluated"},
+        "issues": [],
+        "summary": "The medical and practical review was not completed before the deadline.",
+        "approval_reason": "Not approved: the deadline was reached before the review finished.",
+    },
+    "meal_plan_refiner_agent": {
+        "operations": [],
+        "refinement_notes": ["No refinement: the deadline was reached."],
+    },
+}
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a run reaches its deadline before producing a meal plan."""
+
+
+def deadline_state(deadline: Optional[float]) -> Optional[Dict[str, Any]]:
+    """
+    Build the state delta that starts a run against a deadline.
+
+    Args:
+        deadline: Absolute deadline (time.time() based), or None
+
+    Returns:
+        The deadline with the degraded flag reset, or None without a deadline
+    """
+    return {DEADLINE_KEY: deadline, DEGRADED_KEY: False} if deadline else None
+
+
+def remaining_seconds(state: Any) -> Optional[float]:
+    """Return the seconds left before the state's deadline, or None if it has none."""
+    deadline = state.get(DEADLINE_KEY)
+    return float(deadline) - time.time() if deadline else None
+
+
+def budget_http_options(
+    remaining: float,
+    retry_options: Optional[types.HttpRetryOptions],
+    call_timeout: float = DEFAULT_CALL_TIMEOUT_SECONDS,
+) -> types.HttpOptions:
+    """
+    Fit a model call's timeout and retries into the remaining time.
+
+    Attempts are kept only while their backoff delays plus MIN_ATTEMPT_SECONDS
+    per attempt fit in the remaining time.
+
+    Args:
+        remaining: Seconds left before the deadline
+        retry_options: The model's normal retry policy
+        call_timeout: Per-attempt timeout when time is plentiful
+
+    Returns:
+        Per-request http_options with timeout (ms) and retry_options
+    """
+    timeout = max(0.1, min(call_timeout, remaining))
+    if retry_options is None:
+        return types.HttpOptions(timeout=int(timeout * 1000))
+    initial = retry_options.initial_delay or 1.0
+    exp_base = retry_options.exp_base or 2.0
+    max_delay = retry_options.max_delay or 60.0
+    attempts, spent = 1, MIN_ATTEMPT_SECONDS
+    while attempts < (retry_options.attempts or 1):
+        delay = min(initial * exp_base ** (attempts - 1), max_delay)
+        if spent + delay + MIN_ATTEMPT_SECONDS > remaining:
+            break
+        spent += delay + MIN_ATTEMPT_SECONDS
+        attempts += 1
+    budgeted = retry_options.model_copy(update={"attempts": attempts, "max_delay": min(max_delay, max(remaining, 1.0))})
+    return types.HttpOptions(timeout=int(timeout * 1000), retry_options=budgeted)
+
+
+class DeadlinePlugin(BasePlugin):
+    """Budgets model calls against the run's deadline and cuts refinement short as it nears."""
+
+    def __init__(
+        self,
+        retry_options: Optional[types.HttpRetryOptions] = None,
+        call_timeout: float = DEFAULT_CALL_TIMEOUT_SECONDS,
+        stage_reserves: Optional[Dict[str, float]] = None,
+        name: str = "deadline_plugin",
+    ):
+        super().__init__(name)
+        self.retry_options = retry_options
+        self.call_timeout = call_timeout
+        self.stage_reserves = dict(STAGE_RESERVES if stage_reserves is None else stage_reserves)
+        self.degraded_runs = 0
+
+    def _degrade(self, callback_context: CallbackContext, reason: str) -> None:
+        if not callback_context.state.get(DEGRADED_KEY):
+            self.degraded_runs += 1
+            logger.warning("deadline: %s; returning the current meal plan", reason)
+        callback_context.state[DEGRADED_KEY] = True
+
+    async def before_agent_callback(self, *, agent: BaseAgent, callback_context: CallbackContext) -> Optional[types.Content]:
+        state = callback_context.state
+        remaining = remaining_seconds(state)
+        if remaining is None:
+            return None
+        reserve = self.stage_reserves.get(agent.name)
+        if reserve is not None and state.get(PLAN_KEY) is not None:
+            if not state.get(DEGRADED_KEY) and remaining >= reserve:
+                return None
+            self._degrade(callback_context, f"{remaining:.1f}s left, skipping {agent.name}")
+            # Leave the refinement loop; the output_key keeps its previous value
+            callback_context.actions.escalate = True
+            output_key = getattr(agent, "output_key", None)
+            text = state.get(output_key) if output_key else None
+            return types.Content(role="model", parts=[types.Part(text=str(text or f"{agent.name} skipped at the deadline"))])
+        if remaining <= 0 and state.get(PLAN_KEY) is None:
+            raise DeadlineExceededError(f"Deadline reached before {agent.name} could run")
+        return None
+
+    async def before_model_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> Optional[LlmResponse]:
+        remaining = remaining_seconds(callback_context.state)
+        if remaining is None:
+            return None
+        if remaining <= 0 and callback_context.state.get(PLAN_KEY) is None:
+            raise DeadlineExceededError(f"Deadline reached before {callback_context.agent_name} could call its model")
+        budget = budget_http_options(remaining, self.retry_options, self.call_timeout)
+        llm_request.config = llm_request.config or types.GenerateContentConfig()
+        http_options = llm_request.config.http_options or types.HttpOptions()
+        llm_request.config.http_options = http_options.model_copy(
+            update={"timeout": budget.timeout, "retry_options": budget.retry_options}
+        )
+        return None
+
+    async def on_model_error_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest, error: Exception
+    ) -> Optional[LlmResponse]:
+        state = callback_context.state
+        remaining = remaining_seconds(state)
+        reserve = self.stage_reserves.get(callback_context.agent_name)
+        if remaining is None or reserve is None or state.get(PLAN_KEY) is None or remaining >= reserve:
+            return None
+        self._degrade(callback_context, f"{callback_context.agent_name} failed with {remaining:.1f}s left ({type(error).__name__})")
+        text = dumps_compact(_SKIPPED_OUTPUTS[callback_context.agent_name])
+        return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
@@ -0,0 +1,425 @@
+"""
+Offline stand-in for the Gemini models used by the nutritionist_agent tree.
+
+FakeGeminiModel answers every agent with schema-valid canned JSON, so the
+orchestration can be exercised and benchmarked without network access or
+quota:
+
+- patient_data_agent returns a fixed patient profile
+- nutrition_calculator_agent returns guideline lists
+- each meal planner looks up its foods with one lookup_foods_nutrition call
+  and returns foods that hit the meal target in its instruction exactly; on
+  day N of a weekly plan it rotates to other dishes
+- meal_plan_critic_agent requests a revision until its Nth review of a plan
+  (approve_after), then approves
+- meal_plan_refiner_agent returns a patch that records the revision
+- web_search_agent returns a short canned summary with per-100g values
+
+Latency is sampled from a configurable distribution, and transient 5xx errors
+and 429s can be injected. When retry_options are given, the retry loop of the
+real client is emulated and every failed attempt is logged on the "httpx"
+logger in the client's format, so MetricsPlugin counts fake retries like real ones.
+
+Setting NUTRITION_AGENT_FAKE_MODEL=1 makes build_model() in agent.py return
+this model; see from_env() for the other variables.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+from typing import Dict, Any, AsyncGenerator, List, Optional
+
+import httpx
+from google.adk.agents import BaseAgent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.tools.agent_tool import AgentTool
+from google.genai import errors, types
+from pydantic import PrivateAttr
+
+from .json_utils import dumps_compact
+from .meal_plan import MACRO_KEYS
+from .projection import estimate_tokens
+
+logger = logging.getLogger(__name__)
+http_logger = logging.getLogger("httpx")
+
+# Staple food per meal; planners look it up and the refiner patches it
+MEAL_FOODS = {
+    "breakfast": ("poha", "1 plate"),
+    "mid_morning_snack": ("guava", "1 medium"),
+    "lunch": ("chapati", "2 pieces"),
+    "evening_snack": ("roasted chana", "1 handful"),
+    "dinner": ("moong dal", "1 katori"),
+}
+# Staple per meal for the later days of a weekly plan (day 1 uses MEAL_FOODS)
+MEAL_ROTATIONS = {
+    "breakfast": [("upma", "1 plate"), ("idli", "3 pieces"), ("besan chilla", "2 pieces"), ("daliya", "1 bowl"),
+                  ("moong dal chilla", "2 pieces"), ("uttapam", "1 piece")],
+    "mid_morning_snack": [("apple", "1 piece"), ("papaya", "1 cup"), ("orange", "1 piece"), ("pomegranate", "1 cup"),
+                          ("banana", "1 piece"), ("sprouts chaat", "1 katori")],
+    "lunch": [("rajma", "1 katori"), ("chole", "1 katori"), ("toor dal", "1 katori"), ("palak paneer", "1 katori"),
+              ("masoor dal", "1 katori"), ("sambar", "1 katori")],
+    "evening_snack": [("makhana", "1 cup"), ("dhokla", "3 pieces"), ("bhel puri", "1 cup"), ("peanuts", "1 handful"),
+                      ("sprouts salad", "1 katori"), ("roasted chana", "1 handful")],
+    "dinner": [("khichdi", "1 katori"), ("masoor dal", "1 katori"), ("matar paneer", "1 katori"), ("toor dal", "1 katori"),
+               ("palak paneer", "1 katori"), ("chole", "1 katori")],
+}
+# Share of a meal target carried by the staple; a side dish makes up the rest
+STAPLE_SHARE = 0.6
+SIDE_DISH = ("mixed vegetable sabzi", "1 katori")
+SIDE_DISH_ROTATION = [("bhindi sabzi", "1 katori"), ("lauki sabzi", "1 katori"), ("palak sabzi", "1 katori"),
+                      ("cabbage sabzi", "1 katori"), ("beans poriyal", "1 katori"), ("green salad", "1 plate")]
+
+FAKE_PROFILE = {
+    "patient_profile": {
+        "age": 42, "gender": "female", "height_cm": 160, "weight_kg": 68, "bmi": 26.6,
+        "bmi_category": "overweight",
+    },
+    "dietary_preferences": {
+        "type": "vegetarian", "restrictions": [], "meal_prep_preference": "home-cooked",
+        "eating_frequency": "3 meals and 2 snacks",
+    },
+    "medical_conditions": {"current": ["hypertension"], "family_history": ["diabetes"], "allergies": []},
+    "lifestyle_factors": {
+        "exercise_minutes_per_week": 90, "exercise_level": "lightly_active", "water_intake_glasses": "6-8",
+        "alcohol": "never", "smoking": "never", "sleep_hours": 7, "stress_level": "moderate",
+        "screen_time_hours": 6,
+    },
+    "blood_test_analysis": {
+        "abnormal_values": [{
+            "parameter": "Vitamin D", "value": 18, "unit": "ng/mL", "reference_range": "30-100",
+            "status": "low", "clinical_significance": "Vitamin D insufficiency",
+        }],
+        "deficiencies": ["vitamin D"],
+        "health_risks": ["cardiovascular risk from hypertension"],
+    },
+    "key_nutritional_considerations": [
+        "Limit sodium to 1500 mg per day", "Moderate calorie deficit for weight loss", "Include vitamin D sources",
+    ],
+}
+
+FAKE_GUIDELINES = {
+    "special_dietary_guidelines": ["Prefer home-cooked meals with minimal added salt", "Avoid pickles and papad"],
+    "additional_recommendations": ["Walk 30 minutes daily", "Get 15 minutes of morning sunlight"],
+}
+
+# Answers the per-100g format bulk_lookup.search_request asks for
+FAKE_SEARCH_SUMMARY = (
+    "Fake search summary, values per 100 g (USDA/IFCT tables):\n"
+    "calories: 150 kcal\nprotein_g: 5 g\ncarbs_g: 20 g\nfats_g: 5 g\nfiber_g: 2 g\nsodium_mg: 200 mg\n"
+    "piece: 50 g\ncup: 200 g\nkatori: 150 g"
+)
+
+_AGENT_NAME_RE = re.compile(r'Your internal name is "([^"]+)"')
+_MEAL_TARGET_RE = re.compile(r'\{"meal":"(\w+)"[^{}]*\}')
+_REVISION_RE = re.compile(r"fake-revision-(\d+)")
+_DAY_RE = re.compile(r"This is day (\d+) of")
+
+
+class LatencyDistribution:
+    """
+    Model latency in seconds, parsed from a spec string:
+
+        fixed:<seconds>
+        uniform:<low>,<high>
+        normal:<mean>,<stddev>
+        lognormal:<median>,<sigma>
+    """
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        kind = kind.strip().lower()
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution {kind!r}; expected one of {', '.join(self.KINDS)}")
+        values = [float(v) for v in params.split(",") if v.strip()]
+        expected = 1 if kind == "fixed" else 2
+        if len(values) != expected:
+            raise ValueError(f"{kind} latency needs {expected} parameter(s), got {spec!r}")
+        self.spec = spec
+        self.kind = kind
+        self.values = values
+
+    def sample(self, rng: random.Random) -> float:
+        """Draw one latency, never negative."""
+        if self.kind == "fixed":
+            value = self.values[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.values)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.values)
+        else:
+            median, sigma = self.values
+            value = rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return max(0.0, value)
+
+
+def _request_text(llm_request: LlmRequest) -> str:
+    parts: List[str] = []
+    system_instruction = llm_request.config.system_instruction if llm_request.config else None
+    if isinstance(system_instruction, str):
+        parts.append(system_instruction)
+    elif isinstance(system_instruction, types.Content):
+        parts.extend(part.text or "" for part in system_instruction.parts or [])
+    for content in llm_request.contents:
+        for part in content.parts or []:
+            if part.text:
+                parts.append(part.text)
+            elif part.function_response:
+                parts.append(json.dumps(part.function_response.response, default=str))
+    return "\n".join(parts)
+
+
+def _has_function_response(llm_request: LlmRequest) -> bool:
+    return any(part.function_response for content in llm_request.contents for part in content.parts or [])
+
+
+def _meal_foods(meal: str, day: int) -> List[tuple]:
+    """Staple and side dish of a meal; weekly plans rotate them by day."""
+    if day <= 1:
+        return [MEAL_FOODS.get(meal, SIDE_DISH), SIDE_DISH]
+    rotation = MEAL_ROTATIONS.get(meal) or [SIDE_DISH]
+    return [rotation[(day - 2) % len(rotation)], SIDE_DISH_ROTATION[(day - 2) % len(SIDE_DISH_ROTATION)]]
+
+
+def _planned_foods(target: Dict[str, Any], day: int = 1) -> List[Dict[str, Any]]:
+    meal = target.get("meal", "")
+    (staple, quantity), side_dish = _meal_foods(meal, day)
+    foods = []
+    for name, amount, share in (
+        (staple, quantity, STAPLE_SHARE),
+        (*side_dish, 1 - STAPLE_SHARE),
+    ):
+        food = {"name": name, "quantity": amount}
+        for key in MACRO_KEYS:
+            food[key] = round((target.get(key) or 0) * share, 1)
+        food["fiber_g"] = round(food["calories"] / 100, 1)
+        foods.append(food)
+    return foods
+
+
+class FakeGeminiModel(BaseLlm):
+    """BaseLlm returning canned, schema-valid responses with simulated latency and failures."""
+
+    latency: str = "lognormal:0.4,0.5"
+    # Agent name -> latency spec overriding `latency`
+    agent_latency: Dict[str, str] = {}
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    approve_after: int = 1
+    planner_tool_calls: bool = True
+    retry_options: Optional[types.HttpRetryOptions] = None
+    # Multiplies the emulated retry backoff so benchmarks do not wait minutes
+    retry_delay_scale: float = 1.0
+    seed: Optional[int] = None
+
+    _rng: random.Random = PrivateAttr()
+    _distributions: Dict[str, LatencyDistribution] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+        self._distributions = {"": LatencyDistribution(self.latency)}
+        for agent_name, spec in self.agent_latency.items():
+            self._distributions[agent_name] = LatencyDistribution(spec)
+
+    @classmethod
+    def from_env(cls, model: str, retry_options: Optional[types.HttpRetryOptions] = None) -> "FakeGeminiModel":
+        """
+        Build a fake model configured from environment variables:
+        NUTRITION_FAKE_LATENCY, NUTRITION_FAKE_ERROR_RATE, NUTRITION_FAKE_RATE_LIMIT_RATE,
+        NUTRITION_FAKE_APPROVE_AFTER, NUTRITION_FAKE_RETRY_DELAY_SCALE and NUTRITION_FAKE_SEED.
+
+        Args:
+            model: Model ID the fake stands in for
+            retry_options: Retry policy to emulate
+
+        Returns:
+            The configured model
+        """
+        seed = os.environ.get("NUTRITION_FAKE_SEED")
+        return cls(
+            model=model,
+            latency=os.environ.get("NUTRITION_FAKE_LATENCY", cls.model_fields["latency"].default),
+            error_rate=float(os.environ.get("NUTRITION_FAKE_ERROR_RATE", 0)),
+            rate_limit_rate=float(os.environ.get("NUTRITION_FAKE_RATE_LIMIT_RATE", 0)),
+            approve_after=int(os.environ.get("NUTRITION_FAKE_APPROVE_AFTER", 1)),
+            retry_options=retry_options,
+            retry_delay_scale=float(os.environ.get("NUTRITION_FAKE_RETRY_DELAY_SCALE", 1.0)),
+            seed=int(seed) if seed else None,
+        )
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        text = _request_text(llm_request)
+        match = _AGENT_NAME_RE.search(text)
+        agent_name = match.group(1) if match else ""
+
+        await self._simulate_call(agent_name, llm_request.config.http_options if llm_request.config else None)
+        content = self._respond(agent_name, text, llm_request)
+        output = "".join(part.text or "" for part in content.parts) or json.dumps(
+            [part.function_call.model_dump(exclude_none=True) for part in content.parts if part.function_call]
+        )
+        yield LlmResponse(
+            content=content,
+            model_version=self.model,
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=estimate_tokens(text),
+                candidates_token_count=estimate_tokens(output),
+                total_token_count=estimate_tokens(text) + estimate_tokens(output),
+            ),
+        )
+
+    async def _simulate_call(self, agent_name: str, http_options: Optional[types.HttpOptions] = None) -> None:
+        """
+        Sleep for the sampled latency, injecting failures and emulating client retries.
+
+        Per-request http_options (timeout and retry_options) override the model's
+        retry policy, as they do for the real client.
+        """
+        distribution = self._distributions.get(agent_name, self._distributions[""])
+        options = (http_options.retry_options if http_options else None) or self.retry_options
+        timeout = http_options.timeout / 1000 if http_options and http_options.timeout else None
+        attempts = max(1, (options.attempts or 1) if options else 1)
+        delay = (options.initial_delay or 1.0) if options else 0.0
+        for attempt in range(1, attempts + 1):
+            latency = distribution.sample(self._rng)
+            if timeout is not None and latency > timeout:
+                await asyncio.sleep(timeout)
+                if options is None or attempt == attempts:
+                    raise httpx.ReadTimeout(f"Fake {self.model} call timed out after {timeout:.1f}s")
+                await asyncio.sleep(min(delay, (options.max_delay or delay)) * self.retry_delay_scale)
+                delay *= options.exp_base or 2
+                continue
+            await asyncio.sleep(latency)
+            roll = self._rng.random()
+            if roll < self.rate_limit_rate:
+                error = errors.ClientError(429, {"error": {"code": 429, "message": "Resource exhausted (fake)", "status": "RESOURCE_EXHAUSTED"}})
+            elif roll < self.rate_limit_rate + self.error_rate:
+                error = errors.ServerError(503, {"error": {"code": 503, "message": "Service unavailable (fake)", "status": "UNAVAILABLE"}})
+            else:
+                return
+            retryable = options is not None and error.code in (options.http_status_codes or ())
+            http_logger.info(
+                'HTTP Request: POST fake://models/%s:generateContent "HTTP/1.1 %d %s"',
+                self.model, error.code, error.status,
+            )
+            if not retryable or attempt == attempts:
+                raise error
+            await asyncio.sleep(min(delay, (options.max_delay or delay)) * self.retry_delay_scale)
+            delay *= options.exp_base or 2
+
+    def _respond(self, agent_name: str, text: str, llm_request: LlmRequest) -> types.Content:
+        if agent_name.endswith("_planner_agent"):
+            return self._plan_meal(agent_name[:-len("_planner_agent")], text, llm_request)
+        if agent_name == "patient_data_agent":
+            body: Any = FAKE_PROFILE
+        elif agent_name == "nutrition_calculator_agent":
+            body = FAKE_GUIDELINES
+        elif agent_name == "meal_plan_critic_agent":
+            body = self._review(text)
+        elif agent_name == "meal_plan_refiner_agent":
+            body = self._patch(text)
+        elif agent_name == "web_search_agent":
+            return _text_content(FAKE_SEARCH_SUMMARY)
+        else:
+            body = {}
+        return _text_content(dumps_compact(body))
+
+    def _plan_meal(self, meal: str, text: str, llm_request: LlmRequest) -> types.Content:
+        day_match = _DAY_RE.search(text)
+        day = int(day_match.group(1)) if day_match else 1
+        if self.planner_tool_calls and not _has_function_response(llm_request):
+            foods = _meal_foods(meal, day)
+            return types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(
+                name="lookup_foods_nutrition",
+                args={"food_names": [name for name, _ in foods], "quantities": [quantity for _, quantity in foods]},
+            ))])
+        target = {}
+        for match in _MEAL_TARGET_RE.finditer(text):
+            if match.group(1) == meal:
+                target = json.loads(match.group(0))
+        return _text_content(dumps_compact({
+            "time": target.get("time", ""),
+            "foods": _planned_foods(target, day),
+            "preparation_notes": "Cook with minimal oil and salt.",
+            "notes": ["Drink water between meals."],
+        }))
+
+    def _review(self, text: str) -> Dict[str, Any]:
+        revisions = max([int(n) for n in _REVISION_RE.findall(text)] or [0])
+        approved = revisions + 1 >= self.approve_after
+        issues = [] if approved else [{
+            "category": "practical",
+            "severity": "major",
+            "problem": f"Fake review {revisions + 1} of {self.approve_after} requests another revision",
+            "suggestion": "Revise the breakfast staple",
+        }]
+        score = "good" if approved else "needs_improvement"
+        return {
+            "medical_compliance": {
+                "diabetes_compliance": "not_applicable", "hypertension_compliance": "compliant",
+                "cholesterol_compliance": "not_applicable", "dietary_restrictions_followed": True,
+                "overall_score": "excellent",
+            },
+            "practical_assessment": {
+                "portion_sizes": "realistic", "meal_variety": "good", "cultural_appropriateness": "appropriate",
+                "ease_of_preparation": "easy", "overall_score": score,
+            },
+            "issues": issues,
+            "summary": "Fake review",
+            "approval_reason": "Approved by fake policy" if approved else "Fake policy requires another revision",
+        }
+
+    def _patch(self, text: str) -> Dict[str, Any]:
+        revisions = max([int(n) for n in _REVISION_RE.findall(text)] or [0])
+        staple, quantity = MEAL_FOODS["breakfast"]
+        return {
+            "operations": [{
+                "op": "rescale", "meal": "breakfast", "food": staple, "factor": 1,
+                "quantity": f"{quantity} (fake-revision-{revisions + 1})",
+            }],
+            "refinement_notes": [f"Fake revision {revisions + 1}"],
+        }
+
+
+def _text_content(text: str) -> types.Content:
+    return types.Content(role="model", parts=[types.Part(text=text)])
+
+
+def install_fake_models(root_agent: BaseAgent, **config: Any) -> int:
+    """
+    Replace the model of every LLM agent in a graph, including agents wrapped
+    in AgentTools, with a FakeGeminiModel for the same model ID.
+
+    Args:
+        root_agent: Root of the agent graph
+        **config: FakeGeminiModel fields (latency, error_rate, approve_after, ...)
+
+    Returns:
+        Number of agents whose model was replaced
+    """
+    replaced = 0
+    seen = set()
+    agents = [root_agent]
+    while agents:
+        agent = agents.pop()
+        if id(agent) in seen:
+            continue
+        seen.add(id(agent))
+        agents.extend(agent.sub_agents)
+        tools = [getattr(tool, "search_tool", tool) for tool in getattr(agent, "tools", [])]
+        agents.extend(tool.agent for tool in tools if isinstance(tool, AgentTool))
+        model = getattr(agent, "model", None)
+        if model:
+            model_id = model if isinstance(model, str) else model.model
+            retry_options = config.get("retry_options", getattr(model, "retry_options", None))
+            agent.model = FakeGeminiModel(model=model_id, **{**config, "retry_options": retry_options})
+            replaced += 1
+    return replaced
@@ -0,0 +1,530 @@
+"""
+Bundled Indian food-composition database.
+
+The source table lives in data/indian_foods.csv (values per 100 g plus common
+household portions). It is compiled into a compact binary file that is
+memory-mapped at runtime:
+
+    header   magic, version, record/key counts and section offsets
+    records  fixed-width structs: string refs + six float32 nutrient values
+    keys     normalized names and aliases sorted bytewise -> record index
+    strings  UTF-8 blob referenced by records and keys
+
+Exact and prefix lookups are binary searches over the mmap'd key table; fuzzy
+lookups use a trigram index built lazily from the keys.
+"""
+import bisect
+import csv
+import difflib
+import functools
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from google.adk.tools import FunctionTool
+
+from .json_utils import dumps_compact
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SOURCE_PATH = os.path.join(DATA_DIR, "indian_foods.csv")
+DATABASE_PATH = os.path.join(DATA_DIR, "indian_foods.nfdb")
+# Where a checkout without the compiled file builds it, since the package directory may be read-only
+CACHE_DATABASE_PATH = os.path.expanduser(
+    os.getenv("NUTRITION_FOOD_DB_CACHE_PATH", "~/.cache/nutrition_agent/indian_foods.nfdb")
+)
+
+MAGIC = b"NFDB"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHIIIII")
+RECORD = struct.Struct("<IHIHIH6f")
+KEY = struct.Struct("<IHI")
+
+NUTRIENT_FIELDS = ["calories", "protein_g", "carbs_g", "fats_g", "fiber_g", "sodium_mg"]
+# Foods this similar to a name are offered as suggestions
+FUZZY_CUTOFF = 0.6
+# A fuzzy match only counts as a hit at this similarity, with every word matched (see _same_words)
+FUZZY_MATCH_CUTOFF = 0.85
+# Two words this similar are the same word misspelled ("chapathi", "chapati")
+WORD_MATCH_CUTOFF = 0.8
+
+_UNIT_ALIASES = {
+    "g": "g", "gm": "g", "gms": "g", "gram": "g", "grams": "g",
+    "kg": "kg",
+    "ml": "ml", "l": "l", "litre": "l", "liter": "l",
+    "cups": "cup", "katoris": "katori", "bowls": "bowl", "glasses": "glass",
+    "pieces": "piece", "pcs": "piece", "pc": "piece", "nos": "piece", "no": "piece",
+    "medium": "piece", "large": "piece", "small": "small piece",
+    "slices": "slice", "plates": "plate", "handfuls": "handful", "cubes": "cube",
+    "tablespoon": "tbsp", "tablespoons": "tbsp", "tbsps": "tbsp",
+    "teaspoon": "tsp", "teaspoons": "tsp", "tsps": "tsp",
+    "legs": "leg",
+}
+# Units a food's portions_g can name; a quantity using one the food lacks cannot be converted
+HOUSEHOLD_UNITS = {
+    "g", "kg", "ml", "l", "cup", "katori", "bowl", "glass", "piece", "slice", "plate",
+    "handful", "cube", "tbsp", "tsp", "leg", "serving", "servings", "spoon", "scoop", "oz", "lb",
+}
+_VULGAR_FRACTIONS = "½⅓⅔¼¾⅕⅖⅗⅘⅙⅚⅐⅛⅜⅝⅞⅑⅒"
+_AMOUNT_WORDS = {"half": 0.5, "quarter": 0.25}
+_MIXED_NUMBER_RE = re.compile(r"(\d+)(?:\s+|-)(\d+)\s*/\s*(\d+)")
+_SIMPLE_FRACTION_RE = re.compile(r"(\d+)\s*/\s*(\d+)")
+_VULGAR_FRACTION_RE = re.compile(rf"(\d*)\s*([{_VULGAR_FRACTIONS}])")
+_DECIMAL_RE = re.compile(r"\d*\.?\d+")
+_AMOUNT_WORD_RE = re.compile(r"(half|quarter)\b(?:\s+(?:a|an)\b)?", re.IGNORECASE)
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalize a food name for indexing: lowercase alphanumerics separated by single spaces.
+
+    Args:
+        name: Raw food name
+
+    Returns:
+        The normalized key
+    """
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", name.lower()).split())
+
+
+def _same_words(query: str, key: str) -> bool:
+    """
+    Whether two normalized names have the same words, allowing for misspellings.
+
+    "panner bhurji" and "paneer bhurji" have; "mutton biryani" and "chicken
+    biryani", or "quinoa upma" and "upma", have not.
+    """
+    query_words, key_words = query.split(), key.split()
+    if len(query_words) != len(key_words):
+        return False
+    remaining = list(key_words)
+    for word in query_words:
+        match = next(
+            (other for other in remaining if difflib.SequenceMatcher(None, word, other).ratio() >= WORD_MATCH_CUTOFF),
+            None,
+        )
+        if match is None:
+            return False
+        remaining.remove(match)
+    return True
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def build_food_database(source_path: str = SOURCE_PATH, output_path: str = DATABASE_PATH) -> int:
+    """
+    Compile the CSV food table into the binary mmap format.
+
+    Args:
+        source_path: Path of the CSV source table
+        output_path: Path of the binary database to write
+
+    Returns:
+        Number of food records written
+    """
+    with open(source_path, "r", newline="", encoding="utf-8") as src:
+        rows = list(csv.DictReader(src))
+
+    strings = bytearray()
+    string_offsets: Dict[bytes, int] = {}
+
+    def add_string(text: str) -> Tuple[int, int]:
+        data = text.encode("utf-8")
+        if data not in string_offsets:
+            string_offsets[data] = len(strings)
+            strings.extend(data)
+        return string_offsets[data], len(data)
+
+    records = bytearray()
+    keys: Dict[bytes, int] = {}
+    for index, row in enumerate(rows):
+        name_ref = add_string(row["name"])
+        category_ref = add_string(row["category"])
+        portions_ref = add_string(row["portions"])
+        values = [float(row[field]) for field in NUTRIENT_FIELDS]
+        records.extend(RECORD.pack(*name_ref, *category_ref, *portions_ref, *values))
+        for alias in [row["name"]] + [a for a in row["aliases"].split("|") if a]:
+            # First spelling wins if two foods share an alias
+            keys.setdefault(normalize_name(alias).encode("utf-8"), index)
+
+    key_table = bytearray()
+    for key in sorted(keys):
+        key_table.extend(KEY.pack(*add_string(key.decode("utf-8")), keys[key]))
+
+    records_offset = HEADER.size
+    keys_offset = records_offset + len(records)
+    strings_offset = keys_offset + len(key_table)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(rows), len(keys), records_offset, keys_offset, strings_offset)
+
+    # A temp file of its own per writer, so concurrent builds never write into each other's file
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, prefix=os.path.basename(output_path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(header + records + key_table + strings)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(rows)
+
+
+class FoodDatabase:
+    """Read-only, memory-mapped food-composition database."""
+
+    def __init__(self, path: str = DATABASE_PATH):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.record_count, self.key_count, self._records_offset, self._keys_offset, self._strings_offset = (
+            HEADER.unpack_from(self._mm, 0)
+        )
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Not a food database (version {FORMAT_VERSION}): {path}")
+        self._keys = _KeyView(self)
+        self._trigram_index: Optional[Dict[str, List[int]]] = None
+        self._trigram_lock = threading.Lock()
+        self._fuzzy_cached = functools.lru_cache(maxsize=4096)(self._fuzzy_indices)
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings_offset + offset
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _key_entry(self, position: int) -> Tuple[bytes, int]:
+        key_offset, key_length, record_index = KEY.unpack_from(self._mm, self._keys_offset + position * KEY.size)
+        start = self._strings_offset + key_offset
+        return self._mm[start:start + key_length], record_index
+
+    def record(self, index: int) -> Dict[str, Any]:
+        """
+        Decode one food record.
+
+        Args:
+            index: Record index
+
+        Returns:
+            A dictionary with name, category, per_100g nutrients and portions (grams per unit)
+        """
+        fields = RECORD.unpack_from(self._mm, self._records_offset + index * RECORD.size)
+        portions = {}
+        for item in self._string(fields[4], fields[5]).split(";"):
+            if "=" in item:
+                unit, grams = item.split("=", 1)
+                portions[unit] = float(grams)
+        return {
+            "name": self._string(fields[0], fields[1]),
+            "category": self._string(fields[2], fields[3]),
+            "per_100g": {field: round(value, 2) for field, value in zip(NUTRIENT_FIELDS, fields[6:])},
+            "portions": portions,
+        }
+
+    def exact(self, name: str) -> Optional[Dict[str, Any]]:
+        """Look up a food by its exact (normalized) name or alias."""
+        key = normalize_name(name).encode("utf-8")
+        position = bisect.bisect_left(self._keys, key)
+        if position < self.key_count:
+            found_key, record_index = self._key_entry(position)
+            if found_key == key:
+                return self.record(record_index)
+        return None
+
+    def prefix(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Return foods whose name or alias starts with the given prefix."""
+        key = normalize_name(prefix).encode("utf-8")
+        position = bisect.bisect_left(self._keys, key)
+        seen: List[int] = []
+        while position < self.key_count and len(seen) < limit:
+            found_key, record_index = self._key_entry(position)
+            if not found_key.startswith(key):
+                break
+            if record_index not in seen:
+                seen.append(record_index)
+            position += 1
+        return [self.record(i) for i in seen]
+
+    def _build_trigram_index(self) -> Dict[str, List[int]]:
+        with self._trigram_lock:
+            if self._trigram_index is None:
+                index: Dict[str, List[int]] = defaultdict(list)
+                for position in range(self.key_count):
+                    for gram in _trigrams(self._key_entry(position)[0].decode("utf-8")):
+                        index[gram].append(position)
+                self._trigram_index = dict(index)
+        return self._trigram_index
+
+    def fuzzy(self, name: str, limit: int = 5, cutoff: float = FUZZY_CUTOFF) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Return the closest foods by trigram candidate search and edit-distance ratio.
+
+        Args:
+            name: Food name to match
+            limit: Maximum number of matches
+            cutoff: Minimum similarity score (0-1)
+
+        Returns:
+            A list of (record, score) tuples, best first
+        """
+        ranked = self._fuzzy_cached(normalize_name(name), limit, cutoff)
+        return [(self.record(i), score) for i, score, _ in ranked]
+
+    def suggest(self, name: str, limit: int = 3) -> List[str]:
+        """Return the names of foods similar to one that was not found."""
+        return [record["name"] for record, _ in self.fuzzy(re.sub(r"\(.*?\)", " ", name), limit=limit)]
+
+    def _fuzzy_indices(self, query: str, limit: int, cutoff: float) -> Tuple[Tuple[int, float, str], ...]:
+        if not query:
+            return ()
+        index = self._trigram_index or self._build_trigram_index()
+        counts: Dict[int, int] = defaultdict(int)
+        for gram in _trigrams(query):
+            for position in index.get(gram, ()):
+                counts[position] += 1
+        candidates = sorted(counts, key=counts.get, reverse=True)[:50]
+
+        # Record index -> (best score, the name or alias it was reached by)
+        best: Dict[int, Tuple[float, str]] = {}
+        matcher = difflib.SequenceMatcher(None, "", query)
+        for position in candidates:
+            key, record_index = self._key_entry(position)
+            matcher.set_seq1(key.decode("utf-8"))
+            if matcher.real_quick_ratio() < cutoff or matcher.quick_ratio() < cutoff:
+                continue
+            score = matcher.ratio()
+            if score >= cutoff and score > best.get(record_index, (0.0, ""))[0]:
+                best[record_index] = (score, key.decode("utf-8"))
+        ranked = sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        return tuple((i, round(score, 3), key) for i, (score, key) in ranked)
+
+    def lookup(self, name: str) -> Optional[Tuple[Dict[str, Any], str, float]]:
+        """
+        Resolve a food name using exact, then unique-prefix, then fuzzy matching.
+
+        A fuzzy match only counts when it is a misspelling of the same words
+        ("chapathi", "panner bhurji"); a different dish with a similar name
+        ("mutton biryani" for chicken biryani) is a miss, with suggest() for
+        the close names.
+
+        Args:
+            name: Food name as written in a meal plan or query
+
+        Returns:
+            (record, match_type, score) or None if nothing matched
+        """
+        record = self.exact(name)
+        if record:
+            return record, "exact", 1.0
+        # Drop parenthesised notes such as "Chapati (whole wheat)"
+        stripped = re.sub(r"\(.*?\)", " ", name)
+        if stripped != name:
+            record = self.exact(stripped)
+            if record:
+                return record, "exact", 1.0
+        prefixed = self.prefix(stripped, limit=2)
+        if len(prefixed) == 1:
+            return prefixed[0], "prefix", 1.0
+        query = normalize_name(stripped)
+        for record_index, score, key in self._fuzzy_cached(query, 5, FUZZY_MATCH_CUTOFF):
+            if _same_words(query, key):
+                return self.record(record_index), "fuzzy", score
+        return None
+
+
+class _KeyView:
+    """Sequence view over the sorted key table so bisect can search the mmap directly."""
+
+    def __init__(self, database: FoodDatabase):
+        self._database = database
+
+    def __len__(self) -> int:
+        return self._database.key_count
+
+    def __getitem__(self, position: int) -> bytes:
+        return self._database._key_entry(position)[0]
+
+
+def parse_amount(text: str) -> Optional[Tuple[float, int, int]]:
+    """
+    Read the amount at the start of a quantity such as "1 1/2 cup", "½ katori", "1/2 cup" or "150 g".
+
+    Args:
+        text: Quantity text
+
+    Returns:
+        (amount, start, end) with the span of the amount in text, or None if
+        text does not start with one
+    """
+    start = len(text) - len(text.lstrip())
+    match = _MIXED_NUMBER_RE.match(text, start)
+    if match:
+        whole, numerator, denominator = (int(group) for group in match.groups())
+        return (whole + numerator / denominator, start, match.end()) if denominator else None
+    match = _SIMPLE_FRACTION_RE.match(text, start)
+    if match:
+        numerator, denominator = (int(group) for group in match.groups())
+        return (numerator / denominator, start, match.end()) if denominator else None
+    match = _VULGAR_FRACTION_RE.match(text, start)
+    if match:
+        return float(match.group(1) or 0) + unicodedata.numeric(match.group(2)), start, match.end()
+    match = _DECIMAL_RE.match(text, start)
+    if match:
+        return float(match.group()), start, match.end()
+    match = _AMOUNT_WORD_RE.match(text, start)
+    if match:
+        return _AMOUNT_WORDS[match.group(1).lower()], start, match.end()
+    return None
+
+
+def parse_quantity(quantity: str, record: Dict[str, Any]) -> Optional[float]:
+    """
+    Convert a household quantity such as "2 chapati", "1 cup" or "150 g" to grams.
+
+    Args:
+        quantity: Quantity text
+        record: Food record providing the household portion weights
+
+    Returns:
+        The weight in grams, or None if the unit is unknown for this food
+    """
+    text = quantity.strip().lower()
+    parsed = parse_amount(text)
+    amount, unit_text = (parsed[0], text[parsed[2]:]) if parsed else (1.0, text)
+
+    portions = record["portions"]
+    words = normalize_name(unit_text).split()
+    for size in (2, 1):
+        for start in range(len(words) - size + 1):
+            candidate = " ".join(words[start:start + size])
+            unit = _UNIT_ALIASES.get(candidate, candidate)
+            if unit == "g":
+                return amount
+            if unit == "kg":
+                return amount * 1000
+            if unit == "ml":
+                return amount
+            if unit == "l":
+                return amount * 1000
+            if unit in portions:
+                return amount * portions[unit]
+    if any(_UNIT_ALIASES.get(word, word) in HOUSEHOLD_UNITS for word in words):
+        return None  # a unit this food has no weight for, e.g. "1 cup" of chapati
+    # "2 roti" / "1 apple": a bare count of a countable food
+    if "piece" in portions:
+        return amount * portions["piece"]
+    return None
+
+
+def quantity_unit(quantity: str) -> Optional[str]:
+    """
+    Name the household unit of a quantity: "piece" for "2 medium pieces", "katori" for "½ katori".
+
+    Args:
+        quantity: Quantity text
+
+    Returns:
+        The canonical unit, or None for a bare count ("2 roti") or text without a known unit
+    """
+    text = quantity.strip().lower()
+    parsed = parse_amount(text)
+    words = normalize_name(text[parsed[2]:] if parsed else text).split()
+    for size in (2, 1):
+        for start in range(len(words) - size + 1):
+            candidate = " ".join(words[start:start + size])
+            unit = _UNIT_ALIASES.get(candidate, candidate)
+            if unit in HOUSEHOLD_UNITS or unit == "small piece":
+                return unit
+    return None
+
+
+def nutrients_for(record: Dict[str, Any], grams: float) -> Dict[str, float]:
+    """Scale a record's per-100g nutrients to the given weight."""
+    factor = grams / 100.0
+    return {field: round(value * factor, 1) for field, value in record["per_100g"].items()}
+
+
+_database: Optional[FoodDatabase] = None
+_database_lock = threading.Lock()
+
+
+def get_food_database() -> FoodDatabase:
+    """
+    Return the process-wide food database.
+
+    The compiled file shipped with the package is loaded as is; after editing
+    the CSV, rebuild it with `python -m nutrition_agent.food_db`. A checkout
+    without the compiled file builds one under CACHE_DATABASE_PATH instead.
+    """
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                path = DATABASE_PATH
+                if not os.path.exists(path):
+                    path = CACHE_DATABASE_PATH
+                    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(SOURCE_PATH):
+                        build_food_database(output_path=path)
+                _database = FoodDatabase(path)
+    return _database
+
+
+def lookup_food_nutrition(food_name: str, quantity: str = "100 g") -> str:
+    """
+    Look up nutritional values for an Indian food from the local food-composition database.
+
+    Args:
+        food_name: Name of the food, e.g. "chapati", "toor dal", "paneer"
+        quantity: Amount eaten, e.g. "2 pieces", "1 cup", "150 g". Defaults to "100 g".
+
+    Returns:
+        A JSON string with the matched food, grams, nutrients for the quantity,
+        per-100g values and household portions. If "found" is false, fall back
+        to web search; "suggestions" lists similar foods in the database, which
+        are only a match if they are the same dish.
+    """
+    database = get_food_database()
+    result = database.lookup(food_name)
+    if result is None:
+        response = {"found": False, "food_name": food_name, "message": "Not in local database; use web search"}
+        suggestions = database.suggest(food_name)
+        if suggestions:
+            response["suggestions"] = suggestions
+        return dumps_compact(response)
+    record, match_type, score = result
+    grams = parse_quantity(quantity, record)
+    response: Dict[str, Any] = {
+        "found": True,
+        "food_name": food_name,
+        "matched_name": record["name"],
+        "match_type": match_type,
+        "match_score": score,
+        "per_100g": record["per_100g"],
+        "portions_g": record["portions"],
+    }
+    if grams is None:
+        response["message"] = f"Unknown unit in quantity '{quantity}'; use portions_g to convert"
+    else:
+        response["quantity"] = quantity
+        response["grams"] = round(grams, 1)
+        response["nutrients"] = nutrients_for(record, grams)
+    return dumps_compact(response)
+
+
+food_lookup_tool = FunctionTool(func=lookup_food_nutrition)
+
+
+if __name__ == "__main__":
+    print(f"Wrote {build_food_database()} foods to {DATABASE_PATH}")
@@ -0,0 +1,167 @@
+import json
+import re
+from typing import Any, List, Optional
+
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+_FENCED_BLOCK_RE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.IGNORECASE | re.DOTALL)
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+_decoder = json.JSONDecoder()
+
+
+def strip_code_fences(text: str) -> str:
+    """
+    Remove a surrounding ```json ... ``` fence from a model response.
+
+    Args:
+        text: Raw model output
+
+    Returns:
+        The text without the leading/trailing markdown fence
+    """
+    return _FENCE_RE.sub("", text).strip()
+
+
+def repair_json(text: str) -> str:
+    """
+    Fix the trivial breakage models produce in otherwise valid JSON.
+
+    Repairs trailing commas, Python literals (True/False/None), single-quoted
+    strings, raw newlines inside strings, and output truncated mid-value (open
+    strings and brackets are closed). Text after the first complete top-level
+    value is dropped.
+
+    Args:
+        text: JSON text starting at its opening brace or bracket
+
+    Returns:
+        The repaired JSON text (not guaranteed to parse)
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    quote = ""
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if quote:
+            if char == "\\" and index + 1 < len(text):
+                out.append(text[index:index + 2])
+                index += 2
+                continue
+            if char == quote:
+                out.append('"')
+                quote = ""
+            elif char == '"':
+                out.append('\\"')
+            elif char == "\n":
+                out.append("\\n")
+            else:
+                out.append(char)
+            index += 1
+            continue
+        if char in "\"'":
+            quote = char
+            out.append('"')
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+            out.append(char)
+        elif char in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack and stack[-1] == char:
+                stack.pop()
+            out.append(char)
+            if not stack:
+                break
+        elif char.isalpha():
+            end = index
+            while end < len(text) and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[index:end]
+            out.append(_PYTHON_LITERALS.get(word, word))
+            index = end
+            continue
+        else:
+            out.append(char)
+        index += 1
+    if quote:
+        out.append('"')
+    while out and (out[-1].isspace() or out[-1] in ",:"):
+        out.pop()
+    out.extend(reversed(stack))
+    return "".join(out)
+
+
+def extract_json(text: Any) -> Any:
+    """
+    Parse the JSON value in a model response, tolerating markdown fences,
+    surrounding prose and trivially broken JSON (see repair_json).
+
+    Well-formed JSON takes a single json.loads; the slower paths only run on
+    malformed output.
+
+    Args:
+        text: Raw model output (already-parsed dicts and lists are returned as is)
+
+    Returns:
+        The parsed value
+
+    Raises:
+        ValueError: If no JSON value can be recovered (json.JSONDecodeError is a subclass)
+    """
+    if isinstance(text, (dict, list)):
+        return text
+    text = str(text)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    fenced = _FENCED_BLOCK_RE.search(text)
+    candidate = fenced.group(1) if fenced else text
+    starts = [position for position in (candidate.find("{"), candidate.find("[")) if position >= 0]
+    if not starts:
+        raise ValueError("No JSON object or array in model output")
+    candidate = candidate[min(starts):]
+    try:
+        # Stops at the end of the first value, ignoring any trailing prose
+        return _decoder.raw_decode(candidate)[0]
+    except json.JSONDecodeError:
+        pass
+    return json.loads(repair_json(candidate))
+
+
+def load_state_json(value: Any) -> Optional[Any]:
+    """
+    Parse a JSON value stored in session state by an agent's output_key.
+
+    Agents write their final text (often fenced) into state, while code-level
+    steps write already-parsed objects. Both forms are accepted here, and
+    malformed text goes through extract_json's repairs.
+
+    Args:
+        value: A JSON string, fenced JSON string, dict or list
+
+    Returns:
+        The parsed object, or None if the value could not be parsed
+    """
+    if value is None:
+        return None
+    try:
+        return extract_json(value)
+    except ValueError:
+        return None
+
+
+def dumps_compact(data: Any) -> str:
+    """
+    Serialize data as minified JSON for tool results and state values.
+
+    Args:
+        data: Any JSON-serializable object
+
+    Returns:
+        JSON string without insignificant whitespace
+    """
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
@@ -0,0 +1,119 @@
+"""
+Code-level control for meal_plan_refinement_loop.
+
+Two non-LLM agents sit inside the LoopAgent:
+
+    critic -> ApprovalGateAgent -> refiner -> ConvergenceGateAgent
+
+ApprovalGateAgent reads the critique from state and escalates out of the
+loop when it is APPROVED, so no refiner call is spent on exiting. Otherwise it
+snapshots the current plan. ConvergenceGateAgent escalates when the refiner
+returned a plan identical or numerically equivalent to that snapshot, since
+another critique of an unchanged plan cannot change the outcome.
+"""
+from typing import Any, AsyncGenerator, Iterable
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+
+from .json_utils import load_state_json
+
+APPROVED_STATUS = "APPROVED"
+PREVIOUS_PLAN_KEY = "previous_meal_plan"
+
+# Free-text fields that the refiner rewrites without changing the plan itself
+IGNORED_PLAN_KEYS = {"refinement_notes", "important_notes", "preparation_notes"}
+
+
+def critique_approved(critique: Any) -> bool:
+    """
+    Check whether a critique state value has status APPROVED.
+
+    Args:
+        critique: The critique JSON string or parsed dict
+
+    Returns:
+        True if the critique parses and its status is APPROVED
+    """
+    parsed = load_state_json(critique)
+    return isinstance(parsed, dict) and str(parsed.get("status", "")).strip().upper() == APPROVED_STATUS
+
+
+def plans_equivalent(a: Any, b: Any, tolerance: float = 0.5, ignored_keys: Iterable[str] = IGNORED_PLAN_KEYS) -> bool:
+    """
+    Compare two meal plans structurally, treating numbers within tolerance as equal.
+
+    Strings are compared case- and whitespace-insensitively and free-text note
+    fields are ignored.
+
+    Args:
+        a: First plan (JSON string or parsed)
+        b: Second plan (JSON string or parsed)
+        tolerance: Maximum absolute difference between numbers considered equal
+        ignored_keys: Dictionary keys excluded from the comparison
+
+    Returns:
+        True if the plans are equivalent
+    """
+    ignored = set(ignored_keys)
+
+    def equal(x: Any, y: Any) -> bool:
+        if isinstance(x, bool) or isinstance(y, bool):
+            return x == y
+        if isinstance(x, (int, float)) and isinstance(y, (int, float)):
+            return abs(x - y) <= tolerance
+        if isinstance(x, str) and isinstance(y, str):
+            return " ".join(x.split()).casefold() == " ".join(y.split()).casefold()
+        if isinstance(x, dict) and isinstance(y, dict):
+            keys = (set(x) | set(y)) - ignored
+            return all(k in x and k in y and equal(x[k], y[k]) for k in keys)
+        if isinstance(x, list) and isinstance(y, list):
+            return len(x) == len(y) and all(equal(i, j) for i, j in zip(x, y))
+        return x == y
+
+    parsed_a, parsed_b = load_state_json(a), load_state_json(b)
+    if parsed_a is None or parsed_b is None:
+        return False
+    return equal(parsed_a, parsed_b)
+
+
+class ApprovalGateAgent(BaseAgent):
+    """Escalates out of the refinement loop when the latest critique is APPROVED."""
+
+    critique_key: str = "critique"
+    plan_key: str = "current_meal_plan"
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        if critique_approved(state.get(self.critique_key)):
+            yield Event(
+                invocation_id=ctx.invocation_id,
+                author=self.name,
+                branch=ctx.branch,
+                actions=EventActions(escalate=True),
+            )
+            return
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={PREVIOUS_PLAN_KEY: state.get(self.plan_key)}),
+        )
+
+
+class ConvergenceGateAgent(BaseAgent):
+    """Escalates out of the refinement loop when the refiner stopped changing the plan."""
+
+    plan_key: str = "current_meal_plan"
+    tolerance: float = 0.5
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        if plans_equivalent(state.get(PREVIOUS_PLAN_KEY), state.get(self.plan_key), self.tolerance):
+            yield Event(
+                invocation_id=ctx.invocation_id,
+                author=self.name,
+                branch=ctx.branch,
+                actions=EventActions(escalate=True),
+            )
@@ -0,0 +1,129 @@
+"""
+Arithmetic over the current_meal_plan structure.
+
+Per-meal and daily totals are always recomputed from the `foods` arrays
+rather than trusted from model output.
+"""
+import copy
+import re
+from typing import Dict, Any, List, Optional
+
+MEALS = ["breakfast", "mid_morning_snack", "lunch", "evening_snack", "dinner"]
+REQUIRED_MEALS = ["breakfast", "lunch", "dinner"]
+MACRO_KEYS = ["calories", "protein_g", "carbs_g", "fats_g"]
+
+# daily_targets field for each meal plan nutrient
+TARGET_KEYS = {
+    "calories": "total_calories",
+    "protein_g": "protein_grams",
+    "carbs_g": "carbohydrates_grams",
+    "fats_g": "fats_grams",
+    "fiber_g": "fiber_grams",
+}
+
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def to_number(value: Any) -> Optional[float]:
+    """
+    Read a numeric value that a model may have written as a number or a string like "120 kcal".
+
+    Args:
+        value: Raw value
+
+    Returns:
+        The number, or None if there is none
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = _NUMBER_RE.search(value)
+        if match:
+            return float(match.group())
+    return None
+
+
+def meal_included(meal: Dict[str, Any]) -> bool:
+    """Snacks carry an `include` flag; main meals are always included."""
+    return bool(meal.get("include", True))
+
+
+def sum_foods(foods: List[Dict[str, Any]], keys: List[str] = MACRO_KEYS) -> Dict[str, float]:
+    """
+    Sum nutrient values over a foods array.
+
+    Args:
+        foods: Food entries from a meal
+        keys: Nutrient keys to sum
+
+    Returns:
+        A dictionary of totals rounded to one decimal
+    """
+    totals = {key: 0.0 for key in keys}
+    for food in foods or []:
+        if not isinstance(food, dict):
+            continue
+        for key in keys:
+            totals[key] += to_number(food.get(key)) or 0.0
+    return {key: round(value, 1) for key, value in totals.items()}
+
+
+def daily_totals(plan: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Sum the recomputed totals of all included meals.
+
+    Args:
+        plan: Parsed current_meal_plan
+
+    Returns:
+        Daily calories, protein_g, carbs_g, fats_g and fiber_g
+    """
+    keys = MACRO_KEYS + ["fiber_g"]
+    totals = {key: 0.0 for key in keys}
+    for meal in (plan.get("meal_plan") or {}).values():
+        if isinstance(meal, dict) and meal_included(meal):
+            for key, value in sum_foods(meal.get("foods"), keys).items():
+                totals[key] += value
+    return {key: round(value, 1) for key, value in totals.items()}
+
+
+def target_comparison(totals: Dict[str, float], daily_targets: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Express daily totals as percentages of the daily targets.
+
+    Args:
+        totals: Daily totals
+        daily_targets: nutrition_requirements["daily_targets"]
+
+    Returns:
+        calories/protein/carbs/fats percentages of target
+    """
+    comparison = {}
+    for key, name in (("calories", "calories"), ("protein_g", "protein"), ("carbs_g", "carbs"), ("fats_g", "fats")):
+        target = to_number(daily_targets.get(TARGET_KEYS[key]))
+        comparison[f"{name}_percentage"] = round(totals.get(key, 0.0) / target * 100, 1) if target else 0.0
+    return comparison
+
+
+def recompute_totals(plan: Dict[str, Any], daily_targets: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Return a copy of the plan with every meal's totals, daily_totals and
+    target_comparison recomputed from the foods arrays.
+
+    Args:
+        plan: Parsed current_meal_plan
+        daily_targets: Targets for target_comparison; left unchanged if omitted
+
+    Returns:
+        The updated plan copy
+    """
+    updated = copy.deepcopy(plan)
+    for meal in (updated.get("meal_plan") or {}).values():
+        if isinstance(meal, dict):
+            meal["totals"] = sum_foods(meal.get("foods"))
+    updated["daily_totals"] = daily_totals(updated)
+    if daily_targets:
+        updated["target_comparison"] = target_comparison(updated["daily_totals"], daily_targets)
+    return updated
@@ -0,0 +1,135 @@
+"""
+Per-meal planning support: meal targets for the parallel meal planners and the
+deterministic fan-in aggregator that assembles current_meal_plan.
+"""
+import json
+from typing import Dict, Any, AsyncGenerator, List, Optional
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.genai import types
+
+from .json_utils import load_state_json, dumps_compact
+from .meal_plan import MEALS, REQUIRED_MEALS, TARGET_KEYS, to_number, recompute_totals
+
+MEAL_TIMES = {
+    "breakfast": "7:00-8:00 AM",
+    "mid_morning_snack": "10:30-11:00 AM",
+    "lunch": "1:00-2:00 PM",
+    "evening_snack": "4:30-5:00 PM",
+    "dinner": "7:30-8:30 PM",
+}
+
+
+def target_key(meal: str) -> str:
+    """State key holding a meal's calorie/macro targets."""
+    return f"{meal}_target"
+
+
+def plan_key(meal: str) -> str:
+    """State key holding a meal planner's output."""
+    return f"{meal}_plan"
+
+
+def meal_targets(requirements: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Split daily targets across meals using meal_distribution.
+
+    Args:
+        requirements: Parsed nutrition_requirements
+
+    Returns:
+        Per-meal dictionaries with include, percentage, calories and macro grams
+    """
+    daily = requirements.get("daily_targets") or {}
+    distribution = requirements.get("meal_distribution") or {}
+    targets = {}
+    for meal in MEALS:
+        entry = distribution.get(meal) or {}
+        percentage = to_number(entry.get("percentage")) or 0.0
+        include = meal in REQUIRED_MEALS or bool(entry.get("include", percentage > 0))
+        share = percentage / 100
+        targets[meal] = {
+            "meal": meal,
+            "time": MEAL_TIMES[meal],
+            "include": include,
+            "percentage": percentage,
+            "calories": to_number(entry.get("calories")) or round((to_number(daily.get("total_calories")) or 0) * share),
+            "protein_g": round((to_number(daily.get(TARGET_KEYS["protein_g"])) or 0) * share, 1),
+            "carbs_g": round((to_number(daily.get(TARGET_KEYS["carbs_g"])) or 0) * share, 1),
+            "fats_g": round((to_number(daily.get(TARGET_KEYS["fats_g"])) or 0) * share, 1),
+        }
+    return targets
+
+
+def prepare_meal_targets(callback_context: CallbackContext) -> Optional[types.Content]:
+    """Publish each meal's slice of the targets to state before the parallel planners run."""
+    requirements = load_state_json(callback_context.state.get("nutrition_requirements")) or {}
+    for meal, target in meal_targets(requirements).items():
+        callback_context.state[target_key(meal)] = dumps_compact(target)
+    return None
+
+
+def skip_excluded_meal(callback_context: CallbackContext) -> Optional[types.Content]:
+    """Skip a snack planner's model call when the snack is not part of the plan."""
+    meal = callback_context.agent_name.replace("_planner_agent", "")
+    target = load_state_json(callback_context.state.get(target_key(meal))) or {}
+    if target.get("include", True):
+        return None
+    skipped = json.dumps({"include": False, "foods": [], "preparation_notes": ""})
+    callback_context.state[plan_key(meal)] = skipped
+    return types.Content(role="model", parts=[types.Part(text=skipped)])
+
+
+def assemble_meal_plan(meal_outputs: Dict[str, Any], requirements: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Assemble per-meal planner outputs into the current_meal_plan structure
+    with totals, daily_totals and target_comparison computed in code.
+
+    Args:
+        meal_outputs: Meal name -> planner output (JSON string or parsed)
+        requirements: Parsed nutrition_requirements
+
+    Returns:
+        The assembled meal plan
+    """
+    targets = meal_targets(requirements)
+    meal_plan: Dict[str, Any] = {}
+    notes: List[str] = []
+    for meal in MEALS:
+        output = load_state_json(meal_outputs.get(meal))
+        output = output if isinstance(output, dict) else {}
+        entry: Dict[str, Any] = {
+            "time": output.get("time") or MEAL_TIMES[meal],
+            "target_calories": targets[meal]["calories"],
+        }
+        if meal not in REQUIRED_MEALS:
+            entry["include"] = bool(output.get("include", targets[meal]["include"]))
+        entry["foods"] = output.get("foods") if isinstance(output.get("foods"), list) else []
+        entry["preparation_notes"] = output.get("preparation_notes", "")
+        meal_plan[meal] = entry
+        for note in output.get("notes") or []:
+            if isinstance(note, str) and note and note not in notes:
+                notes.append(note)
+
+    plan = {"meal_plan": meal_plan, "important_notes": notes}
+    return recompute_totals(plan, requirements.get("daily_targets") or {})
+
+
+class MealPlanAggregatorAgent(BaseAgent):
+    """Fans in the per-meal planner outputs and writes current_meal_plan."""
+
+    output_key: str = "current_meal_plan"
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        requirements = load_state_json(state.get("nutrition_requirements")) or {}
+        plan = assemble_meal_plan({meal: state.get(plan_key(meal)) for meal in MEALS}, requirements)
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={self.output_key: json.dumps(plan, indent=2)}),
+        )
@@ -0,0 +1,386 @@
+"""
+Content-addressed memoization of pipeline stages across runs.
+
+A stage's memo key is a SHA-256 of its inputs (the patient's questionnaire and
+measurements, or the upstream state it reads) plus the instruction template
+and model ID of every agent in the stage. When a key is already in the memo
+the stage's outputs are written to state and its agents are skipped:
+
+    patient_data        patient_data_agent          -> patient_health_data
+    nutrition           nutrition_calculator_agent  -> nutrition_requirements (+ calculated targets, guidelines)
+    approved_meal_plan  meal planners + refinement  -> current_meal_plan, critique (stored only when APPROVED)
+
+Entries live in SQLite with TTL expiry and LRU eviction past max_entries;
+invalidate() removes entries by stage or key.
+
+Usage:
+    python -m nutrition_agent.memo stats
+    python -m nutrition_agent.memo invalidate --stage nutrition
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.tools.agent_tool import AgentTool
+from google.genai import types
+
+from .json_utils import load_state_json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMO_PATH = os.path.expanduser(
+    os.getenv("NUTRITION_STAGE_MEMO_PATH", "~/.cache/nutrition_agent/stage_memo.sqlite3")
+)
+DEFAULT_TTL_SECONDS = float(os.getenv("NUTRITION_STAGE_MEMO_TTL", 30 * 24 * 3600))
+DEFAULT_MAX_ENTRIES = int(os.getenv("NUTRITION_STAGE_MEMO_MAX_ENTRIES", 100000))
+# Invocations whose stage bookkeeping is kept at once: runs cancelled before
+# after_run_callback (deadline, batch retries) are dropped oldest first
+MAX_TRACKED_INVOCATIONS = 1024
+# Bump when code that shapes stage outputs (calculator, aggregation, patching) changes
+MEMO_VERSION = 1
+
+PATIENT_DATA_INPUT = "<patient data>"
+
+# Stage -> top-level agents (in order), state inputs and state outputs
+MEMO_STAGES: Dict[str, Dict[str, List[str]]] = {
+    "patient_data": {
+        "agents": ["patient_data_agent"],
+        "inputs": [PATIENT_DATA_INPUT],
+        "outputs": ["patient_health_data"],
+    },
+    "nutrition": {
+        "agents": ["nutrition_calculator_agent"],
+        "inputs": ["patient_health_data"],
+        "outputs": ["calculated_nutrition_targets", "nutrition_guidelines", "nutrition_requirements"],
+    },
+    "approved_meal_plan": {
+        "agents": ["initial_meal_planner_agent", "meal_plan_refinement_loop"],
+        "inputs": ["patient_health_data", "nutrition_requirements"],
+        "outputs": ["current_meal_plan", "critique"],
+    },
+}
+
+
+def _canonical(value: Any) -> str:
+    parsed = load_state_json(value)
+    if parsed is None:
+        return str(value)
+    return json.dumps(parsed, sort_keys=True, separators=(",", ":"))
+
+
+def _walk(agent: BaseAgent):
+    yield agent
+    for tool in getattr(agent, "tools", []):
+        tool = getattr(tool, "search_tool", tool)
+        if isinstance(tool, AgentTool):
+            yield from _walk(tool.agent)
+    for sub_agent in agent.sub_agents:
+        yield from _walk(sub_agent)
+
+
+def agent_fingerprint(agent: BaseAgent) -> str:
+    """
+    Hash the instruction template and model ID of an agent and everything below it.
+
+    Args:
+        agent: Root of the stage's agent subtree
+
+    Returns:
+        Hex SHA-256
+    """
+    digest = hashlib.sha256()
+    for node in _walk(agent):
+        instruction = getattr(node, "instruction", "")
+        template = getattr(instruction, "template", instruction)
+        model = getattr(node, "model", "")
+        model_id = model if isinstance(model, str) else getattr(model, "model", "")
+        digest.update(json.dumps([node.name, str(template), model_id]).encode())
+    return digest.hexdigest()
+
+
+class StageMemo:
+    """SQLite store of stage outputs keyed by content hash, with TTL and LRU eviction."""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_MEMO_PATH,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS stage_memo ("
+            "key TEXT PRIMARY KEY, stage TEXT NOT NULL, outputs TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS stage_memo_accessed ON stage_memo (accessed_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS stage_memo_stage ON stage_memo (stage)")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the memoized outputs for a key, or None on a miss or expired entry.
+
+        Args:
+            key: Stage memo key
+
+        Returns:
+            State key -> stored value
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT outputs, created_at FROM stage_memo WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._db.execute("DELETE FROM stage_memo WHERE key = ?", (key,))
+                self._counters["expirations"] += 1
+                row = None
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            self._db.execute("UPDATE stage_memo SET accessed_at = ? WHERE key = ?", (now, key))
+            self._counters["hits"] += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, stage: str, outputs: Dict[str, Any]) -> None:
+        """
+        Store a stage's outputs, evicting least recently used entries past max_entries.
+
+        Args:
+            key: Stage memo key
+            stage: Stage name
+            outputs: State key -> value
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO stage_memo (key, stage, outputs, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, stage, json.dumps(outputs), now, now),
+            )
+            self._counters["stores"] += 1
+            overflow = self._db.execute("SELECT COUNT(*) FROM stage_memo").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM stage_memo WHERE key IN (SELECT key FROM stage_memo ORDER BY accessed_at LIMIT ?)",
+                    (overflow,),
+                )
+                self._counters["evictions"] += overflow
+
+    def invalidate(self, stage: Optional[str] = None, key: Optional[str] = None) -> int:
+        """
+        Remove memoized entries for a stage, a single key, or both filters combined.
+
+        Args:
+            stage: Stage name to invalidate
+            key: Memo key to invalidate
+
+        Returns:
+            Number of entries removed
+        """
+        if stage is None and key is None:
+            raise ValueError("invalidate() needs a stage or a key; use clear() to remove everything")
+        clauses, params = [], []
+        if stage is not None:
+            clauses.append("stage = ?")
+            params.append(stage)
+        if key is not None:
+            clauses.append("key = ?")
+            params.append(key)
+        with self._lock:
+            removed = self._db.execute(f"DELETE FROM stage_memo WHERE {' AND '.join(clauses)}", params).rowcount
+            self._counters["invalidations"] += removed
+            return removed
+
+    def purge_expired(self) -> int:
+        """Delete expired entries and return how many were removed."""
+        with self._lock:
+            removed = self._db.execute(
+                "DELETE FROM stage_memo WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+            self._counters["expirations"] += removed
+            return removed
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            self._db.execute("DELETE FROM stage_memo")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters and entry counts per stage."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            stats["entries"] = dict(self._db.execute("SELECT stage, COUNT(*) FROM stage_memo GROUP BY stage").fetchall())
+            return stats
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class StageMemoPlugin(BasePlugin):
+    """Serves memoized stage outputs instead of running the stage's agents."""
+
+    def __init__(
+        self,
+        memo: StageMemo,
+        root_agent: BaseAgent,
+        patient_data_loader: Callable[[Dict[str, Any]], Optional[str]],
+        name: str = "stage_memo_plugin",
+        max_tracked_invocations: int = MAX_TRACKED_INVOCATIONS,
+    ):
+        super().__init__(name)
+        self.memo = memo
+        self.patient_data_loader = patient_data_loader
+        agents = {agent.name: agent for agent in _walk(root_agent)}
+        self._fingerprints = {
+            stage: hashlib.sha256("".join(
+                agent_fingerprint(agents[name]) for name in spec["agents"] if name in agents
+            ).encode()).hexdigest()
+            for stage, spec in MEMO_STAGES.items()
+        }
+        self._entry_stage = {spec["agents"][0]: stage for stage, spec in MEMO_STAGES.items()}
+        self._exit_stage = {spec["agents"][-1]: stage for stage, spec in MEMO_STAGES.items()}
+        self._stage_of = {name: stage for stage, spec in MEMO_STAGES.items() for name in spec["agents"]}
+        self.max_tracked_invocations = max_tracked_invocations
+        # invocation_id -> {"running": {stage: memo key}, "served": {stage}, "finished": [(stage, memo key)]};
+        # finished stages are stored once the agents' own after-callbacks have run
+        self._invocations: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def stage_key(self, stage: str, state: Dict[str, Any]) -> Optional[str]:
+        """
+        Compute a stage's memo key from state.
+
+        Args:
+            stage: Stage name
+            state: Session state
+
+        Returns:
+            Hex SHA-256, or None if an input is missing
+        """
+        parts = [str(MEMO_VERSION), stage, self._fingerprints[stage]]
+        for name in MEMO_STAGES[stage]["inputs"]:
+            if name == PATIENT_DATA_INPUT:
+                try:
+                    value = self.patient_data_loader(state)
+                except (OSError, ValueError):
+                    value = None
+            else:
+                value = state.get(name)
+            if value is None:
+                return None
+            parts.append(_canonical(value))
+        return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+    def _tracked(self, invocation_id: str) -> Dict[str, Any]:
+        """The bookkeeping of an invocation, dropping the oldest ones past max_tracked_invocations."""
+        tracked = self._invocations.get(invocation_id)
+        if tracked is None:
+            tracked = self._invocations[invocation_id] = {"running": {}, "served": set(), "finished": []}
+            while len(self._invocations) > self.max_tracked_invocations:
+                dropped, _ = self._invocations.popitem(last=False)
+                logger.debug("stage memo: dropped bookkeeping of unfinished invocation %s", dropped)
+        else:
+            self._invocations.move_to_end(invocation_id)
+        return tracked
+
+    def _store_finished(self, tracked: Dict[str, Any], state: Any) -> None:
+        for stage, key in tracked["finished"]:
+            outputs = {name: state.get(name) for name in MEMO_STAGES[stage]["outputs"]}
+            if any(value is None for value in outputs.values()):
+                continue
+            if stage == "approved_meal_plan" and (load_state_json(outputs["critique"]) or {}).get("status") != "APPROVED":
+                continue
+            self.memo.put(key, stage, outputs)
+        tracked["finished"] = []
+
+    async def before_agent_callback(self, *, agent: BaseAgent, callback_context: CallbackContext) -> Optional[types.Content]:
+        stage = self._stage_of.get(agent.name)
+        if stage is None:
+            return None
+        state = callback_context.state
+        tracked = self._tracked(callback_context.invocation_id)
+        self._store_finished(tracked, state)
+
+        if stage in tracked["served"]:
+            return types.Content(role="model", parts=[types.Part(text=f"{agent.name} served from stage memo")])
+        if self._entry_stage.get(agent.name) != stage:
+            return None
+
+        key = self.stage_key(stage, state)
+        if key is None:
+            return None
+        outputs = self.memo.get(key)
+        if outputs is None:
+            tracked["running"][stage] = key
+            return None
+
+        for name, value in outputs.items():
+            state[name] = value
+        tracked["served"].add(stage)
+        logger.info("stage memo hit: %s served without running %s", stage, ", ".join(MEMO_STAGES[stage]["agents"]))
+        # ADK stores skip content under an LLM agent's output_key, so return the memoized output
+        output_key = getattr(agent, "output_key", None)
+        text = outputs.get(output_key) if output_key else None
+        return types.Content(role="model", parts=[types.Part(text=str(text or f"{agent.name} served from stage memo"))])
+
+    async def after_agent_callback(self, *, agent: BaseAgent, callback_context: CallbackContext) -> None:
+        stage = self._exit_stage.get(agent.name)
+        tracked = self._invocations.get(callback_context.invocation_id) if stage else None
+        key = tracked["running"].pop(stage, None) if tracked else None
+        if key:
+            tracked["finished"].append((stage, key))
+        return None
+
+    async def after_run_callback(self, *, invocation_context) -> None:
+        tracked = self._invocations.pop(invocation_context.invocation_id, None)
+        if tracked:
+            self._store_finished(tracked, invocation_context.session.state)
+        return None
+
+    async def close(self) -> None:
+        self.memo.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the stage memo")
+    parser.add_argument("--path", default=DEFAULT_MEMO_PATH, help="Stage memo database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Show entry counts per stage")
+    invalidate_command = commands.add_parser("invalidate", help="Remove entries by stage and/or key")
+    invalidate_command.add_argument("--stage", choices=list(MEMO_STAGES))
+    invalidate_command.add_argument("--key")
+    commands.add_parser("purge", help="Remove expired entries")
+    commands.add_parser("clear", help="Remove every entry")
+    args = parser.parse_args()
+
+    memo = StageMemo(args.path)
+    if args.command == "stats":
+        print(json.dumps(memo.stats(), indent=2))
+    elif args.command == "invalidate":
+        if not args.stage and not args.key:
+            parser.error("invalidate needs --stage or --key")
+        print(f"Invalidated {memo.invalidate(stage=args.stage, key=args.key)} entries", file=sys.stderr)
+    elif args.command == "purge":
+        print(f"Removed {memo.purge_expired()} expired entries", file=sys.stderr)
+    else:
+        memo.clear()
+        print("Cleared the stage memo", file=sys.stderr)
+    memo.close()
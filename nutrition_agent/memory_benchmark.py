@@ -0,0 +1,202 @@
+"""
+Memory benchmark for long-running workers: RSS across thousands of sequential plans.
+
+Every model in the graph is replaced by FakeGeminiModel and synthetic
+patients are planned one after another on one Runner, as a worker or the
+HTTP server would. Every --sample-every plans the process RSS and the
+session service's stored session and event counts are sampled.
+
+Two modes can be compared:
+
+- compacting: CompactingSessionService, finished sessions evicted (the default setup)
+- unbounded: plain InMemorySessionService, sessions kept with their full
+  event history (the previous behavior)
+
+Growth is measured from the first sample after --warmup plans to the last
+one, so one-time allocations (imports, caches, the agent graph) do not count.
+Pass --max-growth-mb to fail (exit status 1) when the compacting mode grows
+beyond it.
+
+Usage:
+    python -m nutrition_agent.memory_benchmark --plans 5000 --mode compacting unbounded --report memory.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+
+from .agent import get_nutritionist_agent, APP_NAME
+from .batch import run_patient
+from .compaction import CompactingSessionService
+from .fake_model import install_fake_models
+
+MODES = ["compacting", "unbounded"]
+DEFAULT_PLANS = 2000
+DEFAULT_SAMPLE_EVERY = 100
+DEFAULT_WARMUP = 200
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB; the peak RSS where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            return round(int(statm.read().split()[1]) * _PAGE_SIZE / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _session_stats(session_service: InMemorySessionService) -> Dict[str, int]:
+    if isinstance(session_service, CompactingSessionService):
+        return session_service.stats()
+    sessions = [session for users in session_service.sessions.values() for stored in users.values() for session in stored.values()]
+    return {"sessions": len(sessions), "events": sum(len(session.events) for session in sessions)}
+
+
+def growth(samples: List[Dict[str, Any]], warmup: int) -> Dict[str, Optional[float]]:
+    """
+    RSS growth between the first sample after warmup and the last sample.
+
+    Args:
+        samples: Samples with "plans" and "rss_mb", in order
+        warmup: Plans excluded from the measurement
+
+    Returns:
+        {"rss_growth_mb", "mb_per_1000_plans"}; None when fewer than two samples follow the warmup
+    """
+    measured = [sample for sample in samples if sample["plans"] >= warmup]
+    if len(measured) < 2 or measured[-1]["plans"] == measured[0]["plans"]:
+        return {"rss_growth_mb": None, "mb_per_1000_plans": None}
+    first, last = measured[0], measured[-1]
+    delta = last["rss_mb"] - first["rss_mb"]
+    return {
+        "rss_growth_mb": round(delta, 1),
+        "mb_per_1000_plans": round(delta * 1000 / (last["plans"] - first["plans"]), 2),
+    }
+
+
+async def run_mode(mode: str, plans: int, sample_every: int, warmup: int) -> Dict[str, Any]:
+    """
+    Run plans sequentially with one session setup and sample memory along the way.
+
+    Args:
+        mode: "compacting" or "unbounded"
+        plans: Number of plans to generate
+        sample_every: Plans between samples
+        warmup: Plans excluded from the growth measurement
+
+    Returns:
+        The mode's report entry
+    """
+    compacting = mode == "compacting"
+    session_service = CompactingSessionService() if compacting else InMemorySessionService()
+    runner = Runner(agent=get_nutritionist_agent(), app_name=APP_NAME, session_service=session_service)
+    semaphore = asyncio.Semaphore(1)
+
+    gc.collect()
+    samples: List[Dict[str, Any]] = [{"plans": 0, "rss_mb": current_rss_mb(), **_session_stats(session_service)}]
+    failed = 0
+    started = time.perf_counter()
+    try:
+        for index in range(plans):
+            patient = {"patient_id": f"memory-{mode}-{index + 1}"}
+            result = await run_patient(runner, patient, semaphore, evict=compacting)
+            failed += result["status"] != "ok"
+            if (index + 1) % sample_every == 0 or index + 1 == plans:
+                gc.collect()
+                samples.append({"plans": index + 1, "rss_mb": current_rss_mb(), **_session_stats(session_service)})
+                print(
+                    f"{mode}: {index + 1}/{plans} plans, {samples[-1]['rss_mb']} MB RSS, "
+                    f"{samples[-1]['sessions']} sessions, {samples[-1]['events']} events",
+                    file=sys.stderr,
+                )
+    finally:
+        wall = time.perf_counter() - started
+        await runner.close()
+
+    return {
+        "mode": mode,
+        "plans": plans,
+        "failed": failed,
+        "wall_seconds": round(wall, 3),
+        **growth(samples, warmup),
+        "samples": samples,
+    }
+
+
+async def run_benchmark(
+    modes: List[str],
+    plans: int = DEFAULT_PLANS,
+    sample_every: int = DEFAULT_SAMPLE_EVERY,
+    warmup: int = DEFAULT_WARMUP,
+    approve_after: int = 2,
+) -> Dict[str, Any]:
+    """
+    Install fake models and run every mode in turn.
+
+    Args:
+        modes: Modes to run
+        plans: Plans per mode
+        sample_every: Plans between samples
+        warmup: Plans excluded from the growth measurement
+        approve_after: Critic approves on its Nth review, so each plan runs that many loop iterations
+
+    Returns:
+        The benchmark report
+    """
+    install_fake_models(get_nutritionist_agent(), latency="fixed:0", approve_after=approve_after)
+    report: Dict[str, Any] = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "config": {"plans": plans, "sample_every": sample_every, "warmup": warmup, "approve_after": approve_after},
+        "modes": [],
+    }
+    for mode in modes:
+        entry = await run_mode(mode, plans, max(1, sample_every), warmup)
+        report["modes"].append(entry)
+        print(
+            f"{mode}: {entry['plans'] - entry['failed']}/{entry['plans']} ok in {entry['wall_seconds']}s, "
+            f"RSS growth {entry['rss_growth_mb']} MB ({entry['mb_per_1000_plans']} MB per 1000 plans)",
+            file=sys.stderr,
+        )
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure RSS growth across many sequential plans")
+    parser.add_argument("--plans", "-n", type=int, default=DEFAULT_PLANS, help="Plans per mode")
+    parser.add_argument("--mode", "-m", nargs="+", choices=MODES, default=["compacting"], help="Session setups to run")
+    parser.add_argument("--sample-every", type=int, default=DEFAULT_SAMPLE_EVERY, help="Plans between memory samples")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP, help="Plans excluded from the growth measurement")
+    parser.add_argument("--approve-after", type=int, default=2, help="Critic approves on its Nth review")
+    parser.add_argument("--max-growth-mb", type=float, help="Fail when the compacting mode's RSS grows by more than this")
+    parser.add_argument("--report", "-o", help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args.mode, args.plans, args.sample_every, args.warmup, args.approve_after))
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    exceeded = [
+        entry for entry in report["modes"]
+        if args.max_growth_mb is not None and entry["mode"] == "compacting"
+        and entry["rss_growth_mb"] is not None and entry["rss_growth_mb"] > args.max_growth_mb
+    ]
+    for entry in exceeded:
+        print(f"RSS grew by {entry['rss_growth_mb']} MB, more than {args.max_growth_mb} MB", file=sys.stderr)
+    sys.exit(1 if exceeded else 0)
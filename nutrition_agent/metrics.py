@@ -0,0 +1,489 @@
+"""
+Performance metrics plugin.
+
+MetricsPlugin records, per run:
+- wall time of every agent in the nutritionist_agent graph and of each
+  refinement loop iteration
+- latency and prompt/output token usage of every model call
+- latency of every tool call (including analyze_health_metrics file I/O and
+  nested web_search_agent calls)
+- HTTP responses with retryable status codes seen by the Gemini client, i.e.
+  the retries performed under retry_config
+
+Each finished run is written as a JSON summary, and a Prometheus text-format
+file with p50/p95/p99 quantiles across all runs so far is rewritten at most
+every prometheus_interval seconds and when the plugin is closed. Quantiles
+come from a fixed-size random sample per metric, and run summaries written to
+disk are not kept in memory, so a long-lived plugin stays bounded.
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from collections import defaultdict, deque
+from typing import Deque, Dict, Any, List, Optional, Sequence, Tuple
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+
+QUANTILES = (0.5, 0.95, 0.99)
+RETRYABLE_STATUS_CODES = (429, 500, 503, 504)
+LOOP_AGENT_NAME = "meal_plan_refinement_loop"
+ITERATION_START_AGENT = "meal_plan_critic_agent"
+NESTED_AGENT_NAMES = ("web_search_agent",)
+# Values kept per metric for quantiles; count, sum and mean stay exact
+RESERVOIR_SIZE = 4096
+# Run summaries kept in completed_runs when they are not written to disk
+MAX_KEPT_RUNS = 1000
+PROMETHEUS_INTERVAL_SECONDS = 15.0
+
+_HTTP_LOG_RE = re.compile(r'HTTP Request: \w+ (\S+) "HTTP/[\d.]+ (\d{3})')
+_MODEL_IN_URL_RE = re.compile(r"/models/([^/:]+)")
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """
+    Linear-interpolated percentile of a sample.
+
+    Args:
+        values: Sample values
+        q: Quantile between 0 and 1
+
+    Returns:
+        The percentile, or 0.0 for an empty sample
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    """Count, sum, mean and p50/p95/p99 of a sample."""
+    summary = {
+        "count": len(values),
+        "sum": round(sum(values), 6),
+        "mean": round(sum(values) / len(values), 6) if values else 0.0,
+    }
+    for q in QUANTILES:
+        summary[f"p{int(q * 100)}"] = round(percentile(values, q), 6)
+    return summary
+
+
+class Reservoir:
+    """Exact count and sum of a stream of values, plus a fixed-size uniform random sample for quantiles."""
+
+    def __init__(self, size: int = RESERVOIR_SIZE):
+        self.size = size
+        self.count = 0
+        self.total = 0.0
+        self.values: List[float] = []
+        self._random = random.Random(0)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            # Algorithm R: every value seen so far is in the sample with equal probability
+            index = self._random.randrange(self.count)
+            if index < self.size:
+                self.values[index] = value
+
+    def extend(self, values: Sequence[float]) -> None:
+        for value in values:
+            self.add(value)
+
+    def summary(self) -> Dict[str, float]:
+        """The same fields as summarize(), with quantiles estimated from the sample."""
+        summary = summarize(self.values)
+        summary["count"] = self.count
+        summary["sum"] = round(self.total, 6)
+        summary["mean"] = round(self.total / self.count, 6) if self.count else 0.0
+        return summary
+
+
+class _RetryCounter(logging.Filter):
+    """
+    Counts retryable HTTP responses logged by httpx, per model ID, for every live MetricsPlugin.
+
+    One instance is installed per process (see _install_retry_counter). httpx
+    logs responses at INFO, so its logger's level is lowered to INFO if
+    needed; records below the level that applied before are dropped here once
+    counted, so handlers (including the root logger's) see no extra output.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        super().__init__()
+        self._logger = logger
+        # An explicit level on the httpx logger, or None to follow its parent's
+        self._level = logger.level or None
+        self.plugins: "weakref.WeakSet[MetricsPlugin]" = weakref.WeakSet()
+
+    def _threshold(self) -> int:
+        if self._level is not None:
+            return self._level
+        return self._logger.parent.getEffectiveLevel() if self._logger.parent else logging.WARNING
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        match = _HTTP_LOG_RE.search(record.getMessage())
+        if match and int(match.group(2)) in RETRYABLE_STATUS_CODES:
+            model = _MODEL_IN_URL_RE.search(match.group(1))
+            for plugin in list(self.plugins):
+                plugin.record_retryable_response(model.group(1) if model else "unknown", int(match.group(2)))
+        return record.levelno >= self._threshold()
+
+
+_retry_counter: Optional[_RetryCounter] = None
+_retry_counter_lock = threading.Lock()
+
+
+def _install_retry_counter() -> _RetryCounter:
+    """Attach the process-wide retry counter to the httpx logger, once."""
+    global _retry_counter
+    with _retry_counter_lock:
+        if _retry_counter is None:
+            httpx_logger = logging.getLogger("httpx")
+            _retry_counter = _RetryCounter(httpx_logger)
+            httpx_logger.addFilter(_retry_counter)
+            if httpx_logger.getEffectiveLevel() > logging.INFO:
+                httpx_logger.setLevel(logging.INFO)
+    return _retry_counter
+
+
+class MetricsPlugin(BasePlugin):
+    """
+    Collects per-agent, per-tool and per-model-call latency and token metrics.
+
+    metrics.prom is rewritten at most every prometheus_interval seconds after
+    a run (only on close when None). Run summaries are kept in completed_runs,
+    up to max_kept_runs, only when they are not written to output_dir.
+    """
+
+    def __init__(
+        self,
+        output_dir: Optional[str] = None,
+        name: str = "metrics_plugin",
+        prometheus_interval: Optional[float] = PROMETHEUS_INTERVAL_SECONDS,
+        max_kept_runs: Optional[int] = MAX_KEPT_RUNS,
+    ):
+        super().__init__(name)
+        self.output_dir = output_dir
+        self.prometheus_interval = prometheus_interval
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._runs: Dict[str, Dict[str, Any]] = {}
+        self._timers: Dict[Tuple[str, ...], List[float]] = defaultdict(list)
+        self._open_iterations: Dict[str, float] = {}
+        self._request_models: Dict[Tuple[str, str], Optional[str]] = {}
+        # Samples across every run, for batch aggregates
+        self._samples: Dict[str, Dict[str, Reservoir]] = defaultdict(lambda: defaultdict(Reservoir))
+        self._counters: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.runs = 0
+        self.completed_runs: Deque[Dict[str, Any]] = deque(maxlen=0 if output_dir else max_kept_runs)
+        self._prometheus_written_at: Optional[float] = None
+        self._prometheus_runs = 0
+
+        _install_retry_counter().plugins.add(self)
+
+    # ---- helpers -------------------------------------------------------
+
+    def _run(self, invocation_id: str) -> Dict[str, Any]:
+        run = self._runs.get(invocation_id)
+        if run is None:
+            run = self._runs[invocation_id] = {
+                "run_id": invocation_id,
+                "started_at": time.time(),
+                "_started": time.perf_counter(),
+                "agents": defaultdict(list),
+                "loop_iterations": [],
+                "model_calls": [],
+                "tools": defaultdict(list),
+                "errors": defaultdict(int),
+            }
+        return run
+
+    def _start(self, *key: str) -> None:
+        self._timers[key].append(time.perf_counter())
+
+    def _stop(self, *key: str) -> Optional[float]:
+        starts = self._timers.get(key)
+        if not starts:
+            return None
+        elapsed = time.perf_counter() - starts.pop()
+        if not starts:
+            del self._timers[key]
+        return elapsed
+
+    def record_retryable_response(self, model: str, status_code: int) -> None:
+        """Count a retryable HTTP response (429/5xx) from the model API."""
+        with self._lock:
+            self._counters["retryable_responses"][f"{model}|{status_code}"] += 1
+
+    # ---- run lifecycle -------------------------------------------------
+
+    async def before_run_callback(self, *, invocation_context: InvocationContext) -> None:
+        run = self._run(invocation_context.invocation_id)
+        run["session_id"] = invocation_context.session.id
+        run["user_id"] = invocation_context.user_id
+        run["root_agent"] = invocation_context.agent.name
+        return None
+
+    async def after_run_callback(self, *, invocation_context: InvocationContext) -> None:
+        run = self._runs.pop(invocation_context.invocation_id, None)
+        if run is None:
+            return
+        summary = self._finish_run(run)
+        if summary["root_agent"] in NESTED_AGENT_NAMES:
+            return
+        with self._lock:
+            self.runs += 1
+        self.completed_runs.append(summary)
+        if self.output_dir:
+            path = os.path.join(self.output_dir, f"run-{summary['run_id']}.json")
+            with open(path, "w") as run_file:
+                json.dump(summary, run_file, indent=2)
+            interval = self.prometheus_interval
+            written_at = self._prometheus_written_at
+            if interval is not None and (written_at is None or time.monotonic() - written_at >= interval):
+                self.write_prometheus(os.path.join(self.output_dir, "metrics.prom"))
+
+    def _finish_run(self, run: Dict[str, Any]) -> Dict[str, Any]:
+        run_id = run["run_id"]
+        for key in [k for k in self._request_models if k[0] == run_id]:
+            del self._request_models[key]
+        if run_id in self._open_iterations:
+            run["loop_iterations"].append(time.perf_counter() - self._open_iterations.pop(run_id))
+        wall = time.perf_counter() - run.pop("_started")
+        model_calls = run["model_calls"]
+        summary = {
+            "run_id": run_id,
+            "session_id": run.get("session_id"),
+            "user_id": run.get("user_id"),
+            "root_agent": run.get("root_agent"),
+            "started_at": run["started_at"],
+            "wall_seconds": round(wall, 6),
+            "agents": {name: summarize(values) for name, values in run["agents"].items()},
+            "loop_iterations": {
+                "count": len(run["loop_iterations"]),
+                "seconds": [round(v, 6) for v in run["loop_iterations"]],
+            },
+            "model_calls": {
+                "count": len(model_calls),
+                "latency_seconds": summarize([c["latency"] for c in model_calls]),
+                "prompt_tokens": sum(c["prompt_tokens"] for c in model_calls),
+                "output_tokens": sum(c["output_tokens"] for c in model_calls),
+                "by_agent": {},
+            },
+            "tools": {name: summarize(values) for name, values in run["tools"].items()},
+            "errors": dict(run["errors"]),
+        }
+        by_agent: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for call in model_calls:
+            by_agent[call["agent"]].append(call)
+        for agent_name, calls in by_agent.items():
+            summary["model_calls"]["by_agent"][agent_name] = {
+                "model": calls[0]["model"],
+                "latency_seconds": summarize([c["latency"] for c in calls]),
+                "prompt_tokens": sum(c["prompt_tokens"] for c in calls),
+                "output_tokens": sum(c["output_tokens"] for c in calls),
+            }
+
+        if summary["root_agent"] not in NESTED_AGENT_NAMES:
+            with self._lock:
+                self._samples["run_wall_seconds"][""].add(wall)
+                self._samples["loop_iterations"][""].add(float(len(run["loop_iterations"])))
+                for name, values in run["agents"].items():
+                    self._samples["agent_seconds"][name].extend(values)
+                for name, values in run["tools"].items():
+                    self._samples["tool_seconds"][name].extend(values)
+                self._samples["loop_iteration_seconds"][""].extend(run["loop_iterations"])
+        return summary
+
+    # ---- agents --------------------------------------------------------
+
+    async def before_agent_callback(self, *, agent: BaseAgent, callback_context: CallbackContext) -> None:
+        invocation_id = callback_context.invocation_id
+        self._run(invocation_id)
+        self._start(invocation_id, "agent", agent.name)
+        if agent.name == ITERATION_START_AGENT:
+            now = time.perf_counter()
+            if invocation_id in self._open_iterations:
+                self._run(invocation_id)["loop_iterations"].append(now - self._open_iterations[invocation_id])
+            self._open_iterations[invocation_id] = now
+        return None
+
+    async def after_agent_callback(self, *, agent: BaseAgent, callback_context: CallbackContext) -> None:
+        invocation_id = callback_context.invocation_id
+        elapsed = self._stop(invocation_id, "agent", agent.name)
+        if elapsed is not None:
+            self._run(invocation_id)["agents"][agent.name].append(elapsed)
+        if agent.name == LOOP_AGENT_NAME and invocation_id in self._open_iterations:
+            self._run(invocation_id)["loop_iterations"].append(
+                time.perf_counter() - self._open_iterations.pop(invocation_id)
+            )
+        return None
+
+    async def on_agent_error_callback(self, *, agent: BaseAgent, callback_context: CallbackContext, error: Exception) -> None:
+        self._run(callback_context.invocation_id)["errors"][f"agent:{agent.name}"] += 1
+        return None
+
+    # ---- models --------------------------------------------------------
+
+    async def before_model_callback(self, *, callback_context: CallbackContext, llm_request: LlmRequest) -> None:
+        self._start(callback_context.invocation_id, "model", callback_context.agent_name)
+        self._request_models[(callback_context.invocation_id, callback_context.agent_name)] = llm_request.model
+        return None
+
+    async def after_model_callback(self, *, callback_context: CallbackContext, llm_response: LlmResponse) -> None:
+        if llm_response.partial:
+            return None
+        invocation_id = callback_context.invocation_id
+        agent_name = callback_context.agent_name
+        elapsed = self._stop(invocation_id, "model", agent_name)
+        if elapsed is None:
+            return None
+        usage = llm_response.usage_metadata
+        call = {
+            "agent": agent_name,
+            "model": llm_response.model_version or self._request_models.get((invocation_id, agent_name)) or "unknown",
+            "latency": elapsed,
+            "prompt_tokens": (usage.prompt_token_count or 0) if usage else 0,
+            "output_tokens": (usage.candidates_token_count or 0) if usage else 0,
+        }
+        self._run(invocation_id)["model_calls"].append(call)
+        with self._lock:
+            self._samples["model_call_seconds"][agent_name].add(elapsed)
+            self._counters["prompt_tokens"][agent_name] += call["prompt_tokens"]
+            self._counters["output_tokens"][agent_name] += call["output_tokens"]
+            self._counters["model_calls"][agent_name] += 1
+        return None
+
+    async def on_model_error_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest, error: Exception
+    ) -> None:
+        invocation_id = callback_context.invocation_id
+        self._stop(invocation_id, "model", callback_context.agent_name)
+        self._run(invocation_id)["errors"][f"model:{type(error).__name__}"] += 1
+        with self._lock:
+            self._counters["model_errors"][callback_context.agent_name] += 1
+        return None
+
+    # ---- tools ---------------------------------------------------------
+
+    async def before_tool_callback(self, *, tool: BaseTool, tool_args: Dict[str, Any], tool_context: ToolContext) -> None:
+        self._start(tool_context.invocation_id, "tool", tool_context.function_call_id or tool.name)
+        return None
+
+    async def after_tool_callback(
+        self, *, tool: BaseTool, tool_args: Dict[str, Any], tool_context: ToolContext, result: Dict
+    ) -> None:
+        invocation_id = tool_context.invocation_id
+        elapsed = self._stop(invocation_id, "tool", tool_context.function_call_id or tool.name)
+        if elapsed is not None:
+            self._run(invocation_id)["tools"][tool.name].append(elapsed)
+        return None
+
+    async def on_tool_error_callback(
+        self, *, tool: BaseTool, tool_args: Dict[str, Any], tool_context: ToolContext, error: Exception
+    ) -> None:
+        invocation_id = tool_context.invocation_id
+        self._stop(invocation_id, "tool", tool_context.function_call_id or tool.name)
+        self._run(invocation_id)["errors"][f"tool:{tool.name}"] += 1
+        return None
+
+    async def close(self) -> None:
+        _install_retry_counter().plugins.discard(self)
+        if self.output_dir and self._prometheus_runs != self.runs:
+            self.write_prometheus(os.path.join(self.output_dir, "metrics.prom"))
+
+    # ---- exports -------------------------------------------------------
+
+    def aggregate(self) -> Dict[str, Any]:
+        """
+        Aggregate metrics across every completed run.
+
+        Returns:
+            Quantile summaries per metric and label, and counter totals
+        """
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "summaries": {
+                    metric: {label: reservoir.summary() for label, reservoir in by_label.items()}
+                    for metric, by_label in self._samples.items()
+                },
+                "counters": {metric: dict(by_label) for metric, by_label in self._counters.items()},
+            }
+
+    def write_summary(self, path: str) -> None:
+        """Write the batch aggregate as JSON."""
+        with open(path, "w") as summary_file:
+            json.dump(self.aggregate(), summary_file, indent=2)
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Write all metrics in Prometheus text exposition format (summaries with
+        p50/p95/p99 quantiles, plus counters).
+
+        Args:
+            path: Output file, replaced atomically
+        """
+        aggregate = self.aggregate()
+        label_names = {
+            "agent_seconds": "agent",
+            "tool_seconds": "tool",
+            "model_call_seconds": "agent",
+            "prompt_tokens": "agent",
+            "output_tokens": "agent",
+            "model_calls": "agent",
+            "model_errors": "agent",
+        }
+        lines = [
+            "# HELP nutrition_agent_runs_total Completed nutritionist_agent runs",
+            "# TYPE nutrition_agent_runs_total counter",
+            f"nutrition_agent_runs_total {aggregate['runs']}",
+        ]
+        for metric, by_label in sorted(aggregate["summaries"].items()):
+            name = f"nutrition_agent_{metric}"
+            lines.append(f"# TYPE {name} summary")
+            for label, summary in sorted(by_label.items()):
+                labels = f'{label_names[metric]}="{label}"' if label else ""
+                for q in QUANTILES:
+                    quantile = f'quantile="{q}"'
+                    lines.append(f"{name}{{{','.join(filter(None, [labels, quantile]))}}} {summary[f'p{int(q * 100)}']}")
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {summary['sum']}")
+                lines.append(f"{name}_count{suffix} {summary['count']}")
+        for metric, by_label in sorted(aggregate["counters"].items()):
+            name = f"nutrition_agent_{metric}_total"
+            lines.append(f"# TYPE {name} counter")
+            for label, value in sorted(by_label.items()):
+                if metric == "retryable_responses":
+                    model, status = label.split("|")
+                    labels = f'model="{model}",status="{status}"'
+                else:
+                    labels = f'{label_names[metric]}="{label}"'
+                lines.append(f"{name}{{{labels}}} {value:g}")
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as prom_file:
+            prom_file.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+        self._prometheus_written_at = time.monotonic()
+        self._prometheus_runs = aggregate["runs"]
@@ -0,0 +1,191 @@
+"""
+Apply structured refinement patches to current_meal_plan.
+
+The refiner returns only the changes it wants to make instead of re-emitting
+the entire plan:
+
+    {
+      "operations": [
+        {"op": "replace", "meal": "lunch", "food": "white rice", "new_food": {...}},
+        {"op": "rescale", "meal": "dinner", "food": "chapati", "factor": 0.5, "quantity": "1 piece"},
+        {"op": "remove", "meal": "evening_snack", "food": "samosa"},
+        {"op": "add", "meal": "breakfast", "new_food": {...}},
+        {"op": "replace_meal", "meal": "mid_morning_snack", "foods": [...], "preparation_notes": "..."}
+      ],
+      "refinement_notes": ["<what was changed and why>"]
+    }
+
+Totals are recomputed after the operations are applied.
+"""
+import copy
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+from .food_db import parse_amount
+from .meal_plan import MEALS, MACRO_KEYS, recompute_totals, to_number
+
+SCALED_KEYS = MACRO_KEYS + ["fiber_g", "sodium_mg"]
+# State key holding the errors of the last applied patch
+PATCH_ERRORS_KEY = "patch_errors"
+# "(×1.5)" appended to a quantity whose amount could not be read
+_SCALE_NOTE_RE = re.compile(r"\s*\(×(\d+(?:\.\d+)?)\)$")
+
+
+def _find_food(foods: List[Dict[str, Any]], name: str) -> List[int]:
+    """Indices of the foods a name refers to: the exact match, otherwise every partial match."""
+    target = " ".join(str(name).split()).casefold()
+    if not target:
+        return []
+    names = [" ".join(str(food.get("name") or "").split()).casefold() for food in foods]
+    if target in names:
+        return [names.index(target)]
+    return [index for index, food_name in enumerate(names) if food_name and (target in food_name or food_name in target)]
+
+
+def _format_amount(value: float) -> str:
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def _scale_quantity(quantity: Any, factor: float) -> Any:
+    if isinstance(quantity, (int, float)) and not isinstance(quantity, bool):
+        return round(quantity * factor, 2)
+    if not isinstance(quantity, str) or factor == 1:
+        return quantity
+    parsed = parse_amount(quantity)
+    if parsed:
+        amount, start, end = parsed
+        return quantity[:start] + _format_amount(amount * factor) + quantity[end:]
+    # No amount to scale ("some rice"): say so instead of keeping text that no longer matches the nutrients
+    note = _SCALE_NOTE_RE.search(quantity)
+    if note:
+        factor *= float(note.group(1))
+        quantity = quantity[:note.start()]
+    if round(factor, 2) == 1:
+        return quantity
+    return f"{quantity} (×{_format_amount(factor)})".strip()
+
+
+def rescale_food(food: Dict[str, Any], factor: float, quantity: Optional[str] = None) -> Dict[str, Any]:
+    """Scale a food's nutrients by factor; the quantity text is scaled too unless a new one is given."""
+    scaled = dict(food)
+    for key in SCALED_KEYS:
+        value = to_number(food.get(key))
+        if value is not None:
+            scaled[key] = round(value * factor, 1)
+    scaled["quantity"] = quantity if quantity else _scale_quantity(food.get("quantity"), factor)
+    return scaled
+
+
+def patch_error_issues(errors: List[str]) -> List[Dict[str, str]]:
+    """
+    Turn skipped patch operations into minor critique issues, so the refiner sees them on its next iteration.
+
+    Args:
+        errors: Errors returned by apply_patch()
+
+    Returns:
+        Issues in the critique schema
+    """
+    return [
+        {
+            "category": "practical",
+            "severity": "minor",
+            "problem": f"Refinement operation skipped: {error}",
+            "suggestion": "Use the exact meal and food names from current_meal_plan, one food per operation",
+        }
+        for error in errors
+    ]
+
+
+def is_patch(output: Any) -> bool:
+    """Check whether a refiner output is a patch rather than a full meal plan."""
+    return isinstance(output, dict) and isinstance(output.get("operations"), list) and "meal_plan" not in output
+
+
+def apply_patch(
+    plan: Dict[str, Any],
+    patch: Dict[str, Any],
+    daily_targets: Optional[Dict[str, Any]] = None,
+) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Apply patch operations to a meal plan and recompute its totals.
+
+    Invalid operations are skipped and reported instead of failing the whole patch.
+
+    Args:
+        plan: Parsed current_meal_plan
+        patch: Parsed refiner patch
+        daily_targets: Targets used to recompute target_comparison
+
+    Returns:
+        (patched plan, list of errors for skipped operations)
+    """
+    patched = copy.deepcopy(plan)
+    meals = patched.setdefault("meal_plan", {})
+    errors: List[str] = []
+
+    for position, operation in enumerate(patch.get("operations") or [], start=1):
+        if not isinstance(operation, dict):
+            errors.append(f"operation {position}: not an object")
+            continue
+        op = str(operation.get("op", "")).lower()
+        meal_name = operation.get("meal")
+        if meal_name not in MEALS:
+            errors.append(f"operation {position} ({op}): unknown meal {meal_name!r}")
+            continue
+        meal = meals.setdefault(meal_name, {"foods": []})
+        foods = meal.setdefault("foods", [])
+
+        if op == "replace_meal":
+            new_foods = [f for f in operation.get("foods") or [] if isinstance(f, dict)]
+            if not new_foods:
+                errors.append(f"operation {position} (replace_meal): foods missing")
+                continue
+            meal["foods"] = new_foods
+            if "preparation_notes" in operation:
+                meal["preparation_notes"] = operation["preparation_notes"]
+            if "include" in operation and meal_name not in ("breakfast", "lunch", "dinner"):
+                meal["include"] = bool(operation["include"])
+            continue
+
+        if op == "add":
+            new_food = operation.get("new_food")
+            if isinstance(new_food, dict):
+                foods.append(new_food)
+                if meal.get("include") is False:
+                    meal["include"] = True
+            else:
+                errors.append(f"operation {position} (add): new_food missing")
+            continue
+
+        matches = _find_food(foods, operation.get("food", ""))
+        if not matches:
+            errors.append(f"operation {position} ({op}): {operation.get('food')!r} not found in {meal_name}")
+            continue
+        if len(matches) > 1:
+            candidates = ", ".join(repr(foods[i].get("name")) for i in matches)
+            errors.append(f"operation {position} ({op}): {operation.get('food')!r} is ambiguous in {meal_name} ({candidates})")
+            continue
+        index = matches[0]
+
+        if op == "remove":
+            foods.pop(index)
+        elif op == "replace":
+            new_food = operation.get("new_food")
+            if isinstance(new_food, dict):
+                foods[index] = new_food
+            else:
+                errors.append(f"operation {position} (replace): new_food missing")
+        elif op == "rescale":
+            factor = to_number(operation.get("factor"))
+            if factor is None or factor <= 0:
+                errors.append(f"operation {position} (rescale): invalid factor {operation.get('factor')!r}")
+            else:
+                foods[index] = rescale_food(foods[index], factor, operation.get("quantity"))
+        else:
+            errors.append(f"operation {position}: unknown op {op!r}")
+
+    notes = [n for n in patch.get("refinement_notes") or [] if isinstance(n, str)]
+    if notes:
+        patched["refinement_notes"] = notes
+    return recompute_totals(patched, daily_targets), errors
@@ -0,0 +1,298 @@
+"""
+Patient data store behind analyze_health_metrics.
+
+Patients are looked up by patient ID in a JSON Lines file or a SQLite
+database. Each record holds the questionnaire and measurements:
+
+    {"patient_id": "p001", "questionnaire": {...}, "measurements": {...}}
+
+Serialized records are kept in an in-memory LRU, invalidated when the backing
+file's mtime or size changes, so thousands of patients can be served without
+re-reading or re-parsing files on every tool call. Patients that are still
+described by a questionnaire/measurements file pair go through
+JsonFileCache, which applies the same mtime check per file.
+
+Usage:
+    python -m nutrition_agent.patient_store import roster.jsonl patients.sqlite3
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from .json_utils import dumps_compact
+
+DEFAULT_STORE_PATH = os.getenv("NUTRITION_PATIENT_STORE")
+DEFAULT_CACHED_RECORDS = int(os.getenv("NUTRITION_PATIENT_CACHE_ENTRIES", 4096))
+SQLITE_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+
+# A leading "patient_id" key, as put() writes it; other lines are parsed in full,
+# since an earlier "patient_id" could belong to a nested object
+_PATIENT_ID_RE = re.compile(rb'\s*\{\s*"patient_id"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def _file_version(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class _LruCache:
+    """Small thread-safe LRU mapping."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class PatientStore:
+    """Patient records keyed by patient ID, backed by JSON Lines or SQLite."""
+
+    def __init__(self, path: str, max_cached_records: int = DEFAULT_CACHED_RECORDS):
+        self.path = path
+        self.backend = "sqlite" if path.endswith(SQLITE_SUFFIXES) else "jsonl"
+        self._cache = _LruCache(max_cached_records)
+        self._lock = threading.Lock()
+        self._version: Optional[Tuple] = None
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._counters = {"hits": 0, "misses": 0, "reloads": 0}
+        if self.backend == "sqlite":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS patients ("
+                "patient_id TEXT PRIMARY KEY, questionnaire TEXT NOT NULL, measurements TEXT NOT NULL)"
+            )
+
+    def _current_version(self) -> Optional[Tuple]:
+        if self.backend == "jsonl":
+            return _file_version(self.path)
+        # Committed writes may sit in the WAL until a checkpoint
+        return _file_version(self.path), _file_version(self.path + "-wal")
+
+    def _refresh(self) -> None:
+        """Drop cached records (and re-index a JSON Lines file) if the store changed on disk."""
+        version = self._current_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            self._cache.clear()
+            if self.backend == "jsonl":
+                self._offsets = self._index_jsonl()
+            self._version = version
+            self._counters["reloads"] += 1
+
+    def _index_jsonl(self) -> Dict[str, Tuple[int, int]]:
+        offsets: Dict[str, Tuple[int, int]] = {}
+        if not os.path.exists(self.path):
+            return offsets
+        with open(self.path, "rb") as store_file:
+            position = 0
+            for line in store_file:
+                match = _PATIENT_ID_RE.match(line)
+                if match:
+                    patient_id = json.loads(b'"' + match.group(1) + b'"')
+                elif line.strip():
+                    patient_id = str(json.loads(line).get("patient_id", ""))
+                else:
+                    patient_id = ""
+                if patient_id:
+                    # Later lines override earlier ones, so appending a record updates a patient
+                    offsets[patient_id] = (position, len(line))
+                position += len(line)
+        return offsets
+
+    def _read(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        if self.backend == "jsonl":
+            location = self._offsets.get(patient_id)
+            if location is None:
+                return None
+            with open(self.path, "rb") as store_file:
+                store_file.seek(location[0])
+                record = json.loads(store_file.read(location[1]))
+            return {"questionnaire": record.get("questionnaire"), "measurements": record.get("measurements")}
+        row = self._db.execute(
+            "SELECT questionnaire, measurements FROM patients WHERE patient_id = ?", (patient_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"questionnaire": json.loads(row[0]), "measurements": json.loads(row[1])}
+
+    def get(self, patient_id: str) -> Optional[str]:
+        """
+        Return a patient's questionnaire and measurements as minified JSON.
+
+        Args:
+            patient_id: Patient ID
+
+        Returns:
+            '{"questionnaire":...,"measurements":...}', or None if the patient is unknown
+        """
+        self._refresh()
+        cached = self._cache.get(patient_id)
+        if cached is not None:
+            self._counters["hits"] += 1
+            return cached
+        self._counters["misses"] += 1
+        record = self._read(patient_id)
+        if record is None:
+            return None
+        serialized = dumps_compact(record)
+        self._cache.put(patient_id, serialized)
+        return serialized
+
+    def put(self, patient_id: str, questionnaire: Dict[str, Any], measurements: Dict[str, Any]) -> None:
+        """
+        Add or replace a patient record.
+
+        Args:
+            patient_id: Patient ID
+            questionnaire: Questionnaire responses
+            measurements: Measurements and blood test data
+        """
+        if self.backend == "jsonl":
+            record = {"patient_id": patient_id, "questionnaire": questionnaire, "measurements": measurements}
+            with self._lock, open(self.path, "a") as store_file:
+                store_file.write(dumps_compact(record) + "\n")
+        else:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO patients (patient_id, questionnaire, measurements) VALUES (?, ?, ?)",
+                    (patient_id, dumps_compact(questionnaire), dumps_compact(measurements)),
+                )
+
+    def patient_ids(self) -> List[str]:
+        """Return every patient ID in the store."""
+        self._refresh()
+        if self.backend == "jsonl":
+            return list(self._offsets)
+        return [row[0] for row in self._db.execute("SELECT patient_id FROM patients ORDER BY patient_id")]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters and the number of cached records."""
+        stats: Dict[str, Any] = dict(self._counters)
+        stats["cached_records"] = len(self._cache)
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class JsonFileCache:
+    """Parsed JSON files keyed by path, re-read only when a file's mtime or size changes."""
+
+    def __init__(self, max_entries: int = DEFAULT_CACHED_RECORDS):
+        self._cache = _LruCache(max_entries)
+
+    def load(self, path: str) -> Any:
+        """
+        Load a JSON file, from memory when it is unchanged since the last load.
+
+        Args:
+            path: JSON file path
+
+        Returns:
+            The parsed JSON
+
+        Raises:
+            FileNotFoundError: If the file does not exist
+            json.JSONDecodeError: If the file is not valid JSON
+        """
+        version = _file_version(path)
+        if version is None:
+            raise FileNotFoundError(path)
+        cached = self._cache.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with open(path, "r") as json_file:
+            parsed = json.load(json_file)
+        self._cache.put(path, (version, parsed))
+        return parsed
+
+
+_stores: Dict[str, PatientStore] = {}
+_stores_lock = threading.Lock()
+json_file_cache = JsonFileCache()
+
+
+def get_patient_store(path: str) -> PatientStore:
+    """Return the process-wide PatientStore for a path, opening it on first use."""
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(path)
+            if store is None:
+                store = _stores[path] = PatientStore(path)
+    return store
+
+
+def import_patients(entries: Iterable[Dict[str, Any]], store: PatientStore) -> int:
+    """
+    Copy file-pair patients (patient_id, questionnaire_path, measurements_path) into a store.
+
+    Args:
+        entries: Manifest entries
+        store: Destination store
+
+    Returns:
+        Number of patients imported
+    """
+    count = 0
+    for entry in entries:
+        with open(entry["questionnaire_path"], "r") as q_file:
+            questionnaire = json.load(q_file)
+        with open(entry["measurements_path"], "r") as m_file:
+            measurements = json.load(m_file)
+        store.put(str(entry["patient_id"]), questionnaire, measurements)
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the patient data store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_command = commands.add_parser("import", help="Import a file-pair manifest into a store")
+    import_command.add_argument("manifest", help="JSON or JSON Lines manifest with questionnaire_path/measurements_path")
+    import_command.add_argument("store", help="Destination .jsonl or .sqlite3 store")
+    args = parser.parse_args()
+
+    from .batch import load_manifest
+
+    imported = import_patients(load_manifest(args.manifest), PatientStore(args.store))
+    print(f"Imported {imported} patients into {args.store}", file=sys.stderr)
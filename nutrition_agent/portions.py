@@ -0,0 +1,257 @@
+"""
+Deterministic portion optimization for numeric misses.
+
+Most NEEDS_REVISION critiques are "calories too high" or "protein too low",
+which a refinement round fixes by having the model re-guess quantities. The
+foods of current_meal_plan already carry their macros, so portions can be
+solved for directly instead: one scale factor per food, within realistic
+bounds, chosen by bounded least squares so that
+
+- daily calories, protein, carbs and fats hit daily_targets, each residual
+  measured in units of the validator's tolerance (±100 kcal, ±10%)
+- each meal's calories stay near its meal_distribution share
+- factors stay close to 1, so the planner's choices change as little as possible
+
+Fats, oils and sugar are never increased, and foods counted in pieces,
+katoris or spoons keep whole pieces and half katoris: those are rounded
+first, then the other foods are solved again around them.
+
+The optimized plan is only used when it has fewer nutritional issues than the
+original, so the step can never make a plan worse. It runs in code before the
+critic (see run_numeric_validation in agent.py).
+"""
+import copy
+import math
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from .food_db import get_food_database, parse_amount, quantity_unit
+from .json_utils import load_state_json
+from .meal_plan import MACRO_KEYS, TARGET_KEYS, to_number, meal_included, recompute_totals
+from .patching import rescale_food
+from .validator import CALORIE_TOLERANCE_KCAL, MACRO_TOLERANCE, MEAL_CALORIE_TOLERANCE, BLOCKING_SEVERITIES, validate_meal_plan
+
+# Realistic bounds for rescaling a single food
+MIN_PORTION_FACTOR = 0.5
+MAX_PORTION_FACTOR = 2.0
+# Tighter bounds by food-database category: added fat and sugar may shrink but never grow
+CATEGORY_FACTOR_BOUNDS = {
+    "fat": (0.5, 1.0),
+    "sweetener": (0.5, 1.0),
+    "condiment": (0.5, 1.0),
+}
+# Factors are rounded to this step so quantities stay readable ("1.5 katori", not "1.437 katori")
+FACTOR_STEP = 0.05
+# Countable units are rounded to whole pieces or half servings instead ("2 pieces", not "2.55 pieces")
+COUNT_STEPS = {
+    "piece": 1.0, "small piece": 1.0, "slice": 1.0, "cube": 1.0, "leg": 1.0,
+    "katori": 0.5, "bowl": 0.5, "plate": 0.5, "glass": 0.5, "tbsp": 0.5, "tsp": 0.5,
+}
+# Relative weight of the per-meal calorie rows and of keeping portions unchanged
+MEAL_WEIGHT = 0.5
+CHANGE_WEIGHT = 0.5
+
+MAX_ITERATIONS = 2000
+CONVERGENCE_TOLERANCE = 1e-9
+
+
+def solve_bounded_least_squares(
+    A: np.ndarray,
+    b: np.ndarray,
+    lower: np.ndarray,
+    upper: np.ndarray,
+    x0: Optional[np.ndarray] = None,
+    max_iterations: int = MAX_ITERATIONS,
+) -> np.ndarray:
+    """
+    Minimize ||A x - b||² subject to lower <= x <= upper.
+
+    Accelerated projected gradient descent (FISTA) with a fixed 1/L step; the
+    problems here are a few dozen variables, so this converges in milliseconds.
+
+    Args:
+        A: Coefficient matrix, shape (rows, n)
+        b: Right-hand side, shape (rows,)
+        lower: Lower bounds, shape (n,)
+        upper: Upper bounds, shape (n,)
+        x0: Starting point (clipped to the bounds); the midpoint if omitted
+        max_iterations: Iteration limit
+
+    Returns:
+        The solution, shape (n,)
+    """
+    x = np.clip(x0 if x0 is not None else (lower + upper) / 2, lower, upper)
+    lipschitz = np.linalg.norm(A, 2) ** 2
+    if lipschitz == 0:
+        return x
+    step = 1.0 / lipschitz
+    AtA, Atb = A.T @ A, A.T @ b
+    y, t = x.copy(), 1.0
+    for _ in range(max_iterations):
+        x_next = np.clip(y - step * (AtA @ y - Atb), lower, upper)
+        t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        y = x_next + ((t - 1) / t_next) * (x_next - x)
+        converged = np.max(np.abs(x_next - x)) < CONVERGENCE_TOLERANCE
+        x, t = x_next, t_next
+        if converged:
+            break
+    return x
+
+
+def _issue_counts(validation: Dict[str, Any]) -> Tuple[int, int]:
+    """(blocking, other) nutritional issue counts, compared lexicographically."""
+    issues = [issue for issue in validation["issues"] if issue.get("category") == "nutritional"]
+    blocking = sum(1 for issue in issues if issue.get("severity") in BLOCKING_SEVERITIES)
+    return blocking, len(issues) - blocking
+
+
+def _food_limits(food: Dict[str, Any]) -> Tuple[float, float, Optional[Tuple[float, float]]]:
+    """(lower, upper) factor bounds of a food plus (amount, step) when its quantity is a count."""
+    found = get_food_database().lookup(str(food.get("name") or ""))
+    record = found[0] if found else None
+    category = record["category"] if record else None
+    lower, upper = CATEGORY_FACTOR_BOUNDS.get(category, (MIN_PORTION_FACTOR, MAX_PORTION_FACTOR))
+    quantity = food.get("quantity")
+    parsed = parse_amount(quantity) if isinstance(quantity, str) else None
+    if not parsed or parsed[0] <= 0:
+        return lower, upper, None
+    unit = quantity_unit(quantity)
+    if unit is None and record and "piece" in record["portions"]:
+        unit = "piece"  # "3 chapati"
+    step = COUNT_STEPS.get(unit or "")
+    return lower, upper, (parsed[0], step) if step else None
+
+
+def _count_factor(factor: float, lower: float, upper: float, amount: float, step: float) -> float:
+    """The factor closest to factor that leaves a whole number of steps within the bounds."""
+    low = max(math.ceil(amount * lower / step - 1e-9), 1)
+    high = math.floor(amount * upper / step + 1e-9)
+    if low > high:
+        return 1.0
+    return min(max(round(amount * factor / step), low), high) * step / amount
+
+
+def solve_portions(plan: Dict[str, Any], requirements: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Rescale food portions to fit the daily and per-meal targets.
+
+    Foods without positive calories are left as they are, as are meals that are not included.
+
+    Args:
+        plan: Parsed current_meal_plan
+        requirements: Parsed nutrition_requirements
+
+    Returns:
+        (plan copy with rescaled foods and recomputed totals, list of adjustments
+        {"meal", "food", "factor", "quantity"}); the list is empty when nothing changed
+    """
+    targets = requirements.get("daily_targets") or {}
+    distribution = requirements.get("meal_distribution") or {}
+    meals = plan.get("meal_plan") or {}
+
+    variables: List[Tuple[str, int]] = []
+    columns: List[List[float]] = []
+    limits: List[Tuple[float, float, Optional[Tuple[float, float]]]] = []
+    fixed = np.zeros(len(MACRO_KEYS))
+    fixed_meal: Dict[str, float] = {}
+    for meal_name, meal in meals.items():
+        if not isinstance(meal, dict) or not meal_included(meal):
+            continue
+        for index, food in enumerate(meal.get("foods") or []):
+            if not isinstance(food, dict):
+                continue
+            values = [to_number(food.get(key)) or 0.0 for key in MACRO_KEYS]
+            if values[0] > 0:
+                variables.append((meal_name, index))
+                columns.append(values)
+                limits.append(_food_limits(food))
+            else:
+                fixed += values
+                fixed_meal[meal_name] = fixed_meal.get(meal_name, 0.0) + values[0]
+    if not variables:
+        return plan, []
+    nutrients = np.array(columns).T  # (macro, food)
+
+    rows: List[np.ndarray] = []
+    rhs: List[float] = []
+    for k, key in enumerate(MACRO_KEYS):
+        target = to_number(targets.get(TARGET_KEYS[key]))
+        if not target:
+            continue
+        tolerance = CALORIE_TOLERANCE_KCAL if key == "calories" else target * MACRO_TOLERANCE
+        rows.append(nutrients[k] / tolerance)
+        rhs.append((target - fixed[k]) / tolerance)
+
+    meal_names = np.array([meal_name for meal_name, _ in variables])
+    for meal_name in dict.fromkeys(meal_name for meal_name, _ in variables):
+        target = to_number((distribution.get(meal_name) or {}).get("calories"))
+        if not target:
+            continue
+        tolerance = target * MEAL_CALORIE_TOLERANCE
+        rows.append(MEAL_WEIGHT * np.where(meal_names == meal_name, nutrients[0], 0.0) / tolerance)
+        rhs.append(MEAL_WEIGHT * (target - fixed_meal.get(meal_name, 0.0)) / tolerance)
+    if not rows:
+        return plan, []
+
+    n = len(variables)
+    A = np.vstack(rows + [CHANGE_WEIGHT * np.eye(n)])
+    b = np.concatenate([rhs, CHANGE_WEIGHT * np.ones(n)])
+    lower = np.array([limit[0] for limit in limits])
+    upper = np.array([limit[1] for limit in limits])
+    factors = solve_bounded_least_squares(A, b, lower, upper, x0=np.ones(n))
+    counted = [i for i, limit in enumerate(limits) if limit[2]]
+    if counted:
+        # Pin the counted foods to whole steps and let the other foods make up the difference
+        for i in counted:
+            lower[i] = upper[i] = _count_factor(factors[i], lower[i], upper[i], *limits[i][2])
+        factors = solve_bounded_least_squares(A, b, lower, upper, x0=factors)
+    factors = np.where(lower == upper, factors, np.round(factors / FACTOR_STEP) * FACTOR_STEP)
+
+    optimized = copy.deepcopy(plan)
+    adjustments: List[Dict[str, Any]] = []
+    for (meal_name, index), factor in zip(variables, factors):
+        factor = float(factor)
+        if round(factor, 2) == 1.0:
+            continue
+        foods = optimized["meal_plan"][meal_name]["foods"]
+        foods[index] = rescale_food(foods[index], factor)
+        adjustments.append({
+            "meal": meal_name,
+            "food": foods[index].get("name"),
+            "factor": round(factor, 2),
+            "quantity": foods[index].get("quantity"),
+        })
+    if not adjustments:
+        return plan, []
+    return recompute_totals(optimized, targets), adjustments
+
+
+def optimize_portions(plan: Any, requirements: Any, validation: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Fix numeric misses of a meal plan by rescaling portions, if that helps.
+
+    Args:
+        plan: current_meal_plan (JSON string or parsed)
+        requirements: nutrition_requirements (JSON string or parsed)
+        validation: Result of validate_meal_plan() for the plan
+
+    Returns:
+        {"plan", "validation", "adjustments"} for the optimized plan, or None
+        when the plan has no nutritional issues or rescaling does not reduce them
+    """
+    before = _issue_counts(validation)
+    if before == (0, 0):
+        return None
+    parsed_plan = load_state_json(plan)
+    parsed_requirements = load_state_json(requirements)
+    if not isinstance(parsed_plan, dict) or not isinstance(parsed_requirements, dict):
+        return None
+
+    optimized, adjustments = solve_portions(parsed_plan, parsed_requirements)
+    if not adjustments:
+        return None
+    optimized_validation = validate_meal_plan(optimized, parsed_requirements)
+    if _issue_counts(optimized_validation) >= before:
+        return None
+    return {"plan": optimized, "validation": optimized_validation, "adjustments": adjustments}
@@ -0,0 +1,212 @@
+"""
+Per-agent projection of session state into instructions.
+
+Instructions reference state with `{key}` placeholders. By default ADK injects
+the whole stored value, so every agent reads every field of
+patient_health_data, nutrition_requirements, current_meal_plan and critique.
+AGENT_PROJECTIONS declares, per agent, which fields of each placeholder the
+agent actually needs; apply_state_projections() swaps each agent's template
+for an instruction provider that renders only those fields as minified JSON
+and logs the estimated prompt tokens before and after projection.
+
+Paths are dot-separated keys; `*` matches every key of a dictionary.
+"""
+import fnmatch
+import logging
+import re
+from typing import Dict, Any, Callable, List, Optional
+
+from google.adk.agents import Agent, BaseAgent
+from google.adk.agents.readonly_context import ReadonlyContext
+
+from .json_utils import load_state_json, dumps_compact
+
+logger = logging.getLogger(__name__)
+
+# Agent name (or fnmatch pattern) -> state key -> field paths; keys not listed
+# are injected whole, minified.
+AGENT_PROJECTIONS: Dict[str, Dict[str, List[str]]] = {
+    "nutrition_calculator_agent": {
+        "patient_health_data": [
+            "patient_profile",
+            "dietary_preferences",
+            "medical_conditions",
+            "lifestyle_factors",
+            "blood_test_analysis.deficiencies",
+            "blood_test_analysis.health_risks",
+            "key_nutritional_considerations",
+        ],
+        "calculated_nutrition_targets": ["daily_targets", "medical_adjustments"],
+    },
+    "*_planner_agent": {
+        "patient_health_data": [
+            "patient_profile.age",
+            "patient_profile.gender",
+            "dietary_preferences",
+            "medical_conditions",
+            "key_nutritional_considerations",
+        ],
+        "nutrition_requirements": ["medical_adjustments", "special_dietary_guidelines"],
+    },
+    "meal_plan_critic_agent": {
+        "patient_health_data": [
+            "patient_profile.age",
+            "patient_profile.gender",
+            "dietary_preferences",
+            "medical_conditions",
+            "blood_test_analysis.deficiencies",
+            "blood_test_analysis.health_risks",
+        ],
+        "nutrition_requirements": ["daily_targets.sodium_mg", "medical_adjustments", "special_dietary_guidelines"],
+        "current_meal_plan": ["meal_plan.*.include", "meal_plan.*.foods", "meal_plan.*.preparation_notes"],
+    },
+    "meal_plan_refiner_agent": {
+        "patient_health_data": ["dietary_preferences", "medical_conditions"],
+        "nutrition_requirements": ["daily_targets", "meal_distribution", "medical_adjustments"],
+        "current_meal_plan": ["meal_plan.*.include", "meal_plan.*.foods", "meal_plan.*.totals", "daily_totals"],
+        "critique": ["status", "issues"],
+    },
+}
+
+_PLACEHOLDER_RE = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
+_INDENT_RE = re.compile(r"\n[ \t]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of a prompt (about four characters per token for Gemini models).
+
+    Args:
+        text: Prompt text
+
+    Returns:
+        Estimated token count
+    """
+    return (len(text) + 3) // 4
+
+
+def projections_for(agent_name: str) -> Dict[str, List[str]]:
+    """Return the projection declared for an agent (exact name first, then patterns)."""
+    if agent_name in AGENT_PROJECTIONS:
+        return AGENT_PROJECTIONS[agent_name]
+    for pattern, projection in AGENT_PROJECTIONS.items():
+        if fnmatch.fnmatchcase(agent_name, pattern):
+            return projection
+    return {}
+
+
+def project_fields(data: Any, paths: List[str]) -> Any:
+    """
+    Keep only the given field paths of a parsed JSON value.
+
+    Args:
+        data: Parsed JSON object
+        paths: Dot-separated field paths, `*` matching every dictionary key
+
+    Returns:
+        A new object containing only the selected fields, in their original nesting
+    """
+    def select(node: Any, parts: List[str]) -> Any:
+        if not parts:
+            return node
+        if not isinstance(node, dict):
+            return None
+        head, rest = parts[0], parts[1:]
+        keys = list(node) if head == "*" else [head]
+        selected = {}
+        for key in keys:
+            if key in node:
+                value = select(node[key], rest)
+                if value is not None:
+                    selected[key] = value
+        return selected or None
+
+    def merge(target: Dict[str, Any], source: Dict[str, Any]) -> None:
+        for key, value in source.items():
+            if isinstance(value, dict) and isinstance(target.get(key), dict):
+                merge(target[key], value)
+            else:
+                target[key] = value
+
+    projected: Dict[str, Any] = {}
+    for path in paths:
+        selected = select(data, path.split("."))
+        if isinstance(selected, dict):
+            merge(projected, selected)
+    return projected
+
+
+def render_state_value(value: Any, paths: Optional[List[str]]) -> str:
+    """
+    Render a state value for an instruction: projected and minified if it is JSON.
+
+    Args:
+        value: Raw state value
+        paths: Field paths to keep, or None to keep everything
+
+    Returns:
+        The rendered text
+    """
+    parsed = load_state_json(value)
+    if parsed is None:
+        return str(value)
+    if paths is not None and isinstance(parsed, dict):
+        parsed = project_fields(parsed, paths)
+    return dumps_compact(parsed)
+
+
+def projected_instruction(agent_name: str, template: str) -> Callable[[ReadonlyContext], str]:
+    """
+    Build an instruction provider that fills `{key}` placeholders with projected state.
+
+    Args:
+        agent_name: Agent whose projection applies
+        template: Instruction template with `{key}` placeholders
+
+    Returns:
+        An ADK InstructionProvider
+    """
+    projection = projections_for(agent_name)
+    # The templates are indented to match the source code; the model does not need that whitespace
+    compact_template = _INDENT_RE.sub("\n", template)
+
+    def provider(context: ReadonlyContext) -> str:
+        state = context.state
+
+        def replace(match: "re.Match", project: bool) -> str:
+            key = match.group(1)
+            if key not in state:
+                raise KeyError(f"Context variable not found: `{key}`.")
+            if not project:
+                return str(state[key])
+            return render_state_value(state[key], projection.get(key))
+
+        projected = _PLACEHOLDER_RE.sub(lambda m: replace(m, True), compact_template)
+        if logger.isEnabledFor(logging.INFO):
+            full = _PLACEHOLDER_RE.sub(lambda m: replace(m, False), template)
+            before, after = estimate_tokens(full), estimate_tokens(projected)
+            logger.info(
+                "prompt projection %s: ~%d -> ~%d tokens (%.0f%% saved)",
+                agent_name, before, after, 100 * (before - after) / before if before else 0.0,
+            )
+        return projected
+
+    # Keep the source template so the instruction can still be fingerprinted (see memo.py)
+    provider.template = template
+    return provider
+
+
+def apply_state_projections(root_agent: BaseAgent) -> None:
+    """
+    Replace the string instruction of every LLM agent in the graph that uses
+    state placeholders with a projecting instruction provider.
+
+    Args:
+        root_agent: Root of the agent graph
+    """
+    agents = [root_agent]
+    while agents:
+        agent = agents.pop()
+        agents.extend(agent.sub_agents)
+        if isinstance(agent, Agent) and isinstance(agent.instruction, str) and _PLACEHOLDER_RE.search(agent.instruction):
+            agent.instruction = projected_instruction(agent.name, agent.instruction)
@@ -0,0 +1,291 @@
+"""
+Process-wide client-side rate limiting and scheduling of model calls.
+
+Every model ID gets one ModelRateLimiter with a requests-per-minute and a
+tokens-per-minute token bucket, shared by all agents (and concurrent
+pipelines) that use that model. A call waits until both buckets can cover it,
+so bursts are spread over the quota instead of hitting 429s and backing off.
+
+Waiting calls are served by priority, then arrival order. Calls that finish an
+in-flight pipeline (critic, refiner, meal planners) go ahead of calls that
+start new ones (patient_data_agent), so under saturation running patients
+complete instead of every patient progressing slowly.
+
+Token usage is estimated from the request text before the call and
+corrected with the response's usage_metadata afterwards.
+
+Quotas default to QUOTAS and can be overridden per model with
+NUTRITION_RATE_LIMITS, e.g. "gemini-2.5-flash-lite=4000:4000000,*=1000:1000000"
+(requests per minute : tokens per minute; "*" applies to other models).
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, AsyncGenerator, List, Optional, Tuple
+
+from google.adk.models.google_llm import Gemini
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+
+from .projection import estimate_tokens
+
+# Model ID -> (requests per minute, tokens per minute)
+QUOTAS: Dict[str, Tuple[float, float]] = {
+    "gemini-2.5-flash-lite": (4000, 4_000_000),
+    "gemini-2.0-flash-exp": (2000, 4_000_000),
+    "*": (1000, 1_000_000),
+}
+# Seconds of quota a bucket can spend at once; kept well below a minute so a
+# full bucket plus a minute of refill never exceeds the per-minute quota by much
+BURST_SECONDS = 10.0
+
+# Lower runs first: calls that finish in-flight pipelines before calls that start new ones
+AGENT_PRIORITIES = {
+    "meal_plan_refiner_agent": 0,
+    "meal_plan_critic_agent": 0,
+    "web_search_agent": 1,
+    "breakfast_planner_agent": 1,
+    "mid_morning_snack_planner_agent": 1,
+    "lunch_planner_agent": 1,
+    "evening_snack_planner_agent": 1,
+    "dinner_planner_agent": 1,
+    "nutrition_calculator_agent": 2,
+    "patient_data_agent": 3,
+}
+DEFAULT_PRIORITY = 2
+
+# Label ADK sets on every model request with the calling agent's name
+AGENT_NAME_LABEL = "adk_agent_name"
+
+
+def parse_quotas(spec: Optional[str]) -> Dict[str, Tuple[float, float]]:
+    """
+    Parse a NUTRITION_RATE_LIMITS value.
+
+    Args:
+        spec: "model=rpm:tpm,..." or None
+
+    Returns:
+        Model ID -> (requests per minute, tokens per minute)
+    """
+    quotas: Dict[str, Tuple[float, float]] = {}
+    for entry in (spec or "").split(","):
+        if not entry.strip():
+            continue
+        model, _, limits = entry.partition("=")
+        rpm, _, tpm = limits.partition(":")
+        try:
+            quotas[model.strip()] = (float(rpm), float(tpm))
+        except ValueError:
+            raise ValueError(f"Invalid rate limit {entry!r}; expected model=requests_per_minute:tokens_per_minute")
+    return quotas
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate."""
+
+    def __init__(self, per_minute: float, burst_seconds: float = BURST_SECONDS):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until the bucket holds amount (capped at capacity), 0 if it already does."""
+        self._refill(now)
+        needed = min(amount, self.capacity) - self.level
+        return needed / self.rate if needed > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        """Remove amount; the level may go negative, which delays later calls."""
+        self.level -= amount
+
+
+class _Waiter:
+    __slots__ = ("future", "loop", "tokens", "granted")
+
+    def __init__(self, future: asyncio.Future, loop: asyncio.AbstractEventLoop, tokens: float):
+        self.future = future
+        self.loop = loop
+        self.tokens = tokens
+        self.granted = False
+
+
+class ModelRateLimiter:
+    """Requests- and tokens-per-minute limiter for one model, serving waiters by priority."""
+
+    def __init__(self, model: str, requests_per_minute: float, tokens_per_minute: float):
+        self.model = model
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self._queue: List[Tuple[int, int, _Waiter]] = []
+        self._order = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._wakeup_at = 0.0
+        self._counters = {"granted": 0, "waited": 0, "wait_seconds": 0.0, "max_queue": 0, "token_corrections": 0.0}
+
+    async def acquire(self, tokens: float, priority: int = DEFAULT_PRIORITY) -> float:
+        """
+        Wait until the model's quota covers a call.
+
+        Args:
+            tokens: Estimated tokens of the call
+            priority: Lower values are served first
+
+        Returns:
+            Seconds spent waiting
+        """
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        with self._lock:
+            if not self._queue and self._try_take(tokens, started):
+                self._counters["granted"] += 1
+                return 0.0
+            waiter = _Waiter(loop.create_future(), loop, tokens)
+            heapq.heappush(self._queue, (priority, next(self._order), waiter))
+            self._counters["max_queue"] = max(self._counters["max_queue"], len(self._queue))
+            self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # Granted just as it was cancelled: give the quota back
+                    self.requests.take(-1)
+                    self.tokens.take(-tokens)
+                self._dispatch()
+            raise
+        waited = time.monotonic() - started
+        with self._lock:
+            self._counters["granted"] += 1
+            self._counters["waited"] += 1
+            self._counters["wait_seconds"] += waited
+        return waited
+
+    def settle(self, estimated: float, actual: float) -> None:
+        """Correct the token bucket once a call's actual token usage is known."""
+        with self._lock:
+            self.tokens.take(actual - estimated)
+            self._counters["token_corrections"] += actual - estimated
+
+    def _try_take(self, tokens: float, now: float) -> bool:
+        if self.requests.wait_time(1, now) > 0 or self.tokens.wait_time(tokens, now) > 0:
+            return False
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        return True
+
+    def _dispatch(self) -> None:
+        """Grant queued calls in priority order while quota lasts; schedule a wakeup otherwise. Holds _lock."""
+        now = time.monotonic()
+        while self._queue:
+            waiter = self._queue[0][2]
+            if waiter.future.done():
+                heapq.heappop(self._queue)
+                continue
+            delay = max(self.requests.wait_time(1, now), self.tokens.wait_time(waiter.tokens, now))
+            if delay > 0:
+                self._schedule(waiter.loop, now + delay)
+                return
+            heapq.heappop(self._queue)
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            waiter.granted = True
+            waiter.loop.call_soon_threadsafe(_grant, waiter.future)
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop, when: float) -> None:
+        if self._wakeup is not None and not self._wakeup.cancelled() and self._wakeup_at <= when:
+            return
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+        self._wakeup_at = when
+        self._wakeup = loop.call_later(max(0.0, when - time.monotonic()), self._on_wakeup)
+
+    def _on_wakeup(self) -> None:
+        with self._lock:
+            self._wakeup = None
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return grant/wait counters and the current queue length."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            stats["queued"] = len(self._queue)
+            stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+            return stats
+
+
+def _grant(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+_limiters: Dict[str, ModelRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model: str) -> ModelRateLimiter:
+    """Return the process-wide limiter for a model ID, creating it from its quota on first use."""
+    limiter = _limiters.get(model)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(model)
+            if limiter is None:
+                quotas = {**QUOTAS, **parse_quotas(os.environ.get("NUTRITION_RATE_LIMITS"))}
+                rpm, tpm = quotas.get(model, quotas["*"])
+                limiter = _limiters[model] = ModelRateLimiter(model, rpm, tpm)
+    return limiter
+
+
+def rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """Return stats for every limiter created so far, keyed by model ID."""
+    return {model: limiter.stats() for model, limiter in sorted(_limiters.items())}
+
+
+def request_tokens(llm_request: LlmRequest) -> int:
+    """Estimate the tokens a request will consume (prompt plus a typical response)."""
+    config = llm_request.config
+    parts = [str(config.system_instruction or "")] if config else []
+    for content in llm_request.contents:
+        for part in content.parts or []:
+            if part.text:
+                parts.append(part.text)
+            elif part.function_call:
+                parts.append(json.dumps(part.function_call.args or {}, default=str))
+            elif part.function_response:
+                parts.append(json.dumps(part.function_response.response or {}, default=str))
+    prompt = estimate_tokens("\n".join(parts))
+    max_output = (config.max_output_tokens if config else None) or prompt // 4
+    return prompt + max_output
+
+
+class RateLimitedLlmMixin:
+    """Makes a model wait for its process-wide rate limiter before every call."""
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        limiter = get_rate_limiter(llm_request.model or self.model)
+        labels = (llm_request.config.labels if llm_request.config else None) or {}
+        estimated = request_tokens(llm_request)
+        await limiter.acquire(estimated, AGENT_PRIORITIES.get(labels.get(AGENT_NAME_LABEL, ""), DEFAULT_PRIORITY))
+        settled = False
+        async for response in super().generate_content_async(llm_request, stream):
+            usage = response.usage_metadata
+            if not settled and not response.partial and usage and usage.total_token_count:
+                limiter.settle(estimated, usage.total_token_count)
+                settled = True
+            yield response
+
+
+class RateLimitedGemini(RateLimitedLlmMixin, Gemini):
+    """Gemini sharing the process-wide per-model rate limiter."""
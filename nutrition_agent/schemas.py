@@ -0,0 +1,310 @@
+"""
+Schemas for the JSON every LLM agent writes to state, and validation of
+model responses against them.
+
+Each model-written output key has a Pydantic schema:
+
+    patient_health_data    PatientHealthData
+    nutrition_guidelines   NutritionGuidelines
+    <meal>_plan            MealOutput (one per meal planner)
+    critic_review          CriticReview
+    meal_plan_patch        RefinerOutput (a patch, or a full meal plan)
+
+The schemas check structure (required sections, lists vs objects, food
+entries with numeric nutrients, known patch operations) and are lenient about
+everything else: extra fields are kept, and numbers written as strings like
+"120 kcal" are coerced.
+
+apply_output_validation() attaches model callbacks to every agent with a
+schema. A final text response is parsed with extract_json and validated; a
+valid response is replaced by its minified, normalized JSON so downstream
+steps never see fences or broken JSON. An invalid response costs one targeted
+retry: the same request is sent again with the validation errors appended,
+through the plugins' model callbacks, so cassettes, metrics, rate limits and
+deadlines cover it like any other model call. If that also fails,
+OutputValidationError is raised so the stage fails fast (and a batch retry
+resumes from that stage) instead of passing malformed output on to the critic.
+"""
+import logging
+from typing import Dict, Any, List, Literal, Optional, Tuple, Type, Union
+
+from google.adk.agents import Agent, BaseAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator, model_validator
+
+from .json_utils import extract_json, dumps_compact
+from .meal_plan import MEALS, to_number
+from .meal_planning import plan_key
+
+logger = logging.getLogger(__name__)
+
+# Retries of a model call whose output failed validation
+VALIDATION_RETRIES = 1
+
+
+class OutputValidationError(ValueError):
+    """Raised when an agent's output is still invalid after its retries."""
+
+
+class _Schema(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+
+def _coerce_number(value: Any) -> Any:
+    if value is None or isinstance(value, bool):
+        return value
+    number = to_number(value)
+    return value if number is None else number
+
+
+def _optional_number(value: Any) -> Optional[float]:
+    """Coerce to a number, treating values like "unknown" as missing."""
+    return to_number(value)
+
+
+class PatientProfile(_Schema):
+    age: Union[float, str, None] = None
+    gender: Optional[str] = None
+    height_cm: Optional[float] = None
+    weight_kg: Optional[float] = None
+    bmi: Optional[float] = None
+    bmi_category: Optional[str] = None
+
+    _age = field_validator("age", mode="before")(_coerce_number)
+    _numbers = field_validator("height_cm", "weight_kg", "bmi", mode="before")(_optional_number)
+
+
+class PatientHealthData(_Schema):
+    patient_profile: PatientProfile
+    dietary_preferences: Dict[str, Any] = Field(default_factory=dict)
+    medical_conditions: Dict[str, Any] = Field(default_factory=dict)
+    lifestyle_factors: Dict[str, Any] = Field(default_factory=dict)
+    blood_test_analysis: Dict[str, Any] = Field(default_factory=dict)
+    key_nutritional_considerations: List[str] = Field(default_factory=list)
+
+
+class NutritionGuidelines(_Schema):
+    special_dietary_guidelines: List[str]
+    additional_recommendations: List[str] = Field(default_factory=list)
+
+
+class Food(_Schema):
+    name: str = Field(min_length=1)
+    quantity: Union[str, float, None] = None
+    calories: float
+    protein_g: float
+    carbs_g: float
+    fats_g: float
+    fiber_g: Optional[float] = None
+
+    _numbers = field_validator("calories", "protein_g", "carbs_g", "fats_g", mode="before")(_coerce_number)
+    _fiber = field_validator("fiber_g", mode="before")(_optional_number)
+
+
+class MealOutput(_Schema):
+    time: Optional[str] = None
+    foods: List[Food] = Field(min_length=1)
+    preparation_notes: Optional[str] = None
+    notes: List[str] = Field(default_factory=list)
+
+
+class Issue(_Schema):
+    category: Optional[str] = None
+    severity: Optional[str] = None
+    problem: str
+    suggestion: Optional[str] = None
+
+
+class CriticReview(_Schema):
+    medical_compliance: Dict[str, Any]
+    practical_assessment: Dict[str, Any]
+    issues: List[Issue] = Field(default_factory=list)
+    summary: Optional[str] = None
+    approval_reason: Optional[str] = None
+
+
+class PatchOperation(_Schema):
+    op: Literal["rescale", "replace", "remove", "add", "replace_meal"]
+    meal: Literal[tuple(MEALS)]  # type: ignore[valid-type]
+    food: Optional[str] = None
+    factor: Optional[float] = None
+    quantity: Optional[str] = None
+    new_food: Optional[Food] = None
+    foods: Optional[List[Food]] = Field(default=None, min_length=1)
+
+    _numbers = field_validator("factor", mode="before")(_coerce_number)
+
+    @model_validator(mode="after")
+    def _check_arguments(self) -> "PatchOperation":
+        required = {
+            "rescale": ("food", "factor"),
+            "replace": ("food", "new_food"),
+            "remove": ("food",),
+            "add": ("new_food",),
+            "replace_meal": ("foods",),
+        }[self.op]
+        missing = [name for name in required if getattr(self, name) is None]
+        if missing:
+            raise ValueError(f"{self.op} operation needs {', '.join(missing)}")
+        return self
+
+
+class RefinerOutput(_Schema):
+    operations: Optional[List[PatchOperation]] = None
+    meal_plan: Optional[Dict[str, Any]] = None
+    refinement_notes: List[str] = Field(default_factory=list)
+
+    @model_validator(mode="after")
+    def _check_patch_or_plan(self) -> "RefinerOutput":
+        if self.operations is None and self.meal_plan is None:
+            raise ValueError("expected a patch with operations or a full meal_plan")
+        return self
+
+
+# State key written by an LLM agent -> schema of its output
+OUTPUT_SCHEMAS: Dict[str, Type[BaseModel]] = {
+    "patient_health_data": PatientHealthData,
+    "nutrition_guidelines": NutritionGuidelines,
+    **{plan_key(meal): MealOutput for meal in MEALS},
+    "critic_review": CriticReview,
+    "meal_plan_patch": RefinerOutput,
+}
+
+
+def _error_messages(error: ValidationError) -> List[str]:
+    return [
+        f"{'.'.join(str(part) for part in detail['loc']) or '<root>'}: {detail['msg']}"
+        for detail in error.errors()
+    ]
+
+
+def validate_output(output_key: str, value: Any) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    Parse and validate an agent output against its schema.
+
+    Args:
+        output_key: State key the output is written to
+        value: Raw model text or an already-parsed object
+
+    Returns:
+        (normalized output, []) when valid, otherwise (None, error messages)
+    """
+    try:
+        parsed = extract_json(value)
+    except ValueError as e:
+        return None, [f"not valid JSON: {e}"]
+    schema = OUTPUT_SCHEMAS.get(output_key)
+    if schema is None:
+        return parsed, []
+    if not isinstance(parsed, dict):
+        return None, [f"expected a JSON object, got {type(parsed).__name__}"]
+    try:
+        return schema.model_validate(parsed).model_dump(mode="json", exclude_none=True), []
+    except ValidationError as e:
+        return None, _error_messages(e)
+
+
+def _response_text(llm_response: LlmResponse) -> Optional[str]:
+    """Return the text of a final response, or None for partial and function-call responses."""
+    content = llm_response.content
+    if llm_response.partial or content is None or not content.parts:
+        return None
+    if any(part.function_call for part in content.parts):
+        return None
+    text = "".join(part.text or "" for part in content.parts if not part.thought)
+    return text if text.strip() else None
+
+
+def _text_response(llm_response: LlmResponse, text: str) -> LlmResponse:
+    return llm_response.model_copy(update={"content": types.Content(role="model", parts=[types.Part(text=text)])})
+
+
+async def _call_model(agent: Agent, callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """Call an agent's model from inside a model callback, through the plugins' model callbacks."""
+    plugins = callback_context._invocation_context.plugin_manager
+    response = await plugins.run_before_model_callback(callback_context=callback_context, llm_request=llm_request)
+    if response is not None:
+        return response
+    try:
+        async for partial_or_final in agent.canonical_model.generate_content_async(llm_request):
+            if not partial_or_final.partial:
+                response = partial_or_final
+    except Exception as e:
+        response = await plugins.run_on_model_error_callback(
+            callback_context=callback_context, llm_request=llm_request, error=e
+        )
+        if response is None:
+            raise
+        return response
+    if response is None:
+        return None
+    altered = await plugins.run_after_model_callback(callback_context=callback_context, llm_response=response)
+    return altered if altered is not None else response
+
+
+class OutputValidator:
+    """Model callbacks validating one agent's final response against its output schema."""
+
+    def __init__(self, agent: Agent, retries: int = VALIDATION_RETRIES):
+        self.agent = agent
+        self.retries = retries
+        self._requests: Dict[str, LlmRequest] = {}
+
+    async def before_model(self, callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+        self._requests[callback_context.invocation_id] = llm_request
+        return None
+
+    async def after_model(self, callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+        text = _response_text(llm_response)
+        if text is None:
+            return None
+        output_key = self.agent.output_key
+        normalized, errors = validate_output(output_key, text)
+        llm_request = self._requests.pop(callback_context.invocation_id, None)
+        attempt = 0
+        while errors and llm_request is not None and attempt < self.retries:
+            attempt += 1
+            logger.warning("%s output failed validation (%s); retrying", self.agent.name, "; ".join(errors[:5]))
+            retry_request = llm_request.model_copy(deep=True)
+            retry_request.contents.append(types.Content(role="model", parts=[types.Part(text=text)]))
+            retry_request.contents.append(types.Content(role="user", parts=[types.Part(text=(
+                "Your previous response did not match the required JSON structure:\n- "
+                + "\n- ".join(errors)
+                + "\nRespond again with ONLY the corrected JSON, no other text, and do not call any tools."
+            ))]))
+            retried = await _call_model(self.agent, callback_context, retry_request)
+            text = _response_text(retried) if retried is not None else None
+            if text is None:
+                continue
+            llm_response = retried
+            normalized, errors = validate_output(output_key, text)
+        if errors:
+            raise OutputValidationError(f"{self.agent.name} produced invalid {output_key}: {'; '.join(errors)}")
+        return _text_response(llm_response, dumps_compact(normalized))
+
+
+def _add_callback(existing: Any, callback: Any) -> Any:
+    if existing is None:
+        return callback
+    return (list(existing) if isinstance(existing, list) else [existing]) + [callback]
+
+
+def apply_output_validation(root_agent: BaseAgent, retries: int = VALIDATION_RETRIES) -> None:
+    """
+    Attach an OutputValidator to every LLM agent in the graph whose output_key has a schema.
+
+    Args:
+        root_agent: Root of the agent graph
+        retries: Retries of a model call whose output failed validation
+    """
+    agents = [root_agent]
+    while agents:
+        agent = agents.pop()
+        agents.extend(agent.sub_agents)
+        if isinstance(agent, Agent) and agent.output_key in OUTPUT_SCHEMAS:
+            validator = OutputValidator(agent, retries)
+            agent.before_model_callback = _add_callback(agent.before_model_callback, validator.before_model)
+            agent.after_model_callback = _add_callback(agent.after_model_callback, validator.after_model)
@@ -0,0 +1,333 @@
+"""
+Persistent TTL/LRU cache for web search results.
+
+An in-memory LRU sits in front of a SQLite table so repeated food queries
+("paneer nutrition facts") across patients and processes are answered without
+re-running web_search_agent. Entries expire after a TTL and both tiers are
+size-capped.
+
+Misses are coalesced as well: while a query is being searched, identical
+queries from other sessions (or from the same bulk lookup) wait for that
+search instead of starting their own.
+"""
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple
+
+from google.adk.tools.agent_tool import AgentTool
+from google.adk.tools.tool_context import ToolContext
+
+DEFAULT_CACHE_PATH = os.path.expanduser(
+    os.getenv("NUTRITION_SEARCH_CACHE_PATH", "~/.cache/nutrition_agent/search_cache.sqlite3")
+)
+DEFAULT_TTL_SECONDS = float(os.getenv("NUTRITION_SEARCH_CACHE_TTL", 7 * 24 * 3600))
+DEFAULT_MEMORY_ENTRIES = 1024
+DEFAULT_DISK_ENTRIES = int(os.getenv("NUTRITION_SEARCH_CACHE_MAX_ENTRIES", 50000))
+
+_STOPWORDS = {"a", "an", "the", "of", "in", "for", "per", "and", "what", "is", "are", "how", "many", "much"}
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query so trivially different phrasings share a cache entry.
+
+    Lowercases, strips punctuation and filler words, and sorts the remaining
+    tokens: "Paneer nutrition facts?" and "nutrition facts of paneer" match.
+
+    Args:
+        query: Raw search request
+
+    Returns:
+        The normalized cache key
+    """
+    tokens = re.sub(r"[^a-z0-9.]+", " ", query.lower()).split()
+    return " ".join(sorted(t for t in tokens if t not in _STOPWORDS))
+
+
+class SearchCache:
+    """Two-tier (memory LRU + SQLite) cache with TTL expiry and hit/miss/eviction counters."""
+
+    def __init__(
+        self,
+        path: Optional[str] = DEFAULT_CACHE_PATH,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+        max_disk_entries: int = DEFAULT_DISK_ENTRIES,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0,
+            "memory_evictions": 0, "evictions": 0, "expirations": 0,
+        }
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "key TEXT PRIMARY KEY, query TEXT, result TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS search_cache_accessed ON search_cache (accessed_at)")
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return now - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, result: str, created_at: float) -> None:
+        self._memory[key] = (result, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._counters["memory_evictions"] += 1
+
+    def get(self, query: str) -> Optional[str]:
+        """
+        Return a cached result for the query, or None on a miss or expired entry.
+
+        Args:
+            query: Raw search request
+
+        Returns:
+            The cached search result text, or None
+        """
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            expired = False
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._memory.move_to_end(key)
+                    self._counters["hits"] += 1
+                    self._counters["memory_hits"] += 1
+                    return entry[0]
+                del self._memory[key]
+                expired = True
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT result, created_at FROM search_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if not self._expired(row[1], now):
+                        self._db.execute("UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._remember(key, row[0], row[1])
+                        self._counters["hits"] += 1
+                        self._counters["disk_hits"] += 1
+                        return row[0]
+                    self._db.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                    expired = True
+
+            # An entry expired in both tiers counts once
+            self._counters["expirations"] += expired
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, query: str, result: str) -> None:
+        """
+        Store a search result in both tiers, evicting least recently used entries past the caps.
+
+        Args:
+            query: Raw search request
+            result: Search result text
+        """
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            self._remember(key, result, now)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO search_cache (key, query, result, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, query, result, now, now),
+            )
+            overflow = self._db.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0] - self.max_disk_entries
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM search_cache WHERE key IN "
+                    "(SELECT key FROM search_cache ORDER BY accessed_at LIMIT ?)",
+                    (overflow,),
+                )
+                self._counters["evictions"] += overflow
+
+    def purge_expired(self) -> int:
+        """
+        Delete expired entries from both tiers.
+
+        Returns:
+            Number of entries removed
+        """
+        now = time.time()
+        with self._lock:
+            stale = [k for k, (_, created_at) in self._memory.items() if self._expired(created_at, now)]
+            for key in stale:
+                del self._memory[key]
+            removed = len(stale)
+            if self._db is not None:
+                removed += self._db.execute(
+                    "DELETE FROM search_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+                ).rowcount
+            self._counters["expirations"] += removed
+            return removed
+
+    def clear(self) -> None:
+        """Remove every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM search_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return cache counters and current sizes.
+
+        Returns:
+            A dictionary with hits, misses, evictions (from disk; memory_evictions only
+            demote to disk), expirations, hit_rate and entry counts
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+            stats["memory_entries"] = len(self._memory)
+            if self._db is not None:
+                stats["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+            return stats
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+_search_cache: Optional[SearchCache] = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    """Return the process-wide search cache, opening the SQLite store on first use."""
+    global _search_cache
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                _search_cache = SearchCache()
+    return _search_cache
+
+
+class InFlightRequests:
+    """Coalesces concurrent calls with the same key onto a single in-flight call per event loop."""
+
+    def __init__(self):
+        self._calls: Dict[Tuple[int, str], asyncio.Future] = {}
+        self._counters = {"started": 0, "coalesced": 0}
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run call(), or wait for the in-flight call with the same key and share its result.
+
+        If the in-flight call is cancelled, one of its waiters starts the call again.
+
+        Args:
+            key: Request key; calls with equal keys are coalesced
+            call: Starts the request
+
+        Returns:
+            The call's result (an exception is raised to every waiter)
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        while True:
+            future = self._calls.get(flight_key)
+            if future is None:
+                break
+            self._counters["coalesced"] += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+
+        future = loop.create_future()
+        # Mark a failure as retrieved even if nobody else was waiting for it
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._calls[flight_key] = future
+        self._counters["started"] += 1
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[flight_key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return started/coalesced counters and the number of calls in flight."""
+        return {**self._counters, "in_flight": len(self._calls)}
+
+
+# Shared by every CachedAgentTool so identical searches coalesce across agents and sessions
+_in_flight = InFlightRequests()
+
+
+class CachedAgentTool(AgentTool):
+    """
+    AgentTool that answers repeated requests from a SearchCache instead of
+    re-running the wrapped agent, and coalesces concurrent identical requests
+    onto one run.
+
+    On a hit (or a coalesced call) the wrapped agent's output_key
+    (search_results for web_search_agent) is still written to state, so
+    callers observe the same state changes as an uncached call.
+    """
+
+    def __init__(self, agent, cache: Optional[SearchCache] = None, in_flight: Optional[InFlightRequests] = None, **kwargs):
+        super().__init__(agent, **kwargs)
+        self._cache = cache
+        self.in_flight = in_flight or _in_flight
+
+    @property
+    def cache(self) -> SearchCache:
+        if self._cache is None:
+            self._cache = get_search_cache()
+        return self._cache
+
+    async def run_async(self, *, args: Dict[str, Any], tool_context: ToolContext) -> Any:
+        query = str(args.get("request", ""))
+        output_key = getattr(self.agent, "output_key", None)
+        if not query:
+            return await super().run_async(args=args, tool_context=tool_context)
+        cached = self.cache.get(query)
+        if cached is not None:
+            if output_key:
+                tool_context.state[output_key] = cached
+            return cached
+
+        async def search() -> Any:
+            result = await super(CachedAgentTool, self).run_async(args=args, tool_context=tool_context)
+            if isinstance(result, str) and result.strip():
+                self.cache.put(query, result)
+            return result
+
+        result = await self.in_flight.run(f"{self.agent.name}:{normalize_query(query)}", search)
+        if output_key and isinstance(result, str):
+            tool_context.state[output_key] = result
+        return result
@@ -0,0 +1,437 @@
+"""
+Long-lived HTTP service for meal-plan generation.
+
+The agent graph, the Runner and its plugins are built once at startup, so a
+plan request does not pay for imports, graph construction or load_dotenv.
+Requests are queued and run by a fixed number of workers; when the queue is
+full, new requests are rejected with 429 and a Retry-After header instead of
+piling up.
+
+Endpoints:
+
+    POST /plans                   {"patient_id": "p001", ...} -> 202 {"job_id", "status", "queue_position"}
+    GET  /plans/{job_id}          job status, and the plan once finished
+    GET  /plans/{job_id}/events   server-sent events: queued, started, stage (one per
+                                  stage output, as in agent.py's NDJSON), then done
+    GET  /healthz                 queue depth, running jobs, session and rate limiter stats
+
+A request body takes the batch manifest fields (patient_id plus
+questionnaire_path/measurements_path or patient_store_path) and an optional
+deadline_seconds.
+
+Run against the offline fake model or a recorded cassette for local testing:
+
+    NUTRITION_AGENT_FAKE_MODEL=1 python -m nutrition_agent.server --port 8080
+    python -m nutrition_agent.server --cassette traces.sqlite3 --cassette-mode replay
+"""
+import argparse
+import asyncio
+import json
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from google.adk.runners import Runner
+from google.genai import types
+from pydantic import BaseModel, ConfigDict
+
+from .agent import get_nutritionist_agent, APP_NAME, load_patient_data, retry_config, stage_records
+from .batch import PATIENT_STATE_KEYS, QUERY, RESULT_STATE_KEYS
+from .cassette import CassettePlugin, MODES as CASSETTE_MODES
+from .checkpoint import CheckpointPlugin
+from .compaction import CompactingSessionService
+from .deadline import DeadlinePlugin, DEGRADED_KEY, DEADLINE_GRACE_SECONDS, deadline_state
+from .json_utils import load_state_json
+from .memo import StageMemo, StageMemoPlugin
+from .metrics import MetricsPlugin
+from .rate_limit import rate_limiter_stats
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_CONCURRENCY = 4
+DEFAULT_QUEUE_SIZE = 32
+# Finished jobs kept for status and event replay; the oldest are forgotten first
+DEFAULT_FINISHED_JOBS = 1000
+# Seconds between SSE comments that keep idle connections open
+KEEPALIVE_SECONDS = 15.0
+
+FINISHED_STATUSES = ("ok", "error")
+
+
+class QueueFullError(Exception):
+    """Raised when a plan request arrives while the queue is full."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Plan queue is full")
+        self.retry_after = retry_after
+
+
+class PlanRequest(BaseModel):
+    """Body of POST /plans: a batch manifest entry plus an optional deadline."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    patient_id: str
+    questionnaire_path: Optional[str] = None
+    measurements_path: Optional[str] = None
+    patient_store_path: Optional[str] = None
+    deadline_seconds: Optional[float] = None
+
+
+class Job:
+    """One plan request: its status, progress events and result."""
+
+    def __init__(self, job_id: str, patient: Dict[str, Any], deadline_seconds: Optional[float] = None):
+        self.job_id = job_id
+        self.patient = patient
+        self.deadline_seconds = deadline_seconds
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.events: List[Dict[str, Any]] = []
+        self._changed = asyncio.Event()
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        """Record a progress event and wake up every subscriber."""
+        self.events.append({"event": event, "data": data})
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield every event of the job, past ones first, until it finishes.
+
+        Yields None after KEEPALIVE_SECONDS without an event, so callers can keep the connection open.
+        """
+        sent = 0
+        while True:
+            while sent < len(self.events):
+                sent += 1
+                yield self.events[sent - 1]
+            if self.status in FINISHED_STATUSES:
+                return
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield None
+
+    def summary(self) -> Dict[str, Any]:
+        """Return the job's status record, including the result once finished."""
+        summary: Dict[str, Any] = {
+            "job_id": self.job_id,
+            "patient_id": self.patient.get("patient_id"),
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.result is not None:
+            summary["result"] = self.result
+        return summary
+
+
+class PlanService:
+    """Bounded queue of plan jobs served by a fixed pool of workers on one shared Runner."""
+
+    def __init__(
+        self,
+        runner: Runner,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        max_finished_jobs: int = DEFAULT_FINISHED_JOBS,
+    ):
+        self.runner = runner
+        self.concurrency = max(1, concurrency)
+        self.queue: "asyncio.Queue[Job]" = asyncio.Queue(maxsize=max(1, queue_size))
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.running = 0
+        self._workers: List[asyncio.Task] = []
+        self._durations: List[float] = []
+        self._counters = {"accepted": 0, "rejected": 0, "ok": 0, "error": 0}
+
+    def start(self) -> None:
+        """Start the workers."""
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def close(self) -> None:
+        """Stop the workers and close the runner."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        await self.runner.close()
+
+    def retry_after(self) -> float:
+        """Estimate the seconds until a queue slot frees up, from recent job durations."""
+        recent = self._durations[-20:]
+        mean = sum(recent) / len(recent) if recent else 30.0
+        return max(1.0, round(mean / self.concurrency, 1))
+
+    def submit(self, patient: Dict[str, Any], deadline_seconds: Optional[float] = None) -> Job:
+        """
+        Queue a plan request.
+
+        Args:
+            patient: Manifest-style entry with a patient_id
+            deadline_seconds: End-to-end time budget for the plan
+
+        Returns:
+            The queued job
+
+        Raises:
+            QueueFullError: The queue is full; retry after the given number of seconds
+        """
+        job = Job(uuid.uuid4().hex, patient, deadline_seconds)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._counters["rejected"] += 1
+            raise QueueFullError(self.retry_after())
+        self._counters["accepted"] += 1
+        self.jobs[job.job_id] = job
+        job.publish("queued", {"job_id": job.job_id, "queue_position": self.queue.qsize()})
+        return job
+
+    def _forget_finished(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED_STATUSES]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            self.running += 1
+            try:
+                await self._run(job)
+            finally:
+                self.running -= 1
+                self.queue.task_done()
+                self._forget_finished()
+
+    async def _run(self, job: Job) -> None:
+        runner = self.runner
+        patient_id = str(job.patient["patient_id"])
+        job.status = "running"
+        job.started_at = time.time()
+        job.publish("started", {"job_id": job.job_id, "patient_id": patient_id})
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"patient_id": patient_id}
+        try:
+            session = await runner.session_service.create_session(
+                app_name=runner.app_name,
+                user_id=patient_id,
+                session_id=job.job_id,
+                state={key: job.patient[key] for key in PATIENT_STATE_KEYS if key in job.patient},
+            )
+            deadline = time.time() + job.deadline_seconds if job.deadline_seconds else None
+            iteration_count = 0
+
+            async def stream_events() -> None:
+                nonlocal iteration_count
+                async for event in runner.run_async(
+                    user_id=patient_id,
+                    session_id=session.id,
+                    new_message=types.Content(role="user", parts=[types.Part(text=QUERY)]),
+                    state_delta=deadline_state(deadline),
+                ):
+                    if not event.actions or not event.actions.state_delta:
+                        continue
+                    if "critique" in event.actions.state_delta:
+                        iteration_count += 1
+                    for record in stage_records(event, started, iteration_count):
+                        job.publish("stage", record)
+
+            timed_out = False
+            if deadline:
+                try:
+                    await asyncio.wait_for(stream_events(), job.deadline_seconds + DEADLINE_GRACE_SECONDS)
+                except asyncio.TimeoutError:
+                    timed_out = True
+            else:
+                await stream_events()
+
+            session = await runner.session_service.get_session(
+                app_name=runner.app_name, user_id=patient_id, session_id=session.id
+            )
+            state = session.state if session else {}
+            for key in RESULT_STATE_KEYS:
+                value = state.get(key)
+                result[key] = load_state_json(value) if value is not None else None
+            result["iterations"] = iteration_count
+            if deadline:
+                result["degraded"] = bool(timed_out or state.get(DEGRADED_KEY))
+            result["status"] = "ok" if result["current_meal_plan"] is not None else "error"
+            if result["status"] == "error":
+                result["error"] = "Pipeline finished without a meal plan"
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = f"{type(e).__name__}: {e}"
+            result["traceback"] = traceback.format_exc()
+        finally:
+            # The result is kept on the job; the session is not needed any more
+            await runner.session_service.delete_session(
+                app_name=runner.app_name, user_id=patient_id, session_id=job.job_id
+            )
+        elapsed = time.perf_counter() - started
+        result["elapsed_seconds"] = round(elapsed, 3)
+        self._durations = self._durations[-99:] + [elapsed]
+        self._counters[result["status"]] += 1
+        job.result = result
+        job.finished_at = time.time()
+        job.status = result["status"]
+        job.publish("done", {"job_id": job.job_id, **result})
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, running jobs, request counters, session and rate limiter stats."""
+        session_stats = getattr(self.runner.session_service, "stats", None)
+        return {
+            **self._counters,
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "running": self.running,
+            "concurrency": self.concurrency,
+            "jobs": len(self.jobs),
+            "sessions": session_stats() if session_stats else None,
+            "rate_limits": rate_limiter_stats(),
+        }
+
+
+def build_runner(
+    metrics_dir: Optional[str] = None,
+    cassette_path: Optional[str] = None,
+    cassette_mode: str = "replay",
+    stage_memo_path: Optional[str] = None,
+) -> Runner:
+    """
+    Build the service's Runner for nutritionist_agent with the same plugins as batch runs.
+
+    Sessions are in memory, with a compacted event history, and deleted when
+    their job finishes; the job keeps the result.
+
+    Args:
+        metrics_dir: Directory for per-run metrics
+        cassette_path: Cassette to record to or replay from
+        cassette_mode: "record", "replay" or "auto"
+        stage_memo_path: Stage memo for reusing stage outputs of previously seen inputs
+
+    Returns:
+        The runner
+    """
+    plugins = [CheckpointPlugin(), DeadlinePlugin(retry_config)]
+    if metrics_dir:
+        plugins.append(MetricsPlugin(metrics_dir))
+    if cassette_path:
+        plugins.append(CassettePlugin(cassette_path, cassette_mode))
+    if stage_memo_path:
+        plugins.append(StageMemoPlugin(StageMemo(stage_memo_path), get_nutritionist_agent(), load_patient_data))
+    return Runner(
+        agent=get_nutritionist_agent(),
+        app_name=APP_NAME,
+        session_service=CompactingSessionService(),
+        plugins=plugins,
+    )
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def create_app(service_factory: Callable[[], PlanService], title: str = "Nutrition agent") -> FastAPI:
+    """
+    Create the FastAPI app.
+
+    Args:
+        service_factory: Called at startup to build the PlanService
+        title: API title
+
+    Returns:
+        The FastAPI application; the running service is app.state.service
+    """
+
+    @asynccontextmanager
+    async def lifespan(app):
+        service = service_factory()
+        service.start()
+        app.state.service = service
+        try:
+            yield
+        finally:
+            await service.close()
+
+    app = FastAPI(title=title, lifespan=lifespan)
+
+    def get_job(job_id: str) -> Job:
+        job = app.state.service.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+        return job
+
+    @app.post("/plans", status_code=202)
+    async def submit_plan(request: PlanRequest):
+        patient = request.model_dump(exclude_none=True, exclude={"deadline_seconds"})
+        try:
+            job = app.state.service.submit(patient, request.deadline_seconds)
+        except QueueFullError as e:
+            return JSONResponse(
+                status_code=429,
+                content={"error": str(e), "retry_after_seconds": e.retry_after},
+                headers={"Retry-After": str(int(e.retry_after + 0.999))},
+            )
+        return {
+            "job_id": job.job_id,
+            "status": job.status,
+            "queue_position": app.state.service.queue.qsize(),
+            "status_url": f"/plans/{job.job_id}",
+            "events_url": f"/plans/{job.job_id}/events",
+        }
+
+    @app.get("/plans/{job_id}")
+    async def plan_status(job_id: str):
+        return get_job(job_id).summary()
+
+    @app.get("/plans/{job_id}/events")
+    async def plan_events(job_id: str):
+        job = get_job(job_id)
+
+        async def stream() -> AsyncIterator[str]:
+            async for event in job.subscribe():
+                yield ": keepalive\n\n" if event is None else _sse(event["event"], event["data"])
+
+        return StreamingResponse(
+            stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    @app.get("/healthz")
+    async def health():
+        return app.state.service.stats()
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve meal-plan generation over HTTP")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--concurrency", "-c", type=int, default=DEFAULT_CONCURRENCY, help="Plans generated at once")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="Queued plans before requests get 429")
+    parser.add_argument("--metrics-dir", help="Directory for per-run metrics JSON and metrics.prom")
+    parser.add_argument("--cassette", help="Cassette file for recording or replaying model and search traffic")
+    parser.add_argument("--cassette-mode", choices=CASSETTE_MODES, default="replay")
+    parser.add_argument("--stage-memo", help="SQLite stage memo for reusing stage outputs across runs")
+    args = parser.parse_args()
+
+    def service_factory() -> PlanService:
+        runner = build_runner(args.metrics_dir, args.cassette, args.cassette_mode, args.stage_memo)
+        return PlanService(runner, args.concurrency, args.queue_size)
+
+    uvicorn.run(create_app(service_factory), host=args.host, port=args.port)
@@ -0,0 +1,236 @@
+"""
+Cold-start benchmark: how long it takes to import the package and build the agent graph.
+
+Each scenario runs in a fresh interpreter, several times, and records the
+time spent in the scenario's statement (imports and construction) as well as
+the wall time of the whole process. One extra run with `python -X importtime`
+lists the third-party imports that the package's own modules pull in, slowest
+first, to show where a regression came from.
+
+Reports are JSON. Pass --baseline with an earlier report to list regressions
+beyond --threshold; the exit status is 1 when any regression is found.
+
+Usage:
+    python -m nutrition_agent.startup_benchmark --repeats 5 --report startup.json --baseline previous.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, Any, List, Tuple
+
+# name -> statement timed in a fresh interpreter
+SCENARIOS = {
+    "package": "import nutrition_agent",
+    "validator": "import nutrition_agent.validator",
+    "food_db": "import nutrition_agent.food_db",
+    "agent_module": "import nutrition_agent.agent",
+    "agent_graph": "from nutrition_agent.agent import get_nutritionist_agent; get_nutritionist_agent()",
+    "batch": "import nutrition_agent.batch",
+    "server": "import nutrition_agent.server",
+}
+DEFAULT_REPEATS = 5
+DEFAULT_THRESHOLD = 0.10
+# Import time changes smaller than this are treated as noise
+MIN_DELTA_SECONDS = 0.02
+SLOWEST_IMPORTS = 10
+
+_PACKAGE = (__package__ or __name__).split(".")[0]
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_TIMER = """import time
+_started = time.perf_counter()
+{statement}
+print(time.perf_counter() - _started)
+"""
+
+
+def _environment() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [_PROJECT_DIR, env.get("PYTHONPATH")]))
+    env.setdefault("PYTHONWARNINGS", "ignore")
+    return env
+
+
+def time_statement(statement: str) -> Tuple[float, float]:
+    """
+    Run a statement in a fresh interpreter.
+
+    Args:
+        statement: Python code, typically imports
+
+    Returns:
+        (seconds spent in the statement, wall seconds of the whole process)
+
+    Raises:
+        RuntimeError: The statement failed
+    """
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", _TIMER.format(statement=statement)],
+        env=_environment(), cwd=_PROJECT_DIR, capture_output=True, text=True,
+    )
+    process_seconds = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"{statement!r} failed:\n{completed.stderr[-2000:]}")
+    return float(completed.stdout.strip().splitlines()[-1]), process_seconds
+
+
+def slowest_imports(statement: str, limit: int = SLOWEST_IMPORTS) -> List[Dict[str, Any]]:
+    """
+    List the external modules imported directly by the package's modules, by cumulative import time.
+
+    Args:
+        statement: Python code to profile with -X importtime
+        limit: Entries to return
+
+    Returns:
+        [{"module", "imported_by", "cumulative_seconds"}], slowest first
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        env=_environment(), cwd=_PROJECT_DIR, capture_output=True, text=True,
+    )
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative) / 1e6))
+
+    # -X importtime prints a module after everything it imports, so parents follow their children
+    found = []
+    parents: List[str] = []
+    for depth, name, cumulative in reversed(entries):
+        del parents[depth:]
+        parent = parents[-1] if parents else None
+        parents.append(name)
+        if parent and parent.split(".")[0] == _PACKAGE and name.split(".")[0] != _PACKAGE:
+            found.append({"module": name, "imported_by": parent, "cumulative_seconds": round(cumulative, 4)})
+    found.sort(key=lambda entry: -entry["cumulative_seconds"])
+    return found[:limit]
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    return {
+        "median": round(statistics.median(values), 4),
+        "min": round(min(values), 4),
+        "max": round(max(values), 4),
+    }
+
+
+def run_scenario(name: str, statement: str, repeats: int = DEFAULT_REPEATS) -> Dict[str, Any]:
+    """
+    Time one scenario over several fresh interpreters.
+
+    Args:
+        name: Scenario name
+        statement: Statement to time
+        repeats: Interpreters to start
+
+    Returns:
+        The scenario's report entry
+    """
+    runs = [time_statement(statement) for _ in range(max(1, repeats))]
+    return {
+        "name": name,
+        "statement": statement,
+        "import_seconds": _summary([run[0] for run in runs]),
+        "process_seconds": _summary([run[1] for run in runs]),
+        "slowest_imports": slowest_imports(statement),
+    }
+
+
+def run_benchmark(scenarios: Dict[str, str], repeats: int = DEFAULT_REPEATS) -> Dict[str, Any]:
+    """
+    Run every scenario.
+
+    Args:
+        scenarios: Scenario name -> statement
+        repeats: Fresh interpreters per scenario
+
+    Returns:
+        The benchmark report
+    """
+    report: Dict[str, Any] = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {"repeats": repeats},
+        "scenarios": [],
+    }
+    for name, statement in scenarios.items():
+        entry = run_scenario(name, statement, repeats)
+        report["scenarios"].append(entry)
+        slowest = entry["slowest_imports"][0] if entry["slowest_imports"] else None
+        print(
+            f"{name:>14}: {entry['import_seconds']['median']:.3f}s import, "
+            f"{entry['process_seconds']['median']:.3f}s process"
+            + (f", slowest {slowest['module']} ({slowest['cumulative_seconds']:.3f}s)" if slowest else ""),
+            file=sys.stderr,
+        )
+    return report
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    List regressions of a report against a baseline, per matching scenario.
+
+    Args:
+        current: New report
+        baseline: Earlier report
+        threshold: Relative change counted as a regression (0.1 = 10%)
+
+    Returns:
+        Human-readable regression descriptions
+    """
+    regressions = []
+    baseline_scenarios = {scenario["name"]: scenario for scenario in baseline.get("scenarios", [])}
+    for scenario in current.get("scenarios", []):
+        old = baseline_scenarios.get(scenario["name"])
+        if old is None:
+            continue
+        new_seconds, old_seconds = scenario["import_seconds"]["median"], old["import_seconds"]["median"]
+        if old_seconds and new_seconds - old_seconds > MIN_DELTA_SECONDS:
+            change = (new_seconds - old_seconds) / old_seconds
+            if change > threshold:
+                regressions.append(f"{scenario['name']} import time: {old_seconds:g}s -> {new_seconds:g}s ({change:+.0%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark package import and agent graph construction time")
+    parser.add_argument("--scenario", "-s", nargs="+", choices=sorted(SCENARIOS), help="Scenarios to run (default: all)")
+    parser.add_argument("--repeats", "-n", type=int, default=DEFAULT_REPEATS, help="Fresh interpreters per scenario")
+    parser.add_argument("--report", "-o", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    selected = {name: SCENARIOS[name] for name in args.scenario} if args.scenario else SCENARIOS
+    report = run_benchmark(selected, args.repeats)
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as baseline_file:
+            regressions = compare_reports(report, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if not regressions:
+            print("No regressions against baseline", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,281 @@
+"""
+Rule-based nutritional accuracy and completeness checks for a meal plan.
+
+These are the arithmetic parts of the critic's evaluation criteria:
+calories within ±100 kcal, macros within ±10% and all required meals present
+with consistent totals. They produce the `nutritional_accuracy` section and
+the nutritional/completeness `issues` of the critique schema, so the critic
+model only has to judge medical compliance and practicality.
+"""
+from typing import Dict, Any, List, Optional
+
+from .json_utils import load_state_json
+from .meal_plan import MEALS, REQUIRED_MEALS, MACRO_KEYS, TARGET_KEYS, to_number, meal_included, sum_foods, daily_totals
+
+CALORIE_TOLERANCE_KCAL = 100.0
+MACRO_TOLERANCE = 0.10
+# A meal may drift this far from its meal_distribution share before it is flagged
+MEAL_CALORIE_TOLERANCE = 0.25
+# Stated meal totals this far from the recomputed ones count as a calculation error
+TOTALS_TOLERANCE_KCAL = 25.0
+
+# State key holding issues from checks outside this module, added to the validation (see add_issues)
+EXTRA_ISSUES_KEY = "extra_plan_issues"
+
+PASSING_SCORES = ("excellent", "good")
+BLOCKING_SEVERITIES = ("critical", "major")
+
+
+def _status(actual: float, target: float, tolerance: float) -> str:
+    if actual > target + tolerance:
+        return "too_high"
+    if actual < target - tolerance:
+        return "too_low"
+    return "within_range"
+
+
+def _issue(category: str, severity: str, problem: str, suggestion: str) -> Dict[str, str]:
+    return {"category": category, "severity": severity, "problem": problem, "suggestion": suggestion}
+
+
+def check_nutritional_accuracy(plan: Dict[str, Any], requirements: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compare recomputed daily totals against daily_targets.
+
+    Args:
+        plan: Parsed current_meal_plan
+        requirements: Parsed nutrition_requirements
+
+    Returns:
+        {"nutritional_accuracy": {...}, "issues": [...]}
+    """
+    targets = requirements.get("daily_targets") or {}
+    totals = daily_totals(plan)
+    accuracy: Dict[str, Any] = {}
+    issues: List[Dict[str, str]] = []
+
+    target_calories = to_number(targets.get(TARGET_KEYS["calories"])) or 0.0
+    difference = round(totals["calories"] - target_calories, 1)
+    accuracy["calories_status"] = _status(totals["calories"], target_calories, CALORIE_TOLERANCE_KCAL)
+    accuracy["calories_difference"] = difference
+    if accuracy["calories_status"] != "within_range":
+        issues.append(_issue(
+            "nutritional", "major",
+            f"Daily calories are {totals['calories']:.0f} kcal vs target {target_calories:.0f} kcal ({difference:+.0f} kcal)",
+            f"{'Reduce' if difference > 0 else 'Increase'} portions to bring calories within ±{CALORIE_TOLERANCE_KCAL:.0f} kcal of target",
+        ))
+
+    out_of_range = 0
+    for key, label in (("protein_g", "protein"), ("carbs_g", "carbs"), ("fats_g", "fats")):
+        target = to_number(targets.get(TARGET_KEYS[key])) or 0.0
+        status = _status(totals[key], target, target * MACRO_TOLERANCE)
+        accuracy[f"{label}_status"] = status
+        if status != "within_range":
+            out_of_range += 1
+            issues.append(_issue(
+                "nutritional", "major",
+                f"Daily {label} is {totals[key]:.0f} g vs target {target:.0f} g ({status.replace('_', ' ')})",
+                f"Adjust {label} sources to bring {label} within ±{MACRO_TOLERANCE:.0%} of {target:.0f} g",
+            ))
+    if accuracy["calories_status"] != "within_range":
+        out_of_range += 1
+
+    if out_of_range == 0:
+        accuracy["overall_score"] = "excellent" if abs(difference) <= CALORIE_TOLERANCE_KCAL / 2 else "good"
+    elif out_of_range == 1:
+        accuracy["overall_score"] = "needs_improvement"
+    else:
+        accuracy["overall_score"] = "poor"
+    return {"nutritional_accuracy": accuracy, "issues": issues}
+
+
+def check_completeness(plan: Dict[str, Any], requirements: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Check that every required meal is present, has foods with numeric macros,
+    stated totals that match the foods, and calories near its meal_distribution share.
+
+    Args:
+        plan: Parsed current_meal_plan
+        requirements: Parsed nutrition_requirements
+
+    Returns:
+        {"completeness": {...}, "issues": [...]}
+    """
+    meals = plan.get("meal_plan") or {}
+    distribution = requirements.get("meal_distribution") or {}
+    issues: List[Dict[str, str]] = []
+    missing, empty, inconsistent = [], [], []
+
+    for meal_name in MEALS:
+        expected = meal_name in REQUIRED_MEALS or bool((distribution.get(meal_name) or {}).get("include", False))
+        meal = meals.get(meal_name)
+        if not isinstance(meal, dict) or (meal_name not in REQUIRED_MEALS and not meal_included(meal)):
+            if expected:
+                missing.append(meal_name)
+                issues.append(_issue(
+                    "completeness", "critical",
+                    f"{meal_name} is missing from the meal plan",
+                    f"Add {meal_name} with about {to_number((distribution.get(meal_name) or {}).get('calories')) or 0:.0f} kcal",
+                ))
+            continue
+
+        foods = meal.get("foods") or []
+        if not foods:
+            empty.append(meal_name)
+            issues.append(_issue("completeness", "critical", f"{meal_name} has no foods", f"Add foods to {meal_name}"))
+            continue
+
+        for food in foods:
+            absent = [key for key in MACRO_KEYS if to_number(food.get(key)) is None] if isinstance(food, dict) else MACRO_KEYS
+            if absent:
+                name = food.get("name", "unnamed food") if isinstance(food, dict) else "unnamed food"
+                issues.append(_issue(
+                    "completeness", "major",
+                    f"{name} in {meal_name} is missing {', '.join(absent)}",
+                    "Provide numeric calories, protein_g, carbs_g and fats_g for every food",
+                ))
+
+        recomputed = sum_foods(foods)
+        stated = to_number((meal.get("totals") or {}).get("calories"))
+        if stated is None or abs(stated - recomputed["calories"]) > TOTALS_TOLERANCE_KCAL:
+            inconsistent.append(meal_name)
+            issues.append(_issue(
+                "completeness", "minor",
+                f"{meal_name} totals ({stated}) do not match the sum of its foods ({recomputed['calories']:.0f} kcal)",
+                f"Recalculate {meal_name} totals from its foods",
+            ))
+
+        target = to_number((distribution.get(meal_name) or {}).get("calories"))
+        if target and abs(recomputed["calories"] - target) > target * MEAL_CALORIE_TOLERANCE:
+            issues.append(_issue(
+                "nutritional", "minor",
+                f"{meal_name} provides {recomputed['calories']:.0f} kcal vs its {target:.0f} kcal share",
+                f"Rebalance portions so {meal_name} is closer to {target:.0f} kcal",
+            ))
+
+    completeness = {
+        "all_meals_present": not missing and not empty,
+        "missing_meals": missing,
+        "empty_meals": empty,
+        "totals_consistent": not inconsistent,
+    }
+    return {"completeness": completeness, "issues": issues}
+
+
+def validate_meal_plan(plan: Any, requirements: Any) -> Dict[str, Any]:
+    """
+    Run all numeric checks on a meal plan.
+
+    Args:
+        plan: current_meal_plan (JSON string or parsed)
+        requirements: nutrition_requirements (JSON string or parsed)
+
+    Returns:
+        A dictionary with nutritional_accuracy, completeness, issues and
+        passed (True when accuracy is good/excellent and no critical or major issue was found)
+    """
+    parsed_plan = load_state_json(plan)
+    parsed_requirements = load_state_json(requirements) or {}
+    if not isinstance(parsed_plan, dict):
+        return {
+            "nutritional_accuracy": {"overall_score": "poor"},
+            "completeness": {"all_meals_present": False, "missing_meals": list(REQUIRED_MEALS), "empty_meals": [], "totals_consistent": False},
+            "issues": [_issue("completeness", "critical", "The meal plan is not valid JSON", "Output the complete meal plan as valid JSON")],
+            "passed": False,
+        }
+
+    accuracy = check_nutritional_accuracy(parsed_plan, parsed_requirements)
+    completeness = check_completeness(parsed_plan, parsed_requirements)
+    issues = accuracy["issues"] + completeness["issues"]
+    passed = (
+        accuracy["nutritional_accuracy"]["overall_score"] in PASSING_SCORES
+        and not any(issue["severity"] in BLOCKING_SEVERITIES for issue in issues)
+    )
+    return {
+        "nutritional_accuracy": accuracy["nutritional_accuracy"],
+        "completeness": completeness["completeness"],
+        "issues": issues,
+        "passed": passed,
+    }
+
+
+def add_issues(validation: Dict[str, Any], issues: List[Dict[str, str]]) -> Dict[str, Any]:
+    """
+    Add issues found by checks outside this module (e.g. weekly dish variety) to a validation.
+
+    Args:
+        validation: Result of validate_meal_plan()
+        issues: Issues in the critique schema
+
+    Returns:
+        A new validation; it no longer passes if any added issue is critical or major
+    """
+    if not issues:
+        return validation
+    return {
+        **validation,
+        "issues": validation["issues"] + list(issues),
+        "passed": validation["passed"] and not any(issue.get("severity") in BLOCKING_SEVERITIES for issue in issues),
+    }
+
+
+def numeric_critique(validation: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build a full NEEDS_REVISION critique from a failed validation, without a model call.
+
+    Args:
+        validation: Result of validate_meal_plan()
+
+    Returns:
+        A critique in the critic's output schema
+    """
+    not_evaluated = "not_evaluated"
+    return {
+        "status": "NEEDS_REVISION",
+        "nutritional_accuracy": validation["nutritional_accuracy"],
+        "medical_compliance": {"overall_score": not_evaluated},
+        "practical_assessment": {"overall_score": not_evaluated},
+        "completeness": validation["completeness"],
+        "issues": validation["issues"],
+        "summary": "The meal plan failed the numeric accuracy/completeness checks.",
+        "approval_reason": "Not approved: numeric targets or required meals are not met; "
+                           "medical and practical review deferred until they are.",
+    }
+
+
+def merge_critique(validation: Dict[str, Any], model_critique: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combine the numeric validation with the critic model's medical/practical review.
+
+    The status is recomputed with the critic's approval rules: every section
+    scores good or excellent and no critical or major issue exists.
+
+    Args:
+        validation: Result of validate_meal_plan()
+        model_critique: Parsed critic output, or None if it was not valid JSON
+
+    Returns:
+        The merged critique
+    """
+    critique = dict(model_critique or {})
+    model_issues = [
+        issue for issue in critique.get("issues") or []
+        if isinstance(issue, dict) and issue.get("category") not in ("nutritional", "completeness")
+    ]
+    critique["nutritional_accuracy"] = validation["nutritional_accuracy"]
+    critique["completeness"] = validation["completeness"]
+    critique["issues"] = validation["issues"] + model_issues
+
+    scores = [
+        (critique.get(section) or {}).get("overall_score")
+        for section in ("nutritional_accuracy", "medical_compliance", "practical_assessment")
+    ]
+    approved = (
+        model_critique is not None
+        and all(score in PASSING_SCORES for score in scores)
+        and not any(issue.get("severity") in BLOCKING_SEVERITIES for issue in critique["issues"])
+    )
+    critique["status"] = "APPROVED" if approved else "NEEDS_REVISION"
+    if model_critique is None:
+        critique.setdefault("summary", "The critic response was not valid JSON.")
+    return critique
@@ -0,0 +1,461 @@
+"""
+Multi-day (weekly rotating) meal plans.
+
+Running nutritionist_agent once per day would re-derive patient_health_data
+and nutrition_requirements every time, and the days would run one after
+another. run_week() instead:
+
+1. runs the upstream stages (patient_data_agent, nutrition_calculator_agent)
+   once, in the week's first session
+2. seeds one session per day with that session's state and runs the
+   day-level stages (initial_meal_planner_agent, meal_plan_refinement_loop)
+   of every day concurrently
+
+so a week takes about the wall time of a single day. WeeklyPlugin skips the
+top-level stages a session is not meant to run (STAGES_KEY in state).
+
+Days share a variety constraint so the week does not repeat the same dishes:
+
+- each day gets a cuisine theme up front (DAY_THEMES), so days diverge even
+  though they are planned at the same time
+- a DishRegistry tracks the dishes of every day's current plan. Planners and
+  the refiner are told which dishes other days already use for their meal,
+  and before each critique a day's plan is checked against the lower-numbered
+  days: a non-staple dish already used for the same meal on an earlier day is
+  a major "variety" issue, so the plan goes back to the refiner. Staples
+  (breads, grains, dairy, beverages, condiments, fats, sweeteners) may repeat.
+
+Usage:
+    python -m nutrition_agent.weekly roster.jsonl --days 7 --output weekly.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import traceback
+import uuid
+from collections import defaultdict
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.runners import Runner
+from google.genai import types
+
+from .agent import get_nutritionist_agent, APP_NAME, retry_config
+from .batch import PATIENT_STATE_KEYS, QUERY, load_manifest, _drain
+from .checkpoint import CheckpointPlugin, STAGE_OUTPUT_CHECKS, create_session_service
+from .compaction import evict_session
+from .deadline import DeadlinePlugin
+from .food_db import get_food_database, normalize_name
+from .json_utils import load_state_json
+from .meal_plan import MEALS, meal_included
+from .metrics import MetricsPlugin
+from .validator import EXTRA_ISSUES_KEY
+
+DEFAULT_DAYS = 7
+DEFAULT_CONCURRENCY = 1
+
+# Top-level stages computed once per week, and once per day
+UPSTREAM_STAGES = ["patient_data_agent", "nutrition_calculator_agent"]
+DAY_STAGES = ["initial_meal_planner_agent", "meal_plan_refinement_loop"]
+
+# State keys of a weekly session
+STAGES_KEY = "run_stages"
+WEEK_KEY = "week_id"
+DAY_KEY = "plan_day"
+DAYS_KEY = "plan_days"
+
+# Cuisine focus per day; days beyond the list wrap around
+DAY_THEMES = [
+    "North Indian",
+    "South Indian",
+    "Gujarati and Rajasthani",
+    "Bengali and East Indian",
+    "Maharashtrian and Goan",
+    "Punjabi",
+    "millet-based and regional home-style",
+]
+# Food database categories that may appear every day
+STAPLE_CATEGORIES = {"bread", "grain", "dairy", "beverage", "condiment", "fat", "sweetener"}
+
+_PARENTHESES_RE = re.compile(r"\(.*?\)")
+
+
+def dish_key(name: str) -> Optional[str]:
+    """
+    Identify a dish for variety checks.
+
+    Args:
+        name: Food name as written in a meal plan
+
+    Returns:
+        The food database name for a database match (so aliases such as
+        "roti" and "chapati", and misspellings, match), the normalized name
+        otherwise, or None for staples that may repeat
+    """
+    stripped = _PARENTHESES_RE.sub(" ", name)
+    match = get_food_database().lookup(stripped)
+    if match is not None:
+        record, _, _ = match
+        if record["category"] in STAPLE_CATEGORIES:
+            return None
+        return record["name"]
+    return normalize_name(stripped) or None
+
+
+def plan_dishes(plan: Any) -> Dict[str, Dict[str, str]]:
+    """
+    List the non-staple dishes of a meal plan.
+
+    Args:
+        plan: current_meal_plan (JSON string or parsed)
+
+    Returns:
+        Meal -> dish key -> food name as written in the plan
+    """
+    parsed = load_state_json(plan)
+    meals = parsed.get("meal_plan") if isinstance(parsed, dict) else None
+    dishes: Dict[str, Dict[str, str]] = {}
+    for meal in MEALS:
+        entry = (meals or {}).get(meal)
+        if not isinstance(entry, dict) or not meal_included(entry):
+            continue
+        for food in entry.get("foods") or []:
+            name = food.get("name") if isinstance(food, dict) else None
+            key = dish_key(name) if isinstance(name, str) else None
+            if key:
+                dishes.setdefault(meal, {}).setdefault(key, name)
+    return dishes
+
+
+class DishRegistry:
+    """Dishes of every day's current plan in one week; a dish belongs to the earliest day using it for a meal."""
+
+    def __init__(self, days: int):
+        self.days = days
+        self._dishes: Dict[int, Dict[str, Dict[str, str]]] = {}
+
+    def record(self, day: int, plan: Any) -> None:
+        """Replace a day's dishes with those of its current plan."""
+        self._dishes[day] = plan_dishes(plan)
+
+    def used_elsewhere(self, day: int, meal: str) -> List[str]:
+        """Return the dishes other days use for a meal."""
+        names: Dict[str, str] = {}
+        for other, dishes in sorted(self._dishes.items()):
+            if other != day:
+                for key, name in dishes.get(meal, {}).items():
+                    names.setdefault(key, name)
+        return sorted(names.values())
+
+    def conflicts(self, day: int, plan: Any) -> List[Dict[str, str]]:
+        """
+        Find dishes of a day's plan already used for the same meal on an earlier day.
+
+        Args:
+            day: Day of the plan (1-based)
+            plan: The day's current_meal_plan
+
+        Returns:
+            Issues in the critique schema, one per repeated dish
+        """
+        issues = []
+        for meal, dishes in plan_dishes(plan).items():
+            for key, name in dishes.items():
+                earlier = [other for other in range(1, day) if key in self._dishes.get(other, {}).get(meal, {})]
+                if not earlier:
+                    continue
+                avoid = ", ".join(self.used_elsewhere(day, meal))
+                issues.append({
+                    "category": "variety",
+                    "severity": "major",
+                    "problem": f"{name} in {meal} repeats the {meal} of day {earlier[0]} of the weekly plan",
+                    "suggestion": f"Replace {name} with a different dish with similar nutrients; do not use: {avoid}",
+                })
+        return issues
+
+    def repeats(self) -> List[Dict[str, Any]]:
+        """Return every dish used for the same meal on more than one day, with those days."""
+        days_by_dish: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        names: Dict[Tuple[str, str], str] = {}
+        for day, dishes in sorted(self._dishes.items()):
+            for meal, meal_dishes in dishes.items():
+                for key, name in meal_dishes.items():
+                    days_by_dish[(meal, key)].append(day)
+                    names.setdefault((meal, key), name)
+        return [
+            {"meal": meal, "food": names[(meal, key)], "days": days}
+            for (meal, key), days in sorted(days_by_dish.items())
+            if len(days) > 1
+        ]
+
+
+def day_instruction(day: int, days: int, meals: Iterable[str], registry: Optional[DishRegistry]) -> str:
+    """
+    Build the variety instruction added to a day's planner or refiner request.
+
+    Args:
+        day: Day being planned (1-based)
+        days: Days in the week
+        meals: Meals the agent plans
+        registry: The week's dish registry
+
+    Returns:
+        The instruction text
+    """
+    theme = DAY_THEMES[(day - 1) % len(DAY_THEMES)]
+    lines = [
+        f"**WEEKLY ROTATION:** This is day {day} of a {days}-day rotating plan. "
+        f"Where it suits the patient's preferences and conditions, favour {theme} dishes.",
+    ]
+    for meal in meals:
+        used = registry.used_elsewhere(day, meal) if registry else []
+        if used:
+            lines.append(f"Do not repeat these {meal.replace('_', ' ')} dishes planned for other days: {', '.join(used)}.")
+    return "\n".join(lines)
+
+
+class WeeklyPlugin(BasePlugin):
+    """Runs only a session's STAGES_KEY stages and enforces dish variety across the days of a week."""
+
+    def __init__(self, name: str = "weekly_plugin"):
+        super().__init__(name)
+        self._registries: Dict[str, DishRegistry] = {}
+
+    def registry(self, week_id: str, days: int = DEFAULT_DAYS) -> DishRegistry:
+        """Return the dish registry of a week, creating it on first use."""
+        if week_id not in self._registries:
+            self._registries[week_id] = DishRegistry(days)
+        return self._registries[week_id]
+
+    def release(self, week_id: str) -> Optional[DishRegistry]:
+        """Forget a finished week and return its registry."""
+        return self._registries.pop(week_id, None)
+
+    def _day(self, state: Any) -> Tuple[Optional[DishRegistry], int]:
+        week_id, day = state.get(WEEK_KEY), state.get(DAY_KEY)
+        if not week_id or not day:
+            return None, 0
+        return self.registry(week_id, int(state.get(DAYS_KEY) or DEFAULT_DAYS)), int(day)
+
+    async def before_agent_callback(self, *, agent: BaseAgent, callback_context: CallbackContext) -> Optional[types.Content]:
+        state = callback_context.state
+        stages = state.get(STAGES_KEY)
+        if stages is not None and agent.name in STAGE_OUTPUT_CHECKS and agent.name not in stages:
+            # ADK stores skip content under an LLM agent's output_key, so replay the existing output
+            output_key = getattr(agent, "output_key", None)
+            text = state.get(output_key) if output_key and output_key in state else None
+            return types.Content(role="model", parts=[types.Part(text=str(text or f"{agent.name} not run in this session"))])
+        if agent.name == "meal_plan_critic_agent":
+            registry, day = self._day(state)
+            if registry is not None:
+                plan = state.get("current_meal_plan")
+                registry.record(day, plan)
+                state[EXTRA_ISSUES_KEY] = registry.conflicts(day, plan)
+        return None
+
+    async def after_agent_callback(self, *, agent: BaseAgent, callback_context: CallbackContext) -> None:
+        if agent.name in ("meal_plan_aggregator_agent", "meal_plan_refinement_loop"):
+            registry, day = self._day(callback_context.state)
+            if registry is not None:
+                registry.record(day, callback_context.state.get("current_meal_plan"))
+        return None
+
+    async def before_model_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> Optional[LlmResponse]:
+        agent_name = callback_context.agent_name
+        if agent_name.endswith("_planner_agent"):
+            meals = [agent_name[:-len("_planner_agent")]]
+        elif agent_name == "meal_plan_refiner_agent":
+            meals = MEALS
+        else:
+            return None
+        registry, day = self._day(callback_context.state)
+        if registry is not None:
+            llm_request.append_instructions([day_instruction(day, registry.days, meals, registry)])
+        return None
+
+
+async def run_week(
+    runner: Runner,
+    patient: Dict[str, Any],
+    days: int = DEFAULT_DAYS,
+    evict: bool = True,
+) -> Dict[str, Any]:
+    """
+    Generate a multi-day plan for one patient: upstream stages once, then every day concurrently.
+
+    Args:
+        runner: Runner for nutritionist_agent with a WeeklyPlugin
+        patient: Manifest entry
+        days: Number of days to plan
+        evict: Delete the in-memory sessions once their outputs are in the result record
+
+    Returns:
+        A result record with the shared upstream outputs, one record per day
+        (status, current_meal_plan, critique) and the dishes that still repeat
+    """
+    plugin = runner.plugin_manager.get_plugin("weekly_plugin")
+    if not isinstance(plugin, WeeklyPlugin):
+        raise ValueError("run_week needs a runner with a WeeklyPlugin")
+    patient_id = str(patient["patient_id"])
+    week_id = f"{patient_id}-week-{uuid.uuid4().hex[:8]}"
+    session_service = runner.session_service
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"patient_id": patient_id, "week_id": week_id, "days": []}
+    content = types.Content(role="user", parts=[types.Part(text=QUERY)])
+    plugin.registry(week_id, days)
+    session_ids = [week_id]
+    try:
+        state = {key: patient[key] for key in PATIENT_STATE_KEYS if key in patient}
+        state[STAGES_KEY] = UPSTREAM_STAGES
+        session = await session_service.create_session(
+            app_name=runner.app_name, user_id=patient_id, session_id=week_id, state=state
+        )
+        await _drain(runner.run_async(user_id=patient_id, session_id=session.id, new_message=content))
+        session = await session_service.get_session(app_name=runner.app_name, user_id=patient_id, session_id=session.id)
+        upstream = {key: value for key, value in session.state.items() if not key.startswith("_")}
+        for key in ("patient_health_data", "nutrition_requirements"):
+            result[key] = load_state_json(upstream.get(key))
+        if result["nutrition_requirements"] is None:
+            raise RuntimeError("Upstream stages finished without nutrition_requirements")
+
+        async def run_day(day: int) -> Dict[str, Any]:
+            record: Dict[str, Any] = {"day": day}
+            day_started = time.perf_counter()
+            try:
+                day_state = {**upstream, STAGES_KEY: DAY_STAGES, WEEK_KEY: week_id, DAY_KEY: day, DAYS_KEY: days}
+                session_ids.append(f"{week_id}-day-{day}")
+                day_session = await session_service.create_session(
+                    app_name=runner.app_name, user_id=patient_id, session_id=session_ids[-1], state=day_state
+                )
+                await _drain(runner.run_async(user_id=patient_id, session_id=day_session.id, new_message=content))
+                day_session = await session_service.get_session(
+                    app_name=runner.app_name, user_id=patient_id, session_id=day_session.id
+                )
+                for key in ("current_meal_plan", "critique"):
+                    value = day_session.state.get(key)
+                    record[key] = load_state_json(value) if value is not None else None
+                record["status"] = "ok" if record["current_meal_plan"] is not None else "error"
+                if record["status"] == "error":
+                    record["error"] = "Day finished without a meal plan"
+            except Exception as e:
+                record["status"] = "error"
+                record["error"] = f"{type(e).__name__}: {e}"
+                record["traceback"] = traceback.format_exc()
+            record["elapsed_seconds"] = round(time.perf_counter() - day_started, 3)
+            return record
+
+        result["days"] = list(await asyncio.gather(*(run_day(day) for day in range(1, days + 1))))
+        registry = plugin.registry(week_id, days)
+        for record in result["days"]:
+            if record.get("current_meal_plan") is not None:
+                registry.record(record["day"], record["current_meal_plan"])
+        result["repeated_dishes"] = registry.repeats()
+        failed = [record["day"] for record in result["days"] if record["status"] != "ok"]
+        result["status"] = "ok" if not failed else "error"
+        if failed:
+            result["error"] = f"Days without a meal plan: {', '.join(map(str, failed))}"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    finally:
+        plugin.release(week_id)
+        if evict:
+            for session_id in session_ids:
+                await evict_session(session_service, runner.app_name, patient_id, session_id)
+    result["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def main_weekly(
+    manifest_path: str,
+    output_path: Optional[str],
+    days: int = DEFAULT_DAYS,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    metrics_dir: Optional[str] = None,
+    patient_store_path: Optional[str] = None,
+    sessions_db: Optional[str] = None,
+) -> int:
+    """
+    Generate multi-day plans for a manifest and stream results as JSON Lines.
+
+    Args:
+        manifest_path: Patient manifest file (see batch.py)
+        output_path: JSON Lines output file, or None for stdout
+        days: Days per plan
+        concurrency: Patients planned at once (each runs its days concurrently)
+        metrics_dir: Directory for per-run metrics, metrics.prom and summary.json
+        patient_store_path: Patient store used for entries without their own patient_store_path
+        sessions_db: SQLite file for the sessions (in-memory if omitted)
+
+    Returns:
+        Number of patients that failed
+    """
+    patients = load_manifest(manifest_path)
+    if patient_store_path:
+        for patient in patients:
+            patient.setdefault("patient_store_path", patient_store_path)
+    metrics = MetricsPlugin(metrics_dir, prometheus_interval=None) if metrics_dir else None
+    runner = Runner(
+        agent=get_nutritionist_agent(),
+        app_name=APP_NAME,
+        session_service=create_session_service(sessions_db),
+        plugins=[WeeklyPlugin(), CheckpointPlugin(), DeadlinePlugin(retry_config)] + ([metrics] if metrics else []),
+    )
+    output = open(output_path, "a") if output_path else sys.stdout
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    failures = 0
+    started = time.perf_counter()
+
+    async def run(patient: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            return await run_week(runner, patient, days)
+
+    try:
+        for next_done in asyncio.as_completed([run(patient) for patient in patients]):
+            result = await next_done
+            if result["status"] != "ok":
+                failures += 1
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            repeats = len(result.get("repeated_dishes") or [])
+            print(
+                f"[{result['status']}] {result['patient_id']}: {days} days in {result['elapsed_seconds']}s, "
+                f"{repeats} repeated dish(es)",
+                file=sys.stderr,
+            )
+    finally:
+        if output_path:
+            output.close()
+        # Closing the runner closes the metrics plugin, which writes metrics.prom once
+        await runner.close()
+    if metrics:
+        metrics.write_summary(os.path.join(metrics_dir, "summary.json"))
+    print(f"Planned {len(patients)} patients ({failures} failed) in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate multi-day rotating meal plans for a patient manifest")
+    parser.add_argument("manifest", help="JSON or JSON Lines file with one entry per patient")
+    parser.add_argument("--output", "-o", help="JSON Lines output file (default: stdout)")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="Days per plan")
+    parser.add_argument("--concurrency", "-c", type=int, default=DEFAULT_CONCURRENCY, help="Patients planned at once")
+    parser.add_argument("--metrics-dir", help="Directory for per-run metrics JSON, metrics.prom and summary.json")
+    parser.add_argument("--patient-store", help="JSON Lines or SQLite patient store keyed by patient_id")
+    parser.add_argument("--sessions-db", help="SQLite file for the sessions")
+    args = parser.parse_args()
+    failures = asyncio.run(main_weekly(
+        args.manifest, args.output, args.days, args.concurrency, args.metrics_dir, args.patient_store, args.sessions_db,
+    ))
+    sys.exit(1 if failures else 0)
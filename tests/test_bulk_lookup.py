@@ -0,0 +1,198 @@
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import pytest
+from google.adk.agents import Agent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.plugins.plugin_manager import PluginManager
+from google.adk.sessions import InMemorySessionService
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+
+from nutrition_agent.bulk_lookup import (
+    COLUMNS,
+    WEB_SEARCH_MATCH,
+    make_bulk_lookup_tool,
+    parse_search_summary,
+    search_request,
+)
+from nutrition_agent.fake_model import FAKE_SEARCH_SUMMARY
+
+
+class StubSearchTool(BaseTool):
+    """Answers every request with the same summary and keeps the requests."""
+
+    def __init__(self, summary: str = FAKE_SEARCH_SUMMARY):
+        super().__init__(name="web_search_agent", description="stub search")
+        self.summary = summary
+        self.requests: List[str] = []
+
+    async def run_async(self, *, args: Dict[str, Any], tool_context: ToolContext) -> Any:
+        self.requests.append(args["request"])
+        await asyncio.sleep(0)
+        return self.summary
+
+
+def _lookup(search_tool: StubSearchTool, food_names: List[str], quantities: List[str]) -> Dict[str, Any]:
+    tool = make_bulk_lookup_tool(search_tool)
+
+    async def run():
+        session_service = InMemorySessionService()
+        session = await session_service.create_session(app_name="test", user_id="u")
+        invocation_context = InvocationContext(
+            session_service=session_service,
+            invocation_id="inv",
+            agent=Agent(name="lunch_planner_agent", model="gemini-2.5-flash"),
+            session=session,
+            plugin_manager=PluginManager(),
+        )
+        tool_context = ToolContext(invocation_context, function_call_id="call")
+        return await tool.run_async(args={"food_names": food_names, "quantities": quantities}, tool_context=tool_context)
+
+    return json.loads(asyncio.run(run()))
+
+
+def _rows(response: Dict[str, Any]) -> Dict[tuple, Dict[str, Any]]:
+    return {(row[0], row[1]): dict(zip(COLUMNS, row)) for row in response["rows"]}
+
+
+def test_search_request_does_not_depend_on_quantity():
+    assert "quinoa" in search_request("quinoa")
+    assert "per 100 g" in search_request("quinoa")
+
+
+@pytest.mark.parametrize("summary, per_100g, portions", [
+    (
+        FAKE_SEARCH_SUMMARY,
+        {"calories": 150, "protein_g": 5, "carbs_g": 20, "fats_g": 5, "fiber_g": 2, "sodium_mg": 200},
+        {"piece": 50, "cup": 200, "katori": 150},
+    ),
+    (
+        "Per 100 g: Energy 97 kcal, Protein 3.4 g, Total fat 1.2 g, Carbohydrates 18 g, "
+        "Dietary fiber 2.1 g, Sodium 5 mg. One cup (240 g).",
+        {"calories": 97, "protein_g": 3.4, "carbs_g": 18, "fats_g": 1.2, "fiber_g": 2.1, "sodium_mg": 5},
+        {"cup": 240},
+    ),
+    (
+        "- Calories: 120\n- Protein: 4g\n- Carbs: 22g\n- Fat: 2g",
+        {"calories": 120, "protein_g": 4, "carbs_g": 22, "fats_g": 2},
+        {},
+    ),
+    # The "100" of "per 100 g" is not a value
+    (
+        "Calories per 100 g: 52\nProtein per 100 g: 0.3 g\nCarbohydrates (per 100 g): 14 g\nFat per 100g: 0.2 g",
+        {"calories": 52, "protein_g": 0.3, "carbs_g": 14, "fats_g": 0.2},
+        {},
+    ),
+    # Saturated fat listed first does not stand in for total fat
+    (
+        "Calories: 220\nSaturated fat: 2 g\nTrans fat: 0 g\nTotal fat: 12 g\nProtein: 5 g\nCarbs: 20 g",
+        {"calories": 220, "protein_g": 5, "carbs_g": 20, "fats_g": 12},
+        {},
+    ),
+    (
+        "Fat: 12 g (saturated fat: 2 g)\nCalories: 220\nProtein: 5 g\nNet carbs: 15 g\nTotal carbohydrates: 20 g",
+        {"calories": 220, "protein_g": 5, "carbs_g": 20, "fats_g": 12},
+        {},
+    ),
+    # kcal wins over kJ, and kJ alone is converted
+    (
+        "Energy: 920 kJ (220 kcal)\nProtein: 5 g\nCarbs: 20 g\nFat: 12 g",
+        {"calories": 220, "protein_g": 5, "carbs_g": 20, "fats_g": 12},
+        {},
+    ),
+    (
+        "Energy: 920 kJ\nProtein: 5 g\nCarbs: 20 g\nFat: 12 g\nSodium: 0.4 g",
+        {"calories": 219.9, "protein_g": 5, "carbs_g": 20, "fats_g": 12, "sodium_mg": 400},
+        {},
+    ),
+    (
+        "Calories (kcal): 52, Protein (g): 1, Total Carbohydrate: 14 g, Fat: 200 mg, one cup (125 g)",
+        {"calories": 52, "protein_g": 1, "carbs_g": 14, "fats_g": 0.2},
+        {"cup": 125},
+    ),
+])
+def test_parse_search_summary(summary, per_100g, portions):
+    record = parse_search_summary("quinoa", summary)
+    assert record == {"name": "quinoa", "per_100g": per_100g, "portions": portions}
+
+
+@pytest.mark.parametrize("summary", [
+    "Quinoa is a healthy grain.",
+    "Calories: 120, protein: 4 g",
+    # Numbers that do not directly follow their label are not taken
+    "Calories: about 120 kcal, protein roughly 4 g, carbs around 22 g, fat near 2 g",
+    None,
+])
+def test_parse_search_summary_incomplete(summary):
+    assert parse_search_summary("quinoa", summary) is None
+
+
+def test_local_foods_skip_search():
+    search_tool = StubSearchTool()
+    response = _lookup(search_tool, ["chapati", "toor dal"], ["2 pieces", "1 katori"])
+    assert search_tool.requests == []
+    rows = _rows(response)
+    assert rows[("chapati", "2 pieces")]["grams"] == 80.0
+    assert rows[("toor dal", "1 katori")]["grams"] == 150.0
+    assert {row["match_type"] for row in rows.values()} == {"exact"}
+    assert "web_search" not in response
+
+
+def test_match_type_in_rows():
+    search_tool = StubSearchTool()
+    response = _lookup(search_tool, ["chapathi", "mutton biryani"], ["2 pieces", "100 g"])
+    rows = _rows(response)
+    chapati = rows[("chapathi", "2 pieces")]
+    assert (chapati["matched_name"], chapati["match_type"]) == ("chapati", "fuzzy")
+    # A similar dish is not taken for it: the food is searched instead of reading chicken biryani's nutrients
+    assert search_tool.requests == [search_request("mutton biryani")]
+    biryani = rows[("mutton biryani", "100 g")]
+    assert (biryani["matched_name"], biryani["match_type"]) == ("mutton biryani", WEB_SEARCH_MATCH)
+    assert biryani["calories"] == 150.0
+
+
+def test_web_foods_searched_once_per_name_and_scaled_locally():
+    search_tool = StubSearchTool()
+    response = _lookup(
+        search_tool,
+        ["tempeh", "Tempeh", "tempeh", "chapati"],
+        ["1 katori", "250 g", "2 tbsp", "2 pieces"],
+    )
+    assert search_tool.requests == [search_request("tempeh")]
+    rows = _rows(response)
+    katori = rows[("tempeh", "1 katori")]
+    assert (katori["matched_name"], katori["match_type"]) == ("tempeh", WEB_SEARCH_MATCH)
+    assert (katori["grams"], katori["calories"], katori["protein_g"], katori["sodium_mg"]) == (150.0, 225.0, 7.5, 300.0)
+    assert rows[("tempeh", "250 g")]["calories"] == 375.0
+    # A unit the summary gave no weight for comes back with the per-100g values to convert
+    assert response["unresolved"] == [{
+        "food_name": "tempeh",
+        "quantity": "2 tbsp",
+        "matched_name": "tempeh",
+        "match_type": WEB_SEARCH_MATCH,
+        "per_100g": {"calories": 150.0, "protein_g": 5.0, "carbs_g": 20.0, "fats_g": 5.0, "fiber_g": 2.0, "sodium_mg": 200.0},
+        "portions_g": {"piece": 50.0, "cup": 200.0, "katori": 150.0},
+        "message": "Unknown unit in quantity '2 tbsp'; use portions_g to convert",
+    }]
+    assert "web_search" not in response
+
+
+def test_unreadable_summary_lists_suggestions():
+    response = _lookup(StubSearchTool("No data."), ["quinoa upma"], ["1 katori"])
+    assert response["web_search"] == [{
+        "food_name": "quinoa upma", "quantities": ["1 katori"], "summary_per_100g": "No data.", "suggestions": ["upma"],
+    }]
+
+
+def test_unreadable_summary_is_returned_per_100g():
+    search_tool = StubSearchTool("Tempeh is a fermented soy food.")
+    response = _lookup(search_tool, ["tempeh", "tempeh"], ["1 katori", "2 katori"])
+    assert len(search_tool.requests) == 1
+    assert response["rows"] == []
+    assert response["web_search"] == [{
+        "food_name": "tempeh",
+        "quantities": ["1 katori", "2 katori"],
+        "summary_per_100g": "Tempeh is a fermented soy food.",
+    }]
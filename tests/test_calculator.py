@@ -0,0 +1,121 @@
+import json
+import random
+
+import pytest
+
+from nutrition_agent.calculator import (
+    calculate_requirements,
+    calculate_requirements_batch,
+    detect_conditions,
+)
+
+
+def _health_data(gender="male", weight=80, height=180, age=30, bmi=None, minutes=0, level=None, **extra):
+    profile = {"gender": gender, "weight_kg": weight, "height_cm": height, "age": age}
+    if bmi is not None:
+        profile["bmi"] = bmi
+    lifestyle = {"exercise_minutes_per_week": minutes}
+    if level:
+        lifestyle["exercise_level"] = level
+    return {"patient_profile": profile, "lifestyle_factors": lifestyle, **extra}
+
+
+# Worked Mifflin-St Jeor examples: BMR = 10 kg + 6.25 cm - 5 years + sex constant
+@pytest.mark.parametrize("health_data, bmr, level, tdee, calories", [
+    # 800 + 1125 - 150 + 5 = 1780; x1.2; BMI 24.7 keeps TDEE
+    (_health_data(), 1780, "sedentary", 2136, 2136),
+    # 680 + 1000 - 210 - 161 = 1309; x1.375 = 1799.9; BMI 26.6 loses 500
+    (_health_data("female", 68, 160, 42, minutes=90), 1309, "lightly_active", 1800, 1300),
+    # 450 + 1000 - 125 - 161 = 1164; x1.2 = 1396.8; BMI 17.6 gains 300
+    (_health_data("female", 45, 160, 25), 1164, "sedentary", 1397, 1697),
+    # 500 + 937.5 - 350 - 161 = 926.5; x1.2 = 1111.8, below the 1200 kcal floor
+    (_health_data("female", 50, 150, 70), 926, "sedentary", 1112, 1200),
+    # Unknown sex uses the midpoint constant: 700 + 1062.5 - 200 - 78 = 1484.5; x1.55
+    (_health_data("other", 70, 170, 40, minutes=200), 1484, "moderately_active", 2301, 2301),
+    # An explicit exercise level wins over the minutes: 1780 x1.725
+    (_health_data(level="Very Active"), 1780, "very_active", 3070, 3070),
+    # An explicit BMI wins over weight and height
+    (_health_data(bmi=27), 1780, "sedentary", 2136, 1636),
+])
+def test_mifflin_st_jeor(health_data, bmr, level, tdee, calories):
+    requirements = calculate_requirements(health_data)
+    assert requirements["calculations"]["bmr"] == bmr
+    assert requirements["calculations"]["activity_level"] == level
+    assert requirements["calculations"]["tdee"] == tdee
+    assert requirements["daily_targets"]["total_calories"] == calories
+
+
+def test_macro_targets():
+    targets = calculate_requirements(_health_data())["daily_targets"]
+    assert (targets["protein_percentage"], targets["carbohydrates_percentage"], targets["fats_percentage"]) == (20, 50, 30)
+    # 2136 kcal: 20% / 4, 50% / 4, 30% / 9
+    assert (targets["protein_grams"], targets["carbohydrates_grams"], targets["fats_grams"]) == (107, 267, 71)
+    assert (targets["fiber_grams"], targets["sodium_mg"]) == (30, 2300)
+
+
+def test_medical_adjustments():
+    health_data = _health_data(
+        medical_conditions={"current": ["Type 2 diabetes", "Hypertension"]},
+        blood_test_analysis={
+            "abnormal_values": [{"parameter": "LDL cholesterol", "status": "high"}],
+            "deficiencies": ["vitamin D"],
+        },
+    )
+    flags = detect_conditions(health_data)
+    assert flags == {"diabetes": True, "hypertension": True, "high_cholesterol": True, "vitamin_deficiencies": ["vitamin D"]}
+    requirements = calculate_requirements(health_data)
+    targets = requirements["daily_targets"]
+    assert (targets["protein_percentage"], targets["carbohydrates_percentage"], targets["fats_percentage"]) == (30, 45, 25)
+    assert (targets["fiber_grams"], targets["sodium_mg"]) == (30, 1500)
+    assert "1500 mg" in requirements["medical_adjustments"]["hypertension"]
+    assert requirements["medical_adjustments"]["vitamin_deficiencies"] == "Include food sources addressing: vitamin D"
+
+
+@pytest.mark.parametrize("frequency, conditions, snacks", [
+    ("5 small meals", [], True),
+    ("3 meals a day", [], False),
+    ("3 meals and 2 snacks", [], True),
+    ("three meals, one snack", [], True),
+    ("2 meals and no snacks", [], False),
+    ("only 3 meals, never snacks between meals", [], False),
+    ("4 meals, skips snacks", [], False),
+    ("", [], True),
+    ("3 meals a day", ["diabetes"], True),
+])
+def test_meal_distribution(frequency, conditions, snacks):
+    health_data = _health_data(
+        dietary_preferences={"eating_frequency": frequency}, medical_conditions={"current": conditions}
+    )
+    requirements = calculate_requirements(health_data)
+    distribution = requirements["meal_distribution"]
+    assert distribution["evening_snack"]["include"] is snacks
+    assert sum(meal["percentage"] for meal in distribution.values()) == 100
+    total = requirements["daily_targets"]["total_calories"]
+    assert abs(sum(meal["calories"] for meal in distribution.values()) - total) <= 2
+
+
+def test_batch_matches_single():
+    rng = random.Random(0)
+    profiles = [
+        _health_data(
+            rng.choice(["male", "female", "unknown"]), rng.uniform(40, 120), rng.uniform(145, 195), rng.randint(18, 80),
+            minutes=rng.choice([0, 90, 200, 400]),
+            medical_conditions={"current": rng.sample(["diabetes", "hypertension", "high cholesterol", "asthma"], 2)},
+        )
+        for _ in range(50)
+    ]
+    profiles += [json.dumps(profiles[0]), "not json", {}]
+    assert calculate_requirements_batch(profiles) == [calculate_requirements(profile) for profile in profiles]
+    assert calculate_requirements_batch([]) == []
+
+
+@pytest.mark.parametrize("profile, missing", [
+    ({"gender": "male", "age": 30, "height_cm": 180}, ["weight_kg"]),
+    ({"weight_kg": "unknown", "height_cm": 0}, ["weight_kg", "height_cm"]),
+    ({}, ["weight_kg", "height_cm"]),
+])
+def test_missing_weight_or_height(profile, missing):
+    requirements = calculate_requirements({"patient_profile": profile})
+    assert requirements["missing_inputs"] == missing
+    assert "daily_targets" not in requirements
+    assert calculate_requirements_batch([{"patient_profile": profile}]) == [requirements]
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+
+import pytest
+from google.adk.runners import Runner
+
+from nutrition_agent.agent import APP_NAME, get_nutritionist_agent
+from nutrition_agent.batch import run_batch
+from nutrition_agent.checkpoint import CheckpointPlugin, create_session_service, session_id_for
+from nutrition_agent.compaction import CompactingSessionService
+from nutrition_agent.fake_model import install_fake_models
+
+
+@pytest.fixture(scope="module", autouse=True)
+def fake_models():
+    install_fake_models(get_nutritionist_agent(), latency="fixed:0", approve_after=1)
+
+
+def _run(db_path, resume, run_id="nightly"):
+    async def run():
+        plugin = CheckpointPlugin()
+        runner = Runner(
+            agent=get_nutritionist_agent(),
+            app_name=APP_NAME,
+            session_service=create_session_service(db_path),
+            plugins=[plugin],
+        )
+        try:
+            results = [result async for result in run_batch([{"patient_id": "p1"}], runner=runner, resume=resume, run_id=run_id)]
+        finally:
+            await runner.close()
+        return results[0], plugin.skipped
+
+    return asyncio.run(run())
+
+
+def test_session_id_for(tmp_path):
+    persistent = create_session_service(str(tmp_path / "sessions.db"))
+    assert session_id_for("p1", persistent) == "p1"
+    assert session_id_for("p1", persistent, run_id="nightly") == "p1-nightly"
+    in_memory = CompactingSessionService()
+    assert session_id_for("p1", in_memory) != session_id_for("p1", in_memory)
+    assert session_id_for("p1", in_memory, resume=True) == "p1"
+
+
+def test_resume_across_processes(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    result, skipped = _run(db_path, resume=False)
+    assert result["status"] == "ok"
+    assert result["session_id"] == "p1-nightly"
+    assert skipped == {}
+
+    # A new runner and session service, as in a later process
+    resumed, skipped = _run(db_path, resume=True)
+    assert resumed["status"] == "ok"
+    assert resumed["session_id"] == "p1-nightly"
+    assert skipped == {
+        "patient_data_agent": 1,
+        "nutrition_calculator_agent": 1,
+        "initial_meal_planner_agent": 1,
+        "meal_plan_refinement_loop": 1,
+    }
+    assert resumed["current_meal_plan"] == result["current_meal_plan"]
+
+
+def test_resume_without_checkpoint_warns(tmp_path, caplog):
+    with caplog.at_level(logging.WARNING, logger="nutrition_agent.checkpoint"):
+        result, skipped = _run(str(tmp_path / "sessions.db"), resume=True, run_id="missing")
+    assert result["status"] == "ok"
+    assert skipped == {}
+    assert "no checkpointed session 'p1-missing'" in caplog.text
@@ -0,0 +1,101 @@
+import asyncio
+from typing import List
+
+import pytest
+from google.adk.events import Event, EventActions
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+
+from nutrition_agent.agent import APP_NAME, get_nutritionist_agent
+from nutrition_agent.batch import run_batch
+from nutrition_agent.compaction import CompactingSessionService, compact_events, evict_session
+from nutrition_agent.fake_model import install_fake_models
+
+
+@pytest.fixture(scope="module", autouse=True)
+def fake_models():
+    install_fake_models(get_nutritionist_agent(), latency="fixed:0", approve_after=2)
+
+
+def _event(**delta):
+    return Event(author="agent", invocation_id="inv", actions=EventActions(state_delta=delta))
+
+
+def _deltas(events):
+    return [event.actions.state_delta for event in events]
+
+
+def test_compact_events():
+    events = [_event(plan="v1", critique="c1"), _event(plan="v2"), _event(notes="n"), _event(critique="c2")]
+    assert _deltas(compact_events(events)) == [{}, {"plan": "v2"}, {"notes": "n"}, {"critique": "c2"}]
+    assert _deltas(compact_events(events, max_events=2)) == [{"notes": "n"}, {"critique": "c2"}]
+    assert compact_events(events, max_events=0) == []
+    # Compacted events are copies: the originals keep their full deltas
+    assert _deltas(events)[0] == {"plan": "v1", "critique": "c1"}
+
+
+def test_only_the_stored_copy_is_compacted():
+    service = CompactingSessionService(max_events=2)
+
+    async def run():
+        live = await service.create_session(app_name="app", user_id="u", session_id="s")
+        for version in range(1, 5):
+            await service.append_event(live, _event(plan=f"v{version}"))
+        stored = await service.get_session(app_name="app", user_id="u", session_id="s")
+        return live, stored
+
+    live, stored = asyncio.run(run())
+    # The running invocation's session keeps its whole history
+    assert _deltas(live.events) == [{"plan": f"v{version}"} for version in range(1, 5)]
+    assert _deltas(stored.events) == [{}, {"plan": "v4"}]
+    assert stored.state["plan"] == "v4"
+    assert service.stats() == {"sessions": 1, "events": 2, "dropped_events": 2, "evicted_sessions": 0}
+
+
+def test_evict_session_drops_user_entry():
+    service = CompactingSessionService()
+
+    async def run():
+        await service.create_session(app_name="app", user_id="u", session_id="s")
+        await evict_session(service, "app", "u", "s")
+
+    asyncio.run(run())
+    assert service.sessions["app"] == {}
+    assert service.stats()["evicted_sessions"] == 1
+
+
+class ModelRequestRecorder(BasePlugin):
+    def __init__(self):
+        super().__init__("model_request_recorder")
+        self.requests: List[str] = []
+
+    async def before_model_callback(self, *, callback_context, llm_request):
+        contents = [content.model_dump() for content in llm_request.contents]
+        self.requests.append(f"{callback_context.agent_name}: {contents}")
+
+
+def _model_requests(session_service):
+    recorder = ModelRequestRecorder()
+
+    async def run():
+        runner = Runner(
+            agent=get_nutritionist_agent(), app_name=APP_NAME, session_service=session_service, plugins=[recorder]
+        )
+        try:
+            return [result async for result in run_batch([{"patient_id": "p1"}], runner=runner)]
+        finally:
+            await runner.close()
+
+    result, = asyncio.run(run())
+    return result, sorted(recorder.requests)
+
+
+def test_compaction_leaves_model_requests_unchanged():
+    plain, plain_requests = _model_requests(InMemorySessionService())
+    service = CompactingSessionService(max_events=2)
+    compacted, compacted_requests = _model_requests(service)
+    assert service.stats()["dropped_events"] > 0
+    assert compacted["status"] == plain["status"] == "ok"
+    assert compacted["current_meal_plan"] == plain["current_meal_plan"]
+    assert compacted_requests == plain_requests
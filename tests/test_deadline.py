@@ -0,0 +1,98 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.runners import Runner
+
+from nutrition_agent.agent import APP_NAME, get_nutritionist_agent, retry_config
+from nutrition_agent.batch import run_batch
+from nutrition_agent.checkpoint import create_session_service
+from nutrition_agent.deadline import (
+    DEADLINE_KEY,
+    DEGRADED_KEY,
+    PLAN_KEY,
+    DeadlineExceededError,
+    DeadlinePlugin,
+    budget_http_options,
+)
+from nutrition_agent.fake_model import install_fake_models
+
+
+@pytest.fixture(scope="module", autouse=True)
+def fake_models():
+    install_fake_models(get_nutritionist_agent(), latency="fixed:0", approve_after=2)
+
+
+class ModelCallRecorder(BasePlugin):
+    def __init__(self):
+        super().__init__("model_call_recorder")
+        self.agents: List[str] = []
+
+    async def before_model_callback(self, *, callback_context, llm_request):
+        self.agents.append(callback_context.agent_name)
+
+
+@pytest.mark.parametrize("remaining, attempts, timeout_ms", [
+    # Backoff 1, 2, 4, 8 s plus 2 s per attempt all fit
+    (100, 5, 60000),
+    (10, 3, 10000),
+    (1, 1, 1000),
+    (0, 1, 100),
+])
+def test_budget_http_options(remaining, attempts, timeout_ms):
+    options = budget_http_options(remaining, retry_config)
+    assert (options.retry_options.attempts, options.timeout) == (attempts, timeout_ms)
+    assert budget_http_options(remaining, None).retry_options is None
+
+
+def _before_agent(plugin, agent_name, remaining, plan):
+    state = {DEADLINE_KEY: time.time() + remaining, PLAN_KEY: plan}
+    context = SimpleNamespace(state=state, actions=SimpleNamespace(escalate=False))
+    agent = SimpleNamespace(name=agent_name, output_key="critique")
+    return asyncio.run(plugin.before_agent_callback(agent=agent, callback_context=context)), context
+
+
+def test_refinement_skipped_near_deadline():
+    plugin = DeadlinePlugin()
+    content, context = _before_agent(plugin, "meal_plan_critic_agent", 60, "{}")
+    assert content is None and not context.actions.escalate
+    content, context = _before_agent(plugin, "meal_plan_critic_agent", 5, "{}")
+    assert content is not None
+    assert context.actions.escalate
+    assert context.state[DEGRADED_KEY]
+    assert plugin.degraded_runs == 1
+    # Stages without a reserve run regardless, as long as there is time
+    assert _before_agent(plugin, "lunch_planner_agent", 5, None)[0] is None
+
+
+def test_no_plan_at_deadline_fails():
+    with pytest.raises(DeadlineExceededError, match="before meal_plan_critic_agent"):
+        _before_agent(DeadlinePlugin(), "meal_plan_critic_agent", -1, None)
+
+
+def test_pipeline_returns_unrefined_plan_near_deadline():
+    # Reserves longer than the deadline: the first plan is returned without a critic or refiner call
+    recorder = ModelCallRecorder()
+    reserves = {"meal_plan_critic_agent": 3600, "meal_plan_refiner_agent": 3600}
+    plugin = DeadlinePlugin(retry_config, stage_reserves=reserves)
+
+    async def run():
+        runner = Runner(
+            agent=get_nutritionist_agent(), app_name=APP_NAME, session_service=create_session_service(None),
+            plugins=[plugin, recorder],
+        )
+        try:
+            return [result async for result in run_batch([{"patient_id": "p1"}], runner=runner, deadline_seconds=60)]
+        finally:
+            await runner.close()
+
+    result, = asyncio.run(run())
+    assert result["status"] == "ok"
+    assert result["degraded"]
+    assert result["current_meal_plan"]
+    assert "meal_plan_critic_agent" not in recorder.agents
+    assert "meal_plan_refiner_agent" not in recorder.agents
+    assert "lunch_planner_agent" in recorder.agents
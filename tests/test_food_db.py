@@ -0,0 +1,162 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from nutrition_agent import food_db
+from nutrition_agent.food_db import (
+    DATABASE_PATH,
+    build_food_database,
+    get_food_database,
+    lookup_food_nutrition,
+    nutrients_for,
+    parse_amount,
+    parse_quantity,
+)
+
+
+@pytest.fixture(scope="module")
+def database():
+    return get_food_database()
+
+
+@pytest.mark.parametrize("text, amount, rest", [
+    ("2 pieces", 2.0, " pieces"),
+    ("1.5 cup", 1.5, " cup"),
+    ("150g", 150.0, "g"),
+    ("1/2 cup", 0.5, " cup"),
+    ("3 / 4 katori", 0.75, " katori"),
+    ("1 1/2 cup", 1.5, " cup"),
+    ("1-1/2 cup", 1.5, " cup"),
+    ("½ katori", 0.5, " katori"),
+    ("1½ katori", 1.5, " katori"),
+    ("2 ¼ cup", 2.25, " cup"),
+    ("⅓ cup", 1 / 3, " cup"),
+    ("half cup", 0.5, " cup"),
+    ("half a katori", 0.5, " katori"),
+    ("  2 roti", 2.0, " roti"),
+])
+def test_parse_amount(text, amount, rest):
+    parsed = parse_amount(text)
+    assert parsed is not None
+    assert parsed[0] == pytest.approx(amount)
+    assert text[parsed[2]:] == rest
+
+
+@pytest.mark.parametrize("text", ["some rice", "cup", "", "1/0 cup", "halfway"])
+def test_parse_amount_without_amount(text):
+    assert parse_amount(text) is None
+
+
+@pytest.mark.parametrize("food, quantity, grams", [
+    ("chapati", "2 chapati", 80.0),
+    ("chapati", "2 roti", 80.0),
+    ("chapati", "2", 80.0),
+    ("chapati", "3 pieces", 120.0),
+    ("chapati", "1 small roti", 30.0),
+    ("chapati", "60 g", 60.0),
+    ("toor dal", "1 katori", 150.0),
+    ("toor dal", "1/2 cup", 100.0),
+    ("toor dal", "1 1/2 bowls", 375.0),
+    ("toor dal", "½ katori", 75.0),
+    ("toor dal", "half cup", 100.0),
+    ("toor dal", "0.25 kg", 250.0),
+    ("banana", "1 medium banana", 120.0),
+])
+def test_parse_quantity(database, food, quantity, grams):
+    record, _, _ = database.lookup(food)
+    assert parse_quantity(quantity, record) == pytest.approx(grams)
+
+
+@pytest.mark.parametrize("food, quantity", [
+    ("chapati", "1 cup"),
+    ("chapati", "2 tbsp"),
+    ("chapati", "half cup"),
+    ("toor dal", "2 pieces"),
+    ("toor dal", "1 dal"),
+    ("banana", "1 glass"),
+])
+def test_parse_quantity_unknown_unit(database, food, quantity):
+    record, _, _ = database.lookup(food)
+    assert parse_quantity(quantity, record) is None
+
+
+def test_lookup(database):
+    record, match_type, score = database.lookup("Roti (whole wheat)")
+    assert (record["name"], match_type, score) == ("chapati", "exact", 1.0)
+    assert database.lookup("white rice")[0]["name"] == "steamed rice"
+    assert database.lookup("zzzz qqqq") is None
+
+
+@pytest.mark.parametrize("name, matched", [
+    ("chapathi", "chapati"),
+    ("panner bhurji", "paneer bhurji"),
+    ("aloo parata", "aloo paratha"),
+])
+def test_lookup_misspelling(database, name, matched):
+    record, match_type, score = database.lookup(name)
+    assert (record["name"], match_type) == (matched, "fuzzy")
+    assert score >= 0.85
+
+
+@pytest.mark.parametrize("name, suggestion", [
+    ("green tea", "mint chutney"),
+    ("burger", "butter"),
+    ("butter chicken", "grilled chicken breast"),
+    ("mutton biryani", "chicken biryani"),
+    ("quinoa upma", "upma"),
+    ("idli sambar", "sambar"),
+    ("cooked rice", "steamed rice"),
+])
+def test_lookup_similar_dish_is_a_miss(database, name, suggestion):
+    assert database.lookup(name) is None
+    assert suggestion in database.suggest(name)
+
+
+def test_lookup_food_nutrition_not_found():
+    response = json.loads(lookup_food_nutrition("mutton biryani", "1 plate"))
+    assert response["found"] is False
+    assert "chicken biryani" in response["suggestions"]
+
+
+def test_nutrients_for(database):
+    record, _, _ = database.lookup("chapati")
+    nutrients = nutrients_for(record, 40)
+    assert nutrients["calories"] == pytest.approx(record["per_100g"]["calories"] * 0.4, abs=0.05)
+
+
+def test_lookup_food_nutrition_unknown_unit():
+    response = json.loads(lookup_food_nutrition("chapati", "1 cup"))
+    assert response["found"] is True
+    assert "grams" not in response
+    assert "Unknown unit" in response["message"]
+
+
+def test_shipped_database_matches_source(tmp_path):
+    # get_food_database() no longer rebuilds a stale file: run `python -m nutrition_agent.food_db` after editing the CSV
+    path = str(tmp_path / "foods.nfdb")
+    build_food_database(output_path=path)
+    with open(path, "rb") as built, open(DATABASE_PATH, "rb") as shipped:
+        assert built.read() == shipped.read()
+
+
+def test_concurrent_builds(tmp_path):
+    path = str(tmp_path / "foods.nfdb")
+    with ThreadPoolExecutor(4) as pool:
+        counts = list(pool.map(lambda _: build_food_database(output_path=path), range(8)))
+    assert len(set(counts)) == 1
+    assert os.listdir(tmp_path) == ["foods.nfdb"]
+
+
+def test_missing_database_builds_in_cache(tmp_path, monkeypatch):
+    cache_path = str(tmp_path / "cache" / "foods.nfdb")
+    monkeypatch.setattr(food_db, "DATABASE_PATH", str(tmp_path / "missing.nfdb"))
+    monkeypatch.setattr(food_db, "CACHE_DATABASE_PATH", cache_path)
+    monkeypatch.setattr(food_db, "_database", None)
+    database = get_food_database()
+    try:
+        assert database.path == cache_path
+        assert database.exact("chapati")["name"] == "chapati"
+    finally:
+        database.close()
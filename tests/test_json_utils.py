@@ -0,0 +1,161 @@
+import asyncio
+import json
+from typing import AsyncGenerator, List, Optional
+
+import pytest
+from google.adk.agents import Agent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from nutrition_agent.cassette import CassettePlugin
+from nutrition_agent.json_utils import dumps_compact, extract_json, load_state_json, repair_json, strip_code_fences
+from nutrition_agent.schemas import OutputValidationError, apply_output_validation, validate_output
+
+GUIDELINES = {"special_dietary_guidelines": ["Limit added sugar"], "additional_recommendations": []}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('```\n[1, 2]\n```', [1, 2]),
+    ('Here is the plan:\n```json\n{"a": 1}\n```\nLet me know!', {"a": 1}),
+    ('Sure. {"a": {"b": [1, 2]}} Hope this helps {"c": 3}', {"a": {"b": [1, 2]}}),
+    ('{"a": 1, "b": [1, 2,],}', {"a": 1, "b": [1, 2]}),
+    ("{'a': 'x', 'ok': True, 'none': None}", {"a": "x", "ok": True, "none": None}),
+    ('{"note": "line one\nline two"}', {"note": "line one\nline two"}),
+    ('{"a": [1, 2', {"a": [1, 2]}),
+    ('{"a": "trunc', {"a": "trunc"}),
+    ({"a": 1}, {"a": 1}),
+])
+def test_extract_json(text, expected):
+    assert extract_json(text) == expected
+
+
+@pytest.mark.parametrize("text", ["no json here", "", "```json\n```"])
+def test_extract_json_invalid(text):
+    with pytest.raises(ValueError):
+        extract_json(text)
+
+
+def test_helpers():
+    assert strip_code_fences("```json\n{}\n```") == "{}"
+    assert repair_json('{"a": 1,} trailing') == '{"a": 1}'
+    assert load_state_json("not json") is None
+    assert load_state_json(None) is None
+    assert dumps_compact({"a": [1, "é"]}) == '{"a":[1,"é"]}'
+
+
+@pytest.mark.parametrize("output_key, value, expected", [
+    ("nutrition_guidelines", json.dumps(GUIDELINES), GUIDELINES),
+    (
+        "breakfast_plan",
+        '```json\n{"foods": [{"name": "Poha", "quantity": "1 cup", "calories": "250 kcal", '
+        '"protein_g": 5, "carbs_g": "45g", "fats_g": 6, "fiber_g": "unknown", "extra": 1}]}\n```',
+        {"foods": [{"name": "Poha", "quantity": "1 cup", "calories": 250.0, "protein_g": 5.0,
+                    "carbs_g": 45.0, "fats_g": 6.0, "extra": 1}], "notes": []},
+    ),
+    (
+        "meal_plan_patch",
+        {"operations": [{"op": "rescale", "meal": "lunch", "food": "rice", "factor": "0.5"}]},
+        {"operations": [{"op": "rescale", "meal": "lunch", "food": "rice", "factor": 0.5}], "refinement_notes": []},
+    ),
+    ("unchecked_key", "[1, 2]", [1, 2]),
+])
+def test_validate_output(output_key, value, expected):
+    assert validate_output(output_key, value) == (expected, [])
+
+
+@pytest.mark.parametrize("output_key, value, error", [
+    ("nutrition_guidelines", "no json", "not valid JSON"),
+    ("nutrition_guidelines", "[1]", "expected a JSON object, got list"),
+    ("nutrition_guidelines", "{}", "special_dietary_guidelines: Field required"),
+    ("lunch_plan", '{"foods": []}', "foods: List should have at least 1 item"),
+    ("lunch_plan", '{"foods": [{"name": "Rice", "calories": "lots"}]}', "foods.0.calories"),
+    ("meal_plan_patch", '{"refinement_notes": []}', "expected a patch with operations or a full meal_plan"),
+    ("meal_plan_patch", '{"operations": [{"op": "rescale", "meal": "lunch", "food": "rice"}]}', "rescale operation needs factor"),
+    ("meal_plan_patch", '{"operations": [{"op": "swap", "meal": "lunch"}]}', "operations.0.op"),
+    ("meal_plan_patch", '{"operations": [{"op": "replace_meal", "meal": "lunch", "foods": []}]}', "operations.0.foods"),
+])
+def test_validate_output_errors(output_key, value, error):
+    normalized, errors = validate_output(output_key, value)
+    assert normalized is None
+    assert any(error in message for message in errors)
+
+
+class ScriptedModel(BaseLlm):
+    """Returns the scripted texts in turn and keeps the requests it was sent."""
+
+    texts: List[str]
+    requests: List[LlmRequest] = []
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        self.requests.append(llm_request)
+        text = self.texts[min(len(self.requests), len(self.texts)) - 1]
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+class ModelCallCounter(BasePlugin):
+    def __init__(self):
+        super().__init__("model_call_counter")
+        self.before = 0
+        self.after: List[str] = []
+
+    async def before_model_callback(self, *, callback_context, llm_request):
+        self.before += 1
+
+    async def after_model_callback(self, *, callback_context, llm_response):
+        self.after.append(llm_response.content.parts[0].text)
+
+
+def _run_validated_agent(texts: List[str], plugin: Optional[BasePlugin] = None):
+    model = ScriptedModel(model="scripted", texts=texts)
+    agent = Agent(name="guidelines_agent", model=model, instruction="Write guidelines.", output_key="nutrition_guidelines")
+    apply_output_validation(agent)
+    plugin = plugin or ModelCallCounter()
+
+    async def run():
+        runner = Runner(agent=agent, app_name="test", session_service=InMemorySessionService(), plugins=[plugin])
+        session = await runner.session_service.create_session(app_name="test", user_id="u")
+        try:
+            message = types.Content(role="user", parts=[types.Part(text="go")])
+            async for _ in runner.run_async(user_id="u", session_id=session.id, new_message=message):
+                pass
+            session = await runner.session_service.get_session(app_name="test", user_id="u", session_id=session.id)
+        finally:
+            await runner.close()
+        return session.state
+
+    return asyncio.run(run()), model, plugin
+
+
+def test_output_validator_retries_through_plugins():
+    state, model, plugin = _run_validated_agent(["Sure! {\"additional_recommendations\": []}", json.dumps(GUIDELINES)])
+    assert json.loads(state["nutrition_guidelines"]) == GUIDELINES
+    assert len(model.requests) == 2
+    assert "special_dietary_guidelines: Field required" in model.requests[1].contents[-1].parts[0].text
+    # The plugins see the retry as a model call of its own
+    assert plugin.before == 2
+    assert plugin.after == ["Sure! {\"additional_recommendations\": []}", json.dumps(GUIDELINES)]
+
+
+def test_output_validator_gives_up_after_retries():
+    with pytest.raises(OutputValidationError, match="guidelines_agent produced invalid nutrition_guidelines"):
+        _run_validated_agent(["[]"])
+
+
+def test_output_validator_retry_replays_from_cassette(tmp_path):
+    path = str(tmp_path / "cassette.sqlite3")
+    recorder = CassettePlugin(path, mode="record")
+    recorded, _, _ = _run_validated_agent(["[]", json.dumps(GUIDELINES)], recorder)
+    assert recorder.counters["recorded"] == 2
+
+    player = CassettePlugin(path, mode="replay")
+    replayed, model, _ = _run_validated_agent(["live call"], player)
+    assert player.counters == {"hits": 2, "misses": 0, "recorded": 0}
+    assert model.requests == []
+    assert replayed == recorded
@@ -0,0 +1,99 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.runners import Runner
+
+from nutrition_agent.agent import APP_NAME, get_nutritionist_agent, load_patient_data
+from nutrition_agent.batch import run_batch
+from nutrition_agent.compaction import CompactingSessionService
+from nutrition_agent.fake_model import install_fake_models
+from nutrition_agent.memo import StageMemo, StageMemoPlugin
+
+
+@pytest.fixture(scope="module", autouse=True)
+def fake_models():
+    install_fake_models(get_nutritionist_agent(), latency="fixed:0", approve_after=1)
+
+
+class ModelCallRecorder(BasePlugin):
+    def __init__(self):
+        super().__init__("model_call_recorder")
+        self.agents: List[str] = []
+
+    async def before_model_callback(self, *, callback_context, llm_request):
+        self.agents.append(callback_context.agent_name)
+
+
+def _patient_data(state):
+    return state.get("patient_data")
+
+
+@pytest.fixture
+def plugin(tmp_path):
+    plugin = StageMemoPlugin(
+        StageMemo(str(tmp_path / "memo.sqlite3")), get_nutritionist_agent(), _patient_data, max_tracked_invocations=4
+    )
+    yield plugin
+    asyncio.run(plugin.close())
+
+
+def _before(plugin, agent_name, invocation_id, state):
+    agent = SimpleNamespace(name=agent_name, output_key=None)
+    context = SimpleNamespace(invocation_id=invocation_id, state=state)
+    return asyncio.run(plugin.before_agent_callback(agent=agent, callback_context=context))
+
+
+def test_unfinished_invocations_are_bounded(plugin):
+    # Runs cancelled by a deadline or a batch retry never reach after_run_callback
+    for i in range(10):
+        assert _before(plugin, "patient_data_agent", f"inv-{i}", {"patient_data": f'{{"id": {i}}}'}) is None
+    assert list(plugin._invocations) == [f"inv-{i}" for i in range(6, 10)]
+
+
+def test_after_run_drops_invocation(plugin):
+    _before(plugin, "patient_data_agent", "inv", {"patient_data": "{}"})
+    invocation_context = SimpleNamespace(invocation_id="inv", session=SimpleNamespace(state={}))
+    asyncio.run(plugin.after_run_callback(invocation_context=invocation_context))
+    assert not plugin._invocations
+
+
+def test_memo_hit_skips_stages(tmp_path):
+    questionnaire = tmp_path / "q.json"
+    measurements = tmp_path / "m.json"
+    questionnaire.write_text(json.dumps({"name": "Ananya"}))
+    measurements.write_text(json.dumps({"weight_kg": 68}))
+    patient = {"patient_id": "p1", "questionnaire_path": str(questionnaire), "measurements_path": str(measurements)}
+    memo_path = str(tmp_path / "memo.sqlite3")
+
+    def run():
+        recorder = ModelCallRecorder()
+        plugin = StageMemoPlugin(StageMemo(memo_path), get_nutritionist_agent(), load_patient_data)
+
+        async def pipeline():
+            runner = Runner(
+                agent=get_nutritionist_agent(), app_name=APP_NAME, session_service=CompactingSessionService(),
+                plugins=[plugin, recorder],
+            )
+            try:
+                return [result async for result in run_batch([dict(patient)], runner=runner)]
+            finally:
+                await runner.close()
+
+        result, = asyncio.run(pipeline())
+        return result, recorder.agents
+
+    first, first_calls = run()
+    assert first["status"] == "ok"
+    assert {"patient_data_agent", "nutrition_calculator_agent", "meal_plan_critic_agent"} <= set(first_calls)
+    # Same inputs: every stage is served from the memo without a model call
+    second, second_calls = run()
+    assert second["status"] == "ok"
+    assert second_calls == []
+    assert second["current_meal_plan"] == first["current_meal_plan"]
+    memo = StageMemo(memo_path)
+    assert memo.stats()["entries"] == {"patient_data": 1, "nutrition": 1, "approved_meal_plan": 1}
+    memo.close()
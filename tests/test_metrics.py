@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import os
+
+import pytest
+from google.adk.runners import Runner
+
+from nutrition_agent.agent import APP_NAME, get_nutritionist_agent
+from nutrition_agent.batch import run_batch
+from nutrition_agent.compaction import CompactingSessionService
+from nutrition_agent.fake_model import install_fake_models
+from nutrition_agent.metrics import MetricsPlugin, Reservoir, percentile, summarize
+
+HTTP_LOG = 'HTTP Request: POST https://example.test/v1beta/models/%s:generateContent "HTTP/1.1 %d %s"'
+
+
+@pytest.mark.parametrize("q, expected", [(0.0, 1.0), (0.5, 2.5), (1.0, 4.0), (0.95, 3.85)])
+def test_percentile(q, expected):
+    assert percentile([4.0, 1.0, 3.0, 2.0], q) == pytest.approx(expected)
+
+
+def test_summarize_empty():
+    assert summarize([]) == {"count": 0, "sum": 0.0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+
+
+def test_reservoir_is_bounded_with_exact_totals():
+    reservoir = Reservoir(size=100)
+    reservoir.extend(float(value) for value in range(10_000))
+    assert len(reservoir.values) == 100
+    summary = reservoir.summary()
+    assert summary["count"] == 10_000
+    assert summary["sum"] == sum(range(10_000))
+    assert summary["mean"] == pytest.approx(4999.5)
+    assert 3000 < summary["p50"] < 7000
+
+
+def test_reservoir_below_size_is_exact():
+    reservoir = Reservoir(size=100)
+    reservoir.extend([1.0, 2.0, 3.0])
+    assert reservoir.summary() == summarize([1.0, 2.0, 3.0])
+
+
+def test_retry_counter_is_shared_and_silent(caplog):
+    httpx_logger = logging.getLogger("httpx")
+    first, second = MetricsPlugin(), MetricsPlugin()
+    assert len(httpx_logger.filters) == 1
+    with caplog.at_level(logging.WARNING):
+        httpx_logger.info(HTTP_LOG, "gemini-2.5-flash-lite", 503, "Service Unavailable")
+        httpx_logger.info(HTTP_LOG, "gemini-2.5-flash-lite", 200, "OK")
+    # Counted by every plugin, but not passed on to handlers that would not have shown it
+    assert [record for record in caplog.records if record.name == "httpx"] == []
+    for plugin in (first, second):
+        assert plugin.aggregate()["counters"]["retryable_responses"] == {"gemini-2.5-flash-lite|503": 1}
+
+    asyncio.run(first.close())
+    httpx_logger.info(HTTP_LOG, "gemini-2.0-flash-exp", 429, "Too Many Requests")
+    assert "gemini-2.0-flash-exp|429" not in first.aggregate()["counters"]["retryable_responses"]
+    assert second.aggregate()["counters"]["retryable_responses"]["gemini-2.0-flash-exp|429"] == 1
+    asyncio.run(second.close())
+
+
+def test_retry_counter_keeps_configured_httpx_output(caplog):
+    MetricsPlugin()
+    with caplog.at_level(logging.INFO):
+        logging.getLogger("httpx").info(HTTP_LOG, "gemini-2.5-flash-lite", 200, "OK")
+    assert any(record.name == "httpx" for record in caplog.records)
+
+
+def test_batch_metrics_are_bounded(tmp_path):
+    install_fake_models(get_nutritionist_agent(), latency="fixed:0", approve_after=2)
+    metrics = MetricsPlugin(str(tmp_path), prometheus_interval=None)
+    runner = Runner(
+        agent=get_nutritionist_agent(), app_name=APP_NAME, session_service=CompactingSessionService(), plugins=[metrics]
+    )
+
+    async def run():
+        try:
+            return [result async for result in run_batch([{"patient_id": f"m{i}"} for i in range(3)], runner=runner)]
+        finally:
+            await runner.close()
+
+    results = asyncio.run(run())
+    assert [result["status"] for result in results] == ["ok"] * 3
+    assert metrics.runs == 3
+    assert len(metrics.completed_runs) == 0
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("run-")]) == 3
+    prometheus = (tmp_path / "metrics.prom").read_text()
+    assert "nutrition_agent_runs_total 3" in prometheus
+    assert metrics.aggregate()["summaries"]["run_wall_seconds"][""]["count"] == 3
@@ -0,0 +1,146 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from nutrition_agent.patching import PATCH_ERRORS_KEY, apply_patch, is_patch, patch_error_issues, rescale_food
+
+
+def _food(name, quantity, calories, protein=0.0, carbs=0.0, fats=0.0):
+    return {"name": name, "quantity": quantity, "calories": calories, "protein_g": protein, "carbs_g": carbs, "fats_g": fats}
+
+
+@pytest.fixture
+def plan():
+    return {
+        "meal_plan": {
+            "breakfast": {"foods": [_food("Poha", "1 cup", 250, 5, 45, 6), _food("Masala chai", "1 cup", 80, 2, 10, 3)]},
+            "lunch": {"foods": [_food("Chapati", "2 pieces", 240, 8, 36, 6), _food("Paneer bhurji", "1/2 cup", 200, 12, 5, 15)]},
+            "dinner": {"foods": [_food("Dal tadka", "1 katori", 180, 9, 24, 5), _food("", "1 tsp", 40, 0, 0, 4)]},
+        }
+    }
+
+
+@pytest.mark.parametrize("quantity, factor, expected", [
+    ("2 pieces", 1.5, "3 pieces"),
+    ("150 g", 0.5, "75 g"),
+    ("150g", 1.2, "180g"),
+    ("1/2 cup", 1.5, "0.75 cup"),
+    ("1 1/2 cup", 2, "3 cup"),
+    ("½ katori", 2, "1 katori"),
+    ("1½ katori", 0.5, "0.75 katori"),
+    ("half cup", 2, "1 cup"),
+    ("1.5 bowls", 1 / 3, "0.5 bowls"),
+    ("some rice", 1.5, "some rice (×1.5)"),
+    ("some rice (×1.5)", 2, "some rice (×3)"),
+    ("some rice (×2)", 0.5, "some rice"),
+    ("to taste", 1, "to taste"),
+    (2, 1.5, 3.0),
+    (None, 2, None),
+])
+def test_rescale_food_quantity(quantity, factor, expected):
+    scaled = rescale_food({"name": "x", "quantity": quantity, "calories": 100, "protein_g": 4}, factor)
+    assert scaled["quantity"] == expected
+    assert scaled["calories"] == pytest.approx(round(100 * factor, 1))
+    assert scaled["protein_g"] == pytest.approx(round(4 * factor, 1))
+
+
+def test_rescale_food_with_explicit_quantity():
+    scaled = rescale_food(_food("Rice", "1 katori", 200), 0.5, "1/2 katori")
+    assert scaled == {**_food("Rice", "1/2 katori", 100.0), "protein_g": 0.0, "carbs_g": 0.0, "fats_g": 0.0}
+
+
+def test_is_patch():
+    assert is_patch({"operations": []})
+    assert not is_patch({"operations": [], "meal_plan": {}})
+    assert not is_patch({"meal_plan": {}})
+    assert not is_patch("operations")
+
+
+def test_apply_patch_operations(plan):
+    patch = {
+        "operations": [
+            {"op": "replace", "meal": "breakfast", "food": "poha", "new_food": _food("Upma", "1 cup", 220, 6, 38, 5)},
+            {"op": "rescale", "meal": "lunch", "food": "Chapati", "factor": 0.5},
+            {"op": "remove", "meal": "breakfast", "food": "masala  chai"},
+            {"op": "add", "meal": "evening_snack", "new_food": _food("Roasted chana", "1/4 cup", 120, 7, 18, 2)},
+            {"op": "replace_meal", "meal": "dinner", "foods": [_food("Khichdi", "1 bowl", 300, 10, 50, 6)]},
+        ],
+        "refinement_notes": ["Lighter breakfast"],
+    }
+    patched, errors = apply_patch(plan, patch, {"total_calories": 1000})
+    assert errors == []
+    meals = patched["meal_plan"]
+    assert [food["name"] for food in meals["breakfast"]["foods"]] == ["Upma"]
+    assert meals["lunch"]["foods"][0]["quantity"] == "1 pieces"
+    assert meals["lunch"]["foods"][0]["calories"] == 120.0
+    assert meals["evening_snack"]["foods"][0]["name"] == "Roasted chana"
+    assert meals["dinner"]["foods"][0]["name"] == "Khichdi"
+    assert patched["daily_totals"]["calories"] == 220 + 120 + 200 + 120 + 300
+    assert patched["target_comparison"]["calories_percentage"] == 96.0
+    assert patched["refinement_notes"] == ["Lighter breakfast"]
+    # The input plan is left untouched
+    assert plan["meal_plan"]["breakfast"]["foods"][0]["name"] == "Poha"
+
+
+@pytest.mark.parametrize("foods", [[], None, ["Khichdi"]])
+def test_apply_patch_replace_meal_without_foods(plan, foods):
+    patched, errors = apply_patch(plan, {"operations": [{"op": "replace_meal", "meal": "dinner", "foods": foods}]})
+    assert errors == ["operation 1 (replace_meal): foods missing"]
+    assert patched["meal_plan"]["dinner"]["foods"] == plan["meal_plan"]["dinner"]["foods"]
+
+
+def test_apply_patch_partial_name(plan):
+    patched, errors = apply_patch(plan, {"operations": [{"op": "remove", "meal": "dinner", "food": "dal"}]})
+    assert errors == []
+    assert [food["name"] for food in patched["meal_plan"]["dinner"]["foods"]] == [""]
+
+
+def test_apply_patch_never_matches_nameless_food(plan):
+    patched, errors = apply_patch(plan, {"operations": [{"op": "remove", "meal": "dinner", "food": "paneer"}]})
+    assert errors == ["operation 1 (remove): 'paneer' not found in dinner"]
+    assert len(patched["meal_plan"]["dinner"]["foods"]) == 2
+
+
+def test_apply_patch_ambiguous_name(plan):
+    plan["meal_plan"]["breakfast"]["foods"].append(_food("Masala dosa", "1 piece", 170))
+    patch = {"operations": [{"op": "rescale", "meal": "breakfast", "food": "masala", "factor": 2}]}
+    patched, errors = apply_patch(plan, patch)
+    assert errors == ["operation 1 (rescale): 'masala' is ambiguous in breakfast ('Masala chai', 'Masala dosa')"]
+    assert patched["meal_plan"]["breakfast"]["foods"][1]["calories"] == 80
+
+
+@pytest.mark.parametrize("operation, error", [
+    ("rescale", "operation 1: not an object"),
+    ({"op": "add", "meal": "brunch", "new_food": {}}, "operation 1 (add): unknown meal 'brunch'"),
+    ({"op": "add", "meal": "lunch"}, "operation 1 (add): new_food missing"),
+    ({"op": "rescale", "meal": "lunch", "food": "chapati", "factor": 0}, "operation 1 (rescale): invalid factor 0"),
+    ({"op": "replace", "meal": "lunch", "food": "chapati"}, "operation 1 (replace): new_food missing"),
+    ({"op": "swap", "meal": "lunch", "food": "chapati"}, "operation 1: unknown op 'swap'"),
+    ({"op": "remove", "meal": "lunch", "food": ""}, "operation 1 (remove): '' not found in lunch"),
+])
+def test_apply_patch_errors(plan, operation, error):
+    patched, errors = apply_patch(plan, {"operations": [operation]})
+    assert errors == [error]
+    assert patched["meal_plan"]["lunch"]["foods"] == plan["meal_plan"]["lunch"]["foods"]
+
+
+def test_patch_errors_reach_the_next_refinement(plan):
+    from nutrition_agent.agent import apply_meal_plan_patch, run_numeric_validation
+
+    requirements = {"daily_targets": {"total_calories": 1000}}
+    context = SimpleNamespace(state={
+        "current_meal_plan": json.dumps(plan),
+        "nutrition_requirements": json.dumps(requirements),
+        "meal_plan_patch": json.dumps({"operations": [{"op": "remove", "meal": "dinner", "food": "paneer"}]}),
+    })
+    apply_meal_plan_patch(context)
+    assert context.state[PATCH_ERRORS_KEY] == ["operation 1 (remove): 'paneer' not found in dinner"]
+
+    run_numeric_validation(context)
+    issues = json.loads(context.state["numeric_validation"])["issues"]
+    assert patch_error_issues(context.state[PATCH_ERRORS_KEY])[0] in issues
+
+    context.state["meal_plan_patch"] = json.dumps({"operations": []})
+    apply_meal_plan_patch(context)
+    assert context.state[PATCH_ERRORS_KEY] == []
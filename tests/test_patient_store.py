@@ -0,0 +1,131 @@
+import json
+
+import pytest
+
+from nutrition_agent.agent import load_patient_data
+from nutrition_agent.patient_store import JsonFileCache, PatientStore, import_patients
+
+
+def _record(patient_id, **questionnaire):
+    return {"patient_id": patient_id, "questionnaire": questionnaire, "measurements": {"weight_kg": 60}}
+
+
+def _write_lines(path, lines, newline="\n"):
+    with open(path, "wb") as store_file:
+        for line in lines:
+            text = line if isinstance(line, str) else json.dumps(line, ensure_ascii=False)
+            store_file.write((text + newline).encode("utf-8"))
+
+
+def _questionnaire(store, patient_id):
+    return json.loads(store.get(patient_id))["questionnaire"]
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_jsonl_offsets(tmp_path, newline):
+    path = str(tmp_path / "patients.jsonl")
+    _write_lines(path, [
+        _record("p1", name="Ananya Rao", diet="शाकाहारी"),
+        "",
+        _record("p2", name="Zoë", notes="line\nbreak"),
+        _record('p"3', name="quoted id"),
+        {"questionnaire": {"name": "id last"}, "measurements": {}, "patient_id": "p4"},
+        _record(5, name="numeric id"),
+        _record("p1", name="Ananya Rao", diet="updated"),
+    ], newline)
+    store = PatientStore(path)
+    assert sorted(store.patient_ids()) == ["5", 'p"3', "p1", "p2", "p4"]
+    # Byte offsets stay right after multi-byte characters, and a later line overrides an earlier one
+    assert _questionnaire(store, "p1") == {"name": "Ananya Rao", "diet": "updated"}
+    assert _questionnaire(store, "p2") == {"name": "Zoë", "notes": "line\nbreak"}
+    assert _questionnaire(store, 'p"3') == {"name": "quoted id"}
+    assert _questionnaire(store, "p4") == {"name": "id last"}
+    assert _questionnaire(store, "5") == {"name": "numeric id"}
+    assert store.get("missing") is None
+
+
+def test_jsonl_nested_patient_id_is_not_the_key(tmp_path):
+    path = str(tmp_path / "patients.jsonl")
+    _write_lines(path, [
+        {"questionnaire": {"patient_id": "referrer-9", "name": "nested id"}, "measurements": {}, "patient_id": "p1"},
+    ])
+    store = PatientStore(path)
+    assert store.patient_ids() == ["p1"]
+    assert _questionnaire(store, "p1")["name"] == "nested id"
+
+
+def test_jsonl_put_reindexes(tmp_path):
+    store = PatientStore(str(tmp_path / "patients.jsonl"))
+    assert store.patient_ids() == []
+    store.put("p1", {"name": "first"}, {})
+    assert _questionnaire(store, "p1") == {"name": "first"}
+    assert _questionnaire(store, "p1") == {"name": "first"}
+    store.put("p1", {"name": "second"}, {})
+    store.put("p2", {"name": "other"}, {})
+    assert _questionnaire(store, "p1") == {"name": "second"}
+    assert sorted(store.patient_ids()) == ["p1", "p2"]
+    stats = store.stats()
+    assert (stats["hits"], stats["reloads"]) == (1, 2)
+
+
+def test_lru_bound(tmp_path):
+    path = str(tmp_path / "patients.jsonl")
+    _write_lines(path, [_record(f"p{i}") for i in range(5)])
+    store = PatientStore(path, max_cached_records=2)
+    for patient_id in store.patient_ids():
+        store.get(patient_id)
+    assert store.stats()["cached_records"] == 2
+
+
+def test_sqlite_store(tmp_path):
+    path = str(tmp_path / "store" / "patients.sqlite3")
+    store = PatientStore(path)
+    store.put("p2", {"name": "b"}, {"weight_kg": 70})
+    store.put("p1", {"name": "a"}, {})
+    store.put("p2", {"name": "b2"}, {})
+    assert store.patient_ids() == ["p1", "p2"]
+    assert json.loads(store.get("p2")) == {"questionnaire": {"name": "b2"}, "measurements": {}}
+    assert store.get("p3") is None
+    # Another connection sees the same data
+    store.close()
+    assert _questionnaire(PatientStore(path), "p1") == {"name": "a"}
+
+
+def test_import_patients(tmp_path):
+    questionnaire = tmp_path / "q.json"
+    measurements = tmp_path / "m.json"
+    questionnaire.write_text(json.dumps({"name": "a"}))
+    measurements.write_text(json.dumps({"weight_kg": 60}))
+    store = PatientStore(str(tmp_path / "patients.jsonl"))
+    entries = [{"patient_id": 1, "questionnaire_path": str(questionnaire), "measurements_path": str(measurements)}]
+    assert import_patients(entries, store) == 1
+    assert json.loads(store.get("1")) == {"questionnaire": {"name": "a"}, "measurements": {"weight_kg": 60}}
+
+
+def test_json_file_cache(tmp_path):
+    path = tmp_path / "q.json"
+    path.write_text('{"a": 1}')
+    cache = JsonFileCache()
+    first = cache.load(str(path))
+    assert cache.load(str(path)) is first
+    path.write_text('{"a": 22}')
+    assert cache.load(str(path)) == {"a": 22}
+    with pytest.raises(FileNotFoundError):
+        cache.load(str(tmp_path / "missing.json"))
+
+
+def test_load_patient_data_prefers_entry_files(tmp_path):
+    questionnaire = tmp_path / "q.json"
+    measurements = tmp_path / "m.json"
+    questionnaire.write_text(json.dumps({"name": "from files"}))
+    measurements.write_text(json.dumps({}))
+    store_path = str(tmp_path / "patients.jsonl")
+    PatientStore(store_path).put("p1", {"name": "from store"}, {})
+    files = {"questionnaire_path": str(questionnaire), "measurements_path": str(measurements)}
+    # A manifest entry with its own files is not looked up in the store, even with a store configured
+    state = {"patient_id": "p2", "patient_store_path": store_path, **files}
+    assert json.loads(load_patient_data(state))["questionnaire"] == {"name": "from files"}
+    assert json.loads(load_patient_data({"patient_id": "p1", "patient_store_path": store_path}))["questionnaire"] == {
+        "name": "from store"
+    }
+    assert load_patient_data({"patient_id": "p2", "patient_store_path": store_path}) is None
@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+
+from nutrition_agent.meal_plan import daily_totals
+from nutrition_agent.portions import (
+    MAX_PORTION_FACTOR,
+    MIN_PORTION_FACTOR,
+    optimize_portions,
+    solve_bounded_least_squares,
+    solve_portions,
+)
+from nutrition_agent.validator import validate_meal_plan
+
+
+def _food(name, quantity, calories, protein, carbs, fats):
+    return {"name": name, "quantity": quantity, "calories": calories, "protein_g": protein, "carbs_g": carbs, "fats_g": fats}
+
+
+@pytest.fixture
+def requirements():
+    return {
+        "daily_targets": {"total_calories": 1450, "protein_grams": 50, "carbohydrates_grams": 200, "fats_grams": 50},
+        "meal_distribution": {"breakfast": {"calories": 350}, "lunch": {"calories": 600}, "dinner": {"calories": 500}},
+    }
+
+
+@pytest.fixture
+def plan():
+    """About 450 kcal over target, with fractional household quantities."""
+    return {
+        "meal_plan": {
+            "breakfast": {"foods": [
+                _food("Vegetable poha", "1 1/2 cup", 375, 7.5, 66, 9),
+                _food("Curd", "½ katori", 60, 3.5, 4.5, 3),
+            ]},
+            "lunch": {"foods": [
+                _food("Steamed rice", "1 1/2 katori", 390, 8, 84, 1),
+                _food("Toor dal", "1 katori", 230, 13.5, 32, 6),
+                _food("Paneer bhurji", "1/2 cup", 260, 15, 6, 20),
+            ]},
+            "dinner": {"foods": [
+                _food("Chapati", "3 pieces", 360, 12, 54, 9),
+                _food("Mixed veg sabzi", "1 katori", 180, 4.5, 16, 11),
+                _food("Ghee", "1 tsp", 45, 0, 0, 5),
+            ]},
+        }
+    }
+
+
+def test_solver_matches_unconstrained_solution():
+    rng = np.random.default_rng(0)
+    A = rng.normal(size=(8, 4))
+    x_true = np.array([0.8, 1.2, 1.0, 1.5])
+    solution = solve_bounded_least_squares(A, A @ x_true, np.zeros(4), np.full(4, 2.0), x0=np.ones(4))
+    np.testing.assert_allclose(solution, x_true, atol=1e-4)
+
+
+def test_solver_respects_bounds():
+    A = np.eye(3)
+    b = np.array([-1.0, 0.5, 5.0])
+    solution = solve_bounded_least_squares(A, b, np.zeros(3), np.ones(3))
+    np.testing.assert_allclose(solution, [0.0, 0.5, 1.0], atol=1e-6)
+
+
+def test_solver_with_zero_matrix_returns_start():
+    solution = solve_bounded_least_squares(np.zeros((2, 2)), np.ones(2), np.zeros(2), np.full(2, 2.0), x0=np.ones(2))
+    np.testing.assert_array_equal(solution, [1.0, 1.0])
+
+
+def test_solve_portions_hits_targets(plan, requirements):
+    assert daily_totals(plan)["calories"] - 1450 > 400
+    optimized, adjustments = solve_portions(plan, requirements)
+    assert adjustments
+    assert abs(optimized["daily_totals"]["calories"] - 1450) <= 100
+    for adjustment in adjustments:
+        assert MIN_PORTION_FACTOR <= adjustment["factor"] <= MAX_PORTION_FACTOR
+    # The input plan is left untouched
+    assert plan["meal_plan"]["lunch"]["foods"][0]["quantity"] == "1 1/2 katori"
+
+
+def test_solve_portions_rewrites_fractional_quantities(plan, requirements):
+    original = {
+        (meal, food["name"]): food["quantity"]
+        for meal, entry in plan["meal_plan"].items() for food in entry["foods"]
+    }
+    amounts = {"1 1/2 cup": 1.5, "½ katori": 0.5, "1 1/2 katori": 1.5, "1 katori": 1.0, "1/2 cup": 0.5, "3 pieces": 3.0, "1 tsp": 1.0}
+    _, adjustments = solve_portions(plan, requirements)
+    for adjustment in adjustments:
+        before = original[(adjustment["meal"], adjustment["food"])]
+        amount, unit = adjustment["quantity"].split(" ", 1)
+        assert unit == before.split(" ")[-1]
+        assert float(amount) == pytest.approx(amounts[before] * adjustment["factor"], rel=0.01)
+
+
+@pytest.mark.parametrize("scale, chapati", [(1.0, "3 pieces"), (0.6, "5 pieces")])
+def test_countable_foods_stay_whole(plan, requirements, scale, chapati):
+    # At 0.6 the plan is under target, so portions grow
+    for entry in plan["meal_plan"].values():
+        for food in entry["foods"]:
+            food.update({key: food[key] * scale for key in ("calories", "protein_g", "carbs_g", "fats_g")})
+    optimized, _ = solve_portions(plan, requirements)
+    assert abs(optimized["daily_totals"]["calories"] - 1450) <= 100
+    foods = {food["name"]: food for entry in optimized["meal_plan"].values() for food in entry["foods"]}
+    assert foods["Chapati"]["quantity"] == chapati
+    for food in foods.values():
+        amount, unit = food["quantity"].replace("½", "0.5").split(" ", 1)
+        if unit in ("katori", "tsp"):
+            assert (2 * float(amount)).is_integer()
+    # Ghee may shrink but never grow
+    assert foods["Ghee"]["fats_g"] <= 5 * scale
+
+
+def test_solve_portions_without_targets(plan):
+    assert solve_portions(plan, {}) == (plan, [])
+
+
+def test_optimize_portions_reduces_issues(plan, requirements):
+    validation = validate_meal_plan(plan, requirements)
+    assert not validation["passed"]
+    result = optimize_portions(plan, requirements, validation)
+    assert result is not None
+    assert result["validation"]["passed"]
+    assert result["plan"]["daily_totals"] == daily_totals(result["plan"])
+
+
+def test_optimize_portions_leaves_passing_plan(plan, requirements):
+    optimized, _ = solve_portions(plan, requirements)
+    validation = validate_meal_plan(optimized, requirements)
+    assert validation["passed"]
+    assert optimize_portions(optimized, requirements, validation) is None
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from nutrition_agent.rate_limit import ModelRateLimiter, TokenBucket, parse_quotas
+
+
+def test_parse_quotas():
+    assert parse_quotas("gemini-2.5-flash-lite=4000:4000000, *=10:1000") == {
+        "gemini-2.5-flash-lite": (4000.0, 4000000.0),
+        "*": (10.0, 1000.0),
+    }
+    assert parse_quotas(None) == {}
+    with pytest.raises(ValueError, match="expected model=requests_per_minute:tokens_per_minute"):
+        parse_quotas("gemini=fast")
+
+
+def test_token_bucket_refill():
+    # 60 per minute: one per second, holding at most 10 seconds' worth
+    bucket = TokenBucket(60, burst_seconds=10)
+    start = bucket._updated
+    assert (bucket.capacity, bucket.wait_time(10, start)) == (10.0, 0.0)
+    bucket.take(12)
+    assert bucket.wait_time(1, start) == pytest.approx(3.0)
+    assert bucket.wait_time(1, start + 2.5) == pytest.approx(0.5)
+    # Refill stops at capacity, and more than capacity only waits for a full bucket
+    assert bucket.wait_time(1, start + 100) == 0.0
+    assert bucket.level == 10.0
+    assert bucket.wait_time(50, start + 100) == 0.0
+
+
+def _drained(requests_per_minute=6000):
+    limiter = ModelRateLimiter("test-model", requests_per_minute, 1_000_000)
+    limiter.requests.take(limiter.requests.capacity)
+    return limiter
+
+
+def test_waiters_served_by_priority_then_arrival():
+    # 100 requests per second once drained: each call waits about 10 ms for the next request
+    limiter = _drained()
+    order = []
+
+    async def call(name, priority):
+        await limiter.acquire(100, priority)
+        order.append(name)
+
+    async def run():
+        await asyncio.gather(*(call(name, priority) for name, priority in [
+            ("patient_data", 3), ("critic", 0), ("calculator", 2), ("refiner", 0), ("planner", 1),
+        ]))
+
+    asyncio.run(run())
+    assert order == ["critic", "refiner", "planner", "calculator", "patient_data"]
+    stats = limiter.stats()
+    assert (stats["granted"], stats["waited"], stats["max_queue"], stats["queued"]) == (5, 5, 5, 0)
+
+
+def test_quota_refills_over_time():
+    limiter = _drained()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        waits = [await limiter.acquire(100) for _ in range(3)]
+        return waits, loop.time() - started
+
+    waits, elapsed = asyncio.run(run())
+    assert all(wait > 0 for wait in waits)
+    assert 0.02 <= elapsed < 1.0
+
+
+def test_immediate_grant_with_quota_left():
+    limiter = ModelRateLimiter("test-model", 60, 1000)
+    assert asyncio.run(limiter.acquire(100)) == 0.0
+    limiter.settle(100, 250)
+    assert limiter.tokens.level == pytest.approx(limiter.tokens.capacity - 250, abs=1)
+    assert limiter.stats()["token_corrections"] == 150
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    limiter = _drained()
+
+    async def run():
+        waiting = asyncio.ensure_future(limiter.acquire(100))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        return await limiter.acquire(100, priority=0)
+
+    assert asyncio.run(run()) > 0
+    assert limiter.stats()["queued"] == 0
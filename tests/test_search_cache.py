@@ -0,0 +1,118 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from nutrition_agent import search_cache
+from nutrition_agent.search_cache import InFlightRequests, SearchCache, normalize_query
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(search_cache, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_normalize_query():
+    assert normalize_query("Paneer nutrition facts?") == normalize_query("nutrition facts of paneer")
+    assert normalize_query("Calories in 1.5 cups of rice") == "1.5 calories cups rice"
+
+
+@pytest.mark.parametrize("path", [None, "cache.sqlite3"])
+def test_ttl_expiry(tmp_path, clock, path):
+    cache = SearchCache(str(tmp_path / path) if path else None, ttl_seconds=60)
+    cache.put("paneer nutrition", "265 kcal")
+    clock[0] += 60
+    assert cache.get("nutrition of paneer") == "265 kcal"
+    clock[0] += 1
+    assert cache.get("paneer nutrition") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 1, 1)
+    cache.close()
+
+
+def test_memory_lru_falls_back_to_disk(tmp_path, clock):
+    cache = SearchCache(str(tmp_path / "cache.sqlite3"), max_memory_entries=2, max_disk_entries=10)
+    for query in ("a1", "a2", "a3"):
+        clock[0] += 1
+        cache.put(query, query.upper())
+    # a1 was the least recently used in memory, but the disk tier still has it
+    assert cache.get("a1") == "A1"
+    stats = cache.stats()
+    assert (stats["memory_evictions"], stats["memory_hits"], stats["disk_hits"]) == (2, 0, 1)
+    assert (stats["memory_entries"], stats["disk_entries"]) == (2, 3)
+    cache.close()
+
+
+def test_disk_lru_eviction(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = SearchCache(path, max_memory_entries=1, max_disk_entries=2)
+    for query in ("a1", "a2"):
+        clock[0] += 1
+        cache.put(query, query.upper())
+    clock[0] += 1
+    assert cache.get("a1") == "A1"
+    clock[0] += 1
+    cache.put("a3", "A3")
+    assert cache.stats()["evictions"] == 1
+    cache.close()
+    # a2 was the least recently accessed
+    reopened = SearchCache(path)
+    assert [reopened.get(query) for query in ("a1", "a2", "a3")] == ["A1", None, "A3"]
+    reopened.close()
+
+
+def test_in_flight_requests_coalesce():
+    in_flight = InFlightRequests()
+    calls = []
+
+    async def search(query):
+        calls.append(query)
+        await asyncio.sleep(0.01)
+        return f"result for {query}"
+
+    async def run():
+        return await asyncio.gather(*(
+            in_flight.run(query, lambda query=query: search(query)) for query in ("paneer", "paneer", "dal", "paneer")
+        ))
+
+    assert asyncio.run(run()) == ["result for paneer", "result for paneer", "result for dal", "result for paneer"]
+    assert sorted(calls) == ["dal", "paneer"]
+    assert in_flight.stats() == {"started": 2, "coalesced": 2, "in_flight": 0}
+
+
+def test_in_flight_failure_reaches_every_waiter():
+    in_flight = InFlightRequests()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("search failed")
+
+    async def run():
+        return await asyncio.gather(*(in_flight.run("paneer", failing) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [type(result) for result in results] == [ValueError] * 3
+    assert in_flight.stats()["started"] == 1
+
+
+def test_in_flight_cancelled_call_is_restarted_by_a_waiter():
+    in_flight = InFlightRequests()
+    calls = []
+
+    async def search():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        first = asyncio.ensure_future(in_flight.run("paneer", search))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(in_flight.run("paneer", search))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await waiter
+
+    assert asyncio.run(run()) == "result"
+    assert len(calls) == 2
@@ -0,0 +1,108 @@
+import asyncio
+
+import httpx
+import pytest
+
+from nutrition_agent.agent import get_nutritionist_agent
+from nutrition_agent.fake_model import install_fake_models
+from nutrition_agent.server import PlanService, QueueFullError, build_runner, create_app
+
+
+@pytest.fixture(scope="module", autouse=True)
+def fake_models():
+    install_fake_models(get_nutritionist_agent(), latency="fixed:0", approve_after=1)
+
+
+class BlockedSessions:
+    """Session service whose create_session never returns, so started jobs stay running."""
+
+    async def create_session(self, **kwargs):
+        await asyncio.Event().wait()
+
+    async def delete_session(self, **kwargs):
+        return None
+
+
+class StubRunner:
+    app_name = "test"
+    session_service = BlockedSessions()
+
+    async def close(self):
+        return None
+
+
+def test_submit_rejects_when_queue_is_full():
+    async def run():
+        service = PlanService(StubRunner(), concurrency=2, queue_size=2)
+        jobs = [service.submit({"patient_id": f"p{i}"}) for i in range(2)]
+        with pytest.raises(QueueFullError) as rejected:
+            service.submit({"patient_id": "p2"})
+        # Without finished jobs the estimate is 30 s spread over the workers
+        assert rejected.value.retry_after == 15.0
+        service._durations = [4.0, 6.0]
+        assert service.retry_after() == 2.5
+        return jobs, service.stats()
+
+    jobs, stats = asyncio.run(run())
+    assert [job.status for job in jobs] == ["queued", "queued"]
+    assert (stats["accepted"], stats["rejected"], stats["queued"]) == (2, 1, 2)
+
+
+def _post_plans(service_factory, bodies):
+    app = create_app(service_factory)
+
+    async def run():
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                responses = []
+                for body in bodies:
+                    responses.append(await client.post("/plans", json=body))
+                    # Let a worker pick the job up
+                    await asyncio.sleep(0.01)
+                return responses, app.state.service.stats()
+
+    return asyncio.run(run())
+
+
+def test_full_queue_returns_429_with_retry_after():
+    # One worker busy with the first job and one queue slot taken by the second
+    bodies = [{"patient_id": f"p{i}"} for i in range(3)]
+    responses, stats = _post_plans(lambda: PlanService(StubRunner(), concurrency=1, queue_size=1), bodies)
+    assert [response.status_code for response in responses] == [202, 202, 429]
+    assert responses[2].headers["Retry-After"] == "30"
+    assert responses[2].json() == {"error": "Plan queue is full", "retry_after_seconds": 30.0}
+    assert (stats["running"], stats["queued"], stats["rejected"]) == (1, 1, 1)
+
+
+def test_unknown_field_is_rejected():
+    responses, _ = _post_plans(lambda: PlanService(StubRunner()), [{"patient_id": "p1", "plan": "keto"}])
+    assert responses[0].status_code == 422
+
+
+def test_job_runs_to_done():
+    app = create_app(lambda: PlanService(build_runner(), concurrency=1))
+
+    async def run():
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                submitted = await client.post("/plans", json={"patient_id": "p1", "deadline_seconds": 60})
+                job_id = submitted.json()["job_id"]
+                events = []
+                async with client.stream("GET", f"/plans/{job_id}/events") as stream:
+                    async for line in stream.aiter_lines():
+                        if line.startswith("event: "):
+                            events.append(line[len("event: "):])
+                status = (await client.get(f"/plans/{job_id}")).json()
+                missing = await client.get("/plans/unknown")
+                return events, status, missing.status_code
+
+    events, status, missing = asyncio.run(run())
+    assert events[:2] == ["queued", "started"]
+    assert events[-1] == "done"
+    assert "stage" in events
+    assert status["status"] == "ok"
+    assert status["result"]["current_meal_plan"]
+    assert status["result"]["degraded"] is False
+    assert missing == 404
@@ -0,0 +1,175 @@
+import copy
+import json
+
+import pytest
+
+from nutrition_agent.validator import (
+    add_issues,
+    check_completeness,
+    check_nutritional_accuracy,
+    merge_critique,
+    numeric_critique,
+    validate_meal_plan,
+)
+
+
+def _meal(calories, protein, carbs, fats, name="Thali"):
+    food = {"name": name, "quantity": "1 plate", "calories": calories, "protein_g": protein, "carbs_g": carbs, "fats_g": fats}
+    return {"foods": [food], "totals": {k: food[k] for k in ("calories", "protein_g", "carbs_g", "fats_g")}}
+
+
+@pytest.fixture
+def requirements():
+    return {
+        "daily_targets": {"total_calories": 1500, "protein_grams": 75, "carbohydrates_grams": 200, "fats_grams": 50},
+        "meal_distribution": {
+            "breakfast": {"calories": 400},
+            "mid_morning_snack": {"calories": 0, "include": False},
+            "lunch": {"calories": 600},
+            "evening_snack": {"calories": 0, "include": False},
+            "dinner": {"calories": 500},
+        },
+    }
+
+
+@pytest.fixture
+def plan():
+    """Exactly on every target."""
+    return {"meal_plan": {
+        "breakfast": _meal(400, 20, 55, 12),
+        "lunch": _meal(600, 30, 80, 20),
+        "dinner": _meal(500, 25, 65, 18),
+    }}
+
+
+def _problems(result):
+    return [issue["problem"] for issue in result["issues"]]
+
+
+def test_plan_on_target_passes(plan, requirements):
+    result = validate_meal_plan(json.dumps(plan), json.dumps(requirements))
+    assert result["passed"]
+    assert result["issues"] == []
+    assert result["nutritional_accuracy"] == {
+        "calories_status": "within_range", "calories_difference": 0.0, "protein_status": "within_range",
+        "carbs_status": "within_range", "fats_status": "within_range", "overall_score": "excellent",
+    }
+    assert result["completeness"] == {"all_meals_present": True, "missing_meals": [], "empty_meals": [], "totals_consistent": True}
+
+
+@pytest.mark.parametrize("extra_calories, calories_status, score", [
+    (50, "within_range", "excellent"),
+    (80, "within_range", "good"),
+    (-100, "within_range", "good"),
+    (101, "too_high", "needs_improvement"),
+    (-150, "too_low", "needs_improvement"),
+])
+def test_calorie_tolerance(plan, requirements, extra_calories, calories_status, score):
+    food = plan["meal_plan"]["lunch"]["foods"][0]
+    food["calories"] += extra_calories
+    accuracy = check_nutritional_accuracy(plan, requirements)["nutritional_accuracy"]
+    assert accuracy["calories_status"] == calories_status
+    assert accuracy["calories_difference"] == extra_calories
+    assert accuracy["overall_score"] == score
+
+
+@pytest.mark.parametrize("protein, status", [(7.5, "within_range"), (8, "too_high"), (-7.5, "within_range"), (-8, "too_low")])
+def test_macro_tolerance(plan, requirements, protein, status):
+    # Protein target 75 g, ±10%
+    plan["meal_plan"]["lunch"]["foods"][0]["protein_g"] += protein
+    result = check_nutritional_accuracy(plan, requirements)
+    assert result["nutritional_accuracy"]["protein_status"] == status
+    assert len(result["issues"]) == (status != "within_range")
+
+
+def test_several_targets_missed_is_poor(plan, requirements):
+    plan["meal_plan"]["lunch"]["foods"][0].update(calories=900, fats_g=45)
+    result = validate_meal_plan(plan, requirements)
+    assert result["nutritional_accuracy"]["overall_score"] == "poor"
+    assert not result["passed"]
+    assert "Daily calories are 1800 kcal vs target 1500 kcal (+300 kcal)" in _problems(result)
+
+
+def test_missing_and_empty_meals(plan, requirements):
+    del plan["meal_plan"]["dinner"]
+    plan["meal_plan"]["lunch"]["foods"] = []
+    requirements["meal_distribution"]["evening_snack"] = {"calories": 150, "include": True}
+    completeness = check_completeness(plan, requirements)
+    assert completeness["completeness"]["missing_meals"] == ["evening_snack", "dinner"]
+    assert completeness["completeness"]["empty_meals"] == ["lunch"]
+    assert not completeness["completeness"]["all_meals_present"]
+    assert {issue["severity"] for issue in completeness["issues"]} == {"critical"}
+
+
+def test_excluded_snack_is_not_missing(plan, requirements):
+    plan["meal_plan"]["evening_snack"] = {"include": False, "foods": []}
+    assert check_completeness(plan, requirements)["issues"] == []
+
+
+def test_food_without_macros(plan, requirements):
+    plan["meal_plan"]["lunch"]["foods"].append({"name": "Salad", "calories": "some"})
+    problems = _problems(check_completeness(plan, requirements))
+    assert "Salad in lunch is missing calories, protein_g, carbs_g, fats_g" in problems
+
+
+def test_inconsistent_totals_and_meal_share(plan, requirements):
+    plan["meal_plan"]["breakfast"]["totals"]["calories"] = 300
+    plan["meal_plan"]["dinner"]["foods"][0]["calories"] = 700
+    plan["meal_plan"]["dinner"]["totals"]["calories"] = 700
+    result = check_completeness(plan, requirements)
+    assert not result["completeness"]["totals_consistent"]
+    assert _problems(result) == [
+        "breakfast totals (300.0) do not match the sum of its foods (400 kcal)",
+        "dinner provides 700 kcal vs its 500 kcal share",
+    ]
+    assert {issue["severity"] for issue in result["issues"]} == {"minor"}
+
+
+def test_invalid_plan(requirements):
+    result = validate_meal_plan("not json", requirements)
+    assert not result["passed"]
+    assert result["issues"][0]["severity"] == "critical"
+
+
+def test_add_issues(plan, requirements):
+    validation = validate_meal_plan(plan, requirements)
+    assert add_issues(validation, []) is validation
+    minor = add_issues(validation, [{"category": "practical", "severity": "minor", "problem": "p"}])
+    assert minor["passed"] and len(minor["issues"]) == 1
+    assert not add_issues(validation, [{"category": "practical", "severity": "major", "problem": "p"}])["passed"]
+
+
+def test_numeric_critique(plan, requirements):
+    plan["meal_plan"]["lunch"]["foods"][0]["calories"] = 900
+    critique = numeric_critique(validate_meal_plan(plan, requirements))
+    assert critique["status"] == "NEEDS_REVISION"
+    assert critique["medical_compliance"] == {"overall_score": "not_evaluated"}
+    assert critique["issues"]
+
+
+@pytest.mark.parametrize("medical, practical, issues, status", [
+    ("good", "excellent", [], "APPROVED"),
+    ("good", "needs_improvement", [], "NEEDS_REVISION"),
+    ("good", "good", [{"category": "medical", "severity": "major", "problem": "too much salt"}], "NEEDS_REVISION"),
+    # The model's own numeric issues are replaced by the validation's
+    ("good", "good", [{"category": "nutritional", "severity": "major", "problem": "wrong sum"}], "APPROVED"),
+])
+def test_merge_critique(plan, requirements, medical, practical, issues, status):
+    validation = validate_meal_plan(plan, requirements)
+    model_critique = {
+        "status": "APPROVED",
+        "nutritional_accuracy": {"overall_score": "poor"},
+        "medical_compliance": {"overall_score": medical},
+        "practical_assessment": {"overall_score": practical},
+        "issues": copy.deepcopy(issues),
+    }
+    critique = merge_critique(validation, model_critique)
+    assert critique["status"] == status
+    assert critique["nutritional_accuracy"] == validation["nutritional_accuracy"]
+    assert all(issue["category"] != "nutritional" for issue in critique["issues"])
+
+
+def test_merge_critique_without_model_output(plan, requirements):
+    critique = merge_critique(validate_meal_plan(plan, requirements), None)
+    assert critique["status"] == "NEEDS_REVISION"
+    assert critique["summary"] == "The critic response was not valid JSON."